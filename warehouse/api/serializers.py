@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from .models import (
     Product, Warehouse, Item, Inventory, Move,
@@ -41,23 +43,174 @@ class MoveSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class MoveCreateSerializer(serializers.Serializer):
+    """
+    Payload tạo 1 Move (dùng cho POST /moves/ và từng dòng của /moves/bulk/).
+    FK truyền theo id hoặc mã tự nhiên:
+    - theo Item:  item_id | barcode            (qty = 1)
+    - theo Bulk:  product_id | sku + quantity
+    - kho:        from_wh_id | from_wh_code, to_wh_id | to_wh_code
+    validate() chỉ kiểm tra hình dạng (không query DB); FK được resolve trong api.services.
+    """
+    action = serializers.ChoiceField(choices=Move.ACTIONS)
+    item_id = serializers.IntegerField(required=False, allow_null=True)
+    barcode = serializers.CharField(required=False, allow_blank=True, max_length=15)
+    product_id = serializers.IntegerField(required=False, allow_null=True)
+    sku = serializers.CharField(required=False, allow_blank=True, max_length=64)
+    quantity = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+    from_wh_id = serializers.IntegerField(required=False, allow_null=True)
+    from_wh_code = serializers.CharField(required=False, allow_blank=True, max_length=32)
+    to_wh_id = serializers.IntegerField(required=False, allow_null=True)
+    to_wh_code = serializers.CharField(required=False, allow_blank=True, max_length=32)
+    type_action = serializers.CharField(required=False, allow_blank=True, max_length=64, default="")
+    note = serializers.CharField(required=False, allow_blank=True, max_length=255, default="")
+    tag = serializers.IntegerField(required=False, min_value=1, default=1)
+    batch_id = serializers.CharField(required=False, allow_blank=True, max_length=32, default="")
+    duration_seconds = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+
+    def validate(self, attrs):
+        has_item = bool(attrs.get("item_id") or attrs.get("barcode"))
+        has_bulk = bool(attrs.get("product_id") or attrs.get("sku") or attrs.get("quantity"))
+        if has_item and has_bulk:
+            raise serializers.ValidationError("Chỉ chọn Item (item_id/barcode) HOẶC Product+Quantity.")
+        if not has_item and not has_bulk:
+            raise serializers.ValidationError("Thiếu dữ liệu: cần Item hoặc Product+Quantity.")
+        if has_bulk and not ((attrs.get("product_id") or attrs.get("sku")) and attrs.get("quantity")):
+            raise serializers.ValidationError("Bulk cần đủ (product, quantity>0).")
+        if attrs["action"] == "IN" and not (attrs.get("to_wh_id") or attrs.get("to_wh_code")):
+            raise serializers.ValidationError("IN cần to_wh (kho nhận).")
+        if attrs["action"] == "OUT" and not (attrs.get("from_wh_id") or attrs.get("from_wh_code")):
+            raise serializers.ValidationError("OUT cần from_wh (kho xuất).")
+        return attrs
+
+    def create(self, validated_data):
+        from .services import ingest_validated_moves
+
+        request = self.context.get("request")
+        res = ingest_validated_moves([validated_data], user=getattr(request, "user", None))
+        if res.errors:
+            raise serializers.ValidationError(res.errors[0]["errors"])
+        return res.moves[0]
+
+
+# ----- ITEM -----
+class ItemCreateBySkuSerializer(serializers.Serializer):
+    """Tạo 1 Item theo SKU (tự sinh seq/barcode); mark_in=True -> IN luôn vào kho to_wh_code."""
+    sku = serializers.CharField(max_length=64)
+    import_date = serializers.DateField(required=False, allow_null=True)
+    mark_in = serializers.BooleanField(required=False, default=False)
+    to_wh_code = serializers.CharField(required=False, allow_blank=True, max_length=32)
+    note = serializers.CharField(required=False, allow_blank=True, max_length=255, default="")
+
+    def validate(self, attrs):
+        attrs["product"] = Product.objects.filter(sku=attrs["sku"]).first()
+        if attrs["product"] is None:
+            raise serializers.ValidationError({"sku": "Không tìm thấy SKU."})
+        if attrs.get("mark_in"):
+            code = attrs.get("to_wh_code")
+            attrs["to_wh"] = Warehouse.objects.filter(code=code).first() if code else None
+            if attrs["to_wh"] is None:
+                raise serializers.ValidationError({"to_wh_code": "mark_in cần mã kho nhận hợp lệ."})
+        return attrs
+
+    def create(self, validated_data):
+        request = self.context.get("request")
+        user = getattr(request, "user", None)
+        with transaction.atomic():
+            item = Item(product=validated_data["product"], import_date=validated_data.get("import_date"))
+            item.save()
+            if validated_data.get("mark_in"):
+                mv = Move.objects.create(
+                    item=item, action="IN", to_wh=validated_data["to_wh"],
+                    type_action="CREATE_BY_SKU", note=validated_data.get("note", ""),
+                    created_by=user if user is not None and user.is_authenticated else None,
+                )
+                mv.apply()
+        return item
+
+
+class ItemBatchLineSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=64)
+    qty = serializers.IntegerField(min_value=1, max_value=99999)
+    import_date = serializers.DateField(required=False, allow_null=True)
+    to_wh_code = serializers.CharField(required=False, allow_blank=True, max_length=32)
+    note = serializers.CharField(required=False, allow_blank=True, max_length=255, default="")
+
+
+class ItemBatchCreateBySkuSerializer(serializers.Serializer):
+    """Tạo nhiều Item theo SKU trong 1 request; có to_wh_code -> IN luôn vào kho đó (xem api.services)."""
+    items = ItemBatchLineSerializer(many=True, allow_empty=False)
+    batch_id = serializers.CharField(required=False, allow_blank=True, max_length=32, default="")
+
+    def validate_items(self, value):
+        limit = getattr(settings, "API_ITEM_BATCH_MAX", 5000)
+        if sum(r["qty"] for r in value) > limit:
+            raise serializers.ValidationError(f"Tối đa {limit} item mỗi request.")
+        return value
+
+    def create(self, validated_data):
+        from .services import create_items_by_sku
+
+        request = self.context.get("request")
+        return create_items_by_sku(validated_data["items"], user=getattr(request, "user", None),
+                                   batch_id=validated_data.get("batch_id", ""))
+
+
 # ----- STOCK ORDER -----
+def _pk(obj):
+    return obj.pk if obj is not None else None
+
+
+class _PrefetchedPKField(serializers.PrimaryKeyRelatedField):
+    """PK field đọc từ map đã prefetch theo lô (StockOrderLineListSerializer); không có thì query như thường."""
+
+    def to_internal_value(self, data):
+        refs = self.context.get("_line_refs", {}).get(self.get_queryset().model)
+        if refs is not None:
+            try:
+                return refs[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+class StockOrderLineListSerializer(serializers.ListSerializer):
+    """Danh sách dòng: lấy Item/Product của cả danh sách bằng 1 query mỗi model trước khi validate từng dòng."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            refs = {}
+            for model, key in ((Item, "item_id"), (Product, "product_id")):
+                ids = set()
+                for row in data:
+                    try:
+                        ids.add(int(row.get(key)))
+                    except (AttributeError, TypeError, ValueError):
+                        pass
+                refs[model] = model.objects.in_bulk(ids) if ids else {}
+            self.context["_line_refs"] = refs
+        return super().to_internal_value(data)
+
+
 class StockOrderLineWriteSerializer(serializers.ModelSerializer):
     """
     Dùng cho ghi (POST/PUT). Một dòng phải:
     - có item (barcode) và KHÔNG có product/quantity, hoặc
     - có product + quantity và KHÔNG có item.
+    id (tuỳ chọn) = dòng đã có của đơn khi cập nhật; không có id thì ghép theo item_id / product_id.
     """
-    item_id = serializers.PrimaryKeyRelatedField(
+    id = serializers.IntegerField(required=False)
+    item_id = _PrefetchedPKField(
         queryset=Item.objects.all(), source="item", required=False, allow_null=True
     )
-    product_id = serializers.PrimaryKeyRelatedField(
+    product_id = _PrefetchedPKField(
         queryset=Product.objects.all(), source="product", required=False, allow_null=True
     )
 
     class Meta:
         model = StockOrderLine
         fields = ["id", "item_id", "product_id", "quantity", "note"]
+        list_serializer_class = StockOrderLineListSerializer
 
     def validate(self, attrs):
         item = attrs.get("item")
@@ -119,20 +272,96 @@ class StockOrderSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         lines_data = validated_data.pop("lines", [])
         user = self.context["request"].user if self.context.get("request") else None
+        if user is not None and not user.is_authenticated:
+            user = None
         order = StockOrder.objects.create(created_by=user, **validated_data)
-        for ld in lines_data:
-            StockOrderLine.objects.create(order=order, **ld)
+        StockOrderLine.objects.bulk_create([
+            StockOrderLine(order=order, **{k: v for k, v in ld.items() if k != "id"}) for ld in lines_data
+        ])
         return order
 
     def update(self, instance, validated_data):
         lines_data = validated_data.pop("lines", None)
-        for k, v in validated_data.items():
-            setattr(instance, k, v)
-        instance.save()
-
-        if lines_data is not None:
-            # đơn giản: xoá toàn bộ rồi tạo lại (có thể tối ưu patch sau)
-            instance.lines.all().delete()
-            for ld in lines_data:
-                StockOrderLine.objects.create(order=instance, **ld)
+        with transaction.atomic():
+            for k, v in validated_data.items():
+                setattr(instance, k, v)
+            instance.save()
+
+            if lines_data is not None:
+                self.line_changes = self._sync_lines(instance, lines_data)
         return instance
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if getattr(self, "line_changes", None) is not None:
+            data["line_changes"] = self.line_changes
+        return data
+
+    @staticmethod
+    def _line_key(item_id, product_id):
+        return ("item", item_id) if item_id is not None else ("product", product_id)
+
+    def _sync_lines(self, order, lines_data):
+        """
+        Đồng bộ dòng theo diff (lines gửi lên = toàn bộ dòng mới của đơn):
+        ghép theo id, còn lại theo item/product -> bulk_update dòng đổi, bulk_create dòng mới, 1 DELETE dòng bỏ.
+        """
+        existing = list(order.lines.all())
+        by_id = {line.id: line for line in existing}
+        pairs, matched = [], set()
+
+        # 1) dòng có id
+        for ld in lines_data:
+            lid = ld.get("id")
+            if lid is None:
+                continue
+            line = by_id.get(lid)
+            if line is None or lid in matched:
+                raise serializers.ValidationError({"lines": f"Dòng id={lid} không thuộc đơn #{order.id} (hoặc bị lặp)."})
+            matched.add(lid)
+            pairs.append((ld, line))
+
+        # 2) dòng không id: ghép theo item / product với dòng cũ chưa được ghép
+        free = {}
+        for line in existing:
+            if line.id not in matched:
+                free.setdefault(self._line_key(line.item_id, line.product_id), []).append(line)
+        for ld in lines_data:
+            if ld.get("id") is not None:
+                continue
+            cands = free.get(self._line_key(_pk(ld.get("item")), _pk(ld.get("product"))))
+            line = cands.pop(0) if cands else None
+            if line is not None:
+                matched.add(line.id)
+            pairs.append((ld, line))
+
+        to_create, to_update, fields = [], [], set()
+        for ld, line in pairs:
+            # so sánh theo *_id để không phải load FK của dòng cũ
+            values = {
+                "item_id": _pk(ld.get("item")), "product_id": _pk(ld.get("product")),
+                "quantity": ld.get("quantity"), "note": ld.get("note", ""),
+            }
+            if line is None:
+                to_create.append(StockOrderLine(order=order, **values))
+                continue
+            changed = [f for f, v in values.items() if getattr(line, f) != v]
+            if changed:
+                for f in changed:
+                    setattr(line, f, values[f])
+                fields.update(changed)
+                to_update.append(line)
+
+        deleted = [line.id for line in existing if line.id not in matched]
+        if deleted:
+            StockOrderLine.objects.filter(order=order, id__in=deleted).delete()
+        if to_update:
+            StockOrderLine.objects.bulk_update(to_update, sorted(fields))
+        if to_create:
+            StockOrderLine.objects.bulk_create(to_create)
+        return {
+            "created": [line.id for line in to_create],
+            "updated": [line.id for line in to_update],
+            "deleted": deleted,
+            "unchanged": len(pairs) - len(to_create) - len(to_update),
+        }
@@ -0,0 +1,288 @@
+# api/services.py
+"""
+Nhập Move hàng loạt cho API (job đồng bộ ERP đẩy hàng nghìn dòng / lần).
+
+- Hình dạng từng dòng kiểm tra bằng MoveCreateSerializer (không query DB).
+- FK resolve theo lô: Item / Product / Warehouse mỗi model 1 query (theo id hoặc barcode/sku/code),
+  Inventory của mọi cặp (product, warehouse) liên quan 1 query (select_for_update).
+- Mô phỏng tồn kho + trạng thái item theo đúng thứ tự dòng (như Move.apply), rồi ghi:
+  Move.bulk_create, Inventory cộng dồn theo (product, warehouse) -> bulk_update/bulk_create, Item bulk_update.
+- mode="atomic": có dòng lỗi -> không ghi gì; mode="partial": bỏ dòng lỗi, ghi các dòng hợp lệ.
+
+Tạo Item hàng loạt theo SKU (create_items_by_sku): cấp dải seq cho mỗi (product, import_date) bằng 1 query Max,
+bulk_create Item + Move IN, cộng tồn 1 lần cho mỗi (product, warehouse). Dải vượt MAX_SEQ -> 400, không ghi gì.
+"""
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Product, Warehouse, Item, Inventory, Move
+
+ATOMIC, PARTIAL = "atomic", "partial"
+MODES = (ATOMIC, PARTIAL)
+MAX_SEQ = 99999   # barcode = code4 + ddmmyy + seq 5 chữ số (Item.barcode_text 15 ký tự)
+
+
+@dataclass
+class BulkResult:
+    moves: list = field(default_factory=list)    # Move đã tạo (có pk)
+    errors: list = field(default_factory=list)   # [{"index": i, "errors": ...}]
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def ingest_moves(rows, mode=ATOMIC, user=None, batch_id=""):
+    """Kiểm tra + ghi danh sách payload MoveCreate (dict). batch_id dùng cho dòng không tự truyền."""
+    from .serializers import MoveCreateSerializer
+
+    child = MoveCreateSerializer()
+    data, errors = [], []
+    for i, row in enumerate(rows):
+        try:
+            data.append((i, child.run_validation(row)))
+        except serializers.ValidationError as e:
+            errors.append({"index": i, "errors": e.detail})
+    if errors and mode == ATOMIC:
+        return BulkResult(errors=errors)
+    return _ingest(data, errors, mode, user, batch_id)
+
+
+def ingest_validated_moves(rows, mode=ATOMIC, user=None, batch_id=""):
+    """Như ingest_moves nhưng rows đã qua MoveCreateSerializer (validated_data)."""
+    return _ingest(list(enumerate(rows)), [], mode, user, batch_id)
+
+
+# ---------- Resolve FK theo lô ----------
+def _collect(data, id_field, code_field):
+    ids = {d[id_field] for _, d in data if d.get(id_field)}
+    codes = {d[code_field] for _, d in data if d.get(code_field)}
+    return ids, codes
+
+
+def _prefetch(data):
+    """{("id", x) | ("code", x): obj} cho item / product / warehouse — mỗi model 1 query."""
+    refs = {"item": {}, "product": {}, "wh": {}}
+
+    ids, codes = _collect(data, "item_id", "barcode")
+    if ids or codes:
+        for it in Item.objects.select_for_update().filter(Q(id__in=ids) | Q(barcode_text__in=codes)):
+            refs["item"][("id", it.id)] = refs["item"][("code", it.barcode_text)] = it
+
+    ids, codes = _collect(data, "product_id", "sku")
+    if ids or codes:
+        for p in Product.objects.filter(Q(id__in=ids) | Q(sku__in=codes)):
+            refs["product"][("id", p.id)] = refs["product"][("code", p.sku)] = p
+
+    ids, codes = _collect(data, "from_wh_id", "from_wh_code")
+    ids2, codes2 = _collect(data, "to_wh_id", "to_wh_code")
+    ids, codes = ids | ids2, codes | codes2
+    if ids or codes:
+        for w in Warehouse.objects.filter(Q(id__in=ids) | Q(code__in=codes)):
+            refs["wh"][("id", w.id)] = refs["wh"][("code", w.code)] = w
+    return refs
+
+
+def _ref(refs, kind, d, id_field, code_field, label):
+    if d.get(id_field):
+        key, shown = ("id", d[id_field]), d[id_field]
+    elif d.get(code_field):
+        key, shown = ("code", d[code_field]), d[code_field]
+    else:
+        return None
+    obj = refs[kind].get(key)
+    if obj is None:
+        raise ValidationError(f"Không tìm thấy {label} '{shown}'.")
+    return obj
+
+
+def _build_move(d, refs, user, batch_id):
+    item = _ref(refs, "item", d, "item_id", "barcode", "item")
+    product = _ref(refs, "product", d, "product_id", "sku", "product")
+    mv = Move(
+        item=item,
+        product=product,
+        quantity=d.get("quantity") if item is None else None,
+        action=d["action"],
+        type_action=d.get("type_action") or "",
+        from_wh=_ref(refs, "wh", d, "from_wh_id", "from_wh_code", "kho") if d["action"] == "OUT" else None,
+        to_wh=_ref(refs, "wh", d, "to_wh_id", "to_wh_code", "kho") if d["action"] == "IN" else None,
+        note=d.get("note") or "",
+        tag=d.get("tag") or 1,
+        created_by=user,
+        batch_id=d.get("batch_id") or batch_id,
+        duration_seconds=d.get("duration_seconds"),
+    )
+    mv.clean()
+    return mv
+
+
+def _delta(mv):
+    """((product_id, warehouse_id), delta) của 1 move — cùng quy tắc với Move.apply."""
+    product_id = mv.item.product_id if mv.item is not None else mv.product_id
+    qty = 1 if mv.item is not None else int(mv.quantity or 0)
+    if mv.action == "IN":
+        return (product_id, mv.to_wh_id), qty
+    return (product_id, mv.from_wh_id), -qty
+
+
+# ---------- Tồn kho theo lô ----------
+def _load_stock(pairs):
+    """{(product_id, warehouse_id): Inventory} của các cặp: 1 query (khoá dòng trên Postgres)."""
+    if not pairs:
+        return {}
+    qs = Inventory.objects.select_for_update().filter(
+        product_id__in={p for p, _ in pairs}, warehouse_id__in={w for _, w in pairs},
+    )
+    return {(inv.product_id, inv.warehouse_id): inv for inv in qs if (inv.product_id, inv.warehouse_id) in pairs}
+
+
+def _write_stock(stock, new_qty, batch_size):
+    """Ghi tồn đã cộng dồn: mỗi cặp (product, warehouse) đúng 1 lần (bulk_update + bulk_create)."""
+    updated = []
+    for key in new_qty.keys() & stock.keys():
+        stock[key].qty = new_qty[key]
+        updated.append(stock[key])
+    Inventory.objects.bulk_update(updated, ["qty"], batch_size=batch_size)
+    Inventory.objects.bulk_create(
+        [Inventory(product_id=p, warehouse_id=w, qty=q) for (p, w), q in new_qty.items() if (p, w) not in stock],
+        batch_size=batch_size,
+    )
+
+
+# ---------- Ghi ----------
+def _ingest(data, errors, mode, user, batch_id):
+    if user is not None and not user.is_authenticated:
+        user = None
+    batch_size = int(_conf("API_BULK_MOVE_BATCH_SIZE", 500))
+
+    with transaction.atomic():
+        refs = _prefetch(data)
+
+        built = []
+        for idx, d in data:
+            try:
+                mv = _build_move(d, refs, user, batch_id)
+            except ValidationError as e:
+                errors.append({"index": idx, "errors": e.messages})
+                continue
+            built.append((idx, mv, *_delta(mv)))
+
+        stock = _load_stock({key for _, _, key, _ in built})
+        qty = {key: inv.qty for key, inv in stock.items()}
+
+        moves, touched, items = [], set(), {}
+        for idx, mv, key, delta in built:
+            new_qty = qty.get(key, 0) + delta
+            if new_qty < 0:
+                errors.append({"index": idx, "errors": [
+                    f"Tồn kho âm cho product={key[0]} @ warehouse={key[1]}: {qty.get(key, 0)} + ({delta})"
+                ]})
+                continue
+            qty[key] = new_qty
+            touched.add(key)
+            if mv.item is not None:
+                if mv.action == "IN":
+                    mv.item.warehouse, mv.item.status = mv.to_wh, "in_stock"
+                else:
+                    mv.item.warehouse, mv.item.status = None, "shipping"
+                items[mv.item.pk] = mv.item
+            moves.append(mv)
+
+        errors.sort(key=lambda e: e["index"])
+        if errors and mode == ATOMIC:
+            # chưa ghi gì; item đã sửa trong bộ nhớ chỉ là bản prefetch
+            return BulkResult(errors=errors)
+
+        Move.objects.bulk_create(moves, batch_size=batch_size)
+        _write_stock(stock, {key: qty[key] for key in touched}, batch_size)
+        Item.objects.bulk_update(list(items.values()), ["warehouse", "status"], batch_size=batch_size)
+
+    return BulkResult(moves=moves, errors=errors)
+
+
+# ---------- Tạo Item theo SKU hàng loạt ----------
+def create_items_by_sku(rows, user=None, batch_id=""):
+    """
+    rows: validated_data của ItemBatchCreateBySkuSerializer [{sku, qty, import_date, to_wh_code, note}].
+    Tất cả hoặc không: SKU/kho sai -> serializers.ValidationError({"items": [{...}, ...]}), không ghi gì.
+    Trả về danh sách Item theo đúng thứ tự dòng (mỗi dòng qty item liên tiếp).
+    """
+    if user is not None and not user.is_authenticated:
+        user = None
+    batch_size = int(_conf("API_BULK_MOVE_BATCH_SIZE", 500))
+    today = timezone.localdate()
+
+    with transaction.atomic():
+        skus = {r["sku"] for r in rows}
+        codes = {r["to_wh_code"] for r in rows if r.get("to_wh_code")}
+        # khoá Product để 2 request cùng SKU không cấp trùng dải seq
+        products = {p.sku: p for p in Product.objects.select_for_update().filter(sku__in=skus)}
+        whs = {w.code: w for w in Warehouse.objects.filter(code__in=codes)} if codes else {}
+
+        # lỗi theo dạng của ListSerializer: 1 dict / dòng ({} = hợp lệ)
+        errors = []
+        for r in rows:
+            err = {}
+            if r["sku"] not in products:
+                err["sku"] = [f"Không tìm thấy SKU '{r['sku']}'."]
+            if r.get("to_wh_code") and r["to_wh_code"] not in whs:
+                err["to_wh_code"] = [f"Không tìm thấy kho '{r['to_wh_code']}'."]
+            errors.append(err)
+        if any(errors):
+            raise serializers.ValidationError({"items": errors})
+
+        # seq hiện tại của mọi (product, ngày): 1 query GROUP BY
+        groups = {(products[r["sku"]].id, r.get("import_date") or today) for r in rows}
+        next_seq = {key: 1 for key in groups}
+        for g in (Item.objects
+                  .filter(product_id__in={p for p, _ in groups}, import_date__in={d for _, d in groups})
+                  .values("product_id", "import_date").annotate(m=Max("seq"))):
+            key = (g["product_id"], g["import_date"])
+            if key in next_seq:
+                next_seq[key] = (g["m"] or 0) + 1
+
+        ranges = []
+        for r in rows:
+            key = (products[r["sku"]].id, r.get("import_date") or today)
+            start = next_seq[key]
+            next_seq[key] = start + r["qty"]
+            ranges.append((key, start))
+        errors = [
+            {"qty": [f"Vượt số thứ tự tối đa {MAX_SEQ} của SKU '{r['sku']}' ngày {key[1]:%d/%m/%Y}."]}
+            if start + r["qty"] - 1 > MAX_SEQ else {}
+            for r, (key, start) in zip(rows, ranges)
+        ]
+        if any(errors):
+            raise serializers.ValidationError({"items": errors})
+
+        items, targets = [], []
+        for r, (key, start) in zip(rows, ranges):
+            product = products[r["sku"]]
+            wh = whs.get(r.get("to_wh_code"))
+            for seq in range(start, start + r["qty"]):
+                it = Item(product=product, import_date=key[1], seq=seq,
+                          warehouse=wh, status="in_stock" if wh else "none")
+                it.barcode_text = it._compose_barcode()
+                items.append(it)
+                targets.append((wh, r.get("note") or ""))
+        Item.objects.bulk_create(items, batch_size=batch_size)
+
+        moves, deltas = [], {}
+        for it, (wh, note) in zip(items, targets):
+            if wh is None:
+                continue
+            moves.append(Move(item=it, action="IN", to_wh=wh, type_action="CREATE_BY_SKU",
+                              note=note, created_by=user, batch_id=batch_id))
+            deltas[(it.product_id, wh.id)] = deltas.get((it.product_id, wh.id), 0) + 1
+        Move.objects.bulk_create(moves, batch_size=batch_size)
+
+        stock = _load_stock(set(deltas))
+        _write_stock(stock, {key: (stock[key].qty if key in stock else 0) + d for key, d in deltas.items()}, batch_size)
+    return items
@@ -1,3 +1,219 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from tests.querycount import Endpoint, QueryCountMixin
+
+from .models import Product, Warehouse, Item, Inventory, Move, StockOrder, StockOrderLine
+
+BULK_URL = "/api/v2/moves/bulk/"
+
+
+class BulkMoveTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("sync", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.hcm = Warehouse.objects.create(code="HCM", name="Kho HCM")
+        self.hn = Warehouse.objects.create(code="HN", name="Kho HN")
+        self.p = Product.objects.create(sku="SKU-A", name="A")
+        self.item = Item.objects.create(product=self.p)
+
+    def _post(self, rows, mode="atomic"):
+        return self.client.post(BULK_URL, {"items": rows, "mode": mode}, format="json")
+
+    def test_atomic_rolls_back_whole_list(self):
+        rows = [
+            {"action": "IN", "sku": "SKU-A", "quantity": 5, "to_wh_code": "HCM"},
+            {"action": "OUT", "sku": "SKU-A", "quantity": 9, "from_wh_code": "HCM"},
+            {"action": "IN", "sku": "NOPE", "quantity": 1, "to_wh_code": "HCM"},
+        ]
+        res = self._post(rows)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual([e["index"] for e in res.json()["errors"]], [1, 2])
+        self.assertFalse(Move.objects.exists())
+        self.assertFalse(Inventory.objects.exists())
+
+    def test_partial_aggregates_inventory_and_updates_items(self):
+        rows = [
+            {"action": "IN", "sku": "SKU-A", "quantity": 5, "to_wh_code": "HCM"},
+            {"action": "IN", "barcode": self.item.barcode_text, "to_wh_id": self.hn.id},
+            {"action": "OUT", "product_id": self.p.id, "quantity": 2, "from_wh_code": "HCM"},
+            {"action": "OUT", "sku": "SKU-A", "quantity": 9, "from_wh_code": "HCM"},
+            {"action": "IN", "quantity": 1},
+        ]
+        res = self._post(rows, mode="partial")
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.json()["created"], 3)
+        self.assertEqual([e["index"] for e in res.json()["errors"]], [3, 4])
+        self.assertEqual(Inventory.objects.get(product=self.p, warehouse=self.hcm).qty, 3)
+        self.assertEqual(Inventory.objects.get(product=self.p, warehouse=self.hn).qty, 1)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.warehouse_id, self.item.status), (self.hn.id, "in_stock"))
+        self.assertEqual(Move.objects.filter(created_by=self.user).count(), 3)
+
+    def test_lookups_do_not_grow_with_rows(self):
+        rows = [{"action": "IN", "sku": "SKU-A", "quantity": 1, "to_wh_code": "HCM"}] * 50
+        self._post(rows)  # lần đầu tạo dòng Inventory
+        with CaptureQueriesContext(connection) as ctx:
+            res = self._post(rows * 4)
+        self.assertEqual(res.json()["created"], 200)
+        sqls = [q["sql"] for q in ctx.captured_queries]
+        # product + warehouse + inventory, 1 UPDATE tồn; INSERT chỉ chia theo batch
+        self.assertEqual(sum(q.startswith("SELECT") for q in sqls), 3)
+        self.assertEqual(sum(q.startswith("UPDATE") for q in sqls), 1)
+        self.assertEqual(Inventory.objects.get(product=self.p, warehouse=self.hcm).qty, 250)
+
+
+class ItemBatchCreateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("recv", password="x"))
+        self.wh = Warehouse.objects.create(code="HCM", name="Kho HCM")
+        self.a = Product.objects.create(sku="SKU-A", name="A")
+        self.b = Product.objects.create(sku="SKU-B", name="B")
+        Item.objects.create(product=self.a, import_date=date(2026, 1, 2))  # seq 1 đã dùng
+
+    def test_allocates_seq_ranges_and_posts_inventory_once(self):
+        rows = [
+            {"sku": "SKU-A", "qty": 2, "import_date": "2026-01-02", "to_wh_code": "HCM"},
+            {"sku": "SKU-B", "qty": 1, "import_date": "2026-01-02"},
+            {"sku": "SKU-A", "qty": 1, "import_date": "2026-01-02", "to_wh_code": "HCM"},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post("/api/v2/items/create-by-sku/batch/", {"items": rows}, format="json")
+        self.assertEqual(res.status_code, 201)
+        code_a, code_b = self.a.code4 + "020126", self.b.code4 + "020126"
+        self.assertEqual(res.json()["barcodes"], [
+            code_a + "00002", code_a + "00003", code_b + "00001", code_a + "00004",
+        ])
+        self.assertEqual(Inventory.objects.get(product=self.a, warehouse=self.wh).qty, 3)
+        self.assertEqual(Move.objects.filter(action="IN", type_action="CREATE_BY_SKU").count(), 3)
+        self.assertEqual(Item.objects.get(barcode_text=code_b + "00001").status, "none")
+        self.assertEqual(sum(q["sql"].startswith("INSERT") for q in ctx.captured_queries), 3)
+
+    def test_unknown_sku_writes_nothing(self):
+        rows = [{"sku": "SKU-A", "qty": 3}, {"sku": "NOPE", "qty": 1}]
+        res = self.client.post("/api/v2/items/create-by-sku/batch/", {"items": rows}, format="json")
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json()["items"][0], {})
+        self.assertIn("sku", res.json()["items"][1])
+        self.assertEqual(Item.objects.count(), 1)
+
+
+    def test_seq_range_past_five_digits_is_rejected(self):
+        Item.objects.create(product=self.b, import_date=date(2026, 1, 2), seq=99998)
+        rows = [{"sku": "SKU-B", "qty": 2, "import_date": "2026-01-02"},
+                {"sku": "SKU-A", "qty": 1, "import_date": "2026-01-02"}]
+        res = self.client.post("/api/v2/items/create-by-sku/batch/", {"items": rows}, format="json")
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("qty", res.json()["items"][0])
+        self.assertEqual(res.json()["items"][1], {})
+        self.assertEqual(Item.objects.count(), 2)
+
+class StockOrderLineDiffTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.wh = Warehouse.objects.create(code="HCM", name="Kho HCM")
+        self.a = Product.objects.create(sku="SKU-A", name="A")
+        self.b = Product.objects.create(sku="SKU-B", name="B")
+        self.item = Item.objects.create(product=self.a)
+        res = self.client.post("/api/v2/orders/", {
+            "order_type": "IN", "to_wh_id": self.wh.id,
+            "lines": [
+                {"product_id": self.a.id, "quantity": 1},
+                {"product_id": self.b.id, "quantity": 2},
+                {"item_id": self.item.id},
+            ],
+        }, format="json")
+        self.assertEqual(res.status_code, 201)
+        self.order = StockOrder.objects.get(pk=res.json()["id"])
+        self.lines = {(l.item_id, l.product_id): l for l in self.order.lines.all()}
+
+    def test_patch_diffs_lines(self):
+        line_a = self.lines[(None, self.a.id)]
+        line_b = self.lines[(None, self.b.id)]
+        line_item = self.lines[(self.item.id, None)]
+        res = self.client.patch(f"/api/v2/orders/{self.order.id}/", {"lines": [
+            {"id": line_a.id, "product_id": self.a.id, "quantity": 5},
+            {"item_id": self.item.id},
+            {"product_id": self.b.id, "quantity": 7, "note": "mới"},
+        ]}, format="json")
+        self.assertEqual(res.status_code, 200)
+        changes = res.json()["line_changes"]
+        self.assertEqual(changes["updated"], [line_a.id, line_b.id])
+        self.assertEqual((changes["created"], changes["deleted"], changes["unchanged"]), ([], [], 1))
+        self.assertEqual(StockOrderLine.objects.get(pk=line_item.id).order_id, self.order.id)
+        self.assertEqual(StockOrderLine.objects.get(pk=line_b.id).quantity, 7)
+
+        res = self.client.patch(f"/api/v2/orders/{self.order.id}/", {"lines": [
+            {"id": line_a.id, "product_id": self.a.id, "quantity": 5},
+            {"product_id": self.b.id, "quantity": 1},
+            {"product_id": self.b.id, "quantity": 3},
+        ]}, format="json")
+        changes = res.json()["line_changes"]
+        self.assertEqual(changes["deleted"], [line_item.id])
+        self.assertEqual(changes["updated"], [line_b.id])
+        self.assertEqual(len(changes["created"]), 1)
+        self.assertEqual(self.order.lines.count(), 3)
+
+
+class QueryCountTests(QueryCountMixin, TestCase):
+    """Mọi route của api/urls.py (/api/v2/): số query không đổi khi dữ liệu / số dòng payload tăng."""
+    URLCONF = "api.urls"
+    ENDPOINTS = [
+        Endpoint("api-root", "/api/v2/"),
+        Endpoint("product-list", "/api/v2/products/"),
+        Endpoint("product-detail", lambda t, n: f"/api/v2/products/{t.products[0].id}/"),
+        Endpoint("warehouse-list", "/api/v2/warehouses/"),
+        Endpoint("warehouse-detail", lambda t, n: f"/api/v2/warehouses/{t.wh.id}/"),
+        Endpoint("item-list", "/api/v2/items/"),
+        Endpoint("item-detail", lambda t, n: f"/api/v2/items/{t.items[0].id}/"),
+        Endpoint("item-create-by-sku", "/api/v2/items/create-by-sku/", "post", status=(201,),
+                 data=lambda t, n: {"sku": t.products[0].sku, "mark_in": True, "to_wh_code": "QC"}),
+        Endpoint("item-create-by-sku-batch", "/api/v2/items/create-by-sku/batch/", "post", status=(201,),
+                 data=lambda t, n: {"items": [{"sku": p.sku, "qty": 1, "to_wh_code": "QC"} for p in t.products]}),
+        Endpoint("inventory-list", "/api/v2/inventories/"),
+        Endpoint("inventory-detail", lambda t, n: f"/api/v2/inventories/{t.inventories[0].id}/"),
+        Endpoint("move-list", "/api/v2/moves/"),
+        Endpoint("move-detail", lambda t, n: f"/api/v2/moves/{t.moves[0].id}/"),
+        Endpoint("move-bulk", "/api/v2/moves/bulk/", "post", status=(201,),
+                 data=lambda t, n: {"items": [{"action": "IN", "sku": p.sku, "quantity": 1, "to_wh_code": "QC"}
+                                              for p in t.products]}),
+        Endpoint("order-list", "/api/v2/orders/"),
+        Endpoint("order-detail", lambda t, n: f"/api/v2/orders/{t.order.id}/"),
+        Endpoint("order-lines", lambda t, n: f"/api/v2/orders/{t.order.id}/lines/"),
+        Endpoint("order-add-line", lambda t, n: f"/api/v2/orders/{t.order.id}/add_line/", "post", status=(201,),
+                 data=lambda t, n: {"product_id": t.products[0].id, "quantity": 1}),
+        Endpoint("order-remove-line", lambda t, n: f"/api/v2/orders/{t.order.id}/remove_line/", "post",
+                 data=lambda t, n: {"line_id": t.order.lines.first().id}),
+        # confirm sinh 1 Move / dòng: dùng đơn 2 dòng cố định, chỉ dữ liệu nền tăng
+        Endpoint("order-confirm", lambda t, n: f"/api/v2/orders/{t.small_order.id}/confirm/", "post", data={}),
+    ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("qc", password="x"))
+        self.wh = Warehouse.objects.create(code="QC", name="Kho QC")
+        self.order = StockOrder.objects.create(order_type="IN", to_wh=self.wh)
+        self.products, self.items, self.inventories, self.moves = [], [], [], []
+
+    def grow(self, n):
+        for i in range(len(self.products), n):
+            p = Product.objects.create(sku=f"QC-{i:03d}", name=f"SP {i}")
+            it = Item.objects.create(product=p, warehouse=self.wh, status="in_stock")
+            self.inventories.append(Inventory.objects.create(product=p, warehouse=self.wh, qty=10))
+            self.moves.append(Move.objects.create(item=it, action="IN", to_wh=self.wh))
+            StockOrderLine.objects.create(order=self.order, product=p, quantity=1)
+            StockOrderLine.objects.create(order=self.order, item=it)
+            StockOrder.objects.create(order_type="OUT", from_wh=self.wh, reference=f"QC-{i}")
+            self.products.append(p)
+            self.items.append(it)
+        self.small_order = StockOrder.objects.create(order_type="IN", to_wh=self.wh)
+        StockOrderLine.objects.create(order=self.small_order, product=self.products[0], quantity=1)
+        StockOrderLine.objects.create(order=self.small_order, product=self.products[1], quantity=1)
 
-# Create your tests here.
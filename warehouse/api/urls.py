@@ -1,8 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import (
+from inventory.views_api import StockOrderViewSet
+from .views_api import (
     ProductViewSet, WarehouseViewSet, ItemViewSet,
-    InventoryViewSet, MoveViewSet, StockOrderViewSet
+    InventoryViewSet, MoveViewSet,
 )
 
 router = DefaultRouter()
@@ -2,18 +2,20 @@
 from rest_framework import viewsets, mixins, status, permissions, filters
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.db import IntegrityError
 from django.db.models import Prefetch, Q, Sum
 
 from api.models import Product, Warehouse, Item, Inventory, Move
+from . import services
 from .serializers import (
     ProductSerializer, WarehouseSerializer,
-    ItemSerializer, ItemCreateBySkuSerializer,
+    ItemSerializer, ItemCreateBySkuSerializer, ItemBatchCreateBySkuSerializer,
     InventorySerializer,
     MoveSerializer, MoveCreateSerializer,
 )
 
-# class DefaultPerms(permissions.IsAuthenticatedOrReadOnly):
-#     pass
+class DefaultPerms(permissions.IsAuthenticatedOrReadOnly):
+    pass
 
 
 # ===== Catalog =====
@@ -63,11 +65,30 @@ class ItemViewSet(viewsets.ModelViewSet):
         POST /api/items/create-by-sku/
         body: { "sku": "...", "import_date": "YYYY-MM-DD", "mark_in": true, "to_wh_code": "HCM", "note": "" }
         """
-        ser = ItemCreateBySkuSerializer(data=request.data)
+        ser = ItemCreateBySkuSerializer(data=request.data, context={"request": request})
         ser.is_valid(raise_exception=True)
         item = ser.save()
         return Response(ItemSerializer(item).data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=["post"], url_path="create-by-sku/batch")
+    def create_by_sku_batch(self, request):
+        """
+        POST /api/v2/items/create-by-sku/batch/
+        body: { "items": [ {"sku": "...", "qty": 10, "import_date": "YYYY-MM-DD", "to_wh_code": "HCM"}, ... ],
+                "batch_id": "" }
+        -> barcodes theo đúng thứ tự dòng (mỗi dòng qty mã liên tiếp).
+        """
+        ser = ItemBatchCreateBySkuSerializer(data=request.data, context={"request": request})
+        ser.is_valid(raise_exception=True)
+        try:
+            items = ser.save()
+        except IntegrityError:
+            # request khác vừa cấp trùng seq (vd tạo lẻ cùng lúc) -> client gửi lại
+            return Response({"detail": "Trùng seq do tạo đồng thời, vui lòng thử lại."},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({"created": len(items), "barcodes": [it.barcode_text for it in items]},
+                        status=status.HTTP_201_CREATED)
+
 
 # ===== Inventory (read-only) =====
 class InventoryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -98,7 +119,7 @@ class MoveViewSet(viewsets.ModelViewSet):
     ordering_fields = ["created_at", "action"]
 
     def create(self, request, *args, **kwargs):
-        ser = MoveCreateSerializer(data=request.data)
+        ser = MoveCreateSerializer(data=request.data, context={"request": request})
         ser.is_valid(raise_exception=True)
         mv = ser.save()
         return Response(MoveSerializer(mv).data, status=status.HTTP_201_CREATED)
@@ -106,12 +127,26 @@ class MoveViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["post"], url_path="bulk")
     def bulk(self, request):
         """
-        POST /api/moves/bulk/
-        body: { "items": [ {MoveCreate payload}, ... ] }
+        POST /api/v2/moves/bulk/
+        body: { "items": [ {MoveCreate payload}, ... ], "mode": "atomic" | "partial", "batch_id": "" }
+        - atomic (mặc định): 1 dòng lỗi -> không ghi gì, trả 400 + danh sách lỗi theo index.
+        - partial: ghi các dòng hợp lệ, trả lỗi của các dòng còn lại.
         """
-        data = request.data.get("items") or []
-        out = []
-        for row in data:
-            s = MoveCreateSerializer(data=row); s.is_valid(raise_exception=True)
-            mv = s.save(); out.append(MoveSerializer(mv).data)
-        return Response({"created": len(out), "moves": out}, status=status.HTTP_201_CREATED)
+        rows = request.data.get("items") or []
+        mode = request.data.get("mode") or services.ATOMIC
+        if not isinstance(rows, list):
+            return Response({"detail": "items phải là danh sách."}, status=status.HTTP_400_BAD_REQUEST)
+        if mode not in services.MODES:
+            return Response({"detail": f"mode phải là một trong {services.MODES}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        res = services.ingest_moves(rows, mode=mode, user=request.user,
+                                    batch_id=str(request.data.get("batch_id") or "")[:32])
+        body = {
+            "mode": mode,
+            "created": len(res.moves),
+            "moves": MoveSerializer(res.moves, many=True).data,
+            "errors": res.errors,
+        }
+        ok = res.moves or not res.errors
+        return Response(body, status=status.HTTP_201_CREATED if ok else status.HTTP_400_BAD_REQUEST)
@@ -8,4 +8,14 @@ if [ "${COLLECT_STATIC:-0}" = "1" ]; then
   python manage.py collectstatic --noinput
 fi
 
+# "serve": gunicorn theo SERVER_MODE (asgi = uvicorn worker, mặc định; wsgi = sync worker như cũ)
+if [ "$1" = "serve" ]; then
+  shift
+  if [ "${SERVER_MODE:-asgi}" = "wsgi" ]; then
+    set -- gunicorn -w "${WEB_WORKERS:-3}" -b "0.0.0.0:${PORT:-8000}" "$@" warehouse.wsgi:application
+  else
+    set -- gunicorn -k uvicorn.workers.UvicornWorker -w "${WEB_WORKERS:-3}" -b "0.0.0.0:${PORT:-8000}" "$@" warehouse.asgi:application
+  fi
+fi
+
 exec "$@"
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Cache danh bạ user ecom-platform (id -> ExternalUser) đặt trước user_selector.
+
+- 2 tầng: LRU trong process (USER_DIRECTORY_LOCAL_TTL giây) -> Redis (CACHES, USER_DIRECTORY_TTL giây) -> DB.
+- get_many(ids, load): id thiếu ở cả 2 tầng gom lại tra bằng 1 lần load(ids) (1 query IN (...)).
+- Cache âm: id không có trong bảng user được nhớ là "không tồn tại" USER_DIRECTORY_MISS_TTL giây
+  (id rác / user đã xoá không gây query mỗi request). load() lỗi -> không cache gì.
+- Redis lỗi -> chỉ dùng LRU + DB, bỏ qua Redis USER_DIRECTORY_BACKOFF giây.
+- Không có tín hiệu khi bảng user bên ecom đổi: đổi role / email thấy được sau tối đa TTL; cần ngay -> invalidate(ids).
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "erp:user:v1:"
+MISS = "-"   # giá trị đánh dấu id không tồn tại (cache âm)
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def cache_key(user_id: int) -> str:
+    return f"{KEY_PREFIX}{user_id}"
+
+
+class _LRU:
+    """LRU có hạn theo từng entry (user thật và cache âm sống khác nhau)."""
+
+    def __init__(self):
+        self._data = OrderedDict()   # id -> (value, expires)
+        self._lock = threading.Lock()
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, object]:
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for i in ids:
+                hit = self._data.get(i)
+                if hit is None:
+                    continue
+                if now >= hit[1]:
+                    del self._data[i]
+                    continue
+                self._data.move_to_end(i)
+                out[i] = hit[0]
+        return out
+
+    def set_many(self, values: Dict[int, object], maxsize: int):
+        now = time.monotonic()
+        local_ttl = float(_conf("USER_DIRECTORY_LOCAL_TTL", 60))
+        miss_ttl = min(local_ttl, float(_conf("USER_DIRECTORY_MISS_TTL", 60)))
+        with self._lock:
+            for i, v in values.items():
+                self._data[i] = (v, now + (miss_ttl if v == MISS else local_ttl))
+                self._data.move_to_end(i)
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+
+    def delete_many(self, ids: Iterable[int]):
+        with self._lock:
+            for i in ids:
+                self._data.pop(i, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_lru = _LRU()
+_down_until = 0.0
+
+
+def _cache():
+    return caches[_conf("USER_DIRECTORY_CACHE_ALIAS", "default")]
+
+
+def _cache_available() -> bool:
+    return time.monotonic() >= _down_until
+
+
+def _mark_down(exc):
+    global _down_until
+    if _cache_available():
+        logger.warning("user directory cache unavailable, fallback to DB: %s", exc)
+    _down_until = time.monotonic() + float(_conf("USER_DIRECTORY_BACKOFF", 30))
+
+
+def _redis_get_many(ids: List[int]) -> Dict[int, object]:
+    if not ids or not _cache_available():
+        return {}
+    try:
+        found = _cache().get_many([cache_key(i) for i in ids])
+    except Exception as exc:
+        _mark_down(exc)
+        return {}
+    return {i: found[cache_key(i)] for i in ids if cache_key(i) in found}
+
+
+def _redis_set_many(values: Dict[int, object]):
+    if not values or not _cache_available():
+        return
+    hits = {cache_key(i): v for i, v in values.items() if v != MISS}
+    misses = {cache_key(i): MISS for i, v in values.items() if v == MISS}
+    try:
+        if hits:
+            _cache().set_many(hits, int(_conf("USER_DIRECTORY_TTL", 300)))
+        if misses:
+            _cache().set_many(misses, int(_conf("USER_DIRECTORY_MISS_TTL", 60)))
+    except Exception as exc:
+        _mark_down(exc)
+
+
+# ---------- API chính ----------
+def get_many(ids: Iterable[int], load: Callable[[List[int]], Dict[int, object]]) -> Dict[int, object]:
+    """
+    {id: user} cho các id có thật (id không tồn tại bị bỏ). ids đã chuẩn hoá về int.
+    load(ids_thiếu) -> {id: user}: chỉ gọi khi còn id chưa có ở LRU / Redis, tối đa 1 lần.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {}
+    maxsize = int(_conf("USER_DIRECTORY_MAXSIZE", 4096))
+    values = _lru.get_many(ids)
+
+    missing = [i for i in ids if i not in values]
+    if missing:
+        remote = _redis_get_many(missing)
+        if remote:
+            _lru.set_many(remote, maxsize)
+            values.update(remote)
+        missing = [i for i in missing if i not in remote]
+
+    if missing:
+        loaded = load(missing)
+        fresh = {i: loaded.get(i, MISS) for i in missing}
+        _lru.set_many(fresh, maxsize)
+        _redis_set_many(fresh)
+        values.update(fresh)
+
+    return {i: v for i, v in values.items() if v != MISS}
+
+
+def invalidate(ids: Iterable[int]):
+    # vẫn thử xoá Redis khi đang backoff: tránh giữ bản cũ nếu Redis vừa sống lại
+    ids = list(ids)
+    _lru.delete_many(ids)
+    try:
+        _cache().delete_many([cache_key(i) for i in ids])
+    except Exception as exc:
+        _mark_down(exc)
+
+
+def clear_local():
+    """Xoá LRU của process (Redis giữ nguyên, hết hạn theo TTL)."""
+    _lru.clear()
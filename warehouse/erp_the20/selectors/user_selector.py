@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Optional, Set, Dict, List
+from typing import Optional, Set, Dict, Iterable, List
 import logging
+import threading
+import time
 
-from django.db import connections, DatabaseError
+from django.conf import settings
+from django.db import connections, DatabaseError, ProgrammingError
+
+from erp_the20.selectors import user_directory
 
 logger = logging.getLogger(__name__)
 
@@ -50,63 +55,130 @@ def _pick(colnames: Set[str], candidates: List[str]) -> Optional[str]:
             return c
     return None
 
-# ========= SINGLE READ =========
+# ========= COLUMN MAPPING (cache theo process) =========
 
-def get_external_user(employee_id: int) -> Optional[ExternalUser]:
+@dataclass(frozen=True)
+class _Columns:
+    id: str
+    fullname: str
+    role: str
+    mail: str
+
+# {"value": _Columns | None, "expires": monotonic}; TTL = settings.ECOM_USER_COLUMNS_TTL
+_columns_cache = {"value": None, "expires": 0.0}
+_columns_lock = threading.Lock()
+
+def _resolve_columns(cols: Set[str]) -> Optional[_Columns]:
     """
-    Đọc (id, fullname, role, mail) từ ecom-platform (public.user),
-    tự dò tên cột phù hợp (fullname vs "FullName", role vs "Role", id vs "Id"/"ID", mail vs email/Gmail...).
+    Tự dò tên cột phù hợp (fullname vs "FullName", role vs "Role", id vs "Id"/"ID", mail vs email/Gmail...).
     """
-    try:
-        cols = _list_columns()
+    id_col       = _pick(cols, ["id", "Id", "ID"])
+    fullname_col = _pick(cols, ["fullname", "FullName", "full_name", "Full_Name", "name", "Name"])
+    role_col     = _pick(cols, ["role", "Role"])
+    mail_col     = _pick(cols, ["email", "Email", "EMAIL", "mail", "Mail", "MAIL", "gmail", "Gmail", "GMAIL", "user_email", "UserEmail", "userMail"])
 
-        id_col       = _pick(cols, ["id", "Id", "ID"])
-        fullname_col = _pick(cols, ["fullname", "FullName", "full_name", "Full_Name", "name", "Name"])
-        role_col     = _pick(cols, ["role", "Role"])
-        mail_col     = _pick(cols, ["email", "Email", "EMAIL", "mail", "Mail", "MAIL", "gmail", "Gmail", "GMAIL", "user_email", "UserEmail", "userMail"])
-
-        if not id_col:
-            logger.error("Cannot resolve ID column in external user table.")
-            return None
+    if not id_col:
+        logger.error("Cannot resolve ID column in external user table.")
+        return None
 
-        if not fullname_col:
-            logger.warning("Fullname column not found, default to first available column.")
-            fullname_col = "fullname" if "fullname" in cols else next(iter(cols))
+    if not fullname_col:
+        logger.warning("Fullname column not found, default to first available column.")
+        fullname_col = "fullname" if "fullname" in cols else next(iter(cols))
 
-        if not role_col:
-            logger.warning("Role column not found, default to first available column.")
-            role_col = "role" if "role" in cols else next(iter(cols))
+    if not role_col:
+        logger.warning("Role column not found, default to first available column.")
+        role_col = "role" if "role" in cols else next(iter(cols))
 
-        if not mail_col:
-            logger.warning("Mail column not found, default to first available column.")
-            mail_col = "email" if "email" in cols else next(iter(cols))
+    if not mail_col:
+        logger.warning("Mail column not found, default to first available column.")
+        mail_col = "email" if "email" in cols else next(iter(cols))
 
-        q_id       = _quote_ident(id_col)
-        q_fullname = _quote_ident(fullname_col)
-        q_role     = _quote_ident(role_col)
-        q_mail     = _quote_ident(mail_col)
+    return _Columns(id=id_col, fullname=fullname_col, role=role_col, mail=mail_col)
 
+def _columns(refresh: bool = False) -> Optional[_Columns]:
+    """
+    Mapping cột của bảng user: dò 1 lần (information_schema) rồi giữ trong process ECOM_USER_COLUMNS_TTL giây.
+    Không dò được (bảng trống / thiếu cột id) -> không cache, lần sau dò lại.
+    """
+    now = time.monotonic()
+    if not refresh and _columns_cache["value"] is not None and now < _columns_cache["expires"]:
+        return _columns_cache["value"]
+    with _columns_lock:
+        now = time.monotonic()
+        if not refresh and _columns_cache["value"] is not None and now < _columns_cache["expires"]:
+            return _columns_cache["value"]
+        mapping = _resolve_columns(_list_columns())
+        if mapping is not None and mapping != _columns_cache["value"]:
+            logger.info("External user columns resolved: %s", mapping)
+        _columns_cache["value"] = mapping
+        _columns_cache["expires"] = now + float(getattr(settings, "ECOM_USER_COLUMNS_TTL", 3600))
+        return mapping
+
+def clear_columns_cache() -> None:
+    with _columns_lock:
+        _columns_cache["value"] = None
+        _columns_cache["expires"] = 0.0
+
+def _select_users(where: str, params: tuple) -> List[ExternalUser]:
+    """
+    SELECT (id, fullname, role, mail) theo mapping đã cache.
+    Lỗi ProgrammingError (cột bị đổi tên / xoá: schema drift) -> dò lại mapping rồi thử lại 1 lần.
+    """
+    for attempt in (0, 1):
+        cols = _columns(refresh=attempt > 0)
+        if cols is None:
+            return []
+        q_id = _quote_ident(cols.id)
         sql = f"""
-            SELECT {q_id} AS id, {q_fullname} AS fullname, {q_role} AS role, {q_mail} AS mail
+            SELECT {q_id} AS id, {_quote_ident(cols.fullname)} AS fullname,
+                   {_quote_ident(cols.role)} AS role, {_quote_ident(cols.mail)} AS mail
             FROM {_table_ref()}
-            WHERE {q_id} = %s
-            LIMIT 1
+            WHERE {q_id} {where}
         """
-        with connections[ECOM_DB_ALIAS].cursor() as cur:
-            cur.execute(sql, (employee_id,))
-            row = cur.fetchone()
-            if not row:
-                return None
-            _id, fullname, role, mail = row
-            return ExternalUser(
-                id=int(_id),
-                fullname=str(fullname or ""),
-                role=str(role or ""),
-                mail=str(mail or ""),
-            )
-    except DatabaseError as e:
-        logger.exception("Query external user failed: %s", e)
+        try:
+            with connections[ECOM_DB_ALIAS].cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+        except ProgrammingError as e:
+            if attempt:
+                raise
+            logger.warning("External user query failed with cached columns %s, re-resolving: %s", cols, e)
+            continue
+        return [
+            ExternalUser(id=int(_id), fullname=str(fullname or ""), role=str(role or ""), mail=str(mail or ""))
+            for _id, fullname, role, mail in rows
+        ]
+    return []
+
+def warm_up(background: bool = True) -> None:
+    """
+    Dò sẵn mapping cột lúc khởi động worker (wsgi.py / asgi.py) để request đầu không phải chờ.
+    Chạy ở thread nền: DB ở xa chậm / lỗi không làm chậm khởi động, request đầu sẽ tự dò lại.
+    """
+    def run():
+        try:
+            _columns(refresh=True)
+        except DatabaseError as e:
+            logger.warning("Warm up external user columns failed: %s", e)
+        finally:
+            connections[ECOM_DB_ALIAS].close()   # connection của thread này (trả về pool)
+
+    if not getattr(settings, "ECOM_USER_WARM_ON_START", True):
+        return
+    if background:
+        threading.Thread(target=run, name="ecom-user-warm", daemon=True).start()
+    else:
+        run()
+
+# ========= SINGLE READ =========
+
+def get_external_user(employee_id: int) -> Optional[ExternalUser]:
+    """
+    Đọc (id, fullname, role, mail) từ ecom-platform (public.user) qua cache danh bạ (user_directory).
+    """
+    if not str(employee_id).isdigit():
         return None
+    return get_many([employee_id]).get(int(employee_id))
 
 def get_employee_role(employee_id: int) -> Optional[str]:
     u = get_external_user(employee_id)
@@ -132,46 +204,39 @@ def is_employee_manager(employee_id: int) -> bool:
 
 # ========= BATCH READ =========
 
-def get_external_users_map(employee_ids: List[int]) -> Dict[int, ExternalUser]:
+def _load_users(ids: List[int]) -> Dict[int, ExternalUser]:
+    placeholders = ",".join(["%s"] * len(ids))
+    return {u.id: u for u in _select_users(f"IN ({placeholders})", tuple(ids))}
+
+def get_many(employee_ids: Iterable) -> Dict[int, ExternalUser]:
     """
     Trả về dict {employee_id: ExternalUser}. Bỏ qua id không tồn tại.
-    Tối ưu 1 query thay vì gọi get_external_user() N lần.
+    Đọc qua cache danh bạ (LRU process + Redis); id chưa có trong cache tra bằng 1 query IN (...).
     """
-    ids = [int(i) for i in set(employee_ids or []) if str(i).isdigit()]
+    ids = [int(i) for i in dict.fromkeys(employee_ids or []) if str(i).isdigit()]
     if not ids:
         return {}
-
     try:
-        cols = _list_columns()
-        id_col       = _pick(cols, ["id", "Id", "ID"]) or "id"
-        fullname_col = _pick(cols, ["fullname", "FullName", "full_name", "Full_Name", "name", "Name"]) or "fullname"
-        role_col     = _pick(cols, ["role", "Role"]) or "role"
-        mail_col     = _pick(cols, ["email", "Email", "EMAIL", "mail", "Mail", "MAIL", "gmail", "Gmail", "GMAIL", "user_email", "UserEmail", "userMail"]) or "email"
-
-        q_id       = _quote_ident(id_col)
-        q_fullname = _quote_ident(fullname_col)
-        q_role     = _quote_ident(role_col)
-        q_mail     = _quote_ident(mail_col)
-
-        placeholders = ",".join(["%s"] * len(ids))
-        sql = f"""
-            SELECT {q_id} AS id, {q_fullname} AS fullname, {q_role} AS role, {q_mail} AS mail
-            FROM {_table_ref()}
-            WHERE {q_id} IN ({placeholders})
-        """
-
-        out: Dict[int, ExternalUser] = {}
-        with connections[ECOM_DB_ALIAS].cursor() as cur:
-            cur.execute(sql, tuple(ids))
-            for row in cur.fetchall():
-                _id, fullname, role, mail = row
-                out[int(_id)] = ExternalUser(
-                    id=int(_id),
-                    fullname=str(fullname or ""),
-                    role=str(role or ""),
-                    mail=str(mail or ""),
-                )
-        return out
+        return user_directory.get_many(ids, _load_users)
     except DatabaseError as e:
         logger.warning("Batch external user query failed: %s", e)
         return {}
+
+def get_external_users_map(employee_ids: List[int]) -> Dict[int, ExternalUser]:
+    """Tên cũ của get_many()."""
+    return get_many(employee_ids)
+
+def prefetch(employee_ids: Iterable) -> None:
+    """
+    Nạp trước các user 1 request sẽ cần (actor, người nhận, người duyệt...) bằng 1 query:
+    các lệnh tra lẻ sau đó (is_employee_manager, get_employee_email...) đọc từ cache.
+    """
+    get_many(employee_ids)
+
+def invalidate(employee_ids: Iterable) -> None:
+    user_directory.invalidate(int(i) for i in employee_ids if str(i).isdigit())
+
+def clear_cache() -> None:
+    """Xoá mapping cột + LRU danh bạ của process (test / sau khi đổi dữ liệu bên ecom)."""
+    clear_columns_cache()
+    user_directory.clear_local()
@@ -497,7 +497,16 @@ def batch_decide_attendance(
         except Exception as e:
             errors.append({"index": idx, "id": it.get("id"), "error": str(e)})
 
-    # Notify theo công tắc
+    notify_batch_decided(manager_user_id=manager_user_id, updated=updated,
+                         send_email=send_email, send_lark=send_lark)
+    return updated, []
+
+
+def notify_batch_decided(*, manager_user_id: int, updated: List[Attendance],
+                         send_email: bool = True, send_lark: bool = True) -> None:
+    """Email/Lark cho các ca vừa duyệt (tách khỏi batch_decide_attendance để view async chạy ở pool I/O)."""
+    if not (send_email or send_lark):
+        return
     try:
         approved_by_emp: Dict[int, List[Attendance]] = {}
         for a in updated:
@@ -563,5 +572,3 @@ def batch_decide_attendance(
                                 "SENT" if ok_mail else "FAILED", emp_id, len(atts))
     except Exception as ex:
         logger.exception("[attendance] Notify exception (batch-decide): %s", ex)
-
-    return updated, []
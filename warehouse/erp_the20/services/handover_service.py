@@ -12,9 +12,10 @@ except Exception:
         return None
 
 try:
-    from erp_the20.selectors.user_selector import get_employee_fullname
+    from erp_the20.selectors.user_selector import get_employee_fullname, prefetch
 except Exception:
     def get_employee_fullname(_): return None
+    def prefetch(_): return None
 
 def _name(uid: Optional[int]) -> str:
     if not uid:
@@ -40,6 +41,7 @@ def open_handover(
     receiver_employee_id: Optional[int] = None,
     due_date=None,
     note: str = "",
+    send_notify: bool = True,
 ) -> Handover:
     h = repo.create_handover(
         employee_id=employee_id,
@@ -48,15 +50,21 @@ def open_handover(
         due_date=due_date,
         note=note,
     )
+    if send_notify:
+        notify_opened(h)
+    return h
 
+def notify_opened(h: Handover) -> None:
+    employee_id, manager_id, receiver_employee_id = h.employee_id, h.manager_id, h.receiver_employee_id
+    prefetch(_join_ids(employee_id, manager_id, receiver_employee_id))   # tên + email người nhận: 1 query
     title = f"📦 Mở bàn giao #{h.id} cho {_name(employee_id)}"
     subject = f"[Handover] Mở bàn giao #{h.id} cho {_name(employee_id)}"
     body = (
         f"Employee : {_name(employee_id)} (#{employee_id})\n"
         f"Manager  : {_name(manager_id) or '-'}\n"
         f"Receiver : {_name(receiver_employee_id) or '-'}\n"
-        f"Due date : {due_date or '-'}\n"
-        f"Note     : {note or '-'}"
+        f"Due date : {h.due_date or '-'}\n"
+        f"Note     : {h.note or '-'}"
     )
     recipients = _join_ids(manager_id, receiver_employee_id)
 
@@ -73,16 +81,23 @@ def open_handover(
         send_email=True,
         send_lark=True,
     )
-    return h
 
 def add_item(
     handover_id: int,
     title: str,
     detail: str = "",
-    assignee_id: Optional[int] = None
+    assignee_id: Optional[int] = None,
+    send_notify: bool = True,
 ) -> HandoverItem:
     it = repo.add_item(handover_id, title=title, detail=detail, assignee_id=assignee_id)
-    ho = repo.get_handover(handover_id)
+    if send_notify:
+        notify_item_added(it)
+    return it
+
+def notify_item_added(it: HandoverItem) -> None:
+    ho = repo.get_handover(it.handover_id)
+    title, detail, assignee_id = it.title, it.detail, it.assignee_id
+    prefetch(_join_ids(ho.employee_id, ho.manager_id, assignee_id))
 
     n_title = f"🆕 Handover item #{it.id} — {title}"
     n_subject = f"[Handover] Item mới #{it.id} — {title}"
@@ -109,7 +124,6 @@ def add_item(
         send_email=True,
         send_lark=True,
     )
-    return it
 
 def set_item_status(item_id: int, status: int) -> HandoverItem:
     it = repo.set_item_status(item_id, status)
@@ -17,11 +17,12 @@ from django.conf import settings
 
 # Optional: map thông tin user
 try:
-    from erp_the20.selectors.user_selector import get_employee_email, get_employee_fullname, is_employee_manager
+    from erp_the20.selectors.user_selector import get_employee_email, get_employee_fullname, is_employee_manager, prefetch
 except Exception:
     def get_employee_email(_): return None
     def get_employee_fullname(_): return None
     def is_employee_manager(_): return False
+    def prefetch(_): return None
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +34,7 @@ APPROVABLE_OFF_TYPES = {
 }
 
 def _notify_manager_new_leave(leave: LeaveRequest, manager_id: int, *, send_email: bool, send_lark: bool) -> None:
+    prefetch([manager_id, leave.employee_id])   # email quản lý + tên nhân viên: 1 query
     email = get_employee_email(manager_id)
     name_emp = get_employee_fullname(leave.employee_id) or f"Emp#{leave.employee_id}"
     subject = f"[Leave] New request from {name_emp}"
@@ -133,6 +135,23 @@ def _notify_employee_decision(leave: LeaveRequest, manager_id: int, *, send_emai
             to_lark_user_id=at_uid or "",
         )
 
+# Gửi thông báo tách riêng để view async chạy phần ghi DB và phần email/Lark ở 2 pool khác nhau
+def notify_new_leave(leave: LeaveRequest, manager_id: int, *, send_email: bool = True, send_lark: bool = True) -> None:
+    if not (send_email or send_lark):
+        return
+    try:
+        _notify_manager_new_leave(leave, manager_id, send_email=send_email, send_lark=send_lark)
+    except Exception as ex:
+        logger.warning("[leave] notify manager failed: %s", ex)
+
+def notify_decision(leave: LeaveRequest, manager_id: int, *, send_email: bool = True, send_lark: bool = True) -> None:
+    if not (send_email or send_lark):
+        return
+    try:
+        _notify_employee_decision(leave, manager_id=manager_id, send_email=send_email, send_lark=send_lark)
+    except Exception as ex:
+        logger.warning("[leave] notify employee decision failed: %s", ex)
+
 def create_leave(
     *, employee_id: int, manager_id: int, leave_type: int, start_date, end_date,
     paid: bool = False, hours: Optional[float] = None, reason: str = "",
@@ -159,10 +178,7 @@ def create_leave(
         "handover_content": handover_content or None,
     })
 
-    try:
-        _notify_manager_new_leave(obj, manager_id, send_email=send_email, send_lark=send_lark)
-    except Exception as ex:
-        logger.warning("[leave] notify manager failed: %s", ex)
+    notify_new_leave(obj, manager_id, send_email=send_email, send_lark=send_lark)
     return obj
 
 def update_leave(*, leave_id: int, employee_id: int, **changes: Any) -> LeaveRequest:
@@ -217,9 +233,5 @@ def manager_decide(*, leave_id: int, manager_id: int, approve: bool,
     else:
         obj = repo.reject(leave_id=leave_id, manager_id=manager_id)
 
-    try:
-        _notify_employee_decision(obj, manager_id=manager_id, send_email=send_email, send_lark=send_lark)
-    except Exception as ex:
-        logger.warning("[leave] notify employee decision failed: %s", ex)
-
+    notify_decision(obj, manager_id, send_email=send_email, send_lark=send_lark)
     return obj
@@ -11,10 +11,11 @@ from erp_the20.utils.notify import send_email_notification, send_lark_notificati
 
 # Optional user info resolvers
 try:
-    from erp_the20.selectors.user_selector import get_employee_email, get_employee_fullname
+    from erp_the20.selectors.user_selector import get_employee_email, get_employee_fullname, get_external_users_map
 except Exception:
     def get_employee_email(_): return None
     def get_employee_fullname(_): return None
+    def get_external_users_map(_): return {}
 
 log = logging.getLogger(__name__)
 
@@ -27,9 +28,13 @@ def _coalesce(*vals):
 
 
 def _emails_from_user_ids(user_ids: Iterable[int]) -> List[str]:
+    # 1 query cho cả danh sách người nhận (không gọi get_employee_email từng người)
+    user_ids = list(user_ids or [])
+    umap = get_external_users_map(user_ids) if user_ids else {}
     out: List[str] = []
-    for uid in user_ids or []:
-        mail = get_employee_email(uid)
+    for uid in user_ids:
+        u = umap.get(int(uid)) if str(uid).isdigit() else None
+        mail = (u.mail or "").strip() if u else ""
         if mail:
             out.append(mail)
     return list(dict.fromkeys(out))
@@ -9,10 +9,11 @@ from erp_the20.services.notification_service import (
 
 # Optional helpers
 try:
-    from erp_the20.selectors.user_selector import get_employee_email, get_employee_fullname
+    from erp_the20.selectors.user_selector import get_employee_email, get_employee_fullname, prefetch
 except Exception:
     def get_employee_email(_): return None
     def get_employee_fullname(_): return None
+    def prefetch(_): return None
 
 def submit(
     employee_id: int,
@@ -30,6 +31,7 @@ def submit(
     )
 
     if manager_id:
+        prefetch([employee_id, manager_id])   # tên NV + email quản lý (notify): 1 query
         emp_name = get_employee_fullname(employee_id) or f"Emp#{employee_id}"
         subject = f"[Proposal] {emp_name} — {title}"
         text = (
@@ -0,0 +1,114 @@
+from datetime import date, time
+from unittest import mock
+
+from django.db import connections
+from django.test import TestCase
+
+from erp_the20.models import (
+    Attendance, Department, EmployeeProfile, Handover, LeaveRequest, Notification, Position, Proposal, ShiftTemplate,
+)
+from erp_the20.selectors import user_selector
+from tests.querycount import Endpoint, QueryCountMixin
+
+MANAGER_ID = 1
+WORKFLOW = "ghi theo luồng duyệt (1 bản ghi / request), đã có test service riêng"
+
+
+class ErpQueryCountTests(QueryCountMixin, TestCase):
+    """
+    Mọi route của erp_the20/urls: số query (erp_postgres + ecom_platform) không đổi khi dữ liệu tăng.
+    Bảng user của ecom-platform được tạo tạm trong DB test ecom_platform.
+    """
+    databases = {"default", "erp_postgres", "ecom_platform"}
+    URLCONF = "erp_the20.urls"
+    COUNT_ALIASES = ("default", "erp_postgres", "ecom_platform")
+    EXEMPT = {
+        "attendance-batch-decide": WORKFLOW,
+        "attendance-batch-register": WORKFLOW,
+        "attendance-approve-or-reject": WORKFLOW,
+        "attendance-cancel": WORKFLOW,
+        "attendance-manager-cancel": WORKFLOW,
+        "attendance-restore": WORKFLOW,
+        "attendance-shift-options": "tính theo lịch ca của 1 nhân viên, không duyệt danh sách",
+        "leave-requests-list": WORKFLOW,
+        "leave-requests-cancel": WORKFLOW,
+        "leave-requests-decide": WORKFLOW,
+        "proposals-approve": WORKFLOW,
+        "proposals-reject": WORKFLOW,
+        "proposals-set-note": WORKFLOW,
+        "handover-add-item": WORKFLOW,
+        "handover_item_set_status": WORKFLOW,
+    }
+    ENDPOINTS = [
+        Endpoint("shift-templates-ui", "/the20/shift-templates/"),
+        Endpoint("attendance-templates-ui", "/the20/attendance_ui/"),
+        Endpoint("leave-employee-ui", "/the20/leave/employee/"),
+        Endpoint("leave-manager-ui", "/the20/leave/manager/"),
+        Endpoint("notification-ui", "/the20/ui/notifications/"),
+        Endpoint("profile-ui", "/the20/ui/profile/"),
+        Endpoint("proposal-ui", "/the20/ui/proposals/"),
+        Endpoint("handover-ui", "/the20/ui/handovers/"),
+        Endpoint("api-root", "/the20/attendance/"),
+        Endpoint("department-list-create", "/the20/departments/"),
+        Endpoint("department-detail", lambda t, n: f"/the20/departments/{t.dept.id}/"),
+        Endpoint("position-list-create", "/the20/positions/"),
+        Endpoint("position-detail", lambda t, n: f"/the20/positions/{t.pos.id}/"),
+        Endpoint("shift-template-list", "/the20/shifts/templates/"),
+        Endpoint("shift-template-detail", lambda t, n: f"/the20/shifts/templates/{t.shift.id}/"),
+        Endpoint("attendance-list", "/the20/attendance/"),
+        Endpoint("attendance-detail", lambda t, n: f"/the20/attendance/{t.attendance.id}/"),
+        Endpoint("attendance-search", "/the20/attendance/search/"),
+        Endpoint("attendance-my-pending", "/the20/attendance/my-pending/?employee_id=2"),
+        Endpoint("attendance-manager-pending", f"/the20/attendance/pending/?manager_id={MANAGER_ID}"),
+        # quyền của người chấm + tên trong response: 1 query ecom cho cả request (cache danh bạ)
+        Endpoint("attendance-punch", lambda t, n: f"/the20/attendance/{t.attendance.id}/punch/", "post",
+                 data=lambda t, n: {"employee_id": MANAGER_ID, "kind": "in"}),
+        Endpoint("leave-requests-detail", lambda t, n: f"/the20/leave/requests/{t.leave.id}/"),
+        Endpoint("leave-requests-my-leaves", "/the20/leave/requests/my/?employee_id=2"),
+        Endpoint("leave-requests-pending", f"/the20/leave/requests/pending/?manager_id={MANAGER_ID}"),
+        Endpoint("leave-requests-search", f"/the20/leave/requests/search/?manager_id={MANAGER_ID}"),
+        Endpoint("notifications-list", "/the20/notifications/"),
+        # gửi cho n người nhận kèm email: tra email cả danh sách bằng 1 query
+        Endpoint("notifications-send", "/the20/notifications/send/", "post", status=(201,),
+                 data=lambda t, n: {"title": "QC", "recipients": list(range(1, n + 1)), "send_email": True}),
+        Endpoint("proposals-list", "/the20/proposals/"),
+        Endpoint("proposals-detail", lambda t, n: f"/the20/proposals/{t.proposal.id}/"),
+        Endpoint("-list", "/the20/profile/"),
+        Endpoint("-detail", lambda t, n: f"/the20/profile/{t.profile.id}/"),
+        Endpoint("handover-list", "/the20/handover/"),
+        Endpoint("handover-detail", lambda t, n: f"/the20/handover/{t.handover.id}/"),
+    ]
+
+    def setUp(self):
+        with connections["ecom_platform"].cursor() as cur:
+            cur.execute('CREATE TABLE IF NOT EXISTS "public"."user" '
+                        '(id integer PRIMARY KEY, fullname varchar(200), role varchar(50), email varchar(254))')
+        patcher = mock.patch("erp_the20.services.notification_service.send_email_notification")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dept = Department.objects.create(code="QC", name="QC")
+        self.pos = Position.objects.create(code="QC", name="QC")
+        self.shift = ShiftTemplate.objects.create(code="QC", name="QC", start_time=time(8), end_time=time(17))
+        self.size = 0
+
+    def reset_state(self):
+        super().reset_state()
+        user_selector.clear_cache()   # lần đo nào cũng dò lại cột + tra lại danh bạ -> 2 cỡ dữ liệu so sánh được
+
+    def grow(self, n):
+        with connections["ecom_platform"].cursor() as cur:
+            for uid in range(self.size + 1, n + 2):
+                cur.execute('INSERT INTO "public"."user" (id, fullname, role, email) VALUES (%s, %s, %s, %s)',
+                            (uid, f"NV {uid}", "admin" if uid == MANAGER_ID else "staff", f"nv{uid}@example.com"))
+        for i in range(self.size, n):
+            emp = i + 2
+            self.attendance = Attendance.objects.create(employee_id=emp, shift_template=self.shift,
+                                                        date=date(2026, 1, 1 + i % 28))
+            self.leave = LeaveRequest.objects.create(employee_id=emp, start_date=date(2026, 2, 1),
+                                                     end_date=date(2026, 2, 2), leave_type=0,
+                                                     handover_to_employee_id=MANAGER_ID)
+            Notification.objects.create(title=f"QC {i}", to_user=emp, recipients=[emp, MANAGER_ID])
+            self.proposal = Proposal.objects.create(employee_id=emp, manager_id=MANAGER_ID, type=2, title=f"QC {i}")
+            self.profile = EmployeeProfile.objects.create(user_id=emp, full_name=f"NV {emp}")
+            self.handover = Handover.objects.create(employee_id=emp, manager_id=MANAGER_ID)
+        self.size = n
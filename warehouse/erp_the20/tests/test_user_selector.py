@@ -0,0 +1,115 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import OperationalError, ProgrammingError
+from django.test import SimpleTestCase, override_settings
+
+from erp_the20.selectors import user_selector
+
+
+class FakeCursor:
+    """Giả bảng "public"."user" chỉ có user id 7; ghi lại SQL đã chạy."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self.db.sql.append(sql)
+        if self.db.down:
+            raise OperationalError("server closed the connection unexpectedly")
+        if "information_schema" in sql:
+            self.rows = [(c,) for c in self.db.columns]
+        elif any(f'"{c}"' in sql or f" {c} AS" in sql for c in self.db.removed):
+            raise ProgrammingError("column does not exist")
+        else:
+            self.rows = [(i, "Nguyen Van A", "Admin", "a@example.com") for i in params if i == 7]
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeDb:
+    def __init__(self, columns):
+        self.columns = set(columns)
+        self.removed = set()
+        self.down = False
+        self.sql = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def introspections(self):
+        return sum("information_schema" in s for s in self.sql)
+
+    def lookups(self):
+        return len(self.sql) - self.introspections()
+
+
+class FakeEcomTestCase(SimpleTestCase):
+
+    def setUp(self):
+        user_selector.clear_cache()
+        self.addCleanup(user_selector.clear_cache)
+        cache.clear()
+        self.db = FakeDb({"id", "fullname", "role", "email"})
+        patcher = mock.patch.object(user_selector, "connections", {user_selector.ECOM_DB_ALIAS: self.db})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class ColumnCacheTests(FakeEcomTestCase):
+
+    def test_columns_resolved_once_per_process(self):
+        self.assertEqual(user_selector.get_employee_email(7), "a@example.com")
+        self.assertEqual(user_selector.get_employee_fullname(7), "Nguyen Van A")
+        self.assertEqual(set(user_selector.get_external_users_map([7, 8])), {7})
+        self.assertEqual((self.db.introspections(), len(self.db.sql)), (1, 4))
+
+    def test_schema_drift_triggers_refresh(self):
+        self.assertTrue(user_selector.is_employee_manager(7))
+        self.db.columns = {"id", "FullName", "role", "email"}
+        self.db.removed = {"fullname"}
+        self.assertEqual(user_selector.get_employee_fullname(7), "Nguyen Van A")
+        self.assertEqual(self.db.introspections(), 2)
+        self.assertIn('"FullName"', self.db.sql[-1])
+
+    @mock.patch.object(user_selector.settings, "ECOM_USER_COLUMNS_TTL", 0, create=True)
+    def test_ttl_expiry_re_resolves(self):
+        user_selector.get_external_user(7)
+        user_selector.get_external_user(7)
+        self.assertEqual(self.db.introspections(), 2)
+
+
+@override_settings(USER_DIRECTORY_TTL=300, USER_DIRECTORY_LOCAL_TTL=60, USER_DIRECTORY_MISS_TTL=60)
+class DirectoryCacheTests(FakeEcomTestCase):
+
+    def test_punch_lookups_cost_one_query(self):
+        user_selector.prefetch([7, 7, 8, None])
+        self.assertTrue(user_selector.is_employee_manager(7))
+        self.assertTrue(user_selector.is_employee_manager(7))
+        self.assertEqual(user_selector.get_employee_email(7), "a@example.com")
+        self.assertIsNone(user_selector.get_employee_fullname(8))   # cache âm
+        self.assertEqual(self.db.lookups(), 1)
+
+    def test_get_many_only_queries_missing_ids(self):
+        self.assertEqual(set(user_selector.get_many([7])), {7})
+        self.assertEqual(set(user_selector.get_many([7, 8, 9])), {7})
+        self.assertIn("IN (%s,%s)", self.db.sql[-1])
+        user_selector.clear_cache()   # LRU process trống: đọc lại từ Redis, không query
+        self.assertEqual(set(user_selector.get_many([7, 8, 9])), {7})
+        self.assertEqual(self.db.lookups(), 2)
+
+    def test_failed_lookup_is_not_cached(self):
+        user_selector.get_many([7])
+        self.db.down = True
+        self.assertEqual(user_selector.get_many([8]), {})
+        self.db.down = False
+        self.assertEqual(user_selector.get_employee_fullname(8), None)
+        self.assertEqual(user_selector.get_employee_fullname(7), "Nguyen Van A")
+        self.assertEqual(self.db.lookups(), 3)
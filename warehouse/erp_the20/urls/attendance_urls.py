@@ -1,10 +1,18 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from erp_the20.views import async_view
 from erp_the20.views.attendance_view import AttendanceViewSet
 
 router = DefaultRouter()
 router.register(r"", AttendanceViewSet, basename="attendance")  # <-- root, KHÔNG 'attendance'
 
-urlpatterns = [
+urlpatterns = []
+if getattr(settings, "ASYNC_VIEWS", True):
+    # bản async cùng URL, đứng trước route DRF
+    urlpatterns += [
+        path("batch-decide/", async_view.attendance_batch_decide_view, name="attendance-batch-decide"),
+    ]
+urlpatterns += [
     path("", include(router.urls)),
 ]
@@ -1,11 +1,20 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from erp_the20.views import async_view
 from erp_the20.views.handover_view import HandoverViewSet, HandoverItemViewSet
 
 router = DefaultRouter()
 router.register(r"", HandoverViewSet, basename="handover")
 
-urlpatterns = [
+urlpatterns = []
+if getattr(settings, "ASYNC_VIEWS", True):
+    # bản async cùng URL, đứng trước route DRF (method khác vẫn về ViewSet)
+    urlpatterns += [
+        path("", async_view.handover_list_view, name="handover-list"),
+        path("<int:pk>/add_item/", async_view.handover_add_item_view, name="handover-add-item"),
+    ]
+urlpatterns += [
     path("", include(router.urls)),
     path(
         "items/set-status/",
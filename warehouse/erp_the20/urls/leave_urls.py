@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from erp_the20.views import async_view
 from erp_the20.views.leave_view import LeaveRequestViewSet
 
 app_name = "leave"
@@ -9,6 +11,13 @@ app_name = "leave"
 router = DefaultRouter()
 router.register(r"requests", LeaveRequestViewSet, basename="leave-requests")
 
-urlpatterns = [
+urlpatterns = []
+if getattr(settings, "ASYNC_VIEWS", True):
+    # bản async cùng URL, đứng trước route DRF (method khác vẫn về ViewSet)
+    urlpatterns += [
+        path("requests/", async_view.leave_list_view, name="leave-requests-list"),
+        path("requests/<int:pk>/decide/", async_view.leave_decide_view, name="leave-requests-decide"),
+    ]
+urlpatterns += [
     path("", include(router.urls)),
 ]
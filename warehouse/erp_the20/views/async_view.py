@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Bản async của các endpoint nặng thông báo / tra cứu ngoài (chạy dưới ASGI, xem warehouse/aio.py):
+  POST /leave/requests/, PUT /leave/requests/<pk>/decide/, PUT /attendance/batch-decide/,
+  POST /handover/, POST /handover/<pk>/add_item/
+Cùng URL, cùng payload / response với ViewSet DRF. Ghi DB + tra user ở pool "db",
+email/Lark ở pool "io" (chạy song song với bước tra user) -> không giữ worker trong lúc chờ mạng.
+Method khác hoặc body không phải JSON hợp lệ -> chuyển nguyên cho view DRF (chạy ở pool "db").
+Tắt bằng ASYNC_VIEWS = False (urls chỉ còn route DRF).
+"""
+from __future__ import annotations
+import asyncio
+import json
+
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from erp_the20.serializers.attendance_serializer import AttendanceReadSerializer, BatchDecisionSerializer
+from erp_the20.serializers.handover_serializer import HandoverItemSerializer, HandoverSerializer
+from erp_the20.serializers.leave_serializer import (
+    LeaveCreateSerializer,
+    LeaveManagerDecisionSerializer,
+    LeaveRequestReadSerializer,
+)
+from erp_the20.services import attendance_service, handover_service, leave_service
+from erp_the20.views.attendance_view import AttendanceViewSet, _build_users_map_from_objs
+from erp_the20.views.handover_view import HandoverViewSet
+from erp_the20.views.leave_view import LeaveRequestViewSet, get_external_users_map, is_employee_manager
+from warehouse import aio
+
+
+def _to_bool(v):
+    if isinstance(v, bool): return v
+    if isinstance(v, str): return v.strip().lower() in ("1","true","yes","y","on")
+    if isinstance(v, (int,float)): return bool(v)
+    return False
+
+
+def _json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type="application/json")
+
+
+def _payload(request):
+    """dict từ body JSON; None nếu không phải JSON object (để view DRF tự parse / báo lỗi như cũ)."""
+    if request.content_type != "application/json":
+        return None
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _render_drf(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if hasattr(response, "render"):
+        response.render()
+    return response
+
+
+def async_route(drf_view, **handlers):
+    """
+    handlers: {method thường: async fn(request, data, **kwargs)}; còn lại -> drf_view.
+    drf_view là ViewSet.as_view(...) của đúng route đó (giữ OPTIONS / 405 / lỗi parse của DRF).
+    """
+    async def view(request, *args, **kwargs):
+        handler = handlers.get(request.method.lower())
+        data = _payload(request) if handler is not None else None
+        if data is None:
+            return await aio.run_db(_render_drf, drf_view, request, *args, **kwargs)
+        return await handler(request, data, *args, **kwargs)
+    view.csrf_exempt = True   # như view DRF; csrf_exempt() của Django 4.2 bọc thành hàm sync
+    return view
+
+
+def _leave_user_ids(obj):
+    return [obj.employee_id, getattr(obj, "handover_to_employee_id", None)]
+
+
+# ---------- Leave ----------
+async def leave_create(request, data):
+    ser = LeaveCreateSerializer(data=data)
+    if not ser.is_valid():
+        return _json(ser.errors, status=400)
+    vd = ser.validated_data
+    try:
+        obj = await aio.run_db(leave_service.create_leave, **vd, send_email=False, send_lark=False)
+    except Exception as e:
+        return _json({"detail": str(e)}, status=400)
+    umap, _ = await asyncio.gather(
+        aio.run_db(get_external_users_map, _leave_user_ids(obj)),
+        aio.run_io(leave_service.notify_new_leave, obj, vd["manager_id"],
+                   send_email=_to_bool(data.get("send_email", True)),
+                   send_lark=_to_bool(data.get("send_lark", True))),
+    )
+    return _json(LeaveRequestReadSerializer(obj, context={"user_map": umap}).data, status=201)
+
+
+async def leave_decide(request, data, pk):
+    ser = LeaveManagerDecisionSerializer(data=data)
+    if not ser.is_valid():
+        return _json(ser.errors, status=400)
+    manager_id = ser.validated_data["manager_id"]
+    approve = ser.validated_data["approve"]
+    if not await aio.run_db(is_employee_manager, manager_id):
+        return _json({"detail": "Manager privilege required."}, status=403)
+    try:
+        obj = await aio.run_db(leave_service.manager_decide, leave_id=int(pk), manager_id=manager_id,
+                               approve=approve, send_email=False, send_lark=False)
+    except Exception as e:
+        return _json({"detail": str(e)}, status=400)
+    umap, _ = await asyncio.gather(
+        aio.run_db(get_external_users_map, _leave_user_ids(obj)),
+        aio.run_io(leave_service.notify_decision, obj, manager_id,
+                   send_email=_to_bool(data.get("send_email", True)),
+                   send_lark=_to_bool(data.get("send_lark", True))),
+    )
+    return _json(LeaveRequestReadSerializer(obj, context={"user_map": umap}).data)
+
+
+# ---------- Attendance ----------
+def _attendance_payload(updated, errors):
+    return {
+        "updated": AttendanceReadSerializer(
+            updated, many=True, context={"users_map": _build_users_map_from_objs(updated)}
+        ).data,
+        "errors": errors,
+    }
+
+
+async def attendance_batch_decide(request, data):
+    ser = BatchDecisionSerializer(data=data)
+    if not ser.is_valid():
+        return _json(ser.errors, status=400)
+    manager_id = ser.validated_data["manager_id"]
+    if not await aio.run_db(is_employee_manager, manager_id):
+        return _json({"detail": "Manager privilege required."}, status=403)
+    updated, errors = await aio.run_db(attendance_service.batch_decide_attendance, manager_user_id=manager_id,
+                                       items=ser.validated_data["items"], send_email=False, send_lark=False)
+    # serializer đọc shift_template (FK) -> chạy ở pool db cùng bước tra user
+    payload, _ = await asyncio.gather(
+        aio.run_db(_attendance_payload, updated, errors),
+        aio.run_io(attendance_service.notify_batch_decided, manager_user_id=manager_id, updated=updated,
+                   send_email=_to_bool(data.get("send_email", True)),
+                   send_lark=_to_bool(data.get("send_lark", True))),
+    )
+    return _json(payload)
+
+
+# ---------- Handover ----------
+def _handover_data(ho):
+    return HandoverSerializer(ho).data
+
+
+async def handover_create(request, d):
+    ho = await aio.run_db(
+        handover_service.open_handover,
+        employee_id=int(d["employee_id"]),
+        manager_id=int(d["manager_id"]) if d.get("manager_id") else None,
+        receiver_employee_id=int(d["receiver_employee_id"]) if d.get("receiver_employee_id") else None,
+        due_date=d.get("due_date"),
+        note=d.get("note", ""),
+        send_notify=False,
+    )
+    data, _ = await asyncio.gather(
+        aio.run_db(_handover_data, ho),
+        aio.run_io(handover_service.notify_opened, ho),
+    )
+    return _json(data, status=201)
+
+
+async def handover_add_item(request, d, pk):
+    it = await aio.run_db(
+        handover_service.add_item,
+        int(pk),
+        title=d["title"],
+        detail=d.get("detail", ""),
+        assignee_id=int(d["assignee_id"]) if d.get("assignee_id") else None,
+        send_notify=False,
+    )
+    await aio.run_io(handover_service.notify_item_added, it)
+    return _json(HandoverItemSerializer(it).data, status=201)
+
+
+leave_list_view = async_route(LeaveRequestViewSet.as_view({"get": "list", "post": "create"}), post=leave_create)
+leave_decide_view = async_route(LeaveRequestViewSet.as_view({"put": "decide"}), put=leave_decide)
+attendance_batch_decide_view = async_route(AttendanceViewSet.as_view({"put": "batch_decide"}),
+                                           put=attendance_batch_decide)
+handover_list_view = async_route(HandoverViewSet.as_view({"get": "list", "post": "create"}), post=handover_create)
+handover_add_item_view = async_route(HandoverViewSet.as_view({"post": "add_item"}), post=handover_add_item)
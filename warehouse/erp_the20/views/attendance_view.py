@@ -32,6 +32,7 @@ from erp_the20.selectors.attendance_selector import (
 from erp_the20.selectors.user_selector import (
     is_employee_manager,
     get_external_users_map,
+    prefetch as prefetch_users,
 )
 from erp_the20.serializers.attendance_serializer import (
     ApproveDecisionSerializer,
@@ -621,6 +622,8 @@ class AttendanceViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
         data = ser.validated_data
 
         obj = get_object_or_404(Attendance, id=pk)
+        # 1 query ecom cho cả request: quyền của actor (2 lần) + tên trong response đọc từ cache danh bạ
+        prefetch_users([data["employee_id"], obj.employee_id, obj.requested_by, obj.approved_by])
         if int(obj.employee_id) != int(data["employee_id"]) and not is_employee_manager(int(data["employee_id"])):
             return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
 
@@ -48,16 +48,12 @@ PAGE_PARAMS = [
     OpenApiParameter("page_size", OpenApiTypes.INT, OpenApiParameter.QUERY, required=False, description="Kích thước trang (mặc định 20, tối đa 200)"),
 ]
 
-def _build_user_map_for_qs(qs) -> dict:
-    ids = set(qs.values_list("employee_id", flat=True).distinct())
-    # include cả người nhận bàn giao nếu có
-    try:
-        handover_ids = qs.values_list("handover_to_employee_id", flat=True).distinct()
-        for x in handover_ids:
-            if x:
-                ids.add(x)
-    except Exception:
-        pass
+def _build_user_map_for_rows(rows) -> dict:
+    # chỉ user của các dòng sắp trả về (trang hiện tại), kể cả người nhận bàn giao: 1 lần get_external_users_map
+    ids = set()
+    for o in rows:
+        ids.update((o.employee_id, getattr(o, "handover_to_employee_id", None)))
+    ids.discard(None)
     return get_external_users_map(list(ids))
 
 
@@ -230,7 +226,7 @@ class LeaveRequestViewSet(
 
         qs = list_my_leaves(employee_id)
         page = self.paginate_queryset(qs)
-        umap = _build_user_map_for_qs(qs)
+        umap = _build_user_map_for_rows(page if page is not None else qs)
 
         if page is not None:
             ser = LeaveRequestReadSerializer(page, many=True, context={"user_map": umap})
@@ -263,7 +259,7 @@ class LeaveRequestViewSet(
         date_to = request.query_params.get("to")
         qs = list_pending_for_manager(date_from, date_to)
         page = self.paginate_queryset(qs)
-        umap = _build_user_map_for_qs(qs)
+        umap = _build_user_map_for_rows(page if page is not None else qs)
 
         if page is not None:
             ser = LeaveRequestReadSerializer(page, many=True, context={"user_map": umap})
@@ -305,7 +301,7 @@ class LeaveRequestViewSet(
 
         qs = filter_leaves(filters, order_by=["-start_date", "-created_at"])
         page = self.paginate_queryset(qs)
-        umap = _build_user_map_for_qs(qs)
+        umap = _build_user_map_for_rows(page if page is not None else qs)
 
         if page is not None:
             ser = LeaveRequestReadSerializer(page, many=True, context={"user_map": umap})
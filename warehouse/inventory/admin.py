@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, Warehouse, Item, Inventory, Move
+from .models import Product, Warehouse, Item, Inventory, Move, SavedQuery, SavedQueryRun
 
 # Đăng ký các model đơn giản
 admin.site.register(Warehouse)
@@ -24,3 +24,15 @@ class ProductAdmin(admin.ModelAdmin):
     readonly_fields = ("code4",)  # code4 chỉ đọc
     ordering = ("id",)
     fields = ("sku", "name", "code4")  # code4 hiển thị read-only
+
+@admin.register(SavedQuery)
+class SavedQueryAdmin(admin.ModelAdmin):
+    list_display = ("name", "materialize", "refresh_seconds", "last_run_at", "last_runtime_ms", "last_row_count")
+    list_filter = ("materialize",)
+    search_fields = ("name", "sql")
+    ordering = ("-last_runtime_ms",)   # query tốn kém lên đầu
+
+@admin.register(SavedQueryRun)
+class SavedQueryRunAdmin(admin.ModelAdmin):
+    list_display = ("query", "started_at", "trigger", "runtime_ms", "row_count", "ok")
+    list_filter = ("ok", "trigger")
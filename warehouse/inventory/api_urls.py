@@ -4,7 +4,7 @@ from rest_framework.routers import DefaultRouter
 from .api_views import (
     WarehouseViewSet, ProductViewSet, ItemViewSet,
     InventoryView, HistoryView, HistoryStatsView, HistoryUpdatesView,
-    ManualBatchView, ScanView, GenerateLabelsView, BarcodeCheckView,
+    ManualBatchView, ScanView, GenerateLabelsView, BarcodeCheckView, BarcodeCacheStatsView,
     BulkOutBySkuView, BulkImportOrdersView,BatchTagSuggestAPI, BOMStocktakeView,ReprintBarcodesView,
 )
 
@@ -48,6 +48,7 @@ urlpatterns = [
 
     # 🔎 Barcode lookup (ITEM info + move history)
     path("barcode/check", BarcodeCheckView.as_view(), name="api_barcode_check"),
+    path("barcode/cache-stats", BarcodeCacheStatsView.as_view(), name="api_barcode_cache_stats"),
     # (tuỳ chọn) path dùng URL param:
     path("barcode/<str:barcode>", BarcodeCheckView.as_view(), name="api_barcode_check_slug"),
     path("batches/tag-suggest", BatchTagSuggestAPI.as_view(), name="api_batch_tag_suggest"),
@@ -5,13 +5,17 @@ import tempfile
 from django.utils import timezone
 from django.db.models import Q, Sum, Max, Count, F, IntegerField, CharField, Case, When, Value
 from django.db import transaction, IntegrityError
-from django.http import FileResponse, HttpResponse, HttpResponseBadRequest
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.conf import settings
 from pathlib import Path
-import csv, io, re, zipfile
+import csv, re, zipfile
 # thêm import (trên đầu file)
 from django.db.models.deletion import ProtectedError
 from .utils import save_code128_png
+from warehouse import dbwriter
+from warehouse.db_routers import replica_reads
+from warehouse.logpipe import fields
+from warehouse.streaming import FileResponse
 
 from rest_framework import viewsets, mixins, status
 from rest_framework.views import APIView
@@ -22,21 +26,24 @@ from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.core.exceptions import ValidationError
 from .pagination import PageLimitPagination
+from . import barcode_cache, refcache, labels, importers
 
-from .models import Product, Warehouse, Item, Inventory, Move, StockOrder, StockOrderLine
+from .models import Product, Warehouse, Item, Inventory, Move, StockOrder, StockOrderLine, TagCounter
 from .serializers import (
     ProductSerializer, WarehouseSerializer, ItemSerializer,
     InventorySerializer, MoveSerializer,
     BatchTagSuggestInputSerializer, BatchTagSuggestOutputSerializer,
+    with_quantity, quantity_context,
 )
 
 # === import helpers từ views.py (giữ nguyên file gốc) ===
 from .views import (
-    adjust_inventory, _manual_batch, _save_manual_batch,
-    preview_bulk_out, allocate_bulk_out,
+    _manual_batch, _save_manual_batch,
+    preview_bulk_out_many, _preview_pools,
     _scan_state, _save_scan_state, _tag_max_today,
-    _parse_manual_file, _merge_lines,
-    export_barcodes_csv, export_history_csv
+    _merge_lines,
+    export_barcodes_csv, export_history_csv,
+    post_scan, post_manual_lines, create_label_items,
 )
 
 MEDIA_ROOT = Path(settings.MEDIA_ROOT)
@@ -79,7 +86,7 @@ class ProductViewSet(viewsets.ModelViewSet):
 
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        qs = with_quantity(super().get_queryset())
         q = self.request.query_params.get("q", "").strip()
         if q:
             qs = qs.filter(Q(sku__icontains=q)|Q(name__icontains=q)|Q(code4__icontains=q))
@@ -144,11 +151,6 @@ class ItemViewSet(viewsets.ReadOnlyModelViewSet):
         page_size = int(request.query_params.get("page_size", 10))
         total_records = qs.count()
         total_pages = (total_records + page_size - 1) // page_size
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated_qs = qs[start:end]
-
-        serializer = self.get_serializer(paginated_qs, many=True)
 
 
         summary = {
@@ -168,20 +170,23 @@ class ItemViewSet(viewsets.ReadOnlyModelViewSet):
 
         # ======= Pagination + serializer =======
         page = self.paginate_queryset(qs)
+        rows = page if page is not None else list(qs)
+        # tồn theo product của cả trang: 1 query (thay vì 1 query / item)
+        ctx = {**self.get_serializer_context(), **quantity_context(it.product_id for it in rows)}
+        serializer = self.get_serializer_class()(rows, many=True, context=ctx)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response({
                 "results": serializer.data,
                 "summary": summary
             })
 
-        serializer = self.get_serializer(qs, many=True)
         return Response({
             "results": serializer.data,
             "summary": summary
         })
 
     @action(detail=False, methods=["get"])
+    @replica_reads()
     def export_csv(self, request):
         qs = self.get_queryset()
         # trả file CSV stream y hệt dashboard_barcodes
@@ -245,9 +250,9 @@ class BulkOutBySkuView(APIView):
         # Resolve warehouse (auto-create by code if not exists)
         wh = None
         if wh_id:
-            wh = Warehouse.objects.filter(id=wh_id).first()
+            wh = refcache.get_warehouse(id=wh_id)
         if not wh and wh_code:
-            wh = Warehouse.objects.filter(code=wh_code).first()
+            wh = refcache.get_warehouse(code=wh_code)
             if not wh:
                 # Auto-create warehouse with given code
                 wh = Warehouse.objects.create(code=wh_code, name=wh_code)
@@ -270,7 +275,7 @@ class BulkOutBySkuView(APIView):
         if any((not s) for s in skus) or any(q <= 0 for q in qtys):
             return Response({"detail": "Mỗi dòng cần sku và qty>0."}, status=400)
 
-        products = {p.sku: p for p in Product.objects.filter(sku__in=skus)}
+        products = refcache.get_products_by_skus(skus)
         missing = [s for s in skus if s not in products]
         # Auto-create missing products (name = sku)
         if missing:
@@ -306,7 +311,7 @@ class BulkOutBySkuView(APIView):
                             "warehouse": (order.from_wh or order.to_wh).code if (order.from_wh or order.to_wh) else None,
                             "lines": [
                                 {"sku": ln.product.sku, "qty": ln.quantity}
-                                for ln in order.lines.all() if ln.product_id and ln.quantity
+                                for ln in order.lines.select_related("product") if ln.product_id and ln.quantity
                             ],
                             "skipped": True,
                         }, status=200)
@@ -350,7 +355,7 @@ class BulkOutBySkuView(APIView):
                         "warehouse": (existing.from_wh or existing.to_wh).code if (existing.from_wh or existing.to_wh) else None,
                         "lines": [
                             {"sku": ln.product.sku, "qty": ln.quantity}
-                            for ln in existing.lines.all() if ln.product_id and ln.quantity
+                            for ln in existing.lines.select_related("product") if ln.product_id and ln.quantity
                         ],
                         "skipped": True,
                     }, status=200)
@@ -402,9 +407,9 @@ class BulkImportOrdersView(APIView):
                 # Resolve warehouse (auto-create)
                 wh = None
                 if wh_id:
-                    wh = Warehouse.objects.filter(id=wh_id).first()
+                    wh = refcache.get_warehouse(id=wh_id)
                 if not wh and wh_code:
-                    wh = Warehouse.objects.filter(code=wh_code).first()
+                    wh = refcache.get_warehouse(code=wh_code)
                     if not wh:
                         wh = Warehouse.objects.create(code=wh_code, name=wh_code)
                 if not wh:
@@ -426,7 +431,7 @@ class BulkImportOrdersView(APIView):
                     raise ValueError("Mỗi dòng cần sku và qty>0.")
 
                 # Load/create products
-                products = {p.sku: p for p in Product.objects.filter(sku__in=skus)}
+                products = refcache.get_products_by_skus(skus)
                 missing = [s for s in skus if s not in products]
                 if missing:
                     for m in sorted(set(missing)):
@@ -548,7 +553,7 @@ class HistoryView(APIView):
         start_d = parse_date(start_s)
         end_d = parse_date(end_s)
 
-        qs = Move.objects.select_related("item__product","product","from_wh","to_wh")
+        qs = Move.objects.select_related("item__product","item__warehouse","product","from_wh","to_wh")
 
         if start_d:
             qs = qs.filter(created_at__date__gte=start_d)
@@ -577,6 +582,7 @@ class HistoryView(APIView):
             )
         return qs
 
+    @replica_reads()   # lịch sử / export: đọc replica (nếu có)
     def get(self, request):
         qs = self.get_queryset(request)
 
@@ -618,7 +624,9 @@ class HistoryView(APIView):
         )
 
         # simple list, paging client-side
-        data = MoveSerializer(qs.order_by("-created_at")[:1000], many=True).data
+        moves = list(qs.order_by("-created_at")[:1000])
+        pids = [m.product_id for m in moves] + [m.item.product_id for m in moves if m.item_id]
+        data = MoveSerializer(moves, many=True, context=quantity_context(pids)).data
 
         return Response({
             "count": qs.count(),
@@ -630,6 +638,7 @@ class HistoryView(APIView):
 # ---------- Real-time stats ----------
 class HistoryStatsView(APIView):
     permission_classes = [AllowAny]
+    @replica_reads()
     def get(self, request):
         today = timezone.now().date()
         hour_ago = timezone.now() - timedelta(hours=1)
@@ -682,7 +691,7 @@ class ManualBatchView(APIView):
             action = (request.data.get("action") or "OUT").upper()
             wh_id = request.data.get("wh_id")
             allow = bool(request.data.get("allow_consume_itemized", False))
-            wh = Warehouse.objects.filter(id=wh_id).first()
+            wh = refcache.get_warehouse(id=wh_id)
             if action not in ("IN","OUT") or not wh:
                 return Response({"detail":"Action/Kho không hợp lệ."}, status=400)
             st = {
@@ -702,7 +711,7 @@ class ManualBatchView(APIView):
             sku = (request.data.get("sku") or "").strip()
             qty = int(request.data.get("qty") or 0)
             if not sku or qty <= 0: return Response({"detail":"SKU/Qty không hợp lệ."}, status=400)
-            if not Product.objects.filter(sku=sku).exists():
+            if not refcache.get_product(sku=sku):
                 return Response({"detail":f"SKU {sku} không tồn tại."}, status=404)
             st["lines"].append({"sku": sku, "qty": qty})
             _save_manual_batch(request, st)
@@ -723,7 +732,7 @@ class ManualBatchView(APIView):
                 return Response({"detail":"Thiếu hoặc action không hợp lệ (IN/OUT)."}, status=400)
 
             wh_id = request.data.get("wh_id")
-            wh = Warehouse.objects.select_for_update().filter(id=wh_id).first()
+            wh = refcache.get_warehouse(id=wh_id)
             if not wh:
                 return Response({"detail":"Kho không hợp lệ."}, status=400)
 
@@ -734,44 +743,30 @@ class ManualBatchView(APIView):
             if not isinstance(lines, list) or not lines:
                 return Response({"detail":"Thiếu lines."}, status=400)
 
-            created_moves = 0
-            with transaction.atomic():
-                for ln in lines:
-                    sku = (ln.get("sku") or "").strip()
-                    try:
-                        qty = int(ln.get("qty") or 0)
-                    except (TypeError, ValueError):
-                        return Response({"detail": f"Qty không hợp lệ cho SKU {sku}."}, status=400)
-                    if not sku or qty <= 0:
-                        return Response({"detail": f"Dòng không hợp lệ (sku/qty)."}, status=400)
-
-                    product = Product.objects.filter(sku=sku).first()
-                    if not product:
-                        return Response({"detail": f"SKU {sku} không tồn tại."}, status=404)
-
-                    if action == "IN":
-                        Move.objects.create(product=product, quantity=qty, action="IN", to_wh=wh,
-                                            type_action="MANUAL", note="IN (manual bulk)", batch_id=batch_id)
-                        adjust_inventory(product, wh, +qty)
-                        created_moves += 1
-                    else:
-                        bulk_used, picked_items = allocate_bulk_out(product, wh, qty, allow_consume_itemized=allow)
-                        if bulk_used > 0:
-                            Move.objects.create(product=product, quantity=bulk_used, action="OUT", from_wh=wh,
-                                                type_action="MANUAL", note="OUT (manual bulk)", batch_id=batch_id)
-                            adjust_inventory(product, wh, -bulk_used)
-                            created_moves += 1
-                        for it in picked_items:
-                            Move.objects.create(item=it, action="OUT", from_wh=wh,
-                                                type_action="MANUAL", note="OUT (manual picked)", batch_id=batch_id)
-                            adjust_inventory(it.product, wh, -1)
-                            it.warehouse = None; it.status = "shipped"; it.save(update_fields=["warehouse","status"])
-                            created_moves += 1
+            product_map = refcache.get_products_by_skus(
+                (ln.get("sku") or "").strip() for ln in lines
+            )
+            # kiểm tra hết các dòng trước khi ghi: dòng lỗi không để lại nửa đơn đã ghi
+            rows = []
+            for ln in lines:
+                sku = (ln.get("sku") or "").strip()
+                try:
+                    qty = int(ln.get("qty") or 0)
+                except (TypeError, ValueError):
+                    return Response({"detail": f"Qty không hợp lệ cho SKU {sku}."}, status=400)
+                if not sku or qty <= 0:
+                    return Response({"detail": f"Dòng không hợp lệ (sku/qty)."}, status=400)
+
+                product = product_map.get(sku)
+                if not product:
+                    return Response({"detail": f"SKU {sku} không tồn tại."}, status=404)
+                rows.append((product, qty))
+
+            created_moves = dbwriter.post(post_manual_lines, wh, action, rows, batch_id, allow)
 
             # Clear any session batch (optional)
             try:
-                request.session["manual_batch"] = {"active": False, "lines": []}
-                request.session.modified = True
+                _save_manual_batch(request, {"active": False, "lines": []})
             except Exception:
                 pass
 
@@ -785,14 +780,17 @@ class ManualBatchView(APIView):
             merge = str(request.data.get("merge_duplicate","")).lower() in {"1","true","yes"}
             replace = str(request.data.get("replace","")).lower() in {"1","true","yes"}
             try:
-                rows = _parse_manual_file(dj_file)
-                if merge: rows = _merge_lines(rows)
+                reader = importers.UploadReader(dj_file, importers.MANUAL)
+                rows = _merge_lines(reader) if merge else list(reader)
+                reader.raise_if_errors()
                 new_lines = [{"sku": r["sku"], "qty": int(r["qty"])} for r in rows]
                 if replace: st["lines"]=new_lines
                 else: st["lines"].extend(new_lines)
                 _save_manual_batch(request, st)
                 total = sum(int(x["qty"]) for x in new_lines)
                 return Response({"detail":"OK","added_lines":len(new_lines),"total_qty":total,"lines":st["lines"]})
+            except importers.ImportFileError as e:
+                return Response({"detail":f"Lỗi đọc file: {e}","errors":e.errors}, status=400)
             except Exception as e:
                 return Response({"detail":f"Lỗi đọc file: {e}"}, status=400)
 
@@ -804,16 +802,18 @@ class ManualBatchView(APIView):
         if path.endswith("/preview"):
             st = _manual_batch(request)
             if not st.get("active"): return Response({"detail":"Chưa bắt đầu."}, status=400)
-            wh = Warehouse.objects.filter(id=st["wh_id"]).first()
+            wh = refcache.get_warehouse(id=st["wh_id"])
             action = st["action"]
             allow = st.get("allow_consume_itemized", False)
             preview_rows=[]; total_warn=0
+            product_map = refcache.get_products_by_skus(ln["sku"] for ln in st.get("lines", []))
+            pools = preview_bulk_out_many(wh, (p.id for p in product_map.values())) if action == "OUT" else {}
             for i,ln in enumerate(st.get("lines",[])):
-                product = Product.objects.filter(sku=ln["sku"]).first()
+                product = product_map.get(ln["sku"])
                 qty = int(ln["qty"])
                 row={"idx":i,"sku":ln["sku"],"qty":qty,"valid": bool(product)}
                 if product and action == "OUT":
-                    pv = preview_bulk_out(product, wh, qty); row.update(pv)
+                    pv = _preview_pools(*pools.get(product.id, (0, 0)), qty); row.update(pv)
                     row["status"]="OK" if pv["lack"]==0 else ("THIẾU (sẽ bốc item)" if allow else "THIẾU (bị chặn)")
                     if pv["lack"]>0 and not allow: total_warn+=1
                 preview_rows.append(row)
@@ -860,7 +860,7 @@ class ScanView(APIView):
             if act not in {"IN", "OUT"}:
                 return Response({"detail": "Thiếu hoặc action không hợp lệ (IN/OUT)."}, status=400)
             wh_id = request.data.get("wh_id")
-            wh = Warehouse.objects.filter(id=wh_id).first()
+            wh = refcache.get_warehouse(id=wh_id)
             tag_max = _tag_max_today(act, wh) + 1 if wh else 1
             note_user = (request.data.get("note_user") or "").strip()
 
@@ -869,6 +869,7 @@ class ScanView(APIView):
             except (TypeError, ValueError):
                 return Response({"detail": "Tag không hợp lệ."}, status=400)
             tag = tag if 1<=tag<=tag_max else tag_max
+            TagCounter.claim(act, wh, tag)
             st = {
                 "active": True,
                 "action": act,
@@ -879,10 +880,7 @@ class ScanView(APIView):
                 "started_at": timezone.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "scanned": [],
             }
-            try:
-                logger.info("SCAN start: action=%s type=%s wh_id=%s tag=%s", act, st.get("type_action"), wh_id, tag)
-            except Exception:
-                pass
+            logger.info("scan start", extra=fields(action=act, type=st["type_action"], wh_id=wh_id, tag=tag))
             _save_scan_state(request, st)
             return Response({"detail":"OK","state":st})
 
@@ -890,10 +888,7 @@ class ScanView(APIView):
             st = _scan_state(request)
             st["active"]=False
             _save_scan_state(request, st)
-            try:
-                logger.info("SCAN stop: wh_id=%s tag=%s", st.get("wh_id"), st.get("tag"))
-            except Exception:
-                pass
+            logger.info("scan stop", extra=fields(wh_id=st.get("wh_id"), tag=st.get("tag")))
             return Response({"detail":"Stopped","state":st})
 
         if path.endswith("/scan"):
@@ -916,48 +911,22 @@ class ScanView(APIView):
             except (TypeError, ValueError):
                 return Response({"detail": "Tag không hợp lệ."}, status=400)
             wh_id = request.data.get("wh_id")
-            wh = Warehouse.objects.filter(id=wh_id).first() if wh_id else None
+            wh = refcache.get_warehouse(id=wh_id) if wh_id else None
             if action == "IN" and not wh:
                 return Response({"detail": "IN cần wh_id."}, status=400)
 
-            # --- Logging request context ---
-            try:
-                logger.info(
-                    "SCAN request: code=%s action=%s type=%s tag=%s wh_id=%s session_active=%s",
-                    code, action, (type_action or ""), tag, wh_id, bool(st and st.get("active"))
-                )
-            except Exception:
-                pass
-            try:
-                item = Item.objects.select_for_update().select_related("product","warehouse").get(barcode_text=code)
-            except Item.DoesNotExist:
-                logger.info("SCAN not_found: code=%s", code)
-                return Response({"detail":f"Không tìm thấy {code}"}, status=404)
-
-            with transaction.atomic():
-                if action=="IN":
-                    if item.warehouse:
-                        logger.info("SCAN IN blocked: code=%s already in %s", code, item.warehouse.code if item.warehouse else None)
-                        return Response({"detail":f"{code} đang ở {item.warehouse.code}."}, status=400)
-                    Move.objects.create(item=item, action="IN", to_wh=wh, type_action=type_action, tag=tag, note="IN (scan)", note_user=note_user)
-                    item.warehouse=wh; item.status="in_stock"; item.save(update_fields=["warehouse","status"])
-                    if affect_inv:
-                        adjust_inventory(item.product, wh, +1)
-                    msg=f"IN {code} → {wh.code}"
-                    logger.info("SCAN IN ok: code=%s to_wh=%s tag=%s type=%s", code, wh.code if wh else None, tag, type_action)
-                else:
-                    if not item.warehouse:
-                        logger.info("SCAN OUT blocked: code=%s already OUT", code)
-                        return Response({"detail":f"{code} đã OUT trước đó."}, status=400)
-                    base_wh = wh or item.warehouse
-                    if wh and item.warehouse != wh:
-                        logger.info("SCAN OUT blocked: code=%s in %s but session wh=%s", code, item.warehouse.code if item.warehouse else None, wh.code if wh else None)
-                        return Response({"detail":f"{code} đang ở {item.warehouse.code}, khác kho phiên ({wh.code})."}, status=400)
-                    Move.objects.create(item=item, action="OUT", from_wh=base_wh, type_action=type_action, tag=tag, note= "OUT (scan)", note_user=note_user)
-                    adjust_inventory(item.product, base_wh, -1)
-                    item.warehouse=None; item.status="shipped"; item.save(update_fields=["warehouse","status"])
-                    msg=f"OUT {code}"
-                    logger.info("SCAN OUT ok: code=%s from_wh=%s tag=%s type=%s", code, base_wh.code if base_wh else None, tag, type_action)
+            # 1 dòng log / lần scan (kết quả), kèm ngữ cảnh request
+            ctx = dict(code=code, action=action, type=type_action, tag=tag, wh_id=wh_id,
+                       session_active=bool(st and st.get("active")))
+            status, msg, log = dbwriter.post(post_scan, code, action, wh, type_action, tag,
+                                             note_user=note_user, affect_inv=affect_inv, claim=True)
+            if status == 404:
+                logger.info("scan not_found", extra=fields(**ctx))
+                return Response({"detail":msg}, status=404)
+            if status != 200:
+                logger.info("scan blocked", extra=fields(**ctx, **log))
+                return Response({"detail":msg}, status=status)
+            logger.info("scan ok", extra=fields(**ctx, **log))
             st["scanned"] = [code] + st.get("scanned", [])[:19]; _save_scan_state(request, st)
             return Response({"detail":msg,"state":st})
         return Response({"detail":"Unsupported"}, status=404)
@@ -1014,14 +983,37 @@ class ScanView(APIView):
 
 #         return FileResponse(open(zip_file, "rb"), as_attachment=True, filename=f"{batch_code}.zip")
 # ---------- Generate labels API ----------
+def _label_job_response(fmt, job, path, spool, template=None):
+    """zpl/epl/pdf: spool -> ghi vào thư mục máy in, trả JSON; không thì ghi 1 file và trả file."""
+    if spool:
+        spooled = labels.spool_job(fmt, job, path.stem)
+        return Response({"format": fmt, "count": len(job), "spooled": spooled.name}, status=201)
+    labels.render_file(fmt, job, path, template)
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=path.name,
+                        content_type=labels.CONTENT_TYPES[fmt])
+
+
+def _label_options(data):
+    """(fmt, spool, template) từ body; ValueError nếu sai."""
+    fmt = labels.parse_format(data.get("format"))
+    spool = fmt in labels.TEXT_FORMATS and bool(data.get("spool"))
+    if spool and not labels.spool_enabled():
+        raise ValueError("Chưa cấu hình LABEL_SPOOL_DIR.")
+    template = labels.template_from(data) if fmt == labels.PDF else None
+    return fmt, spool, template
+
+
 class GenerateLabelsView(APIView):
     """
     POST /api/generate/labels
     body:
     {
-        "lines": [{"sku":"...","name":"...","qty":10,"import_date":"dd/mm/yyyy"}, ...]
+        "lines": [{"sku":"...","name":"...","qty":10,"import_date":"dd/mm/yyyy"}, ...],
+        "format": "png" | "zpl" | "epl" | "pdf",   # (optional) mặc định png
+        "spool": false,                    # (optional) zpl/epl: ghi vào LABEL_SPOOL_DIR thay vì tải về
+        "template": "a4-3x8"               # (optional) pdf: mẫu LABEL_PDF_TEMPLATES (+ cols, rows, margin_mm)
     }
-    -> tạo items + zip trả về file
+    -> tạo items + zip trả về file (png) / 1 file job in (zpl, epl) / PDF tờ decal
     """
     permission_classes = [AllowAny]
 
@@ -1034,42 +1026,42 @@ class GenerateLabelsView(APIView):
         lines = request.data.get("lines") or []
         if not isinstance(lines, list) or not lines:
             return Response({"detail":"Thiếu lines."}, status=400)
+        try:
+            fmt, spool, template = _label_options(request.data)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
 
         batch_code = timezone.localtime().strftime("%Y%m%d-%H%M%S")
         batch_dir = MEDIA_ROOT / "labels" / batch_code
         batch_dir.mkdir(parents=True, exist_ok=True)
 
         from .utils import save_code128_png
-        total_created = 0
-
-        with transaction.atomic():
-            for row in lines:
-                sku = (row.get("sku") or "").strip()
-                name = (row.get("name") or "").strip()
-                qty = int(row.get("qty") or 0)
-                imp = row.get("import_date") or ""
-                if not sku or qty <= 0:
-                    continue
-
-                import_dt = datetime.strptime(imp, "%d/%m/%Y").date() if imp else None
-
-                # Lưu SKU gốc trong DB (không thay đổi)
-                product, _ = Product.objects.get_or_create(sku=sku, defaults={"name": name})
-                if name and product.name != name:
-                    product.name = name
-                    product.save(update_fields=["name"])
-
+        rows = []
+        for row in lines:
+            sku = (row.get("sku") or "").strip()
+            name = (row.get("name") or "").strip()
+            qty = int(row.get("qty") or 0)
+            imp = row.get("import_date") or ""
+            if not sku or qty <= 0:
+                continue
+            import_dt = datetime.strptime(imp, "%d/%m/%Y").date() if imp else None
+            rows.append((sku, name, qty, import_dt))
+
+        # Lưu SKU gốc trong DB (không thay đổi); ảnh tem render sau khi commit
+        created = dbwriter.post(create_label_items, rows, sync_name=True)
+        total_created = len(created)
+        job = [(code, name) for _, code, name in created]
+        if fmt == labels.PNG:
+            for sku, code, name in created:
                 # Chỉ khi tạo thư mục/filename mới cần "an toàn"
-                safe_sku_dirname = self.safe_filename(sku)
-                sku_dir = batch_dir / safe_sku_dirname
+                sku_dir = batch_dir / self.safe_filename(sku)
                 sku_dir.mkdir(exist_ok=True)
+                # Barcode payload vẫn giữ ký tự "/" gốc; save_code128_png tự làm "an toàn" tên file.
+                save_code128_png(code, name, out_dir=str(sku_dir))
 
-                for _ in range(qty):
-                    item = Item.objects.create(product=product, import_date=import_dt)
-                    # Barcode payload (item.barcode_text) vẫn giữ ký tự "/" gốc.
-                    # Hàm save_code128_png sẽ tự làm "an toàn" khi tạo tên file.
-                    save_code128_png(item.barcode_text, product.name, out_dir=str(sku_dir))
-                    total_created += 1
+        if fmt != labels.PNG:
+            labels.save_manifest(batch_dir, [code for code, _ in job])
+            return _label_job_response(fmt, job, batch_dir / f"{batch_code}.{fmt}", spool, template)
 
         zip_file = batch_dir / f"{batch_code}.zip"
         with zipfile.ZipFile(zip_file, "w", zipfile.ZIP_DEFLATED) as zf:
@@ -1085,40 +1077,12 @@ class GenerateLabelsView(APIView):
 
 # ---------- Barcode Check (REST) ----------
 class BarcodeCheckView(APIView):
+    """
+    GET/POST /api/barcode/check?barcode=...  |  GET /api/barcode/<barcode>
+    Payload item + move gần nhất, đọc qua barcode_cache (header X-Cache: HIT/MISS).
+    """
     permission_classes = [AllowAny]
 
-    def _item_payload(self, item):
-        return {
-            "id": item.id,
-            "barcode": item.barcode_text,
-            "status": item.status,
-            "import_date": item.import_date.isoformat() if item.import_date else None,
-            "created_at": item.created_at.isoformat() if item.created_at else None,
-            "product": {
-                "id": item.product.id if item.product else None,
-                "sku": item.product.sku if item.product else None,
-                "name": item.product.name if item.product else None,
-                "code4": item.product.code4 if item.product else None,
-            } if item.product else None,
-            "warehouse": {
-                "id": item.warehouse.id,
-                "code": item.warehouse.code,
-                "name": getattr(item.warehouse, "name", None),
-            } if item.warehouse else None,
-        }
-
-    def _move_payload(self, mv):
-        return {
-            "id": mv.id,
-            "action": mv.action,
-            "type_action": mv.type_action,
-            "from_wh": mv.from_wh.code if mv.from_wh else None,
-            "to_wh": mv.to_wh.code if mv.to_wh else None,
-            "tag": mv.tag,
-            "note": mv.note,
-            "created_at": mv.created_at.isoformat() if mv.created_at else None,
-        }
-
     def _find_barcode(self, request):
         # Accept from query (?barcode=) or JSON/form body {barcode:}
         code = (request.query_params.get("barcode")
@@ -1127,27 +1091,28 @@ class BarcodeCheckView(APIView):
                 or "").strip()
         return code
 
-    def get(self, request):
-        code = self._find_barcode(request)
+    def get(self, request, barcode=None):
+        code = (barcode or "").strip() or self._find_barcode(request)
         if not code:
             return Response({"detail": "Thiếu barcode."}, status=400)
-        try:
-            item = Item.objects.select_related("product", "warehouse").get(barcode_text=code)
-        except Item.DoesNotExist:
+        payload, hit = barcode_cache.lookup(code)
+        if payload is None:
             return Response({"detail": f"Không tìm thấy {code}"}, status=404)
+        return Response(payload, headers={"X-Cache": "HIT" if hit else "MISS"})
 
-        moves = (
-            item.moves.select_related("from_wh", "to_wh")
-                .order_by("-created_at")
-        )
-        return Response({
-            "item": self._item_payload(item),
-            "moves": [self._move_payload(m) for m in moves]
-        })
-
-    def post(self, request):
+    def post(self, request, barcode=None):
         # Same behavior as GET but read barcode from body
-        return self.get(request)
+        return self.get(request, barcode)
+
+
+class BarcodeCacheStatsView(APIView):
+    """GET /api/barcode/cache-stats — hit ratio + latency của cache barcode (theo process)."""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(barcode_cache.stats())
+
+
 class BatchTagSuggestAPI(APIView):
     """
     POST /api/batches/tag-suggest
@@ -1155,8 +1120,8 @@ class BatchTagSuggestAPI(APIView):
       { "action": "IN" | "OUT", "warehouse": "<tên hoặc code>", (optional) "date": "YYYY-MM-DD" }
     Trả về:
       { action, warehouse, date, count, next, tags:[1..count+1] }
-    - Đếm theo ngày (created_at__date = date). Nếu không gửi date thì dùng hôm nay (localdate).
-    - IN: lọc Move(to_wh=warehouse); OUT: lọc Move(from_wh=warehouse).
+    - Đọc TagCounter theo (date, warehouse, action). Nếu không gửi date thì dùng hôm nay (localdate).
+    - count = tag lớn nhất đã dùng trong ngày (IN: to_wh; OUT: from_wh).
     """
     permission_classes = [AllowAny]
 
@@ -1174,13 +1139,8 @@ class BatchTagSuggestAPI(APIView):
         if not wh:
             return Response({"detail": f"Không tìm thấy warehouse '{wh_text}'"}, status=404)
 
-        # Đếm distinct tag theo action + kho + ngày
-        if action == "IN":
-            qs = Move.objects.filter(action="IN", to_wh=wh, created_at__date=day)
-        else:
-            qs = Move.objects.filter(action="OUT", from_wh=wh, created_at__date=day)
-
-        total = qs.values("tag").distinct().count()
+        # Tag lớn nhất đã dùng theo action + kho + ngày (1 lần đọc theo khoá)
+        total = TagCounter.current(action, wh, day)
         next_tag = total + 1
         tags = list(range(1, next_tag + 1))
 
@@ -1215,8 +1175,8 @@ class BOMStocktakeView(APIView):
          # "month": "2025-09"
        }
 
-    B) multipart/form-data (CSV):
-       - file=stocktake.csv (các cột: warehouse_code, sku, counted_qty)
+    B) multipart/form-data (CSV/XLSX):
+       - file=stocktake.csv|.xlsx (các cột: warehouse_code, sku, counted_qty — alias xem importers.STOCKTAKE)
        - dt=ISO-8601 (khuyến nghị) hoặc month=YYYY-MM (cũ)
        - dry_run=1 (tùy chọn)
        - batch_code=BOM-YYYYMMDD-HHMMSS (tùy chọn)
@@ -1238,19 +1198,8 @@ class BOMStocktakeView(APIView):
         f = request.FILES.get("file")
         if not f:
             return None
-        try:
-            text = f.read().decode("utf-8-sig")
-            rdr = csv.DictReader(io.StringIO(text))
-            rows = []
-            for r in rdr:
-                rows.append({
-                    "warehouse_code": (r.get("warehouse_code") or "").strip(),
-                    "sku": (r.get("sku") or "").strip(),
-                    "counted_qty": int(r.get("counted_qty") or 0),
-                })
-            return rows
-        except Exception as e:
-            raise ValidationError(f"Lỗi đọc CSV: {e}")
+        # CSV/XLSX đọc theo luồng; dòng lỗi -> ImportFileError (post trả 400 kèm danh sách)
+        return importers.read_upload(f, importers.STOCKTAKE)
 
     def _parse_datetime(self, request):
         """
@@ -1296,7 +1245,10 @@ class BOMStocktakeView(APIView):
         dry_run = str(request.data.get("dry_run") or "").lower() in {"1","true","yes","on"}
 
         # --- đọc dữ liệu ---
-        lines = self._read_lines_from_request(request)
+        try:
+            lines = self._read_lines_from_request(request)
+        except importers.ImportFileError as e:
+            return Response({"detail": f"Lỗi đọc file: {e}", "errors": e.errors}, status=400)
         if lines is None or not isinstance(lines, list) or not lines:
             return Response({"detail": "Thiếu dữ liệu kiểm kê (lines hoặc file)."}, status=400)
 
@@ -1339,14 +1291,20 @@ class BOMStocktakeView(APIView):
                 if s not in prod_map:
                     prod_map[s] = Product.objects.create(sku=s, name=s)
 
+            # Tồn hiện tại của mọi cặp (kho, sku) trong 1 query (mỗi cặp chỉ xuất hiện 1 lần trong grouped)
+            current_map = {
+                (r["warehouse_id"], r["product_id"]): r["t"] or 0
+                for r in Inventory.objects
+                .filter(warehouse__in=list(wh_map.values()), product__in=list(prod_map.values()))
+                .values("warehouse_id", "product_id").annotate(t=Sum("qty"))
+            }
+
             # Tính delta & (nếu cần) apply
             for (whc, sku), counted in grouped.items():
                 wh = wh_map[whc]
                 prod = prod_map[sku]
 
-                current = (Inventory.objects
-                           .filter(product=prod, warehouse=wh)
-                           .aggregate(t=Sum("qty")).get("t")) or 0
+                current = current_map.get((wh.id, prod.id), 0)
                 delta = int(counted) - int(current)
 
                 row = {
@@ -1421,6 +1379,8 @@ class ReprintBarcodesView(APIView):
     - Không tạo Item mới.
     - Sinh ảnh PNG cho từng barcode trong 'lines', đặt trong batch: <out_dir>/<YYYYMMDD-HHMMSS>/
     - Đóng gói ZIP và trả về file đính kèm.
+    - "format": "zpl" | "epl" -> 1 file job in cho máy in nhiệt ("spool": true -> ghi vào LABEL_SPOOL_DIR).
+    - "format": "pdf" (+ "template", "cols", "rows", "margin_mm") -> tờ decal nhiều tem / trang.
     """
     permission_classes = [AllowAny]
     parser_classes = [JSONParser]
@@ -1464,6 +1424,10 @@ class ReprintBarcodesView(APIView):
 
         if not codes:
             return Response({"detail": "Không có barcode hợp lệ trong 'lines'."}, status=400)
+        try:
+            fmt, spool, template = _label_options(data)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
 
         # Thư mục batch (an toàn)
         out_dir_rel_raw = (data.get("out_dir") or "").strip()
@@ -1476,23 +1440,25 @@ class ReprintBarcodesView(APIView):
         # Sinh ảnh
         total_ok = 0
         errors = []
+        valid = [c for c in codes if BARCODE_RE.match(c)]
+        errors.extend(f"INVALID_FORMAT: {c}" for c in codes if not BARCODE_RE.match(c))
 
-        for code in codes:
-            if not BARCODE_RE.match(code):
-                errors.append(f"INVALID_FORMAT: {code}")
-                continue
+        # Lấy title (tên sản phẩm) cho cả danh sách: 1 query – không ảnh hưởng tên file (đã safe trong utils)
+        try:
+            titles = labels.titles_for(valid)
+        except Exception as e:
+            titles = {}
+            errors.append(f"LOOKUP_ERROR: {e}")
 
-            # Lấy title nếu có (tên sản phẩm) – không ảnh hưởng tên file (đã safe trong utils)
-            title = ""
-            try:
-                it = Item.objects.select_related("product").filter(barcode_text=code).first()
-                if it and it.product and it.product.name:
-                    title = it.product.name
-            except Exception as e:
-                errors.append(f"LOOKUP_ERROR: {code}: {e}")
+        if fmt != labels.PNG:
+            if not valid:
+                return Response({"detail": "Không in được tem nào.", "errors": errors}, status=400)
+            return _label_job_response(fmt, [(c, titles.get(c) or "") for c in valid],
+                                       batch_dir / f"reprint-{ts}.{fmt}", spool, template)
 
+        for code in valid:
             try:
-                save_code128_png(code, title=title, out_dir=str(batch_dir))
+                save_code128_png(code, title=titles.get(code) or "", out_dir=str(batch_dir))
                 total_ok += 1
             except Exception as e:
                 errors.append(f"GEN_ERROR: {code}: {e}")
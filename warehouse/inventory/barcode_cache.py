@@ -0,0 +1,198 @@
+# inventory/barcode_cache.py
+"""
+Cache read-through cho tra cứu barcode (màn Check).
+
+- Lưu payload đã serialize {item, moves, moves_truncated} theo barcode trong CACHES[BARCODE_CACHE_ALIAS].
+- Invalidate khi có Move/Item của barcode đó được ghi (signals.py, sau commit).
+- Redis lỗi/không kết nối được -> đọc thẳng DB, tạm bỏ qua cache BARCODE_CACHE_BACKOFF giây.
+- Thống kê hit/miss/latency theo process: stats() -> GET /api/barcode/cache-stats.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+logger = logging.getLogger("inventory.barcode_cache")
+
+KEY_PREFIX = "inv:barcode:v1:"
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def cache_key(code: str) -> str:
+    return f"{KEY_PREFIX}{code}"
+
+
+# ---------- Payload ----------
+def item_payload(item) -> dict:
+    return {
+        "id": item.id,
+        "barcode": item.barcode_text,
+        "status": item.status,
+        "import_date": item.import_date.isoformat() if item.import_date else None,
+        "created_at": item.created_at.isoformat() if item.created_at else None,
+        "product": {
+            "id": item.product.id,
+            "sku": item.product.sku,
+            "name": item.product.name,
+            "code4": item.product.code4,
+        } if item.product else None,
+        "warehouse": {
+            "id": item.warehouse.id,
+            "code": item.warehouse.code,
+            "name": getattr(item.warehouse, "name", None),
+        } if item.warehouse else None,
+    }
+
+
+def move_payload(mv) -> dict:
+    return {
+        "id": mv.id,
+        "action": mv.action,
+        "type_action": mv.type_action,
+        "from_wh": mv.from_wh.code if mv.from_wh else None,
+        "to_wh": mv.to_wh.code if mv.to_wh else None,
+        "tag": mv.tag,
+        "note": mv.note,
+        "created_at": mv.created_at.isoformat() if mv.created_at else None,
+    }
+
+
+def load_payload(code: str):
+    """Đọc từ DB: item + tối đa BARCODE_CACHE_MOVES move gần nhất. None nếu không có barcode."""
+    from .models import Item
+
+    item = Item.objects.select_related("product", "warehouse").filter(barcode_text=code).first()
+    if item is None:
+        return None
+    limit = int(_conf("BARCODE_CACHE_MOVES", 100))
+    moves = list(
+        item.moves.select_related("from_wh", "to_wh")
+            .order_by("-created_at", "-id")[:limit + 1]
+    )
+    return {
+        "item": item_payload(item),
+        "moves": [move_payload(m) for m in moves[:limit]],
+        "moves_truncated": len(moves) > limit,
+    }
+
+
+# ---------- Thống kê ----------
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.errors = 0
+            self.hit_seconds = 0.0
+            self.miss_seconds = 0.0
+
+    def record(self, hit: bool, seconds: float):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_seconds += seconds
+            else:
+                self.misses += 1
+                self.miss_seconds += seconds
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "lookups": total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "avg_hit_ms": round(self.hit_seconds * 1000 / self.hits, 3) if self.hits else 0.0,
+                "avg_miss_ms": round(self.miss_seconds * 1000 / self.misses, 3) if self.misses else 0.0,
+            }
+
+
+_stats = _Stats()
+_down_until = 0.0
+
+
+def _cache():
+    return caches[_conf("BARCODE_CACHE_ALIAS", "default")]
+
+
+def _cache_available() -> bool:
+    return time.monotonic() >= _down_until
+
+
+def _mark_down(exc):
+    global _down_until
+    _stats.error()
+    if _cache_available():
+        logger.warning("barcode cache unavailable, fallback to DB: %s", exc)
+    _down_until = time.monotonic() + float(_conf("BARCODE_CACHE_BACKOFF", 30))
+
+
+def stats() -> dict:
+    data = _stats.snapshot()
+    data["cache_available"] = _cache_available()
+    data["ttl"] = int(_conf("BARCODE_CACHE_TTL", 300))
+    return data
+
+
+def reset_stats():
+    _stats.reset()
+
+
+# ---------- API chính ----------
+def lookup(code: str):
+    """
+    Trả về (payload | None, hit: bool).
+    Hit: 1 lệnh GET cache. Miss: đọc DB rồi SET (không cache barcode không tồn tại).
+    """
+    t0 = time.perf_counter()
+    key = cache_key(code)
+    if _cache_available():
+        try:
+            payload = _cache().get(key)
+        except Exception as exc:
+            _mark_down(exc)
+            payload = None
+        if payload is not None:
+            _stats.record(True, time.perf_counter() - t0)
+            return payload, True
+
+    payload = load_payload(code)
+    if payload is not None and _cache_available():
+        try:
+            _cache().set(key, payload, int(_conf("BARCODE_CACHE_TTL", 300)))
+        except Exception as exc:
+            _mark_down(exc)
+    _stats.record(False, time.perf_counter() - t0)
+    return payload, False
+
+
+def invalidate(code: str):
+    # vẫn thử xoá khi đang backoff: tránh giữ payload cũ nếu Redis vừa sống lại
+    if not code:
+        return
+    try:
+        _cache().delete(cache_key(code))
+    except Exception as exc:
+        _mark_down(exc)
+
+
+def invalidate_on_commit(code: str):
+    """Xoá cache sau khi transaction hiện tại commit (tránh đọc lại dữ liệu cũ trước commit)."""
+    if code:
+        transaction.on_commit(lambda: invalidate(code))
@@ -0,0 +1,366 @@
+# inventory/bench.py
+"""
+Dữ liệu giả lập + micro-benchmark cho các luồng nóng của kho.
+
+- seed(): tạo N product / warehouse / item / move với phân bố gần thực tế
+  (SKU bán chạy theo Zipf, kho chính nhiều hàng, giờ cao điểm 8h-18h, ngày gần đây dày hơn).
+  Mọi dữ liệu mang prefix (mặc định "SYN") để flush() xoá sạch; ghi bằng bulk_create.
+- run(): đo ScanView IN/OUT, StockOrder.confirm, allocate_bulk_out, HistoryView, ItemViewSet.list và 2 export CSV.
+  Mỗi case chạy trong transaction rồi rollback -> không làm bẩn dữ liệu seed; số query đếm ở lượt warmup.
+- Kết quả (ms: min/p50/p95/mean/max + queries) ghi JSON qua `manage.py bench --output` để so sánh giữa các lần chạy.
+"""
+import platform
+import random
+import statistics
+import subprocess
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, time as dtime, timedelta
+
+import django
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import Product, Warehouse, Item, Inventory, Move, StockOrder, StockOrderLine
+
+BATCH = 1000
+# tỉ trọng giờ trong ngày: ca làm 8h-18h chiếm phần lớn lượt quét
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 5, 12, 14, 14, 12, 8, 12, 14, 14, 12, 8, 5, 3, 2, 1, 1, 1]
+IN_TYPES = ("PO", "RETURN", "TRANSFER")
+IN_WEIGHTS = (6, 2, 2)
+OUT_TYPES = ("SALE", "TRANSFER", "DAMAGE")
+OUT_WEIGHTS = (7, 2, 1)
+
+
+# ---------- Seed ----------
+@contextmanager
+def _keep_created_at(*models):
+    """Tắt auto_now_add tạm thời để bulk_create giữ created_at giả lập."""
+    fields = [m._meta.get_field("created_at") for m in models]
+    for f in fields:
+        f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f in fields:
+            f.auto_now_add = True
+
+
+def _code4s(skus):
+    """code4 cho các SKU mới — cùng quy tắc Product._gen_code4_from_sku (CRC32, trùng thì +1) nhưng tra trong bộ nhớ."""
+    used = set(Product.objects.values_list("code4", flat=True))
+    if len(used) + len(skus) > 10000:
+        raise ValueError(f"Không đủ code4 trống cho {len(skus)} product (đã dùng {len(used)}).")
+    out = []
+    for sku in skus:
+        n = zlib.crc32(sku.encode("utf-8")) % 10000
+        while f"{n:04d}" in used:
+            n = (n + 1) % 10000
+        used.add(f"{n:04d}")
+        out.append(f"{n:04d}")
+    return out
+
+
+class _Clock:
+    """Sinh thời điểm trong `days` ngày gần nhất: ngày gần dày hơn, giờ theo HOUR_WEIGHTS."""
+
+    def __init__(self, rng, days):
+        self.rng = rng
+        self.days = max(1, days)
+        self.now = timezone.now()
+        self.today = timezone.localdate()
+
+    def day(self):
+        back = min(int(self.rng.expovariate(4 / self.days)), self.days - 1)
+        return self.today - timedelta(days=back)
+
+    def at(self, day, after=None):
+        hour = self.rng.choices(range(24), HOUR_WEIGHTS)[0]
+        naive = datetime.combine(day, dtime(hour, self.rng.randrange(60), self.rng.randrange(60)))
+        ts = timezone.make_aware(naive) if settings.USE_TZ else naive
+        if after is not None and ts <= after:
+            ts = after + timedelta(minutes=self.rng.randrange(5, 600))
+        return min(ts, self.now)
+
+
+def seed(products=200, warehouses=4, items=20000, bulk_moves=20000, days=90, prefix="SYN", rng_seed=42):
+    """Tạo dataset giả lập; trả về số bản ghi đã tạo theo loại."""
+    rng = random.Random(rng_seed)
+    clock = _Clock(rng, days)
+
+    with transaction.atomic(), _keep_created_at(Item, Move):
+        whs = Warehouse.objects.bulk_create([
+            Warehouse(code=f"{prefix}-WH{i + 1}", name=f"Kho giả lập {i + 1}") for i in range(warehouses)
+        ])
+        skus = [f"{prefix}-{i + 1:05d}" for i in range(products)]
+        prods = Product.objects.bulk_create([
+            Product(sku=sku, name=f"Sản phẩm {sku}", code4=code4) for sku, code4 in zip(skus, _code4s(skus))
+        ], batch_size=BATCH)
+        # Zipf: vài SKU chiếm phần lớn lượng hàng; kho đầu là kho chính
+        p_weights = [1 / (r + 1) ** 1.1 for r in range(len(prods))]
+        w_weights = [0.5 ** i for i in range(len(whs))]
+
+        # Item: 65% trong kho, 25% đã xuất, 10% mới in nhãn
+        item_objs, plans, seqs = [], [], {}
+        for p in rng.choices(prods, p_weights, k=items):
+            day = clock.day()
+            seq = seqs[(p.id, day)] = seqs.get((p.id, day), 0) + 1
+            created = clock.at(day)
+            state = rng.choices(("in_stock", "shipped", "none"), (65, 25, 10))[0]
+            wh = rng.choices(whs, w_weights)[0] if state != "none" else None
+            it = Item(product=p, import_date=day, seq=seq, status=state,
+                      warehouse=wh if state == "in_stock" else None, created_at=created)
+            it.barcode_text = f"{p.code4}{day:%d%m%y}{seq:05d}"
+            item_objs.append(it)
+            plans.append((state, wh, created))
+        Item.objects.bulk_create(item_objs, batch_size=BATCH)
+
+        moves, stock = [], {}
+        for it, (state, wh, created) in zip(item_objs, plans):
+            if state == "none":
+                continue
+            t_in = clock.at(it.import_date, after=created)
+            tag = rng.randint(1, 5)
+            moves.append(Move(item=it, action="IN", to_wh=wh, tag=tag, created_at=t_in,
+                              type_action=rng.choices(IN_TYPES, IN_WEIGHTS)[0], note="IN (scan)",
+                              batch_id=f"{prefix}-{t_in:%Y%m%d}-{tag}"))
+            if state == "shipped":
+                t_out = clock.at(clock.day(), after=t_in)
+                moves.append(Move(item=it, action="OUT", from_wh=wh, tag=tag, created_at=t_out,
+                                  type_action=rng.choices(OUT_TYPES, OUT_WEIGHTS)[0], note="OUT (scan)",
+                                  batch_id=f"{prefix}-{t_out:%Y%m%d}-{tag}"))
+            else:
+                stock[(it.product_id, wh.id)] = stock.get((it.product_id, wh.id), 0) + 1
+
+        # Bulk: mô phỏng theo thời gian, OUT chỉ khi pool bulk còn đủ
+        bulk, pool = [], {}
+        for _ in range(bulk_moves):
+            day = clock.day()
+            bulk.append((clock.at(day), rng.choices(prods, p_weights)[0], rng.choices(whs, w_weights)[0]))
+        bulk.sort(key=lambda x: x[0])
+        for ts, p, wh in bulk:
+            key = (p.id, wh.id)
+            qty = max(1, int(rng.lognormvariate(2, 0.8)))
+            if rng.random() < 0.4 and pool.get(key, 0) >= qty:
+                pool[key] -= qty
+                moves.append(Move(product=p, quantity=qty, action="OUT", from_wh=wh, created_at=ts,
+                                  type_action=rng.choices(OUT_TYPES, OUT_WEIGHTS)[0], note="OUT (bulk)",
+                                  batch_id=f"{prefix}-{ts:%Y%m%d}"))
+            else:
+                pool[key] = pool.get(key, 0) + qty
+                moves.append(Move(product=p, quantity=qty, action="IN", to_wh=wh, created_at=ts,
+                                  type_action=rng.choices(IN_TYPES, IN_WEIGHTS)[0], note="IN (bulk)",
+                                  batch_id=f"{prefix}-{ts:%Y%m%d}"))
+        Move.objects.bulk_create(moves, batch_size=BATCH)
+
+        for key, qty in pool.items():
+            stock[key] = stock.get(key, 0) + qty
+        Inventory.objects.bulk_create([
+            Inventory(product_id=p, warehouse_id=w, qty=q) for (p, w), q in stock.items()
+        ], batch_size=BATCH)
+
+    return {"warehouses": len(whs), "products": len(prods), "items": len(item_objs),
+            "moves": len(moves), "inventory": len(stock)}
+
+
+def flush(prefix="SYN"):
+    """Xoá toàn bộ dữ liệu mang prefix (kể cả move/đơn tham chiếu tới chúng)."""
+    prods = Product.objects.filter(sku__startswith=f"{prefix}-")
+    whs = Warehouse.objects.filter(code__startswith=f"{prefix}-")
+    with transaction.atomic():
+        counts = {
+            "moves": Move.objects.filter(
+                Q(item__product__in=prods) | Q(product__in=prods) | Q(from_wh__in=whs) | Q(to_wh__in=whs)
+            ).delete()[0],
+        }
+        StockOrderLine.objects.filter(Q(item__product__in=prods) | Q(product__in=prods)).delete()
+        StockOrder.objects.filter(Q(from_wh__in=whs) | Q(to_wh__in=whs)).delete()
+        Inventory.objects.filter(Q(product__in=prods) | Q(warehouse__in=whs)).delete()
+        counts["items"] = Item.objects.filter(product__in=prods).delete()[0]
+        counts["products"] = prods.delete()[0]
+        counts["warehouses"] = whs.delete()[0]
+    return counts
+
+
+# ---------- Benchmark ----------
+@dataclass
+class Env:
+    client: Client
+    prefix: str
+    warehouses: list
+    products: list
+
+
+@dataclass
+class Case:
+    name: str
+    prepare: object     # (env, n) -> step(i); chạy ngoài phần đo
+    repeat: int = 30
+
+
+def _scan_payload(item, action, wh):
+    return {"barcode": item.barcode_text, "action": action, "type_action": "BENCH", "tag": 1,
+            "wh_id": wh.id}
+
+
+def _scan_in(env, n):
+    wh = env.warehouses[0]
+    p = env.products[0]
+    today = timezone.localdate()
+    start = (Item.objects.filter(product=p, import_date=today).order_by("-seq")
+             .values_list("seq", flat=True).first() or 0) + 1
+    items = [Item(product=p, import_date=today, seq=s, barcode_text=f"{p.code4}{today:%d%m%y}{s:05d}")
+             for s in range(start, start + n)]
+    Item.objects.bulk_create(items)
+
+    def step(i):
+        res = env.client.post("/api/scan/scan", _scan_payload(items[i], "IN", wh), content_type="application/json")
+        assert res.status_code == 200, res.content
+    return step
+
+
+def _scan_out(env, n):
+    wh = env.warehouses[0]
+    items = list(Item.objects.filter(warehouse=wh, status="in_stock").order_by("id")[:n])
+    if len(items) < n:
+        raise RuntimeError(f"Cần {n} item in_stock ở {wh.code}, chỉ có {len(items)}.")
+
+    def step(i):
+        res = env.client.post("/api/scan/scan", _scan_payload(items[i], "OUT", wh), content_type="application/json")
+        assert res.status_code == 200, res.content
+    return step
+
+
+def _order_confirm(env, n, lines=20):
+    wh = env.warehouses[0]
+    orders = StockOrder.objects.bulk_create([StockOrder(order_type="IN", source="API", to_wh=wh) for _ in range(n)])
+    prods = env.products[:lines]
+    StockOrderLine.objects.bulk_create([
+        StockOrderLine(order=o, product=p, quantity=5) for o in orders for p in prods
+    ], batch_size=BATCH)
+
+    def step(i):
+        orders[i].confirm(batch_id=f"BENCH-{i}")
+    return step
+
+
+def _allocate(env, n):
+    from .views import allocate_bulk_out
+
+    inv = (Inventory.objects.filter(warehouse__in=env.warehouses, product__in=env.products)
+           .select_related("product", "warehouse").order_by("-qty").first())
+    if inv is None:
+        raise RuntimeError("Chưa có tồn kho để allocate.")
+    qty = max(1, inv.qty - 1)
+
+    def step(i):
+        allocate_bulk_out(inv.product, inv.warehouse, qty, allow_consume_itemized=True)
+    return step
+
+
+def _get(url):
+    def prepare(env, n):
+        def step(i):
+            res = env.client.get(url)
+            assert res.status_code == 200, res.status_code
+            b"".join(res) if getattr(res, "streaming", False) else res.content
+        return step
+    return prepare
+
+
+CASES = [
+    Case("scan_in", _scan_in),
+    Case("scan_out", _scan_out),
+    Case("order_confirm", _order_confirm, repeat=10),
+    Case("allocate_bulk_out", _allocate),
+    Case("history", _get("/api/history/")),
+    Case("items_list", _get("/api/items/?page=1&page_size=50")),
+    Case("export_barcodes_csv", _get("/api/items/export_csv/"), repeat=5),
+    Case("export_history_csv", _get("/api/history/?export=csv"), repeat=5),
+]
+
+
+def _stats(samples):
+    s = sorted(samples)
+    return {
+        "runs": len(s),
+        "min_ms": round(s[0], 3),
+        "p50_ms": round(statistics.median(s), 3),
+        "p95_ms": round(s[min(len(s) - 1, int(round(0.95 * (len(s) - 1))))], 3),
+        "mean_ms": round(statistics.fmean(s), 3),
+        "max_ms": round(s[-1], 3),
+    }
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+def run(names=None, repeat=None, warmup=1, prefix="SYN"):
+    """Chạy các case (mặc định tất cả); trả về dict sẵn sàng ghi JSON."""
+    env = Env(
+        client=Client(),
+        prefix=prefix,
+        warehouses=list(Warehouse.objects.filter(code__startswith=f"{prefix}-").order_by("code")),
+        products=list(Product.objects.filter(sku__startswith=f"{prefix}-").order_by("sku")),
+    )
+    if not env.warehouses or not env.products:
+        raise RuntimeError(f"Chưa có dữ liệu prefix '{prefix}'. Chạy `manage.py seed_synthetic` trước.")
+
+    results = {}
+    for case in CASES:
+        if names and case.name not in names:
+            continue
+        n = repeat or case.repeat
+        try:
+            with transaction.atomic():
+                step = case.prepare(env, n + warmup)
+                queries = None
+                for i in range(warmup):
+                    with CaptureQueriesContext(connection) as ctx:
+                        step(i)
+                    queries = len(ctx.captured_queries)
+                samples = []
+                for i in range(warmup, warmup + n):
+                    t0 = time.perf_counter()
+                    step(i)
+                    samples.append((time.perf_counter() - t0) * 1000)
+                transaction.set_rollback(True)
+            results[case.name] = {**_stats(samples), "queries": queries}
+        except Exception as e:
+            results[case.name] = {"error": str(e)[:500]}
+
+    return {
+        "started_at": timezone.now().isoformat(timespec="seconds"),
+        "git": _git_rev(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "db": connection.vendor,
+        "dataset": {
+            "products": Product.objects.count(),
+            "warehouses": Warehouse.objects.count(),
+            "items": Item.objects.count(),
+            "moves": Move.objects.count(),
+        },
+        "results": results,
+    }
+
+
+def compare(current, previous):
+    """{case: % thay đổi p50 so với lần trước} (âm = nhanh hơn)."""
+    out = {}
+    for name, cur in current.get("results", {}).items():
+        prev = previous.get("results", {}).get(name) or {}
+        if "p50_ms" in cur and prev.get("p50_ms"):
+            out[name] = round((cur["p50_ms"] - prev["p50_ms"]) / prev["p50_ms"] * 100, 1)
+    return out
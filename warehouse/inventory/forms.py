@@ -109,3 +109,5 @@ class ManualUploadForm(forms.Form):
 class SQLQueryForm(forms.Form):
     name = forms.CharField(max_length=128, required=False)
     sql  = forms.CharField(widget=forms.Textarea(attrs={"rows":10, "spellcheck":"false"}))
+    materialize = forms.BooleanField(required=False, label="Lưu sẵn kết quả (materialize)")
+    refresh_seconds = forms.IntegerField(required=False, min_value=60, initial=3600, label="Làm mới mỗi (giây)")
@@ -0,0 +1,211 @@
+# inventory/importers.py
+"""
+Parser file upload CSV/XLSX dùng chung cho manual_upload, ManualBatchView /upload và BOMStocktakeView.
+
+- Đọc theo luồng: CSV giải mã dần qua TextIOWrapper (utf-8-sig), sniff dialect trên chunk đầu;
+  XLSX dùng openpyxl read_only + iter_rows (không list() cả sheet).
+- Alias tiêu đề chuẩn hoá 1 lần khi khai báo Schema (không dựng lại set cho mỗi cột / mỗi file).
+- iter_rows() yield từng dòng đã kiểm tra; dòng lỗi ghi vào reader.errors (số dòng trong file) rồi đi tiếp.
+- Giới hạn cứng IMPORT_MAX_ROWS / IMPORT_MAX_BYTES -> ImportFileError (dừng đọc ngay).
+"""
+import csv
+import io
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import date, datetime
+from itertools import chain
+
+from django.conf import settings
+
+try:
+    from openpyxl import load_workbook   # pip install openpyxl
+except Exception:
+    load_workbook = None
+
+SNIFF_CHARS = 8192
+MAX_ERRORS = 200   # giữ tối đa bấy nhiêu lỗi chi tiết (vẫn đếm hết)
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+class ImportFileError(ValueError):
+    """File không đọc được / thiếu cột / vượt giới hạn / có dòng lỗi (errors = [{"row", "errors"}])."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def normalize(s) -> str:
+    s = str(s or "").strip()
+    s = unicodedata.normalize("NFD", s).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "", s.lower())
+
+
+def _text(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        v = v.date()
+    if isinstance(v, date):
+        return v.strftime("%d/%m/%Y")
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return str(v).strip()
+
+
+def _int(v) -> int:
+    return int(v.replace(",", "").replace(" ", ""))
+
+
+@dataclass(frozen=True)
+class Column:
+    key: str
+    aliases: tuple
+    required: bool = False      # thiếu cột -> lỗi cả file
+    parse: object = None        # hàm str -> giá trị; ValueError -> lỗi dòng
+    default: object = ""        # giá trị khi ô trống
+
+
+class Schema:
+    """Khai báo cột; bảng alias đã chuẩn hoá được dựng 1 lần ở đây."""
+
+    def __init__(self, columns, skip_blank=()):
+        self.columns = tuple(columns)
+        self.skip_blank = tuple(skip_blank)   # thiếu 1 trong các key này -> bỏ qua dòng (không tính lỗi)
+        self.alias_map = {}
+        for col in self.columns:
+            for a in (col.key, *col.aliases):
+                self.alias_map.setdefault(normalize(a), col.key)
+
+    def map_headers(self, headers):
+        """{key: index cột}; cột đầu tiên khớp alias được dùng."""
+        mapping = {}
+        for i, h in enumerate(headers):
+            key = self.alias_map.get(normalize(h))
+            if key is not None and key not in mapping:
+                mapping[key] = i
+        missing = [c.key for c in self.columns if c.required and c.key not in mapping]
+        if missing:
+            raise ImportFileError(f"Thiếu cột bắt buộc: {', '.join(missing)}.")
+        return mapping
+
+
+MANUAL = Schema([
+    Column("sku", ("mã", "ma", "ma sp", "ma_san_pham", "ma san pham", "product_sku"), required=True),
+    Column("qty", ("so luong", "số lượng", "quantity", "q"), required=True, parse=_int),
+    Column("name", ("ten", "tên", "product_name")),
+    Column("note", ("ghi chu", "ghi chú", "ghichu")),
+    Column("import_date", ("importdate", "ngay nhap", "ngày nhập", "date")),
+], skip_blank=("sku", "qty"))
+
+STOCKTAKE = Schema([
+    Column("warehouse_code", ("warehouse", "wh", "kho", "ma kho", "mã kho"), required=True),
+    Column("sku", ("mã", "ma", "ma sp", "product_sku"), required=True),
+    Column("counted_qty", ("counted", "qty", "so luong", "số lượng", "so luong dem"),
+           required=True, parse=_int, default=0),
+])
+
+
+class UploadReader:
+    """
+    for row in UploadReader(dj_file, MANUAL): ...
+    Sau khi duyệt hết: reader.errors, reader.error_count, reader.rows (số dòng dữ liệu đã đọc).
+    """
+
+    def __init__(self, dj_file, schema, max_rows=None, max_bytes=None):
+        self.file = dj_file
+        self.schema = schema
+        self.max_rows = int(max_rows or _conf("IMPORT_MAX_ROWS", 50000))
+        self.max_bytes = int(max_bytes or _conf("IMPORT_MAX_BYTES", 20 * 1024 * 1024))
+        self.errors = []
+        self.error_count = 0
+        self.rows = 0
+
+    def __iter__(self):
+        size = getattr(self.file, "size", None)
+        if size is not None and size > self.max_bytes:
+            raise ImportFileError(f"File quá lớn ({size} bytes, tối đa {self.max_bytes}).")
+        name = (getattr(self.file, "name", "") or "").lower()
+        raw = self._xlsx_rows() if name.endswith(".xlsx") else self._csv_rows()
+        return self._validated(raw)
+
+    def raise_if_errors(self):
+        if self.error_count:
+            raise ImportFileError(f"{self.error_count} dòng lỗi trong file.", self.errors)
+
+    # ----- nguồn dòng thô -----
+    def _csv_rows(self):
+        f = getattr(self.file, "file", self.file)
+        text = io.TextIOWrapper(f, encoding="utf-8-sig", errors="replace", newline="")
+        try:
+            sample = text.read(SNIFF_CHARS)
+            sample += text.readline()   # chunk đầu kết thúc đúng cuối dòng
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+            except csv.Error:
+                dialect = csv.excel
+            yield from csv.reader(chain(io.StringIO(sample), text), dialect)
+        finally:
+            text.detach()   # không đóng file upload của Django
+
+    def _xlsx_rows(self):
+        if not load_workbook:
+            raise ImportFileError("Thiếu thư viện openpyxl. Chạy: pip install openpyxl")
+        wb = load_workbook(filename=getattr(self.file, "file", self.file), read_only=True, data_only=True)
+        try:
+            for r in wb.active.iter_rows(values_only=True):
+                yield [_text(v) for v in r]
+        finally:
+            wb.close()
+
+    # ----- kiểm tra -----
+    def _validated(self, raw):
+        rows = iter(raw)
+        headers = next(rows, None)
+        if headers is None:
+            return
+        mapping = self.schema.map_headers(headers)
+        cols = [(c, mapping[c.key]) for c in self.schema.columns if c.key in mapping]
+        skip = self.schema.skip_blank
+
+        for lineno, r in enumerate(rows, start=2):
+            if not any(r):   # dòng trống
+                continue
+            self.rows += 1
+            if self.rows > self.max_rows:
+                raise ImportFileError(f"File vượt quá {self.max_rows} dòng dữ liệu.")
+            vals = {c.key: (r[i].strip() if i < len(r) else "") for c, i in cols}
+            if any(not vals.get(k) for k in skip):
+                continue
+            row, errs = {}, []
+            for c, _ in cols:
+                v = vals[c.key]
+                if not v:
+                    if c.default != "":
+                        row[c.key] = c.default
+                    continue
+                if c.parse is None:
+                    row[c.key] = v
+                    continue
+                try:
+                    row[c.key] = c.parse(v)
+                except ValueError:
+                    errs.append(f"{c.key} không hợp lệ: {v}")
+            if errs:
+                self.error_count += 1
+                if len(self.errors) < MAX_ERRORS:
+                    self.errors.append({"row": lineno, "errors": errs})
+                continue
+            yield row
+
+
+def read_upload(dj_file, schema):
+    """Đọc hết file -> list dòng hợp lệ; có dòng lỗi -> ImportFileError (kèm danh sách lỗi)."""
+    reader = UploadReader(dj_file, schema)
+    rows = list(reader)
+    reader.raise_if_errors()
+    return rows
@@ -0,0 +1,330 @@
+# inventory/labels.py
+"""
+Nhãn in trực tiếp cho máy in nhiệt (Zebra): ZPL / EPL.
+
+- Máy in tự vẽ Code128 + tên sản phẩm -> server không render PNG, nét in sắc ở 203 dpi.
+- ~150 byte / nhãn: job 5.000 nhãn chỉ vài trăm KB text (thay vì hàng trăm MB PNG).
+- write_job(): ghi cả job ra 1 file (từng chunk, tmp + rename); spool_job(): ghi vào LABEL_SPOOL_DIR
+  để agent máy in nhặt file; iter_file(): stream thẳng không ghi đĩa (tải lại batch).
+- Kích thước tính theo dot (203 dpi: 8 dot/mm), cấu hình LABEL_* trong settings.
+
+PDF (tờ decal A4 nhiều tem): lưới theo template LABEL_PDF_TEMPLATES (cols, rows, lề, khoảng cách),
+Code128 vẽ vector (mã hoá bằng python-barcode, mỗi vạch là 1 hình chữ nhật). Ghi/stream từng trang
+(mỗi trang 1 content stream nén) -> bộ nhớ không tăng theo số tem.
+"""
+import os
+import unicodedata
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+
+PNG, ZPL, EPL, PDF = "png", "zpl", "epl", "pdf"
+FORMATS = (PNG, ZPL, EPL, PDF)
+TEXT_FORMATS = (ZPL, EPL)
+CONTENT_TYPES = {ZPL: "application/vnd.zebra-zpl", EPL: "application/vnd.zebra-epl", PDF: "application/pdf"}
+MANIFEST = "codes.txt"
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def parse_format(value) -> str:
+    """Chuẩn hoá tham số format (png|zpl|epl); rỗng -> LABEL_DEFAULT_FORMAT. ValueError nếu không hỗ trợ."""
+    fmt = (str(value or "").strip().lower()) or _conf("LABEL_DEFAULT_FORMAT", PNG)
+    if fmt not in FORMATS:
+        raise ValueError(f"format không hỗ trợ: {fmt} (chỉ {', '.join(FORMATS)}).")
+    return fmt
+
+
+def _ascii(text: str) -> str:
+    # EPL chỉ có font ASCII: bỏ dấu tiếng Việt
+    text = (text or "").replace("đ", "d").replace("Đ", "D")
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c) and 32 <= ord(c) < 127)
+
+
+def _zpl_text(text: str) -> str:
+    # dùng cùng ^FH: ký tự điều khiển ZPL -> mã hex
+    return (text or "").replace("_", "_5F").replace("^", "_5E").replace("~", "_7E")
+
+
+def _epl_text(text: str) -> str:
+    return _ascii(text).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _title(title: str) -> str:
+    return (title or "").strip()[: int(_conf("LABEL_TITLE_MAX_CHARS", 32))]
+
+
+def zpl_label(code: str, title: str = "") -> str:
+    w = int(_conf("LABEL_WIDTH_DOTS", 406))
+    h = int(_conf("LABEL_HEIGHT_DOTS", 203))
+    module = int(_conf("LABEL_MODULE_DOTS", 2))
+    bar_h = int(_conf("LABEL_BAR_HEIGHT_DOTS", 90))
+    return (
+        f"^XA^CI28^PW{w}^LL{h}"
+        f"^FO16,12^A0N,24,24^FB{w - 32},1,0,C^FH^FD{_zpl_text(_title(title))}^FS"
+        f"^FO24,46^BY{module}^BCN,{bar_h},Y,N,N^FH^FD{_zpl_text(code)}^FS"
+        "^XZ\n"
+    )
+
+
+def epl_label(code: str, title: str = "") -> str:
+    w = int(_conf("LABEL_WIDTH_DOTS", 406))
+    h = int(_conf("LABEL_HEIGHT_DOTS", 203))
+    module = int(_conf("LABEL_MODULE_DOTS", 2))
+    bar_h = int(_conf("LABEL_BAR_HEIGHT_DOTS", 90))
+    return (
+        f"\nN\nq{w}\nQ{h},24\n"
+        f'A16,12,0,3,1,1,N,"{_epl_text(_title(title))}"\n'
+        f'B24,46,0,1,{module},{module},{bar_h},B,"{_epl_text(code)}"\n'
+        "P1\n"
+    )
+
+
+_RENDER = {ZPL: zpl_label, EPL: epl_label}
+
+
+def iter_job(fmt: str, labels, chunk: int = 500):
+    """Sinh text của job theo chunk; labels: iterable (barcode, title)."""
+    render = _RENDER[fmt]
+    buf = []
+    for code, title in labels:
+        buf.append(render(code, title))
+        if len(buf) >= chunk:
+            yield "".join(buf)
+            buf = []
+    if buf:
+        yield "".join(buf)
+
+
+def write_job(fmt: str, labels, path) -> int:
+    """Ghi job ra `path` (ghi file tạm rồi rename, agent không nhặt file dở). Trả về số nhãn."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    count = 0
+
+    def _counted():
+        nonlocal count
+        for row in labels:
+            count += 1
+            yield row
+
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        for part in iter_job(fmt, _counted()):
+            f.write(part)
+    os.replace(tmp, path)
+    return count
+
+
+def spool_enabled() -> bool:
+    return bool(_conf("LABEL_SPOOL_DIR", None))
+
+
+def spool_job(fmt: str, labels, name: str) -> Path:
+    """Ghi job vào LABEL_SPOOL_DIR/<name>.<fmt>. ValueError nếu chưa cấu hình thư mục spool."""
+    spool_dir = _conf("LABEL_SPOOL_DIR", None)
+    if not spool_dir:
+        raise ValueError("Chưa cấu hình LABEL_SPOOL_DIR.")
+    path = Path(spool_dir) / f"{name}.{fmt}"
+    write_job(fmt, labels, path)
+    return path
+
+
+def save_manifest(batch_dir, codes):
+    """Danh sách barcode của batch (theo thứ tự in) để in lại batch ở format khác."""
+    Path(batch_dir, MANIFEST).write_text("\n".join(codes) + "\n", encoding="utf-8")
+
+
+def batch_codes(batch_dir) -> list:
+    """Barcode của batch: codes.txt, batch cũ (chỉ có PNG) thì lấy theo tên file ảnh."""
+    manifest = Path(batch_dir, MANIFEST)
+    if manifest.is_file():
+        return [c for c in manifest.read_text(encoding="utf-8").split() if c]
+    return sorted(p.stem.replace("∕", "/") for p in Path(batch_dir).rglob("*.png"))
+
+
+def titles_for(codes) -> dict:
+    """{barcode: tên sản phẩm} cho danh sách barcode — 1 query."""
+    from .models import Item
+
+    return dict(
+        Item.objects.filter(barcode_text__in=list(codes)).values_list("barcode_text", "product__name")
+    )
+
+
+# ---------- PDF nhiều tem / trang ----------
+MM = 72 / 25.4   # mm -> point
+
+
+def pdf_template(name=None, cols=None, rows=None, margin_mm=None) -> dict:
+    """Template lưới (đơn vị mm) theo tên trong LABEL_PDF_TEMPLATES, cho phép ghi đè cols/rows/lề."""
+    templates = _conf("LABEL_PDF_TEMPLATES", {})
+    name = name or _conf("LABEL_PDF_DEFAULT_TEMPLATE", "a4-3x8")
+    if name not in templates:
+        raise ValueError(f"Template tem không tồn tại: {name} (có: {', '.join(templates)}).")
+    t = dict(templates[name])
+    try:
+        if cols:
+            t["cols"] = int(cols)
+        if rows:
+            t["rows"] = int(rows)
+        if margin_mm not in (None, ""):
+            m = margin_mm if isinstance(margin_mm, (list, tuple)) else [margin_mm] * 4
+            t["margin_mm"] = tuple(float(v) for v in m)
+    except (TypeError, ValueError):
+        raise ValueError("cols/rows/margin_mm không hợp lệ.")
+    if len(t.get("margin_mm", ())) != 4 or not (0 < t["cols"] <= 20 and 0 < t["rows"] <= 40):
+        raise ValueError("Template cần cols 1..20, rows 1..40, margin_mm 4 giá trị (trên, phải, dưới, trái).")
+    return t
+
+
+def _pdf_text(text: str) -> bytes:
+    # Helvetica/WinAnsi: chỉ ASCII an toàn; escape ( ) \
+    return _ascii(text).replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("latin-1")
+
+
+def _code128_modules(code: str) -> str:
+    from barcode import Code128
+
+    return Code128(code).build()[0]
+
+
+def _cell_ops(x, y, w, h, code, title, font_pt) -> bytes:
+    """Lệnh vẽ 1 tem trong ô (x, y góc dưới trái, đơn vị point)."""
+    pad = 1.5 * MM
+    inner = w - 2 * pad
+    max_chars = max(int(inner / (0.5 * font_pt)), 1)
+    ops = [b"BT /F1 %.1f Tf %.2f %.2f Td (%s) Tj ET" % (
+        font_pt, x + pad, y + h - pad - font_pt, _pdf_text((title or "")[:max_chars]))]
+
+    modules = "0" * 10 + _code128_modules(code) + "0" * 10   # quiet zone 10 module mỗi bên
+    mw = inner / len(modules)
+    bar_bottom = y + pad + font_pt + 1
+    bar_h = max(h - 2 * pad - 2 * font_pt - 3, 4)
+    i, n = 0, len(modules)
+    while i < n:
+        if modules[i] == "1":
+            j = i
+            while j < n and modules[j] == "1":
+                j += 1
+            ops.append(b"%.3f %.2f %.3f %.2f re" % (x + pad + i * mw, bar_bottom, (j - i) * mw, bar_h))
+            i = j
+        else:
+            i += 1
+    ops.append(b"f")
+
+    text_w = 0.556 * font_pt * len(code)   # chữ số Helvetica rộng 0.556 em
+    ops.append(b"BT /F1 %.1f Tf %.2f %.2f Td (%s) Tj ET" % (
+        font_pt, x + (w - text_w) / 2, y + pad, _pdf_text(code)))
+    return b"\n".join(ops)
+
+
+class _PdfWriter:
+    """PDF 1.4 tối giản, ghi tuần tự: 1 catalog, 2 pages (ghi cuối), 3 font, từ 4: content + page."""
+
+    def __init__(self, page_w, page_h):
+        self.page_w, self.page_h = page_w, page_h
+        self.offset = 0
+        self.xref = {}
+        self.kids = []
+        self.next_id = 4
+
+    def _obj(self, num, body: bytes) -> bytes:
+        self.xref[num] = self.offset
+        data = b"%d 0 obj\n" % num + body + b"\nendobj\n"
+        self.offset += len(data)
+        return data
+
+    def header(self) -> bytes:
+        data = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self.offset += len(data)
+        return (
+            data
+            + self._obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+            + self._obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        )
+
+    def page(self, content: bytes) -> bytes:
+        stream = zlib.compress(content, 6)
+        cid, pid = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.kids.append(pid)
+        return (
+            self._obj(cid, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+            + self._obj(pid, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+                             b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+                        % (self.page_w, self.page_h, cid))
+        )
+
+    def finish(self) -> bytes:
+        kids = b" ".join(b"%d 0 R" % k for k in self.kids)
+        data = self._obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.kids)))
+        xref_at = self.offset
+        parts = [b"xref\n0 %d\n" % self.next_id, b"0000000000 65535 f \n"]
+        parts.extend(b"%010d 00000 n \n" % self.xref[i] for i in range(1, self.next_id))
+        parts.append(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_id, xref_at))
+        return data + b"".join(parts)
+
+
+def iter_pdf(labels, template=None):
+    """Sinh bytes PDF theo từng trang; labels: iterable (barcode, title)."""
+    t = template or pdf_template()
+    page_w, page_h = (v * MM for v in t["page_mm"])
+    top, right, bottom, left = (v * MM for v in t["margin_mm"])
+    gap_x, gap_y = (v * MM for v in t.get("gap_mm", (0, 0)))
+    cols, rows = t["cols"], t["rows"]
+    cell_w = (page_w - left - right - gap_x * (cols - 1)) / cols
+    cell_h = (page_h - top - bottom - gap_y * (rows - 1)) / rows
+    font_pt = float(t.get("font_pt", 7))
+
+    writer = _PdfWriter(page_w, page_h)
+    yield writer.header()
+    ops, n = [], 0
+    for code, title in labels:
+        r, c = divmod(n, cols)
+        x = left + c * (cell_w + gap_x)
+        y = page_h - top - (r + 1) * cell_h - r * gap_y
+        ops.append(_cell_ops(x, y, cell_w, cell_h, code, title, font_pt))
+        n += 1
+        if n == cols * rows:
+            yield writer.page(b"\n".join(ops))
+            ops, n = [], 0
+    if ops or not writer.kids:
+        yield writer.page(b"\n".join(ops))
+    yield writer.finish()
+
+
+def write_pdf(labels, path, template=None) -> Path:
+    """Ghi PDF ra `path` từng trang (tmp + rename)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        for part in iter_pdf(labels, template):
+            f.write(part)
+    os.replace(tmp, path)
+    return path
+
+
+def template_from(data) -> dict:
+    """Template PDF từ tham số request (template, cols, rows, margin_mm)."""
+    return pdf_template(data.get("template"), data.get("cols"), data.get("rows"), data.get("margin_mm"))
+
+
+def iter_file(fmt: str, labels, template=None):
+    """Nội dung file tem (zpl/epl/pdf) theo chunk, không ghi đĩa."""
+    if fmt == PDF:
+        return iter_pdf(labels, template)
+    return (part.encode("utf-8") for part in iter_job(fmt, labels))
+
+
+def render_file(fmt: str, labels, path, template=None) -> Path:
+    """Ghi 1 file tem (zpl/epl/pdf) ra `path`."""
+    if fmt == PDF:
+        return write_pdf(labels, path, template)
+    write_job(fmt, labels, path)
+    return Path(path)
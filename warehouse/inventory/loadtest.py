@@ -0,0 +1,322 @@
+# inventory/loadtest.py
+"""
+Load test cục bộ: phát lại hỗn hợp request (ghi sẵn hoặc tổng hợp) vào WSGI app thật, tăng dần concurrency.
+
+- Server: mặc định dựng WSGI app (get_wsgi_application) trên wsgiref đa luồng ở 127.0.0.1:<port trống>;
+  hoặc --url trỏ tới server đang chạy (gunicorn/runserver) để đo đúng cấu hình deploy.
+- Mix: file JSONL {"name"?, "method", "path", "body"?, "headers"?} phát lại theo thứ tự (vòng lại khi hết),
+  hoặc synthesize() từ dữ liệu trong DB: đợt quét đầu ca, đơn ecom dồn dập, dashboard polling.
+- Mỗi stage (concurrency) chạy `duration` giây: throughput, p50/p95/p99, tỉ lệ lỗi theo endpoint.
+- SQLite: khi tự dựng server, execute wrapper trên mọi connection đếm lỗi "database is locked/busy"
+  và thời gian câu ghi (INSERT/UPDATE/DELETE — gồm cả thời gian chờ khoá); chế độ --url chỉ đếm qua body 500.
+
+Lưu ý: request ghi (scan, import-orders) ghi thật vào DB đang cấu hình -> chạy trên dữ liệu seed_synthetic.
+"""
+import http.client
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+from socketserver import ThreadingMixIn
+from urllib.parse import quote, urlsplit
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.db import OperationalError
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from .models import Item, Product, Warehouse
+
+BUSY_MARKERS = ("database is locked", "database table is locked", "database is busy")
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# ---------- Mix ----------
+# (tên phase, tỉ lệ trong mix, trọng số từng loại request)
+PHASES = (
+    ("shift_start", 1, {"scan_in": 6, "scan_out": 2, "history_stats": 1, "history_updates": 1}),
+    ("ecom_flood", 1, {"import_orders": 7, "scan_out": 1, "history_stats": 1, "inventory": 1}),
+    ("steady", 1, {"history_stats": 3, "history_updates": 3, "inventory": 1, "items_list": 2, "history": 1}),
+)
+
+
+def load_mix(path):
+    """Đọc file JSONL; dòng trống / comment (#) bỏ qua."""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                e = json.loads(line)
+            except ValueError as exc:
+                raise ValueError(f"{path}:{lineno}: JSON lỗi: {exc}")
+            if not e.get("path"):
+                raise ValueError(f"{path}:{lineno}: thiếu path.")
+            e["method"] = (e.get("method") or "GET").upper()
+            e.setdefault("name", f"{e['method']} {e['path'].split('?')[0]}")
+            entries.append(e)
+    if not entries:
+        raise ValueError(f"{path}: không có request nào.")
+    return entries
+
+
+def save_mix(entries, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+
+def synthesize(n=3000, prefix="SYN", rng_seed=7):
+    """Tạo mix n request từ dữ liệu có prefix (seed_synthetic); mỗi barcode scan chỉ dùng 1 lần."""
+    rng = random.Random(rng_seed)
+    whs = list(Warehouse.objects.filter(code__startswith=f"{prefix}-").order_by("code"))
+    skus = list(Product.objects.filter(sku__startswith=f"{prefix}-").order_by("sku").values_list("sku", flat=True))
+    if not whs or not skus:
+        raise ValueError(f"Chưa có dữ liệu prefix '{prefix}'. Chạy `manage.py seed_synthetic` trước.")
+    scan_in = iter(Item.objects.filter(product__sku__startswith=f"{prefix}-", status="none", warehouse__isnull=True)
+                   .order_by("?").values_list("barcode_text", flat=True)[:n])
+    scan_out = iter(Item.objects.filter(product__sku__startswith=f"{prefix}-", status="in_stock")
+                    .order_by("?").values_list("barcode_text", "warehouse_id")[:n])
+    since = quote((timezone.now() - timedelta(minutes=5)).isoformat(timespec="seconds"))
+    stamp = timezone.localtime().strftime("%Y%m%d%H%M%S")
+    seq = itertools.count(1)
+
+    def build(kind):
+        if kind == "scan_in":
+            code = next(scan_in, None)
+            if code is not None:
+                return {"name": kind, "method": "POST", "path": "/api/scan/scan", "body": {
+                    "barcode": code, "action": "IN", "type_action": "LOADTEST", "tag": 1, "wh_id": whs[0].id}}
+        if kind == "scan_out":
+            row = next(scan_out, None)
+            if row is not None:
+                return {"name": kind, "method": "POST", "path": "/api/scan/scan", "body": {
+                    "barcode": row[0], "action": "OUT", "type_action": "LOADTEST", "tag": 1, "wh_id": row[1]}}
+        if kind == "import_orders":
+            lines = [{"sku": sku, "qty": rng.randint(1, 10)} for sku in rng.sample(skus, min(len(skus), rng.randint(1, 5)))]
+            return {"name": kind, "method": "POST", "path": "/api/bulk/import-orders", "body": {"orders": [{
+                "external_id": f"LT-{stamp}-{next(seq)}", "order_type": "IN",
+                "warehouse_id": rng.choice(whs).id, "reference": "LOADTEST", "lines": lines}]}}
+        if kind == "history_updates":
+            return {"name": kind, "method": "GET", "path": f"/api/history/updates/?last_update={since}"}
+        if kind == "inventory":
+            return {"name": kind, "method": "GET", "path": f"/api/inventory/?wh={rng.choice(whs).id}"}
+        if kind == "items_list":
+            return {"name": kind, "method": "GET", "path": "/api/items/?page=1&page_size=50"}
+        if kind == "history":
+            return {"name": kind, "method": "GET", "path": f"/api/history/?start={timezone.localdate():%Y-%m-%d}"}
+        # history_stats + fallback khi hết barcode để quét
+        return {"name": "history_stats", "method": "GET", "path": "/api/history/stats/"}
+
+    entries = []
+    total = sum(share for _, share, _ in PHASES)
+    for phase, share, weights in PHASES:
+        kinds, w = list(weights), list(weights.values())
+        for _ in range(n * share // total):
+            kind = rng.choices(kinds, w)[0]
+            entries.append({**build(kind), "phase": phase})
+    return entries
+
+
+# ---------- Server ----------
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class SqliteProbe:
+    """Execute wrapper: đếm lỗi busy/locked và đo thời gian câu ghi trên mọi connection của server."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.busy_errors = 0
+            self.write_ms = []
+
+    def __call__(self, execute, sql, params, many, context):
+        write = sql.lstrip()[:7].upper().startswith(WRITE_PREFIXES)
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if any(m in str(e).lower() for m in BUSY_MARKERS):
+                with self.lock:
+                    self.busy_errors += 1
+            raise
+        finally:
+            if write:
+                ms = (time.perf_counter() - t0) * 1000
+                with self.lock:
+                    self.write_ms.append(ms)
+
+    def attach(self, sender, connection, **kwargs):
+        if connection.vendor == "sqlite" and self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def snapshot(self, slow_ms):
+        with self.lock:
+            writes = sorted(self.write_ms)
+            busy = self.busy_errors
+        return {
+            "busy_errors": busy,
+            "writes": len(writes),
+            "write_p50_ms": _pct(writes, 50),
+            "write_p95_ms": _pct(writes, 95),
+            "write_max_ms": round(writes[-1], 2) if writes else None,
+            "slow_writes": sum(1 for x in writes if x >= slow_ms),   # chủ yếu là chờ khoá ghi
+        }
+
+
+class LocalServer:
+    """WSGI app thật trên wsgiref đa luồng (mỗi request 1 thread, 1 connection DB)."""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        from django.core.wsgi import get_wsgi_application
+
+        self.probe = SqliteProbe()
+        connection_created.connect(self.probe.attach, weak=False)
+        self.httpd = make_server(host, port, get_wsgi_application(),
+                                 server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+        self.url = f"http://{host}:{self.httpd.server_port}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="loadtest-server")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        connection_created.disconnect(self.probe.attach)
+
+
+# ---------- Client ----------
+def _pct(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return round(sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo), 2)
+
+
+def _send(base, entry, timeout):
+    """-> (status | None, ms, busy). Mỗi request 1 connection (wsgiref/gunicorn sync đóng sau mỗi response)."""
+    u = urlsplit(base)
+    conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=timeout)
+    body = entry.get("body")
+    headers = dict(entry.get("headers") or {})
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+        headers.setdefault("Content-Type", "application/json")
+    t0 = time.perf_counter()
+    try:
+        conn.request(entry["method"], u.path.rstrip("/") + entry["path"], body=body, headers=headers)
+        resp = conn.getresponse()
+        data = resp.read()
+        status = resp.status
+    except (OSError, http.client.HTTPException):
+        return None, (time.perf_counter() - t0) * 1000, False
+    finally:
+        conn.close()
+    ms = (time.perf_counter() - t0) * 1000
+    busy = status >= 500 and any(m.encode() in data.lower() for m in BUSY_MARKERS)
+    return status, ms, busy
+
+
+def run_stage(base, entries, concurrency, duration, timeout=30):
+    """Chạy `concurrency` worker trong `duration` giây, lấy request lần lượt từ entries (iterator dùng chung)."""
+    lock = threading.Lock()
+    samples = []
+    deadline = time.monotonic() + duration
+
+    def worker():
+        local = []
+        while time.monotonic() < deadline:
+            with lock:
+                entry = next(entries)
+            status, ms, busy = _send(base, entry, timeout)
+            local.append((entry["name"], status, ms, busy))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, name=f"loadtest-{i}") for i in range(concurrency)]
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.monotonic() - t0
+
+
+def summarize(samples, elapsed):
+    by_name = {}
+    for name, status, ms, busy in samples:
+        by_name.setdefault(name, []).append((status, ms, busy))
+
+    def block(rows):
+        lat = sorted(ms for _, ms, _ in rows)
+        errors = sum(1 for s, _, _ in rows if s is None or s >= 500)
+        statuses = {}
+        for s, _, _ in rows:
+            statuses[str(s or "conn_error")] = statuses.get(str(s or "conn_error"), 0) + 1
+        return {
+            "count": len(rows),
+            "rps": round(len(rows) / elapsed, 2) if elapsed else None,
+            "p50_ms": _pct(lat, 50),
+            "p95_ms": _pct(lat, 95),
+            "p99_ms": _pct(lat, 99),
+            "max_ms": round(lat[-1], 2) if lat else None,
+            "error_rate": round(errors / len(rows), 4) if rows else 0,
+            "client_errors": sum(1 for s, _, _ in rows if s is not None and 400 <= s < 500),
+            "busy_responses": sum(1 for _, _, b in rows if b),
+            "status": statuses,
+        }
+
+    out = block([(s, ms, b) for _, s, ms, b in samples]) if samples else {"count": 0}
+    out["endpoints"] = {name: block(rows) for name, rows in sorted(by_name.items())}
+    return out
+
+
+def run(entries, ramp=(1, 4, 8, 16), duration=20, url=None, slow_write_ms=50, timeout=30, on_stage=None):
+    """Chạy các stage theo ramp; trả về report dict (ghi JSON được)."""
+    stream = itertools.cycle(entries)
+    stages = []
+
+    def go(base, probe):
+        for c in ramp:
+            if probe is not None:
+                probe.reset()
+            samples, elapsed = run_stage(base, stream, c, duration, timeout)
+            stage = {"concurrency": c, "duration_s": round(elapsed, 2), **summarize(samples, elapsed)}
+            if probe is not None:
+                stage["sqlite"] = probe.snapshot(slow_write_ms)
+            stages.append(stage)
+            if on_stage:
+                on_stage(stage)
+
+    if url:
+        go(url, None)
+        target = url
+    else:
+        with LocalServer() as srv:
+            go(srv.url, srv.probe)
+            target = f"{srv.url} (wsgiref, in-process)"
+
+    return {
+        "started_at": timezone.now().isoformat(timespec="seconds"),
+        "target": target,
+        "requests_in_mix": len(entries),
+        "stages": stages,
+    }
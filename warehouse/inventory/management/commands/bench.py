@@ -0,0 +1,51 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory import bench
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark các luồng nóng (scan, confirm, allocate, history, items, export CSV); ghi kết quả JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--case", action="append", choices=[c.name for c in bench.CASES],
+                            help="Chỉ chạy case này (lặp lại được).")
+        parser.add_argument("--repeat", type=int, help="Số lần đo mỗi case (mặc định theo case).")
+        parser.add_argument("--warmup", type=int, default=1, help="Số lượt chạy trước khi đo (đếm query ở đây).")
+        parser.add_argument("--prefix", default="SYN", help="Prefix dữ liệu seed_synthetic.")
+        parser.add_argument("--label", default="", help="Nhãn lưu trong JSON (vd tên nhánh/thay đổi).")
+        parser.add_argument("--output", help="File JSON kết quả (mặc định bench-YYYYmmdd-HHMMSS.json).")
+        parser.add_argument("--compare", help="File JSON lần chạy trước để in % thay đổi p50.")
+
+    def handle(self, *args, **opts):
+        previous = None
+        if opts.get("compare"):
+            try:
+                previous = json.loads(Path(opts["compare"]).read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Không đọc được --compare: {e}")
+
+        try:
+            report = bench.run(names=opts.get("case"), repeat=opts.get("repeat"),
+                               warmup=max(1, opts["warmup"]), prefix=opts["prefix"])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        report["label"] = opts["label"]
+
+        deltas = bench.compare(report, previous) if previous else {}
+        for name, r in report["results"].items():
+            if "error" in r:
+                self.stdout.write(self.style.ERROR(f"{name:<22} ERROR {r['error']}"))
+                continue
+            line = (f"{name:<22} p50 {r['p50_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms  "
+                    f"queries {r['queries']:>4}  (n={r['runs']})")
+            if name in deltas:
+                line += f"  {deltas[name]:+.1f}%"
+            self.stdout.write(line)
+
+        out = Path(opts.get("output") or f"bench-{timezone.localtime():%Y%m%d-%H%M%S}.json")
+        out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        self.stdout.write(self.style.SUCCESS(f"Đã ghi {out}"))
@@ -0,0 +1,40 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from warehouse import asyncbench
+
+
+class Command(BaseCommand):
+    help = ("So sánh WSGI (N sync worker) và ASGI (event loop + pool có giới hạn) khi có request ERP chậm: "
+            "độ trễ / throughput của API quét trong lúc các request duyệt đơn nghỉ đang chờ DB ngoài + SMTP/Lark.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--slow", type=int, default=12, help="Số request ERP chậm bắn cùng lúc.")
+        parser.add_argument("--clients", type=int, default=4, help="Số client gọi liên tục API quét.")
+        parser.add_argument("--duration", type=float, default=5, help="Số giây client API quét chạy.")
+        parser.add_argument("--workers", type=int, default=3, help="Số sync worker ở chế độ wsgi (gunicorn -w).")
+        parser.add_argument("--remote-ms", type=float, default=150, help="Giả lập: mỗi lần gọi DB ngoài (ms).")
+        parser.add_argument("--notify-ms", type=float, default=1500, help="Giả lập: gửi email + Lark (ms).")
+        parser.add_argument("--no-simulate", action="store_true",
+                            help="Không giả lập: gọi thẳng erp_postgres / ecom_platform / SMTP đang cấu hình.")
+        parser.add_argument("--output", help="File JSON kết quả (mặc định bench-async-YYYYmmdd-HHMMSS.json).")
+
+    def handle(self, *args, **opts):
+        report = asyncbench.run(
+            slow=opts["slow"], clients=opts["clients"], duration=opts["duration"], workers=opts["workers"],
+            simulate=not opts["no_simulate"], remote_ms=opts["remote_ms"], notify_ms=opts["notify_ms"],
+        )
+        for key in ("wsgi", "asgi"):
+            r = report[key]
+            f, s = r["fast"], r["slow"]
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{r['mode']}: {r['elapsed_s']}s"))
+            self.stdout.write(f"  API quét  n={f['count']:<6} {f['rps'] or 0:>7} rps  p50 {f['p50_ms']} "
+                              f"p95 {f['p95_ms']} max {f['max_ms']} ms  lỗi {f['errors']}")
+            self.stdout.write(f"  ERP chậm  n={s['count']:<6} p50 {s['p50_ms']} p95 {s['p95_ms']} "
+                              f"max {s['max_ms']} ms  lỗi {s['errors']}")
+        out = Path(opts.get("output") or f"bench-async-{timezone.localtime():%Y%m%d-%H%M%S}.json")
+        out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        self.stdout.write(self.style.SUCCESS(f"Đã ghi {out}"))
@@ -0,0 +1,69 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory import loadtest
+
+
+class Command(BaseCommand):
+    help = ("Load test: phát lại mix request (file JSONL hoặc tổng hợp từ dữ liệu seed_synthetic) vào WSGI app, "
+            "tăng dần concurrency; báo throughput, p50/p95/p99, lỗi theo endpoint và lỗi khoá SQLite. "
+            "Request ghi sẽ ghi thật vào DB.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mix", help="File JSONL request ghi sẵn (mặc định: tổng hợp từ DB).")
+        parser.add_argument("--synth", type=int, default=3000, help="Số request khi tổng hợp mix.")
+        parser.add_argument("--prefix", default="SYN", help="Prefix dữ liệu seed_synthetic dùng để tổng hợp.")
+        parser.add_argument("--save-mix", help="Ghi mix đã tổng hợp ra file JSONL (phát lại bằng --mix).")
+        parser.add_argument("--ramp", default="1,4,8,16", help="Các mức concurrency, vd 1,4,8,16.")
+        parser.add_argument("--duration", type=float, default=20, help="Số giây mỗi mức concurrency.")
+        parser.add_argument("--url", help="Server đang chạy (vd http://127.0.0.1:8000); mặc định tự dựng wsgiref.")
+        parser.add_argument("--slow-write-ms", type=float, default=50, help="Ngưỡng đếm câu ghi chậm (chờ khoá).")
+        parser.add_argument("--timeout", type=float, default=30, help="Timeout mỗi request (giây).")
+        parser.add_argument("--output", help="File JSON kết quả (mặc định loadtest-YYYYmmdd-HHMMSS.json).")
+
+    def handle(self, *args, **opts):
+        try:
+            ramp = [int(x) for x in opts["ramp"].split(",") if x.strip()]
+        except ValueError:
+            raise CommandError("--ramp phải là danh sách số nguyên, vd 1,4,8,16")
+        if not ramp or min(ramp) < 1:
+            raise CommandError("--ramp cần ít nhất 1 mức >= 1.")
+
+        try:
+            if opts.get("mix"):
+                entries = loadtest.load_mix(opts["mix"])
+            else:
+                entries = loadtest.synthesize(opts["synth"], prefix=opts["prefix"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        if opts.get("save_mix"):
+            loadtest.save_mix(entries, opts["save_mix"])
+            self.stdout.write(f"Đã ghi mix {len(entries)} request vào {opts['save_mix']}")
+
+        report = loadtest.run(
+            entries, ramp=ramp, duration=opts["duration"], url=opts.get("url"),
+            slow_write_ms=opts["slow_write_ms"], timeout=opts["timeout"], on_stage=self._print_stage,
+        )
+        out = Path(opts.get("output") or f"loadtest-{timezone.localtime():%Y%m%d-%H%M%S}.json")
+        out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        self.stdout.write(self.style.SUCCESS(f"Đã ghi {out}"))
+
+    def _print_stage(self, st):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"concurrency={st['concurrency']}: {st['count']} req / {st['duration_s']}s "
+            f"= {st.get('rps') or 0} rps, p95 {st.get('p95_ms')} ms, lỗi {st.get('error_rate', 0):.2%}"
+        ))
+        for name, e in st["endpoints"].items():
+            self.stdout.write(
+                f"  {name:<18} n={e['count']:<6} p50 {e['p50_ms']:>8} p95 {e['p95_ms']:>8} p99 {e['p99_ms']:>8} ms"
+                f"  err {e['error_rate']:.2%}  4xx {e['client_errors']}"
+            )
+        sq = st.get("sqlite")
+        if sq:
+            self.stdout.write(
+                f"  sqlite: busy={sq['busy_errors']} writes={sq['writes']} "
+                f"p95 {sq['write_p95_ms']} ms max {sq['write_max_ms']} ms slow={sq['slow_writes']}"
+            )
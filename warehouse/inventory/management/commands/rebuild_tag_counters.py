@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from inventory.models import Move, TagCounter
+
+
+class Command(BaseCommand):
+    help = "Tính lại bảng TagCounter (ngày, kho, action -> max_tag) từ lịch sử Move."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Chỉ tính lại từ ngày này (YYYY-MM-DD).")
+        parser.add_argument("--days", type=int, help="Chỉ tính lại N ngày gần nhất (tính cả hôm nay).")
+
+    def handle(self, *args, **opts):
+        since = None
+        if opts.get("since"):
+            try:
+                since = datetime.strptime(opts["since"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--since phải có dạng YYYY-MM-DD")
+        elif opts.get("days"):
+            since = timezone.localdate() - timedelta(days=max(opts["days"], 1) - 1)
+
+        # IN tính theo kho nhận, OUT tính theo kho xuất (giống _tag_max_today)
+        sources = (("IN", "to_wh_id"), ("OUT", "from_wh_id"))
+        counters = []
+        for action, wh_field in sources:
+            qs = Move.objects.filter(action=action, **{f"{wh_field}__isnull": False})
+            rows = (qs.annotate(day=TruncDate("created_at"))
+                      .values("day", wh_field)
+                      .annotate(m=Max("tag")))
+            if since:
+                rows = rows.filter(day__gte=since)
+            for r in rows:
+                counters.append(TagCounter(day=r["day"], warehouse_id=r[wh_field], action=action, max_tag=r["m"] or 0))
+
+        with transaction.atomic():
+            old = TagCounter.objects.all()
+            if since:
+                old = old.filter(day__gte=since)
+            deleted, _ = old.delete()
+            TagCounter.objects.bulk_create(counters, batch_size=1000)
+
+        scope = f"từ {since}" if since else "toàn bộ"
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuild TagCounter ({scope}): xoá {deleted}, tạo {len(counters)} dòng."
+        ))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from inventory import saved_queries
+from inventory.models import SavedQuery
+
+
+class Command(BaseCommand):
+    help = "Làm mới kết quả materialize của SavedQuery đã quá refresh_seconds (chạy bằng cron hoặc --loop)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--id", type=int, action="append", help="Chỉ làm mới query có id này (lặp lại được).")
+        parser.add_argument("--force", action="store_true", help="Làm mới cả khi chưa quá hạn.")
+        parser.add_argument("--loop", type=int, default=0, help="Chạy lặp mỗi N giây (0 = chạy 1 lần).")
+
+    def handle(self, *args, **opts):
+        while True:
+            if opts.get("id"):
+                runs = [saved_queries.refresh(sq, trigger="cron")
+                        for sq in SavedQuery.objects.filter(pk__in=opts["id"])]
+            else:
+                runs = saved_queries.refresh_due(force=opts["force"])
+            for run in runs:
+                status = "OK" if run.ok else f"ERROR {run.error}"
+                self.stdout.write(f"#{run.query_id} {run.query.name}: {run.runtime_ms} ms, {run.row_count} rows — {status}")
+            if not opts["loop"]:
+                self.stdout.write(self.style.SUCCESS(f"Đã làm mới {len(runs)} query."))
+                return
+            close_old_connections()
+            time.sleep(opts["loop"])
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import bench
+
+
+class Command(BaseCommand):
+    help = "Tạo dữ liệu giả lập (product/kho/item/move) để benchmark; mọi bản ghi mang prefix để xoá lại được."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=200)
+        parser.add_argument("--warehouses", type=int, default=4)
+        parser.add_argument("--items", type=int, default=20000)
+        parser.add_argument("--bulk-moves", type=int, default=20000, help="Số move bulk (ngoài move của item).")
+        parser.add_argument("--days", type=int, default=90, help="Trải dữ liệu trên N ngày gần nhất.")
+        parser.add_argument("--prefix", default="SYN", help="Prefix cho SKU / mã kho giả lập.")
+        parser.add_argument("--seed", type=int, default=42, help="Seed random (cùng seed -> cùng dataset).")
+        parser.add_argument("--flush", action="store_true", help="Xoá dữ liệu cùng prefix trước khi tạo.")
+        parser.add_argument("--flush-only", action="store_true", help="Chỉ xoá dữ liệu cùng prefix.")
+
+    def handle(self, *args, **opts):
+        prefix = opts["prefix"].strip()
+        if not prefix:
+            raise CommandError("--prefix không được rỗng.")
+        if opts["flush"] or opts["flush_only"]:
+            counts = bench.flush(prefix)
+            self.stdout.write(f"Đã xoá dữ liệu '{prefix}': {counts}")
+            if opts["flush_only"]:
+                return
+
+        t0 = time.perf_counter()
+        try:
+            counts = bench.seed(
+                products=opts["products"], warehouses=opts["warehouses"], items=opts["items"],
+                bulk_moves=opts["bulk_moves"], days=opts["days"], prefix=prefix, rng_seed=opts["seed"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        except Exception as e:
+            raise CommandError(f"Seed lỗi (đã có dữ liệu prefix '{prefix}'? dùng --flush): {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Seed '{prefix}' xong trong {time.perf_counter() - t0:.1f}s: {counts}"
+        ))
@@ -0,0 +1,42 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+MODES = ("passive", "full", "restart", "truncate")
+
+
+class Command(BaseCommand):
+    help = ("Checkpoint WAL của DB SQLite (chép trang từ file -wal vào file DB). "
+            "Chạy định kỳ (cron) khi WAL lớn dần vì luôn có request đọc giữ snapshot.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="DB alias (mặc định: default).")
+        parser.add_argument("--mode", choices=MODES, default="truncate",
+                            help="passive: không chờ ai; full/restart: chờ ghi xong (busy_timeout); "
+                                 "truncate: như restart + cắt file -wal về 0 byte (mặc định).")
+
+    def handle(self, *args, **opts):
+        conn = connections[opts["database"]]
+        if conn.vendor != "sqlite":
+            raise CommandError(f"DB '{opts['database']}' không phải SQLite.")
+
+        with conn.cursor() as cur:
+            cur.execute("PRAGMA journal_mode")
+            journal = cur.fetchone()[0]
+            if journal != "wal":
+                self.stdout.write(f"journal_mode={journal}: không dùng WAL, không có gì để checkpoint.")
+                return
+            wal = Path(f"{conn.settings_dict['NAME']}-wal")
+            before = wal.stat().st_size if wal.exists() else 0
+            cur.execute(f"PRAGMA wal_checkpoint({opts['mode'].upper()})")
+            busy, log_frames, done_frames = cur.fetchone()
+        after = wal.stat().st_size if wal.exists() else 0
+
+        msg = (f"Checkpoint {opts['mode'].upper()}: {done_frames}/{log_frames} frame, "
+               f"WAL {before // 1024} KB -> {after // 1024} KB.")
+        if busy:
+            # còn giao dịch đọc/ghi đang giữ WAL -> chưa chép hết, chạy lại sau
+            self.stdout.write(self.style.WARNING(msg + " Bị chặn bởi giao dịch đang chạy."))
+        else:
+            self.stdout.write(self.style.SUCCESS(msg))
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.24 on 2026-10-19 01:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('action', models.CharField(choices=[('IN', 'IN'), ('OUT', 'OUT')], max_length=10)),
+                ('max_tag', models.PositiveIntegerField(default=0)),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_counters', to='inventory.warehouse')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tagcounter',
+            constraint=models.UniqueConstraint(fields=('day', 'warehouse', 'action'), name='uniq_tag_counter_day_wh_action'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.24 on 2026-10-19 01:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_tagcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='savedquery',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='savedquery',
+            name='last_row_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='savedquery',
+            name='last_run_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='savedquery',
+            name='last_runtime_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='savedquery',
+            name='materialize',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='savedquery',
+            name='refresh_seconds',
+            field=models.PositiveIntegerField(default=3600),
+        ),
+        migrations.CreateModel(
+            name='SavedQueryResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('truncated', models.BooleanField(default=False)),
+                ('refreshed_at', models.DateTimeField()),
+                ('query', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='result', to='inventory.savedquery')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SavedQueryRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('runtime_ms', models.PositiveIntegerField(default=0)),
+                ('row_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('ok', models.BooleanField(default=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('trigger', models.CharField(default='manual', max_length=16)),
+                ('query', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='inventory.savedquery')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['query', 'started_at'], name='inventory_s_query_i_89b8f1_idx')],
+            },
+        ),
+    ]
@@ -235,6 +235,72 @@ class Move(models.Model):
                 self.item.save(update_fields=["warehouse", "status"])
 
 
+# 5b) Bộ đếm đợt (tag) theo ngày — thay cho aggregate Max("tag") trên Move
+class TagCounter(models.Model):
+    """
+    Lưu tag lớn nhất đã dùng theo (ngày, kho, action).
+    - IN: kho = to_wh; OUT: kho = from_wh (giống cách lọc Move trước đây).
+    - Được cập nhật khi phiên quét "nhận" một tag, và khi chốt đơn thủ công / StockOrder.confirm ghi Move
+      (tag mặc định 1); gợi ý tag chỉ còn 1 lần đọc theo khoá.
+    - Dữ liệu cũ: chạy `python manage.py rebuild_tag_counters`.
+    """
+    day       = models.DateField()
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name="tag_counters")
+    action    = models.CharField(max_length=10, choices=Move.ACTIONS)
+    max_tag   = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "warehouse", "action"], name="uniq_tag_counter_day_wh_action"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.action} @ {self.warehouse_id}: {self.max_tag}"
+
+    @staticmethod
+    def current(action: str, warehouse, day=None) -> int:
+        """Tag lớn nhất đã dùng trong ngày (0 nếu chưa có)."""
+        if warehouse is None:
+            return 0
+        day = day or timezone.localdate()
+        return (
+            TagCounter.objects
+            .filter(day=day, warehouse=warehouse, action=action)
+            .values_list("max_tag", flat=True)
+            .first()
+        ) or 0
+
+    @staticmethod
+    def claim(action: str, warehouse, tag: int, day=None) -> None:
+        """
+        Ghi nhận tag vừa được phiên quét sử dụng.
+        Chỉ tăng max_tag (UPDATE có điều kiện max_tag < tag) nên an toàn khi nhiều phiên chạy song song.
+        """
+        if warehouse is None or not tag:
+            return
+        day = day or timezone.localdate()
+        tag = int(tag)
+        wh_id = getattr(warehouse, "pk", warehouse)
+        with transaction.atomic():
+            counter, created = TagCounter.objects.get_or_create(
+                day=day, warehouse_id=wh_id, action=action, defaults={"max_tag": tag}
+            )
+            if not created and counter.max_tag < tag:
+                TagCounter.objects.filter(pk=counter.pk, max_tag__lt=tag).update(max_tag=tag)
+
+    @staticmethod
+    def claim_moves(moves, day=None) -> None:
+        """Ghi nhận tag của các Move vừa tạo ngoài phiên quét: mỗi (action, kho) 1 lần claim với tag lớn nhất."""
+        top = {}
+        for mv in moves:
+            wh_id = mv.to_wh_id if mv.action == "IN" else mv.from_wh_id
+            if wh_id:
+                key = (mv.action, wh_id)
+                top[key] = max(top.get(key, 0), int(mv.tag or 0))
+        for (action, wh_id), tag in top.items():
+            TagCounter.claim(action, wh_id, tag, day)
+
+
 # 6) Đơn nhập/xuất để nhập tay, đọc file, hoặc API
 class StockOrder(models.Model):
     ORDER_TYPES = (("IN", "IN"), ("OUT", "OUT"))
@@ -266,6 +332,7 @@ class StockOrder(models.Model):
         if self.is_confirmed:
             return
 
+        moves = []
         with transaction.atomic():
             for line in self.lines.select_for_update().all():
                 if line.item:
@@ -297,7 +364,9 @@ class StockOrder(models.Model):
                         batch_id=batch_id or f"ORDER-{self.id}",
                     )
                     mv.apply()
+                moves.append(mv)
 
+            TagCounter.claim_moves(moves)   # gợi ý tag trong ngày thấy cả Move của đơn
             self.is_confirmed = True
             self.confirmed_at = timezone.now()
             self.save(update_fields=["is_confirmed", "confirmed_at"])
@@ -327,6 +396,50 @@ class SavedQuery(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Materialize: lưu sẵn kết quả, làm mới định kỳ (inventory/saved_queries.py)
+    materialize     = models.BooleanField(default=False)
+    refresh_seconds = models.PositiveIntegerField(default=3600)   # TTL của kết quả đã lưu
+    last_run_at     = models.DateTimeField(null=True, blank=True)
+    last_runtime_ms = models.PositiveIntegerField(null=True, blank=True)
+    last_row_count  = models.PositiveIntegerField(null=True, blank=True)
+    last_error      = models.TextField(blank=True, default="")
+
     def __str__(self):
         return self.name
 
+    def is_stale(self, now=None) -> bool:
+        if not self.last_run_at:
+            return True
+        now = now or timezone.now()
+        return (now - self.last_run_at).total_seconds() >= self.refresh_seconds
+
+
+class SavedQueryResult(models.Model):
+    """Kết quả đã materialize của SavedQuery: {cols, rows} dạng JSON nén zlib."""
+    query        = models.OneToOneField(SavedQuery, on_delete=models.CASCADE, related_name="result")
+    data         = models.BinaryField()
+    row_count    = models.PositiveIntegerField(default=0)
+    truncated    = models.BooleanField(default=False)
+    refreshed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.query} @ {self.refreshed_at:%Y-%m-%d %H:%M}"
+
+
+class SavedQueryRun(models.Model):
+    """Lịch sử mỗi lần chạy SavedQuery: thời gian chạy + số dòng (xem dashboard nào tốn kém)."""
+    query      = models.ForeignKey(SavedQuery, on_delete=models.CASCADE, related_name="runs")
+    started_at = models.DateTimeField(default=timezone.now)
+    runtime_ms = models.PositiveIntegerField(default=0)
+    row_count  = models.PositiveIntegerField(null=True, blank=True)
+    ok         = models.BooleanField(default=True)
+    error      = models.TextField(blank=True, default="")
+    trigger    = models.CharField(max_length=16, default="manual")   # manual | background | cron
+
+    class Meta:
+        ordering = ["-started_at"]
+        indexes = [models.Index(fields=["query", "started_at"])]
+
+    def __str__(self):
+        return f"{self.query} {self.started_at:%Y-%m-%d %H:%M} {self.runtime_ms}ms"
+
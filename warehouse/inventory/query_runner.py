@@ -0,0 +1,175 @@
+# inventory/query_runner.py
+"""
+Chạy SQL cho Query Panel có giới hạn:
+- Kiểm tra whitelist từ khoá đầu (như _execute_sql cũ).
+- Timeout: SQLite dùng progress_handler, Postgres dùng SET LOCAL statement_timeout.
+- Đọc theo từng chunk (chunked_cursor + fetchmany), dừng ở max_rows -> không fetchall cả bảng.
+- EXPLAIN (QUERY PLAN) và stream CSV toàn bộ kết quả.
+"""
+import csv
+import io
+import re
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connections, transaction, OperationalError
+
+ALLOWED = (
+    "select", "with", "insert", "update", "delete",
+    "replace", "pragma", "begin", "commit", "rollback",
+)
+READ_ONLY = ("select", "with")
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+@dataclass
+class QueryResult:
+    cols: list = field(default_factory=list)
+    rows: list = field(default_factory=list)
+    affected: int = None
+    truncated: bool = False
+    elapsed_ms: float = 0.0
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def check_sql(sql: str) -> str:
+    """Trả về từ khoá đầu (lower); ValueError nếu không thuộc whitelist."""
+    m = re.match(r"^\s*(" + "|".join(ALLOWED) + r")\b", sql or "", flags=re.IGNORECASE | re.DOTALL)
+    if not m:
+        raise ValueError("Chỉ cho phép: " + ", ".join(ALLOWED))
+    return m.group(1).lower()
+
+
+def _tx(conn, using):
+    # Postgres cần transaction cho SET LOCAL + server-side cursor; SQLite giữ autocommit (cho phép BEGIN/COMMIT)
+    return transaction.atomic(using=using) if conn.vendor == "postgresql" else nullcontext()
+
+
+@contextmanager
+def statement_timeout(conn, seconds):
+    """Giới hạn thời gian chạy câu lệnh trên connection `conn`."""
+    if not seconds:
+        yield
+        return
+    if conn.vendor == "sqlite":
+        conn.ensure_connection()
+        raw = conn.connection
+        deadline = time.monotonic() + seconds
+        timed_out = []
+
+        def _handler():
+            if time.monotonic() > deadline:
+                timed_out.append(True)
+                return 1   # != 0 -> SQLite huỷ câu lệnh (OperationalError: interrupted)
+            return 0
+
+        raw.set_progress_handler(_handler, 10000)
+        try:
+            yield
+        except OperationalError:
+            if timed_out:
+                raise QueryTimeout(f"Query vượt quá {seconds}s, đã huỷ.")
+            raise
+        finally:
+            raw.set_progress_handler(None, 10000)
+    elif conn.vendor == "postgresql":
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = %s", [int(seconds * 1000)])
+        try:
+            yield
+        except OperationalError as e:
+            if "statement timeout" in str(e):
+                raise QueryTimeout(f"Query vượt quá {seconds}s, đã huỷ.")
+            raise
+    else:
+        yield
+
+
+def run_query(sql: str, max_rows=None, timeout=None, using="default") -> QueryResult:
+    """Chạy 1 câu lệnh; SELECT chỉ lấy tối đa max_rows dòng (truncated=True nếu còn)."""
+    check_sql(sql)
+    max_rows = int(max_rows or _conf("QUERY_PANEL_MAX_ROWS", 1000))
+    timeout = _conf("QUERY_PANEL_TIMEOUT", 5) if timeout is None else timeout
+    fetch_size = int(_conf("QUERY_PANEL_FETCH_SIZE", 200))
+    conn = connections[using]
+    res = QueryResult()
+    t0 = time.perf_counter()
+    with _tx(conn, using), statement_timeout(conn, timeout):
+        cur = conn.chunked_cursor()
+        try:
+            cur.execute(sql)
+            if cur.description:
+                res.cols = [c[0] for c in cur.description]
+                while len(res.rows) <= max_rows:
+                    chunk = cur.fetchmany(min(fetch_size, max_rows + 1 - len(res.rows)))
+                    if not chunk:
+                        break
+                    res.rows.extend(chunk)
+                if len(res.rows) > max_rows:
+                    res.rows = res.rows[:max_rows]
+                    res.truncated = True
+            else:
+                rc = getattr(cur, "rowcount", -1)
+                res.affected = rc if rc != -1 else None
+        finally:
+            cur.close()
+    res.elapsed_ms = round((time.perf_counter() - t0) * 1000, 1)
+    return res
+
+
+def explain(sql: str, using="default") -> QueryResult:
+    """Kế hoạch thực thi (chỉ SELECT/WITH): SQLite EXPLAIN QUERY PLAN, DB khác EXPLAIN."""
+    if check_sql(sql) not in READ_ONLY:
+        raise ValueError("EXPLAIN chỉ hỗ trợ SELECT/WITH.")
+    conn = connections[using]
+    prefix = "EXPLAIN QUERY PLAN " if conn.vendor == "sqlite" else "EXPLAIN "
+    res = QueryResult()
+    t0 = time.perf_counter()
+    with _tx(conn, using), statement_timeout(conn, _conf("QUERY_PANEL_TIMEOUT", 5)):
+        with conn.cursor() as cur:
+            cur.execute(prefix + sql.strip().rstrip(";"))
+            res.cols = [c[0] for c in cur.description] if cur.description else []
+            res.rows = cur.fetchall() if cur.description else []
+    res.elapsed_ms = round((time.perf_counter() - t0) * 1000, 1)
+    return res
+
+
+def iter_csv(sql: str, timeout=None, using="default"):
+    """Sinh CSV từng chunk cho StreamingHttpResponse (chỉ SELECT/WITH, có timeout tổng)."""
+    if check_sql(sql) not in READ_ONLY:
+        raise ValueError("Export CSV chỉ hỗ trợ SELECT/WITH.")
+    timeout = _conf("QUERY_PANEL_EXPORT_TIMEOUT", 60) if timeout is None else timeout
+    fetch_size = int(_conf("QUERY_PANEL_FETCH_SIZE", 200)) * 5
+    conn = connections[using]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def _flush():
+        data = buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+        return data
+
+    with _tx(conn, using), statement_timeout(conn, timeout):
+        cur = conn.chunked_cursor()
+        try:
+            cur.execute(sql)
+            buf.write("\ufeff")  # BOM cho Excel
+            writer.writerow([c[0] for c in cur.description or []])
+            yield _flush()
+            while True:
+                chunk = cur.fetchmany(fetch_size)
+                if not chunk:
+                    break
+                writer.writerows(chunk)
+                yield _flush()
+        finally:
+            cur.close()
@@ -0,0 +1,204 @@
+# inventory/refcache.py
+"""
+Cache LRU trong process cho dữ liệu tham chiếu (Warehouse, Product).
+
+- Warehouse theo id / code, Product theo sku / id. Trả về bản copy để view có thể gán/sửa thoải mái.
+- Invalidate: signals save/delete -> bump version key trong CACHES (Redis) sau commit.
+  Mỗi process so version tối đa 1 lần / REFCACHE_VERSION_CHECK giây -> steady state: 0 query DB.
+- Redis không dùng được -> entry chỉ sống tối đa REFCACHE_MAX_AGE giây.
+- Không cache kết quả "không tìm thấy" (tạo mới sẽ bump version, nhưng tránh rủi ro lệch giữa process).
+"""
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+logger = logging.getLogger("inventory.refcache")
+
+VERSION_KEY = "inv:refcache:version"
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+class _LRU:
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            value, ts = hit
+            if time.monotonic() - ts > max_age:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, maxsize):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_lru = _LRU()
+_state = {"version": None, "checked_at": 0.0}
+_state_lock = threading.Lock()
+
+
+def _cache():
+    return caches[_conf("REFCACHE_ALIAS", "default")]
+
+
+def _sync_version():
+    """So version với Redis (có giới hạn tần suất); lệch thì xoá LRU."""
+    now = time.monotonic()
+    if now - _state["checked_at"] < float(_conf("REFCACHE_VERSION_CHECK", 5)):
+        return
+    with _state_lock:
+        if now - _state["checked_at"] < float(_conf("REFCACHE_VERSION_CHECK", 5)):
+            return
+        _state["checked_at"] = now
+        try:
+            version = _cache().get(VERSION_KEY, 0)
+        except Exception as exc:
+            logger.debug("refcache version check failed: %s", exc)
+            return
+        if version != _state["version"]:
+            if _state["version"] is not None:
+                _lru.clear()
+            _state["version"] = version
+
+
+def _get(key):
+    _sync_version()
+    return _lru.get(key, float(_conf("REFCACHE_MAX_AGE", 300)))
+
+
+def _put(keys, obj):
+    maxsize = int(_conf("REFCACHE_MAXSIZE", 2048))
+    for key in keys:
+        _lru.set(key, obj, maxsize)
+
+
+def _wh_keys(wh):
+    return (("wh", "id", wh.id), ("wh", "code", wh.code))
+
+
+def _product_keys(p):
+    return (("product", "id", p.id), ("product", "sku", p.sku))
+
+
+def _normalize_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ---------- Warehouse ----------
+def get_warehouse(id=None, code=None):
+    """Warehouse theo id hoặc code (None nếu không có)."""
+    from .models import Warehouse
+
+    if id not in (None, ""):
+        key, lookup = ("wh", "id", _normalize_id(id)), {"id": _normalize_id(id)}
+        if key[2] is None:
+            return None
+    elif code:
+        key, lookup = ("wh", "code", code), {"code": code}
+    else:
+        return None
+
+    wh = _get(key)
+    if wh is None:
+        wh = Warehouse.objects.filter(**lookup).first()
+        if wh is None:
+            return None
+        _put(_wh_keys(wh), wh)
+    return copy.copy(wh)
+
+
+# ---------- Product ----------
+def get_product(sku=None, id=None):
+    """Product theo sku hoặc id (None nếu không có)."""
+    from .models import Product
+
+    if sku:
+        key, lookup = ("product", "sku", sku), {"sku": sku}
+    elif id not in (None, ""):
+        key, lookup = ("product", "id", _normalize_id(id)), {"id": _normalize_id(id)}
+        if key[2] is None:
+            return None
+    else:
+        return None
+
+    p = _get(key)
+    if p is None:
+        p = Product.objects.filter(**lookup).first()
+        if p is None:
+            return None
+        _put(_product_keys(p), p)
+    return copy.copy(p)
+
+
+def get_products_by_skus(skus):
+    """{sku: Product} cho danh sách sku; các sku chưa có trong cache lấy bằng 1 query."""
+    from .models import Product
+
+    result, missing = {}, []
+    for sku in dict.fromkeys(s for s in skus if s):
+        p = _get(("product", "sku", sku))
+        if p is None:
+            missing.append(sku)
+        else:
+            result[sku] = copy.copy(p)
+    if missing:
+        for p in Product.objects.filter(sku__in=missing):
+            _put(_product_keys(p), p)
+            result[p.sku] = copy.copy(p)
+    return result
+
+
+# ---------- Invalidate ----------
+def bump_version():
+    """Xoá LRU local ngay, tăng version trong Redis để process khác xoá theo."""
+    _lru.clear()
+    try:
+        c = _cache()
+        c.add(VERSION_KEY, 0, None)
+        version = c.incr(VERSION_KEY)
+    except Exception as exc:
+        logger.debug("refcache version bump failed: %s", exc)
+        return
+    with _state_lock:
+        _state["version"] = version
+
+
+def bump_version_on_commit():
+    transaction.on_commit(bump_version)
+
+
+def clear():
+    _lru.clear()
+    with _state_lock:
+        _state["version"] = None
+        _state["checked_at"] = 0.0
@@ -0,0 +1,145 @@
+# inventory/saved_queries.py
+"""
+Materialize kết quả SavedQuery.
+
+- refresh(): chạy SQL qua query_runner (giới hạn dòng + timeout), lưu {cols, rows} nén zlib vào
+  SavedQueryResult, ghi SavedQueryRun (runtime, row_count) và cập nhật last_* trên SavedQuery.
+- get_result(): trả kết quả đã lưu ngay lập tức; nếu quá refresh_seconds thì làm mới ở thread nền
+  (stale-while-revalidate). Chưa có kết quả -> chạy đồng bộ lần đầu.
+- refresh_due(): dùng cho `manage.py refresh_saved_queries` (cron / --loop).
+"""
+import json
+import logging
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from . import query_runner
+from .models import SavedQuery, SavedQueryResult, SavedQueryRun
+
+logger = logging.getLogger("inventory.saved_queries")
+
+_running = set()
+_running_lock = threading.Lock()
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def _encode(cols, rows) -> bytes:
+    raw = json.dumps({"cols": cols, "rows": [list(r) for r in rows]},
+                     ensure_ascii=False, separators=(",", ":"), default=str)
+    return zlib.compress(raw.encode("utf-8"), 6)
+
+
+def decode(data) -> dict:
+    return json.loads(zlib.decompress(bytes(data)).decode("utf-8"))
+
+
+def refresh(sq: SavedQuery, trigger="manual") -> SavedQueryRun:
+    """Chạy lại query và lưu kết quả (chỉ SELECT/WITH). Lỗi được ghi vào lịch sử, không raise."""
+    started = timezone.now()
+    t0 = time.perf_counter()
+    run = SavedQueryRun(query=sq, started_at=started, trigger=trigger)
+    try:
+        if query_runner.check_sql(sq.sql) not in query_runner.READ_ONLY:
+            raise ValueError("Chỉ materialize được SELECT/WITH.")
+        res = query_runner.run_query(
+            sq.sql,
+            max_rows=_conf("SAVED_QUERY_MAX_ROWS", 5000),
+            timeout=_conf("SAVED_QUERY_TIMEOUT", 30),
+        )
+        SavedQueryResult.objects.update_or_create(query=sq, defaults={
+            "data": _encode(res.cols, res.rows),
+            "row_count": len(res.rows),
+            "truncated": res.truncated,
+            "refreshed_at": timezone.now(),
+        })
+        run.row_count = len(res.rows)
+    except Exception as e:
+        run.ok = False
+        run.error = str(e)[:2000]
+        logger.warning("saved query refresh failed: id=%s err=%s", sq.pk, e)
+    run.runtime_ms = int((time.perf_counter() - t0) * 1000)
+    run.save()
+
+    sq.last_run_at = started
+    sq.last_runtime_ms = run.runtime_ms
+    sq.last_error = run.error
+    if run.ok:
+        sq.last_row_count = run.row_count
+    SavedQuery.objects.filter(pk=sq.pk).update(
+        last_run_at=sq.last_run_at, last_runtime_ms=sq.last_runtime_ms,
+        last_row_count=sq.last_row_count, last_error=sq.last_error,
+    )
+    return run
+
+
+def _refresh_job(pk):
+    try:
+        sq = SavedQuery.objects.filter(pk=pk).first()
+        if sq and sq.is_stale():
+            refresh(sq, trigger="background")
+    finally:
+        with _running_lock:
+            _running.discard(pk)
+        cache.delete(f"inv:savedquery:refresh:{pk}")
+        connection.close()
+
+
+def refresh_in_background(sq: SavedQuery) -> bool:
+    """Làm mới ở thread nền; mỗi query chỉ 1 lần chạy cùng lúc (trong process + khoá cache giữa worker)."""
+    with _running_lock:
+        if sq.pk in _running:
+            return False
+        try:
+            locked = cache.add(f"inv:savedquery:refresh:{sq.pk}", 1, _conf("SAVED_QUERY_TIMEOUT", 30) * 2)
+        except Exception:
+            locked = True   # không có Redis: chỉ chặn trùng trong process
+        if not locked:
+            return False
+        _running.add(sq.pk)
+    threading.Thread(target=_refresh_job, args=(sq.pk,), daemon=True, name=f"savedquery-{sq.pk}").start()
+    return True
+
+
+def get_result(sq: SavedQuery):
+    """
+    Trả về (payload | None, meta). payload = {cols, rows}.
+    meta: refreshed_at, row_count, truncated, stale, refreshing.
+    """
+    result = SavedQueryResult.objects.filter(query=sq).first()
+    if result is None:
+        refresh(sq)
+        result = SavedQueryResult.objects.filter(query=sq).first()
+        if result is None:
+            return None, {"stale": True, "refreshing": False}
+    stale, refreshing = sq.is_stale(), False
+    if stale:
+        if _conf("SAVED_QUERY_BACKGROUND", True):
+            refreshing = refresh_in_background(sq)
+        else:
+            refresh(sq, trigger="background")
+            result = SavedQueryResult.objects.filter(query=sq).first()
+    return decode(result.data), {
+        "refreshed_at": result.refreshed_at,
+        "row_count": result.row_count,
+        "truncated": result.truncated,
+        "stale": stale,
+        "refreshing": refreshing,
+    }
+
+
+def refresh_due(now=None, force=False):
+    """Làm mới các query materialize đã quá hạn; trả về danh sách SavedQueryRun."""
+    runs = []
+    for sq in SavedQuery.objects.filter(materialize=True).order_by("id"):
+        if force or sq.is_stale(now):
+            runs.append(refresh(sq, trigger="cron"))
+    return runs
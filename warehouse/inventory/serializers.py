@@ -1,8 +1,26 @@
 # inventory/serializers.py
 from rest_framework import serializers
-from django.db.models import Sum
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from .models import Product, Warehouse, Item, Inventory, Move
 
+
+def with_quantity(qs):
+    """Product queryset + qty_total (tổng tồn mọi kho) trong cùng 1 query."""
+    total = (Inventory.objects.filter(product=OuterRef("pk"))
+             .values("product").annotate(t=Sum("qty")).values("t"))
+    return qs.annotate(qty_total=Coalesce(Subquery(total), 0))
+
+
+def quantity_context(product_ids) -> dict:
+    """Context {"product_qty": {product_id: tổng tồn}} cho serializer lồng Product (1 query cho cả trang)."""
+    ids = {pid for pid in product_ids if pid}
+    rows = (Inventory.objects.filter(product_id__in=ids)
+            .values("product_id").annotate(t=Sum("qty")).values_list("product_id", "t")) if ids else ()
+    qty = dict.fromkeys(ids, 0)
+    qty.update({pid: t or 0 for pid, t in rows})
+    return {"product_qty": qty}
+
 class WarehouseSerializer(serializers.ModelSerializer):
     class Meta:
         model = Warehouse
@@ -15,7 +33,12 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ["id", "sku", "name", "code4", "quantity"]
 
     def get_quantity(self, obj):
-        total = Inventory.objects.filter(product=obj).aggregate(t=Sum("qty")).get("t")
+        # ưu tiên số đã annotate (with_quantity) / map trong context (quantity_context); không có mới query lẻ
+        total = getattr(obj, "qty_total", None)
+        if total is None:
+            total = self.context.get("product_qty", {}).get(obj.pk)
+        if total is None:
+            total = Inventory.objects.filter(product=obj).aggregate(t=Sum("qty")).get("t")
         return total or 0
 
 class ItemSerializer(serializers.ModelSerializer):
@@ -0,0 +1,280 @@
+# inventory/session_state.py
+"""
+Kho trạng thái phiên (scan_session, manual_batch, gen_queue) tách khỏi django_session.
+
+- Khoá theo session_key của Django (chỉ tạo session 1 lần), dữ liệu nằm ở Redis/memory.
+- Schema gọn, ghi theo field:
+    inv:ss:<sid>:<ns>            HASH  field -> JSON (giá trị scalar/dict)
+    inv:ss:<sid>:<ns>:<field>    LIST  phần tử JSON (field có default là list, vd "scanned", "lines")
+    inv:ss:<sid>:<ns>            LIST  (namespace có default là list, vd "gen_queue")
+- save() so với snapshot lúc load(): chỉ HSET/HDEL field đổi; list thêm đầu -> LPUSH+LTRIM,
+  thêm cuối -> RPUSH, còn lại mới ghi đè cả list.
+- SESSION_STATE_BACKEND: "redis" (mặc định) | "memory" (1 process: dev/test) | "session" (như cũ).
+  Redis lỗi -> dùng tạm django session, bỏ qua Redis SESSION_STATE_BACKOFF giây.
+"""
+import copy
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger("inventory.session_state")
+
+KEY_PREFIX = "inv:ss:"
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def _dumps(v):
+    return json.dumps(v, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _loads(v):
+    if isinstance(v, bytes):
+        v = v.decode("utf-8")
+    return json.loads(v)
+
+
+# ---------- Backends ----------
+class MemoryBackend:
+    """Lưu trong process (dict + lock). Chỉ dùng khi chạy 1 process (dev/test)."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def load(self, key, list_keys, as_list):
+        with self._lock:
+            if as_list:
+                return [_loads(x) for x in self._data.get(key, [])], {}
+            lists = {k: [_loads(x) for x in self._data.get(k, [])] for k in list_keys}
+            return dict(self._data.get(key, {})), lists
+
+    def apply(self, ops, keys, ttl):
+        with self._lock:
+            for op, key, *args in ops:
+                if op == "hset":
+                    self._data.setdefault(key, {}).update(args[0])
+                elif op == "hdel":
+                    h = self._data.get(key, {})
+                    for f in args[0]:
+                        h.pop(f, None)
+                elif op == "lpush":
+                    lst = self._data.setdefault(key, [])
+                    lst[:0] = list(args[0])
+                    del lst[args[1]:]
+                elif op == "rpush":
+                    self._data.setdefault(key, []).extend(args[0])
+                elif op == "replace":
+                    self._data[key] = list(args[0])
+                elif op == "delete":
+                    self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis  # redis-py đã có sẵn vì CACHES dùng RedisCache
+
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=float(_conf("SESSION_STATE_SOCKET_TIMEOUT", 0.5)),
+            socket_connect_timeout=float(_conf("SESSION_STATE_SOCKET_TIMEOUT", 0.5)),
+        )
+
+    def load(self, key, list_keys, as_list):
+        pipe = self.client.pipeline(transaction=False)
+        if as_list:
+            pipe.lrange(key, 0, -1)
+            (raw,) = pipe.execute()
+            return [_loads(x) for x in raw], {}
+        pipe.hgetall(key)
+        for k in list_keys:
+            pipe.lrange(k, 0, -1)
+        res = pipe.execute()
+        fields = {(f.decode() if isinstance(f, bytes) else f): v for f, v in res[0].items()}
+        return fields, {k: [_loads(x) for x in raw] for k, raw in zip(list_keys, res[1:])}
+
+    def apply(self, ops, keys, ttl):
+        pipe = self.client.pipeline(transaction=True)
+        for op, key, *args in ops:
+            if op == "hset":
+                pipe.hset(key, mapping=args[0])
+            elif op == "hdel":
+                pipe.hdel(key, *args[0])
+            elif op == "lpush":
+                pipe.lpush(key, *reversed(args[0]))
+                pipe.ltrim(key, 0, args[1] - 1)
+            elif op == "rpush":
+                pipe.rpush(key, *args[0])
+            elif op == "replace":
+                pipe.delete(key)
+                if args[0]:
+                    pipe.rpush(key, *args[0])
+            elif op == "delete":
+                pipe.delete(key)
+        for k in keys:
+            pipe.expire(k, ttl)
+        pipe.execute()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_down_until = 0.0
+
+
+def get_backend():
+    """Backend hiện tại (None = dùng django session)."""
+    global _backend
+    kind = _conf("SESSION_STATE_BACKEND", "redis")
+    if kind == "session" or time.monotonic() < _down_until:
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if kind == "memory":
+                    _backend = MemoryBackend()
+                else:
+                    url = _conf("SESSION_STATE_REDIS_URL", None) or settings.CACHES["default"]["LOCATION"]
+                    _backend = RedisBackend(url)
+    return _backend
+
+
+def reset_backend():
+    global _backend, _down_until
+    _backend = None
+    _down_until = 0.0
+
+
+def _mark_down(exc):
+    global _down_until
+    if time.monotonic() >= _down_until:
+        logger.warning("session state store unavailable, fallback to django session: %s", exc)
+    _down_until = time.monotonic() + float(_conf("SESSION_STATE_BACKOFF", 30))
+
+
+# ---------- Khoá ----------
+def session_id(request) -> str:
+    """session_key ổn định cho client; chỉ ghi django_session lần đầu (để có cookie)."""
+    session = request.session
+    if not session.session_key:
+        session.save()
+        session.modified = True   # để middleware gửi cookie
+    return session.session_key
+
+
+def _ns_key(sid, ns):
+    return f"{KEY_PREFIX}{sid}:{ns}"
+
+
+def _snapshots(request):
+    snaps = getattr(request, "_session_state_snapshots", None)
+    if snaps is None:
+        snaps = {}
+        request._session_state_snapshots = snaps
+    return snaps
+
+
+# ---------- Đọc / ghi ----------
+def load(request, ns, default):
+    """
+    Đọc state của namespace (dict hoặc list tuỳ default). Giữ snapshot để save() tính phần thay đổi.
+    Field có default là list được lưu thành LIST riêng.
+    """
+    backend = get_backend()
+    if backend is not None:
+        try:
+            data = _load_backend(backend, session_id(request), ns, default)
+        except Exception as exc:
+            _mark_down(exc)
+            backend = None
+    if backend is None:
+        data = request.session.setdefault(ns, copy.deepcopy(default))
+    _snapshots(request)[ns] = copy.deepcopy(data)
+    return data
+
+
+def _load_backend(backend, sid, ns, default):
+    key = _ns_key(sid, ns)
+    if isinstance(default, list):
+        items, _ = backend.load(key, [], as_list=True)
+        return items
+    list_fields = [f for f, v in default.items() if isinstance(v, list)]
+    fields, lists = backend.load(key, [f"{key}:{f}" for f in list_fields], as_list=False)
+    if not fields and not any(lists.values()):
+        return copy.deepcopy(default)
+    data = {f: _loads(v) for f, v in fields.items()}
+    for f in list_fields:
+        data[f] = lists[f"{key}:{f}"]
+    return data
+
+
+def save(request, ns, data, default):
+    """Ghi phần thay đổi của state so với lần load() gần nhất trong request."""
+    backend = get_backend()
+    if backend is not None:
+        prev = _snapshots(request).get(ns)
+        try:
+            _save_backend(backend, session_id(request), ns, data, default, prev)
+        except Exception as exc:
+            _mark_down(exc)
+            backend = None
+    if backend is None:
+        request.session[ns] = data
+        request.session.modified = True
+    _snapshots(request)[ns] = copy.deepcopy(data)
+
+
+def _list_ops(key, old, new):
+    if old is None:
+        return [("replace", key, [_dumps(x) for x in new])]
+    if new == old:
+        return []
+    enc = [_dumps(x) for x in new]
+    # thêm vào cuối: new = old + [x..]
+    if len(new) > len(old) and new[:len(old)] == old:
+        return [("rpush", key, enc[len(old):])]
+    # thêm vào đầu rồi cắt đuôi: new = [x..] + old[:k] (vd "scanned" giữ 20 mã gần nhất)
+    for m in range(1, min(len(new), 50)):
+        if new[m:] == old[:len(new) - m]:
+            return [("lpush", key, enc[:m], len(new))]
+    return [("replace", key, enc)]
+
+
+def _save_backend(backend, sid, ns, data, default, prev):
+    key = _ns_key(sid, ns)
+    ttl = int(_conf("SESSION_STATE_TTL", settings.SESSION_COOKIE_AGE))
+    if isinstance(default, list):
+        backend.apply(_list_ops(key, prev, list(data)), [key], ttl)
+        return
+
+    list_fields = [f for f, v in default.items() if isinstance(v, list)]
+    ops, keys = [], [key]
+    if prev is None:
+        # chưa load trong request này -> ghi đè toàn bộ namespace
+        ops.append(("delete", key))
+        prev_fields = {}
+    else:
+        prev_fields = prev
+    changed = {
+        f: _dumps(v) for f, v in data.items()
+        if f not in list_fields and (f not in prev_fields or prev_fields[f] != v)
+    }
+    if changed:
+        ops.append(("hset", key, changed))
+    removed = [f for f in prev_fields if f not in data and f not in list_fields]
+    if removed:
+        ops.append(("hdel", key, removed))
+    for f in list_fields:
+        lkey = f"{key}:{f}"
+        keys.append(lkey)
+        old = None if prev is None else list(prev.get(f) or [])
+        ops.extend(_list_ops(lkey, old, list(data.get(f) or [])))
+    if ops:
+        backend.apply(ops, keys, ttl)
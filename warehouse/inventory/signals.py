@@ -0,0 +1,39 @@
+# inventory/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import barcode_cache, refcache
+from .models import Item, Move, Product, Warehouse
+
+
+@receiver(post_save, sender=Move)
+@receiver(post_delete, sender=Move)
+def _move_changed(sender, instance, **kwargs):
+    """Move của item thay đổi -> bỏ payload barcode trong cache."""
+    item_id = instance.item_id
+    if not item_id:
+        return
+    if "item" in instance._state.fields_cache:   # đã có Item trong tay: không query thêm
+        barcode_cache.invalidate_on_commit(instance.item.barcode_text)
+        return
+    # chỉ có item_id: tra barcode lúc commit, không thêm 1 SELECT vào mỗi lần lưu / xoá Move
+    using = instance._state.db
+    transaction.on_commit(lambda: barcode_cache.invalidate(
+        Item.objects.using(using).filter(pk=item_id).values_list("barcode_text", flat=True).first()
+    ), using=using)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def _item_changed(sender, instance, **kwargs):
+    barcode_cache.invalidate_on_commit(instance.barcode_text)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def _refdata_changed(sender, instance, **kwargs):
+    """Dữ liệu tham chiếu đổi -> bump version cho refcache ở mọi process."""
+    refcache.bump_version_on_commit()
@@ -1,3 +1,820 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.client import MULTIPART_CONTENT
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from warehouse import aio, db_routers, dbwriter, logpipe, metrics, profiling
+from warehouse.db import pool
+from warehouse.idempotency import request_fingerprint
+from tests.querycount import Endpoint, QueryCountMixin
+
+from . import barcode_cache, refcache, session_state, query_runner, saved_queries, importers, loadtest, labels
+from .models import Product, Warehouse, Item, Inventory, Move, TagCounter, SavedQuery
+from .views import post_manual_lines
+
+
+class TagCounterTests(TestCase):
+    def setUp(self):
+        self.wh = Warehouse.objects.create(code="VN", name="Kho VN")
+        self.product = Product.objects.create(sku="SKU-A", name="Sản phẩm A")
+
+    def test_claim_only_increases(self):
+        TagCounter.claim("IN", self.wh, 3)
+        TagCounter.claim("IN", self.wh, 2)
+        self.assertEqual(TagCounter.current("IN", self.wh), 3)
+        self.assertEqual(TagCounter.current("OUT", self.wh), 0)
+
+    def test_scan_start_claims_and_suggest_reads_counter(self):
+        res = self.client.post("/api/scan/start", {"action": "IN", "wh_id": self.wh.id}, content_type="application/json")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["state"]["tag"], 1)
+
+        res = self.client.post("/api/batches/tag-suggest", {"action": "IN", "warehouse": "vn"}, content_type="application/json")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["count"], 1)
+        self.assertEqual(res.json()["next"], 2)
+
+    def test_manual_finalize_and_order_confirm_claim_default_tag(self):
+        post_manual_lines(self.wh, "IN", [(self.product, 5)], "B-1")
+        self.assertEqual(TagCounter.current("IN", self.wh), 1)
+        res = self.client.post("/api/bulk/out-by-sku", {"warehouse_id": self.wh.id, "lines": [{"sku": "SKU-A", "qty": 2}]},
+                               content_type="application/json")
+        self.assertEqual(res.status_code, 201, res.content)
+        self.assertEqual(TagCounter.current("OUT", self.wh), 1)
+        res = self.client.post("/api/batches/tag-suggest", {"action": "OUT", "warehouse": "vn"}, content_type="application/json")
+        self.assertEqual(res.json()["next"], 2)
+
+    def test_rebuild_from_moves(self):
+        for tag in (1, 4):
+            item = Item.objects.create(product=self.product)
+            Move.objects.create(item=item, action="IN", to_wh=self.wh, tag=tag)
+        TagCounter.objects.create(day=timezone.localdate(), warehouse=self.wh, action="OUT", max_tag=9)
+
+        call_command("rebuild_tag_counters", stdout=StringIO())
+
+        self.assertEqual(TagCounter.current("IN", self.wh), 4)
+        self.assertEqual(TagCounter.current("OUT", self.wh), 0)
+
+
+class BarcodeCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        barcode_cache.reset_stats()
+        self.wh = Warehouse.objects.create(code="VN", name="Kho VN")
+        self.item = Item.objects.create(product=Product.objects.create(sku="SKU-A", name="A"))
+
+    def test_lookup_hits_cache_and_move_invalidates(self):
+        url = f"/api/barcode/check?barcode={self.item.barcode_text}"
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            res = self.client.get(url)
+        self.assertEqual(res["X-Cache"], "HIT")
+        self.assertEqual(res.json()["moves"], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/scan/scan", {
+                "barcode": self.item.barcode_text, "action": "IN", "type_action": "Nhập",
+                "wh_id": self.wh.id,
+            }, content_type="application/json")
+
+        res = self.client.get(f"/api/barcode/{self.item.barcode_text}")
+        self.assertEqual(res["X-Cache"], "MISS")
+        self.assertEqual(res.json()["item"]["warehouse"]["code"], "VN")
+        self.assertEqual(len(res.json()["moves"]), 1)
+
+        stats = self.client.get("/api/barcode/cache-stats").json()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_move_by_item_id_defers_barcode_lookup_to_commit(self):
+        url = f"/api/barcode/check?barcode={self.item.barcode_text}"
+        self.client.get(url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connection) as ctx:
+                Move.objects.create(item_id=self.item.id, action="IN", to_wh=self.wh)
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "inventory_item"' in q["sql"]])
+        self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+        for cb in callbacks:
+            cb()
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+
+    def test_unknown_barcode_not_found(self):
+        self.assertEqual(self.client.get("/api/barcode/check?barcode=000000000000000").status_code, 404)
+
+
+class RefCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        refcache.clear()
+        self.wh = Warehouse.objects.create(code="VN", name="Kho VN")
+        self.product = Product.objects.create(sku="SKU-A", name="A")
+
+    def test_scan_start_needs_no_reference_queries_when_warm(self):
+        refcache.get_warehouse(id=self.wh.id)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post("/api/scan/start", {"action": "IN", "wh_id": self.wh.id}, content_type="application/json")
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if "FROM \"inventory_warehouse\"" in q["sql"]])
+
+    def test_save_bumps_version(self):
+        self.assertEqual(refcache.get_product(sku="SKU-A").name, "A")
+        self.product.name = "B"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(refcache.get_product(sku="SKU-A").name, "B")
+        self.assertEqual(set(refcache.get_products_by_skus(["SKU-A", "NOPE"])), {"SKU-A"})
+
+
+class SessionStateTests(TestCase):
+    def setUp(self):
+        refcache.clear()
+        self.wh = Warehouse.objects.create(code="VN", name="Kho VN")
+        product = Product.objects.create(sku="SKU-A", name="A")
+        self.items = [Item.objects.create(product=product) for _ in range(3)]
+
+    def test_list_ops_use_push_when_possible(self):
+        self.assertEqual(session_state._list_ops("k", ["b", "c"], ["a", "b"]), [("lpush", "k", ['"a"'], 2)])
+        self.assertEqual(session_state._list_ops("k", ["a"], ["a", "b"]), [("rpush", "k", ['"b"'])])
+        self.assertEqual(session_state._list_ops("k", ["a", "b"], ["b"])[0][0], "replace")
+
+    def test_scan_does_not_write_django_session(self):
+        self.client.post("/api/scan/start", {"action": "IN", "wh_id": self.wh.id}, content_type="application/json")
+        for it in self.items:
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post("/api/scan/scan", {
+                    "barcode": it.barcode_text, "action": "IN", "type_action": "Nhập", "wh_id": self.wh.id,
+                }, content_type="application/json")
+            self.assertEqual(res.status_code, 200)
+            self.assertFalse([q for q in ctx.captured_queries if "django_session" in q["sql"] and "SELECT" not in q["sql"]])
+
+        state = self.client.get("/api/scan/state").json()
+        self.assertTrue(state["active"])
+        self.assertEqual(state["scanned"], [it.barcode_text for it in reversed(self.items)])
+
+
+class QueryPanelTests(TestCase):
+    COUNT_SQL = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < {}) SELECT x FROM n"
+
+    @override_settings(QUERY_PANEL_MAX_ROWS=10, QUERY_PANEL_FETCH_SIZE=3)
+    def test_row_cap(self):
+        res = query_runner.run_query(self.COUNT_SQL.format(50))
+        self.assertEqual(len(res.rows), 10)
+        self.assertTrue(res.truncated)
+
+    def test_timeout_interrupts_query(self):
+        with self.assertRaises(query_runner.QueryTimeout):
+            query_runner.run_query(self.COUNT_SQL.format(10 ** 9) + " ORDER BY x DESC", timeout=0.2)
+
+    def test_get_previews_selected_table(self):
+        res = self.client.get("/queries/?table=inventory_warehouse")
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(res.context["error"])
+        self.assertIn("code", res.context["result"]["cols"])
+
+    def test_explain_and_csv_export(self):
+        res = self.client.post("/queries/", {"sql": "SELECT * FROM inventory_product WHERE sku = 'A'", "mode": "explain"})
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.context["plan"]["rows"])
+
+        res = self.client.post("/queries/", {"sql": self.COUNT_SQL.format(3), "mode": "csv"})
+        self.assertEqual(b"".join(res.streaming_content).decode("utf-8-sig").split(), ["x", "1", "2", "3"])
+
+    def test_rejects_other_statements(self):
+        res = self.client.post("/queries/", {"sql": "DROP TABLE inventory_product"})
+        self.assertIn("Chỉ cho phép", res.context["error"])
+
+
+class SavedQueryTests(TestCase):
+    def setUp(self):
+        Warehouse.objects.create(code="VN", name="Kho VN")
+
+    def test_save_materialize_and_serve_stored_result(self):
+        res = self.client.post("/queries/", {
+            "mode": "save", "name": "Kho", "sql": "SELECT code FROM inventory_warehouse",
+            "materialize": "on", "refresh_seconds": 600,
+        })
+        sq = SavedQuery.objects.get(name="Kho")
+        self.assertRedirects(res, f"/queries/{sq.pk}/")
+
+        res = self.client.get(f"/queries/{sq.pk}/")
+        self.assertEqual(res.context["result"]["rows"], [["VN"]])
+
+        # kết quả đã lưu được trả lại, không chạy lại SQL dù dữ liệu đổi
+        Warehouse.objects.create(code="US", name="Kho US")
+        res = self.client.get(f"/queries/{sq.pk}/")
+        self.assertEqual(res.context["result"]["rows"], [["VN"]])
+        self.assertEqual(sq.runs.count(), 1)
+
+        sq.refresh_from_db()
+        self.assertEqual(sq.last_row_count, 1)
+        runs = saved_queries.refresh_due(force=True)
+        self.assertEqual([r.row_count for r in runs], [2])
+
+    def test_saved_write_statement_only_runs_on_explicit_post(self):
+        res = self.client.post("/queries/", {"mode": "save", "name": "Xoá", "sql": "DELETE FROM inventory_warehouse"},
+                               follow=True)
+        sq = SavedQuery.objects.get(name="Xoá")
+        self.client.get(f"/queries/{sq.pk}/")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(Warehouse.objects.count(), 1)
+
+        self.client.post(f"/queries/{sq.pk}/", {"mode": "run", "sql": sq.sql})
+        self.assertEqual(Warehouse.objects.count(), 0)
+
+    def test_refresh_records_error(self):
+        sq = SavedQuery.objects.create(name="Sai", sql="SELECT * FROM khong_co_bang", materialize=True)
+        run = saved_queries.refresh(sq)
+        self.assertFalse(run.ok)
+        sq.refresh_from_db()
+        self.assertIn("khong_co_bang", sq.last_error)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        refcache.clear()
+        self.wh = Warehouse.objects.create(code="VN", name="Kho VN")
+        self.item = Item.objects.create(product=Product.objects.create(sku="SKU-A", name="A"))
+        self.body = {"barcode": self.item.barcode_text, "action": "IN", "type_action": "Nhập", "wh_id": self.wh.id}
+
+    def _scan(self, body, key="key-1"):
+        return self.client.post("/api/scan/scan", body, content_type="application/json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response(self):
+        first = self._scan(self.body)
+        again = self._scan(self.body)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(again["Idempotent-Replayed"], "true")
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(Move.objects.filter(item=self.item).count(), 1)
+
+    def test_key_reuse_with_other_body_is_rejected(self):
+        self._scan(self.body)
+        self.assertEqual(self._scan({**self.body, "tag": 2}).status_code, 422)
+
+    def test_in_flight_duplicate_is_blocked(self):
+        # giả lập request đầu đang chạy: khoá đã được giữ với cùng fingerprint
+        req = RequestFactory().post("/api/scan/scan", json.dumps(self.body), content_type="application/json")
+        base = f"idem:anon:{hashlib.sha256(b'key-2').hexdigest()}"
+        cache.add(f"{base}:lock", request_fingerprint(req), 60)
+        res = self._scan(self.body, key="key-2")
+        self.assertEqual(res.status_code, 409)
+        self.assertFalse(Move.objects.exists())
+
+    def test_cache_failure_after_commit_still_returns_response(self):
+        cache_set = mock.patch.object(caches["default"], "set", side_effect=ConnectionError("redis down"))
+        with cache_set, self.assertLogs("warehouse.idempotency", "WARNING"):
+            res = self._scan(self.body)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(Move.objects.filter(item=self.item).count(), 1)
+
+
+class LabelJobTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        product = Product.objects.create(sku="SKU-A", name="Áo thun_đỏ^")
+        self.codes = [Item.objects.create(product=product).barcode_text for _ in range(3)]
+
+    def _reprint(self, **extra):
+        with override_settings(MEDIA_ROOT=self.tmp, LABEL_SPOOL_DIR=os.path.join(self.tmp, "spool")):
+            return self.client.post("/api/barcodes/reprint", {"lines": self.codes, **extra},
+                                    content_type="application/json")
+
+    def test_reprint_zpl_job_file(self):
+        res = self._reprint(format="zpl")
+        self.assertEqual(res.status_code, 200)
+        body = b"".join(res.streaming_content).decode()
+        self.assertEqual(body.count("^XA"), 3)
+        self.assertIn(f"^FD{self.codes[0]}^FS", body)
+        self.assertIn("^FDÁo thun_5Fđỏ_5E^FS", body)   # ký tự điều khiển ZPL được escape qua ^FH
+        self.assertLess(len(body.encode()) / 3, 250)
+
+    def test_reprint_epl_spool(self):
+        res = self._reprint(format="epl", spool=True)
+        self.assertEqual(res.status_code, 201)
+        text = open(os.path.join(self.tmp, "spool", res.json()["spooled"]), encoding="utf-8").read()
+        self.assertEqual(text.count("P1\n"), 3)
+        self.assertIn('A16,12,0,3,1,1,N,"Ao thun_do^"', text)
+
+    def test_unknown_format_rejected(self):
+        self.assertEqual(self._reprint(format="bmp").status_code, 400)
+        self.assertEqual(self._reprint(format="pdf", template="khong-co").status_code, 400)
+
+    def test_reprint_pdf_sheet_pages_and_xref(self):
+        res = self._reprint(format="pdf", template="a4-3x8", cols=1, rows=2)
+        self.assertEqual(res.status_code, 200)
+        pdf = b"".join(res.streaming_content)
+        self.assertTrue(pdf.startswith(b"%PDF-1.4"))
+        self.assertIn(b"/Count 2", pdf)   # 3 tem, 2 tem / trang
+        # mọi offset trong bảng xref trỏ đúng vào "<n> 0 obj"
+        xref = pdf[pdf.rindex(b"xref"):].split(b"trailer")[0].split(b"\n")[3:]
+        for num, line in enumerate(filter(None, xref), start=1):
+            off = int(line.split()[0])
+            self.assertTrue(pdf[off:].startswith(b"%d 0 obj" % num))
+
+    def test_batch_download_in_other_format_does_not_touch_batch_dir(self):
+        batch = "20260102-000000"
+        batch_dir = Path(settings.MEDIA_ROOT) / "labels" / batch
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        self.addCleanup(shutil.rmtree, batch_dir, True)
+        labels.save_manifest(batch_dir, self.codes)
+        (batch_dir / f"{batch}.pdf").write_bytes(b"original")
+        before = sorted(p.name for p in batch_dir.iterdir())
+
+        res = self.client.get(f"/labels/download/{batch}/", {"format": "pdf", "cols": 1, "rows": 1})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"/Count 3", b"".join(res.streaming_content))
+        res = self.client.get(f"/labels/download/{batch}/", {"format": "zpl"})
+        self.assertEqual(b"".join(res.streaming_content).count(b"^XA"), 3)
+        self.assertIn(f'filename="{batch}.zpl"', res["Content-Disposition"])
+
+        self.assertEqual(sorted(p.name for p in batch_dir.iterdir()), before)
+        self.assertEqual((batch_dir / f"{batch}.pdf").read_bytes(), b"original")
+
+
+class ImportParserTests(TestCase):
+    def _file(self, text, name="lines.csv"):
+        return SimpleUploadedFile(name, text.encode("utf-8-sig"))
+
+    def test_sniffs_dialect_aliases_and_collects_row_errors(self):
+        body = "Mã SP;Số lượng;Ghi chú\nA1;1,000;x\n;5;\nB2;abc;\n\nC3;2;\n"
+        reader = importers.UploadReader(self._file(body), importers.MANUAL)
+        rows = list(reader)
+        self.assertEqual(rows, [{"sku": "A1", "qty": 1000, "note": "x"}, {"sku": "C3", "qty": 2}])
+        self.assertEqual(reader.errors, [{"row": 4, "errors": ["qty không hợp lệ: abc"]}])
+        with self.assertRaises(importers.ImportFileError):
+            reader.raise_if_errors()
+
+    def test_limits_and_missing_columns(self):
+        body = "sku,qty\n" + "".join(f"S{i},1\n" for i in range(5))
+        with self.assertRaisesMessage(importers.ImportFileError, "4"):
+            list(importers.UploadReader(self._file(body), importers.MANUAL, max_rows=4))
+        with self.assertRaises(importers.ImportFileError):
+            list(importers.UploadReader(self._file(body), importers.MANUAL, max_bytes=10))
+        with self.assertRaisesMessage(importers.ImportFileError, "counted_qty"):
+            importers.read_upload(self._file("kho,sku\nHCM,A1\n"), importers.STOCKTAKE)
+
+
+class BenchCommandTests(TestCase):
+    def test_seed_and_bench_roll_back(self):
+        call_command("seed_synthetic", products=20, warehouses=2, items=300, bulk_moves=200, stdout=StringIO())
+        self.assertEqual(Item.objects.filter(product__sku__startswith="SYN-").count(), 300)
+        moves = Move.objects.count()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, True)
+        out = os.path.join(tmp, "bench.json")
+        call_command("bench", case=["scan_in", "order_confirm", "items_list"], repeat=2,
+                     output=out, stdout=StringIO())
+        with open(out, encoding="utf-8") as f:
+            results = json.load(f)["results"]
+        self.assertEqual(set(results), {"scan_in", "order_confirm", "items_list"})
+        self.assertTrue(all("p50_ms" in r and r["queries"] for r in results.values()), results)
+        self.assertEqual(Move.objects.count(), moves)   # case chạy trong transaction rồi rollback
+
+
+class LoadTestMixTests(TestCase):
+    def test_synthesized_mix_and_summary(self):
+        call_command("seed_synthetic", products=10, warehouses=2, items=200, bulk_moves=50, stdout=StringIO())
+        entries = loadtest.synthesize(90, rng_seed=1)
+        self.assertEqual([e["phase"] for e in entries[::30]], ["shift_start", "ecom_flood", "steady"])
+        scanned = [e["body"]["barcode"] for e in entries if e["path"] == "/api/scan/scan"]
+        self.assertTrue(scanned)
+        self.assertEqual(len(scanned), len(set(scanned)))   # mỗi barcode quét 1 lần
+
+        samples = [("scan_in", 200, float(ms), False) for ms in range(1, 101)] + [("scan_in", 500, 5.0, True)]
+        out = loadtest.summarize(samples, elapsed=2.0)["endpoints"]["scan_in"]
+        self.assertEqual((out["count"], out["p50_ms"], out["p99_ms"]), (101, 50.0, 99.0))
+        self.assertEqual((out["busy_responses"], out["status"]["500"]), (1, 1))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_records_view_queries_and_renders_prometheus(self):
+        Warehouse.objects.create(code="HCM", name="Kho HCM")
+        with self.assertLogs("warehouse.metrics", "WARNING") as logs, \
+                override_settings(METRICS_SLOW_REQUEST_MS=0.001):
+            self.assertEqual(self.client.get("/api/history/stats/").status_code, 200)
+        self.assertIn("view=api_history_stats", logs.output[0])
+
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn('http_request_duration_seconds_count{view="api_history_stats",method="GET",status="2xx"} 1', body)
+        self.assertIn('db_queries_per_request_sum{view="api_history_stats",alias="default"} 6', body)
+        self.assertIn('http_slow_requests_total{view="api_history_stats"} 1', body)
+        self.assertNotIn('view="metrics"', body)
+
+        with override_settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, True)
+        media = override_settings(MEDIA_ROOT=tmp)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.staff = get_user_model().objects.create_user("ops", password="x", is_staff=True)
+
+    def test_staff_flag_saves_speedscope_and_lists_it(self):
+        self.assertNotIn("X-Profile", self.client.get("/api/history/stats/?__profile=1"))   # chưa đăng nhập
+        self.client.force_login(self.staff)
+        res = self.client.get("/api/history/stats/", HTTP_X_PROFILE="1")
+        name = res["X-Profile"].rsplit("/", 1)[1]
+        doc = json.loads(b"".join(self.client.get(res["X-Profile"]).streaming_content))
+        self.assertEqual(doc["profiles"][0]["type"], "sampled")
+        self.assertEqual(len(doc["profiles"][0]["samples"]), len(doc["profiles"][0]["weights"]))
+        self.assertContains(self.client.get("/profiles/"), name)
+        self.assertEqual(self.client.get("/profiles/..%2Fdb.sqlite3").status_code, 404)
+
+    def test_allowlisted_path_kept_only_when_slow(self):
+        with override_settings(PROFILE_PATHS=("/api/history/",), PROFILE_MIN_MS=60_000):
+            self.assertNotIn("X-Profile", self.client.get("/api/history/stats/"))
+        with override_settings(PROFILE_PATHS=("/api/history/",), PROFILE_MIN_MS=0, PROFILE_KEEP=1):
+            self.client.get("/api/history/stats/")
+            res = self.client.get("/api/history/stats/")
+        self.assertIn("X-Profile", res)
+        self.assertEqual([e["file"] for e in profiling.recent()], [res["X-Profile"].rsplit("/", 1)[1]])
+
+    async def test_asgi_samples_the_sync_view_thread(self):
+        await sync_to_async(self.async_client.force_login)(self.staff)
+        res = await self.async_client.get("/api/history/stats/", headers={"X-Profile": "1"})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("X-Profile", res)
+        entry = (await sync_to_async(profiling.recent)())[0]
+        self.assertEqual(entry["view"], "api_history_stats")
+
+
+class LogPipeTests(TestCase):
+    def _logger(self, handler):
+        log = logging.getLogger("inventory.scan.test")
+        log.addHandler(handler)
+        self.addCleanup(log.removeHandler, handler)
+        return log
+
+    def test_async_handler_writes_key_value_lines_in_background(self):
+        out = StringIO()
+        handler = logpipe.AsyncStreamHandler(stream=out)
+        handler.setFormatter(logpipe.KeyValueFormatter())
+        log = self._logger(handler)
+        log.info("scan ok", extra=logpipe.fields(code="123", to_wh="HCM", note='a "b"'))
+        log.warning("pct %s", 5)
+        handler.stop()   # xả hàng đợi
+        lines = out.getvalue().splitlines()
+        self.assertIn('logger=inventory.scan.test msg="scan ok" code=123 to_wh=HCM note="a \\"b\\""', lines[0])
+        self.assertIn("level=WARNING", lines[1])
+        self.assertIn('msg="pct 5"', lines[1])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = logpipe.AsyncStreamHandler(maxsize=1, stream=StringIO())
+        handler._ensure_started = lambda: None   # không có thread đọc -> hàng đợi đầy ngay
+        log = self._logger(handler)
+        for _ in range(3):
+            log.info("x")
+        self.assertEqual(handler.dropped, 2)
+
+    @override_settings(LOG_THROTTLE={"inventory.scan": {"rate": 2, "per": 60}})
+    def test_throttle_rate_limits_info_and_reports_suppressed(self):
+        f = logpipe.ThrottleFilter()
+        rec = lambda level=logging.INFO: logging.LogRecord("inventory.scan.x", level, "", 0, "m", (), None)
+        self.assertEqual([f.filter(rec()) for _ in range(5)], [True, True, False, False, False])
+        self.assertTrue(f.filter(rec(logging.WARNING)))
+        f._windows["inventory.scan"][0] -= 61   # sang cửa sổ mới
+        r = rec()
+        self.assertTrue(f.filter(r))
+        self.assertEqual(r.suppressed, 3)
+        self.assertTrue(logpipe.ThrottleFilter().filter(logging.LogRecord("erp_the20", 20, "", 0, "m", (), None)))
+
+
+class AsyncServingTests(TestCase):
+    def test_every_middleware_is_async_capable(self):
+        # 1 middleware chỉ-sync -> Django ép view async về sync dưới ASGI
+        sync_only = [m for m in settings.MIDDLEWARE if not getattr(import_string(m), "async_capable", False)]
+        self.assertEqual(sync_only, [])
+
+    @override_settings(ASYNC_POOL_INLINE=False, ASYNC_DB_THREADS=2)
+    def test_run_db_is_bounded_by_pool_size(self):
+        aio.shutdown()
+        self.addCleanup(aio.shutdown)
+        lock, state = threading.Lock(), {"now": 0, "peak": 0, "threads": set()}
+
+        def work():
+            with lock:
+                state["now"] += 1
+                state["peak"] = max(state["peak"], state["now"])
+                state["threads"].add(threading.current_thread().name)
+            time.sleep(0.05)
+            with lock:
+                state["now"] -= 1
+
+        async def burst():
+            await asyncio.gather(*(aio.run_db(work) for _ in range(6)))
+
+        async_to_sync(burst)()
+        self.assertEqual(state["peak"], 2)
+        self.assertTrue(all(n.startswith("aio-db") for n in state["threads"]))
+
+    async def test_asgi_request_counts_queries_from_view_thread(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        metrics._attach(None, connection)   # connection của thread test có thể mở trước khi import metrics
+        res = await self.async_client.get("/api/history/stats/")
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('db_queries_per_request_sum{view="api_history_stats",alias="default"} 6', metrics.render())
+
+    def test_asgi_streams_file_without_buffering(self):
+        batch = "20260101-000000"
+        batch_dir = Path(settings.MEDIA_ROOT) / "labels" / batch
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        self.addCleanup(shutil.rmtree, batch_dir, True)
+        body = os.urandom(300 * 1024)
+        (batch_dir / f"{batch}.zip").write_bytes(body)
+
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+                 "scheme": "http", "path": f"/labels/download/{batch}/", "raw_path": b"", "query_string": b"",
+                 "root_path": "", "headers": [(b"host", b"testserver")], "client": ("127.0.0.1", 1),
+                 "server": ("testserver", 80)}
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            async_to_sync(ASGIHandler())(scope, receive, send)
+        self.assertEqual([str(w.message) for w in caught if "consume" in str(w.message)], [])
+        self.assertEqual(sent[0]["status"], 200)
+        chunks = [m["body"] for m in sent[1:] if m.get("body")]
+        self.assertGreater(len(chunks), 1)   # gửi từng đợt, không 1 cục cả file
+        self.assertEqual(b"".join(chunks), body)
+
+
+class SqliteWriterTests(TransactionTestCase):
+    def test_connection_pragmas_and_immediate_transactions(self):
+        with connection.cursor() as cur:
+            cur.execute("PRAGMA busy_timeout")
+            self.assertEqual(cur.fetchone()[0], settings.SQLITE_BUSY_TIMEOUT_MS)
+            cur.execute("PRAGMA synchronous")
+            self.assertEqual(cur.fetchone()[0], 1)   # NORMAL
+        with CaptureQueriesContext(connection) as ctx, transaction.atomic():
+            Warehouse.objects.create(code="VN", name="Kho VN")
+        self.assertEqual(ctx.captured_queries[0]["sql"], "BEGIN IMMEDIATE")
+
+    def test_writer_batches_queued_jobs_and_isolates_failures(self):
+        w = dbwriter.Writer()
+        self.addCleanup(w.stop)
+        gate = threading.Event()
+        first = w.submit(gate.wait, 5)
+        while not first.running():
+            time.sleep(0.001)
+
+        def create(code):
+            return Warehouse.objects.create(code=code, name=code).code
+
+        def broken():
+            Warehouse.objects.create(code="BAD", name="BAD")
+            raise ValueError("boom")
+
+        # xếp hàng trong lúc thread ghi đang bận -> gom vào 1 giao dịch
+        futs = [w.submit(create, "W1"), w.submit(broken), w.submit(create, "W2")]
+        gate.set()
+        self.assertEqual([futs[0].result(5), futs[2].result(5)], ["W1", "W2"])
+        with self.assertRaises(ValueError):
+            futs[1].result(5)
+        self.assertEqual(sorted(Warehouse.objects.values_list("code", flat=True)), ["W1", "W2"])
+        self.assertEqual((w.batches, w.jobs), (2, 4))
+
+    @override_settings(SQLITE_WRITER_INLINE=False, SQLITE_WRITER_TIMEOUT=0.2)
+    def test_busy_writer_cancels_job_and_returns_503(self):
+        w = dbwriter.writer()
+        gate = threading.Event()
+        self.addCleanup(lambda: (gate.set(), dbwriter._writers.pop("default")[1].stop()))
+        blocker = w.submit(gate.wait, 5)
+        while not blocker.running():
+            time.sleep(0.001)
+
+        def create(code):
+            return Warehouse.objects.create(code=code, name=code).code
+
+        with self.assertRaises(dbwriter.WriterBusy):
+            dbwriter.post(create, "W1")
+        gate.set()
+        blocker.result(5)
+        self.assertEqual(dbwriter.post(create, "W2"), "W2")
+        # việc bị huỷ không chạy về sau
+        self.assertEqual(list(Warehouse.objects.values_list("code", flat=True)), ["W2"])
+
+        # request đang giữ khoá SQLite không đi qua HTTP được -> giả lập writer bận ở tầng API
+        wh = Warehouse.objects.create(code="VN", name="Kho VN")
+        item = Item.objects.create(product=Product.objects.create(sku="A", name="A"))
+        with mock.patch("inventory.api_views.dbwriter.post", side_effect=dbwriter.WriterBusy):
+            res = self.client.post("/api/scan/scan", {"barcode": item.barcode_text, "action": "IN",
+                                                      "type_action": "Nhập", "wh_id": wh.id},
+                                   content_type="application/json")
+        self.assertEqual(res.status_code, 503, res.content)
+        self.assertEqual(res["Retry-After"], "1")
+
+@override_settings(DB_REPLICA_READS=True)
+class ReplicaRoutingTests(TestCase):
+    # primary / replica = 2 file SQLite (settings_test), không replication -> đọc nhầm bên là thấy ngay
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.wh = Warehouse.objects.create(code="VN", name="Kho VN")
+        Move.objects.create(product=Product.objects.create(sku="A", name="A"), quantity=1,
+                            action="IN", to_wh=self.wh, type_action="SEED")
+
+    def test_replica_reads_are_opt_in_and_pinned_after_write(self):
+        self.assertEqual(Product.objects.count(), 1)
+        with db_routers.replica_reads():
+            self.assertEqual(Product.objects.count(), 0)
+            Product.objects.create(sku="B", name="B")
+            self.assertEqual(Product.objects.count(), 2)
+        with db_routers.replica_reads():
+            self.assertEqual(Product.objects.count(), 0)
+
+    def test_stats_view_reads_replica_until_client_writes(self):
+        stats = lambda: self.client.get("/api/history/stats/").json()["today_total"]
+        self.assertEqual(stats(), 0)
+        res = self.client.post("/api/scan/start", {"action": "IN", "wh_id": self.wh.id}, content_type="application/json")
+        self.assertIn(db_routers.PIN_COOKIE, res.cookies)
+        self.assertEqual(stats(), 1)
+        del self.client.cookies[db_routers.PIN_COOKIE]
+        self.assertEqual(stats(), 0)
+
+
+class _FakeConn:
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(TestCase):
+
+    def setUp(self):
+        self.pool = pool.get("pooltest", "u@h:5432/erp", check=lambda c: c.healthy, max_size=1, timeout=0.05)
+        self.addCleanup(pool.close_all)
+
+    def test_reuses_connection_and_times_out_when_full(self):
+        a = self.pool.acquire(_FakeConn)
+        self.pool.release(a)
+        b = self.pool.acquire(_FakeConn)
+        self.assertIs(a, b)
+        with self.assertRaises(pool.PoolTimeout):
+            self.pool.acquire(_FakeConn)
+        s = self.pool.stats()
+        self.assertEqual((s["connects"], s["checkouts"], s["timeouts"], s["in_use"]), (1, 2, 1, 1))
+
+    def test_broken_and_idle_connections_are_dropped(self):
+        self.pool.options.update(check_after=0, idle_timeout=60)
+        a = self.pool.acquire(_FakeConn)
+        self.pool.release(a)
+        a.healthy = False
+        b = self.pool.acquire(_FakeConn)
+        self.assertIsNot(a, b)
+        self.assertTrue(a.closed)
+        self.pool.release(b)
+        with mock.patch("warehouse.db.pool.time.monotonic", return_value=time.monotonic() + 61):
+            c = self.pool.acquire(_FakeConn)
+        self.assertTrue(b.closed)
+        self.assertFalse(c.closed)
+        self.assertEqual(self.pool.stats()["discarded"], {"broken": 1, "idle": 1})
+
+    def test_metrics_exposes_pool_without_host(self):
+        self.pool.release(self.pool.acquire(_FakeConn))
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn('db_pool_connections{alias="pooltest",database="erp",state="idle"} 1', body)
+        self.assertIn('db_pool_connects_total{alias="pooltest",database="erp"} 1', body)
+        self.assertNotIn("u@h", body)
+
+
+def _manual_start(t, n, action="OUT"):
+    t.client.post("/api/manual/start", {"action": action, "wh_id": t.whs[0].id}, content_type="application/json")
+
+
+def _manual_lines(t, n):
+    _manual_start(t, n)
+    for p in t.products[:n]:
+        t.client.post("/api/manual/lines", {"sku": p.sku, "qty": 1}, content_type="application/json")
+
+
+def _manual_csv(t, n):
+    body = "sku,qty\n" + "".join(f"{p.sku},1\n" for p in t.products[:n])
+    return {"file": SimpleUploadedFile("lines.csv", body.encode()), "replace": "1"}
+
+
+class QueryCountTests(QueryCountMixin, TestCase):
+    """Mọi route của inventory/api_urls.py: số query không đổi khi dữ liệu / số dòng payload tăng."""
+    URLCONF = "inventory.api_urls"
+    ENDPOINTS = [
+        Endpoint("api-root", "/api/"),
+        Endpoint("warehouses-list", "/api/warehouses/"),
+        Endpoint("warehouses-detail", lambda t, n: f"/api/warehouses/{t.whs[0].id}/"),
+        Endpoint("products-list", "/api/products/"),
+        Endpoint("products-detail", lambda t, n: f"/api/products/{t.products[0].id}/"),
+        Endpoint("items-list", "/api/items/"),
+        Endpoint("items-detail", lambda t, n: f"/api/items/{t.items[0].id}/"),
+        Endpoint("items-export-csv", "/api/items/export_csv/"),
+        Endpoint("api_inventory", "/api/inventory/"),
+        Endpoint("api_history", "/api/history/"),
+        Endpoint("api_history_stats", "/api/history/stats/"),
+        Endpoint("api_history_updates", "/api/history/updates/?last_update=2000-01-01T00:00:00"),
+        # endpoint ghi theo từng dòng: payload cố định, chỉ dữ liệu nền tăng
+        Endpoint("api_bulk_out_by_sku", "/api/bulk/out-by-sku", "post", status=(200, 201),
+                 data=lambda t, n: {"warehouse_id": t.whs[0].id, "lines": [{"sku": t.products[0].sku, "qty": 1}]}),
+        Endpoint("api_bulk_import_orders", "/api/bulk/import-orders", "post",
+                 data=lambda t, n: {"orders": [{"external_id": "QC-EXT", "order_type": "IN",
+                                                "warehouse_code": t.whs[0].code,
+                                                "lines": [{"sku": t.products[0].sku, "qty": 1}]}]}),
+        Endpoint("api_manual_start", "/api/manual/start", "post",
+                 data=lambda t, n: {"action": "OUT", "wh_id": t.whs[0].id}),
+        Endpoint("api_manual_preview", "/api/manual/preview", setup=_manual_lines),
+        Endpoint("api_manual_lines", "/api/manual/lines", "post", setup=_manual_start,
+                 data=lambda t, n: {"sku": t.products[0].sku, "qty": 1}),
+        Endpoint("api_manual_clear", "/api/manual/clear", "post", setup=_manual_lines, data={}),
+        Endpoint("api_manual_finalize", "/api/manual/finalize", "post",
+                 data=lambda t, n: {"action": "IN", "wh_id": t.whs[0].id,
+                                    "lines": [{"sku": t.products[0].sku, "qty": 1}]}),
+        Endpoint("api_manual_upload", "/api/manual/upload", "post", setup=_manual_start, data=_manual_csv,
+                 kwargs={"content_type": MULTIPART_CONTENT}),
+        Endpoint("api_scan_start", "/api/scan/start", "post",
+                 data=lambda t, n: {"action": "IN", "wh_id": t.whs[0].id}),
+        Endpoint("api_scan_stop", "/api/scan/stop", "post", data={}),
+        Endpoint("api_scan_scan", "/api/scan/scan", "post",
+                 data=lambda t, n: {"barcode": t.items[0].barcode_text, "action": "OUT", "type_action": "SALE"}),
+        Endpoint("api_scan_state", "/api/scan/state"),
+        Endpoint("api_generate_labels", "/api/generate/labels", "post",
+                 data={"lines": [{"sku": "QC-LBL", "qty": 2}], "format": "zpl"}),
+        Endpoint("api_barcode_check", lambda t, n: f"/api/barcode/check?barcode={t.items[0].barcode_text}"),
+        Endpoint("api_barcode_check_slug", lambda t, n: f"/api/barcode/{t.items[0].barcode_text}"),
+        Endpoint("api_barcode_cache_stats", "/api/barcode/cache-stats"),
+        Endpoint("api_batch_tag_suggest", "/api/batches/tag-suggest", "post",
+                 data=lambda t, n: {"action": "IN", "warehouse": t.whs[0].code}),
+        Endpoint("stocktake-bom", "/api/stocktake/bom", "post",
+                 data=lambda t, n: {"dry_run": True, "lines": [
+                     {"warehouse_code": t.whs[0].code, "sku": p.sku, "counted_qty": 3} for p in t.products[:n]]}),
+        Endpoint("reprint-barcodes", "/api/barcodes/reprint", "post",
+                 data=lambda t, n: {"lines": [it.barcode_text for it in t.items[:n]], "format": "zpl"}),
+    ]
+
+    def setUp(self):
+        self.whs, self.products, self.items = [], [], []
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, True)
+        media = override_settings(MEDIA_ROOT=tmp, LABEL_SPOOL_DIR=os.path.join(tmp, "spool"))
+        media.enable()
+        self.addCleanup(media.disable)
+        patcher = mock.patch("inventory.api_views.MEDIA_ROOT", Path(tmp))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reset_state(self):
+        super().reset_state()
+        refcache.clear()
+
+    def grow(self, n):
+        today = timezone.localdate()
+        for i in range(len(self.products), n):
+            wh = Warehouse.objects.create(code=f"QC-WH{i}", name=f"Kho {i}")
+            p = Product.objects.create(sku=f"QC-{i:03d}", name=f"SP {i}")
+            Inventory.objects.create(product=p, warehouse=self.whs[0] if self.whs else wh, qty=100)
+            it = Item.objects.create(product=p, warehouse=self.whs[0] if self.whs else wh,
+                                     status="in_stock", import_date=today)
+            Move.objects.create(item=it, action="IN", to_wh=it.warehouse, type_action="SEED")
+            Move.objects.create(product=p, quantity=5, action="IN", to_wh=it.warehouse, type_action="SEED")
+            self.whs.append(wh)
+            self.products.append(p)
+            self.items.append(it)
 
-# Create your tests here.
@@ -1,16 +1,17 @@
 from pathlib import Path
 import re, io, zipfile
-import csv, unicodedata
+import csv
 
 from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db import transaction, connection
-from django.db.models import Q, Max, Count, Sum, F, Avg, Case, When, Value, IntegerField,  CharField
+from django.db import transaction, connection, DatabaseError
+from django.db.models import Q, Count, Sum, F, Avg, Case, When, Value, IntegerField,  CharField
 from django.core.paginator import Paginator
 from django.db.models.functions import Coalesce
 from django.contrib import messages
 from django.utils import timezone
-from django.http import Http404, HttpResponse, HttpResponseBadRequest, FileResponse, JsonResponse
+from django.utils.dateparse import parse_datetime
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.urls import reverse
 from urllib.parse import quote
 from django.db.models.functions import Extract, TruncHour
@@ -19,20 +20,20 @@ from django.views.decorators.http import require_POST, require_GET
 
 from datetime import datetime, date, timedelta
 from shutil import make_archive
-from .models import Product, Warehouse, Item, Inventory, Move, SavedQuery
+from .models import Product, Warehouse, Item, Inventory, Move, SavedQuery, SavedQueryResult, TagCounter
 from .forms import GenerateForm, ScanMoveForm, ProductForm, SQLQueryForm
 from .utils import make_payload, save_code128_png
+from . import barcode_cache, refcache, session_state, query_runner, saved_queries, labels, importers
+from warehouse import dbwriter
+from warehouse.db_routers import replica_reads
+from warehouse.streaming import FileResponse, StreamingHttpResponse
 from io import StringIO
+from itertools import chain
 from typing import Tuple, List
 from rest_framework.exceptions import ValidationError as DRFValidationError
 
 MEDIA_ROOT = Path(settings.MEDIA_ROOT)
 
-try:
-    from openpyxl import load_workbook   # pip install openpyxl
-except Exception:
-    load_workbook = None
-
 # ---------- Trang chính & Dashboard ----------
 def index(request):
     # vào web -> generate
@@ -48,6 +49,7 @@ def dashboard_redirect(request):
 
 # -------- trang dashboard warehouse ---------
 
+@replica_reads()   # thống kê / export: đọc replica (nếu có)
 def dashboard_warehouse(request):
     wh_id = request.GET.get("wh") or ""
     q     = (request.GET.get("q") or "").strip()
@@ -104,6 +106,7 @@ def dashboard_warehouse(request):
 
 # ---- Tab 2: Barcodes (liệt kê barcode)
 
+@replica_reads()
 def dashboard_barcodes(request):
     # Lấy tham số filter
     q = (request.GET.get('q') or '').strip()
@@ -212,6 +215,7 @@ def export_barcodes_csv(queryset):
 
 # ---- Tab 3: History (đổi tên từ dashboard cũ của bạn)
 
+@replica_reads()
 def dashboard_history(request):
     """Enhanced dashboard history: show both ITEM & BULK in one table"""
     # Get filter parameters
@@ -553,6 +557,7 @@ def dashboard_history_api(request):
     return JsonResponse({'error': 'Invalid timestamp'}, status=400)
 
 
+@replica_reads()
 def dashboard_history_stats(request):
     """API endpoint for dashboard statistics"""
     
@@ -586,14 +591,15 @@ def adjust_inventory(product: Product, warehouse: Warehouse, delta: int):
     inv.save(update_fields=["qty"])
 
 def _get_queue(request):
-    return request.session.setdefault("gen_queue", [])
+    return session_state.load(request, "gen_queue", [])
 
 def _save_queue(request, q):
-    request.session["gen_queue"] = q
-    request.session.modified = True
+    session_state.save(request, "gen_queue", q, [])
 
 # ==== Manual batch in session ====
 
+_MANUAL_BATCH_DEFAULT = {"active": False, "lines": []}
+
 def _manual_batch(request):
     """
     Cấu trúc:
@@ -604,11 +610,10 @@ def _manual_batch(request):
       "batch_code": "20250828-103000"
     }
     """
-    return request.session.setdefault("manual_batch", {"active": False, "lines": []})
+    return session_state.load(request, "manual_batch", _MANUAL_BATCH_DEFAULT)
 
 def _save_manual_batch(request, st):
-    request.session["manual_batch"] = st
-    request.session.modified = True
+    session_state.save(request, "manual_batch", st, _MANUAL_BATCH_DEFAULT)
 
 
 def get_itemized_count(product: Product, warehouse: Warehouse) -> int:
@@ -631,7 +636,23 @@ def preview_bulk_out(product: Product, warehouse: Warehouse, qty: int):
     """
     inv = Inventory.objects.filter(product=product, warehouse=warehouse).first()
     total = inv.qty if inv else 0
-    itemized_cnt = get_itemized_count(product, warehouse)
+    return _preview_pools(total, get_itemized_count(product, warehouse), qty)
+
+def preview_bulk_out_many(warehouse: Warehouse, product_ids) -> dict:
+    """
+    Bản theo lô của preview_bulk_out cho cả danh sách dòng: 2 query cho mọi product
+    -> {product_id: (total, itemized_cnt)}; ghép với qty từng dòng qua _preview_pools.
+    """
+    ids = {pid for pid in product_ids if pid}
+    if not ids or warehouse is None:
+        return {}
+    totals = dict(Inventory.objects.filter(product_id__in=ids, warehouse=warehouse)
+                  .values_list("product_id", "qty"))
+    itemized = dict(Item.objects.filter(product_id__in=ids, warehouse=warehouse, status="in_stock")
+                    .values("product_id").annotate(n=Count("id")).values_list("product_id", "n"))
+    return {pid: (totals.get(pid, 0), itemized.get(pid, 0)) for pid in ids}
+
+def _preview_pools(total: int, itemized_cnt: int, qty: int) -> dict:
     bulk_pool = max(0, total - itemized_cnt)
     lack = max(0, qty - bulk_pool)
     return {
@@ -733,12 +754,93 @@ def allocate_bulk_out(
 
         return bulk_pool, picked
 
+# ==== Ghi sổ (gọi qua dbwriter.post: 1 thread ghi, gom nhiều việc / giao dịch) ====
+def post_scan(code, action, wh, type_action, tag, note_user="", affect_inv=True, claim=False):
+    """
+    1 lần quét IN/OUT: Move + Item + tồn kho (+ TagCounter nếu claim).
+    Trả về (status, detail, log): 200 | 400 (bị chặn) | 404 (không có barcode); log = field cho logger.
+    """
+    try:
+        item = Item.objects.select_for_update().select_related("product", "warehouse").get(barcode_text=code)
+    except Item.DoesNotExist:
+        return 404, f"Không tìm thấy {code}", {}
+
+    if action == "IN":
+        if item.warehouse:
+            return 400, f"{code} đang ở {item.warehouse.code}.", {"reason": "already_in", "item_wh": item.warehouse.code}
+        Move.objects.create(item=item, action="IN", to_wh=wh, type_action=type_action, tag=tag,
+                            note="IN (scan)", note_user=note_user)
+        item.warehouse = wh; item.status = "in_stock"
+        item.save(update_fields=["warehouse", "status"])
+        if affect_inv:
+            adjust_inventory(item.product, wh, +1)
+        base_wh, detail, log = wh, f"IN {code} → {wh.code}", {"to_wh": wh.code}
+    else:
+        if not item.warehouse:
+            return 400, f"{code} đã OUT trước đó.", {"reason": "already_out"}
+        if wh and item.warehouse != wh:
+            return (400, f"{code} đang ở {item.warehouse.code}, khác kho phiên ({wh.code}).",
+                    {"reason": "other_wh", "item_wh": item.warehouse.code})
+        base_wh = wh or item.warehouse
+        Move.objects.create(item=item, action="OUT", from_wh=base_wh, type_action=type_action, tag=tag,
+                            note="OUT (scan)", note_user=note_user)
+        adjust_inventory(item.product, base_wh, -1)
+        item.warehouse = None; item.status = "shipped"
+        item.save(update_fields=["warehouse", "status"])
+        detail, log = f"OUT {code}", {"from_wh": base_wh.code}
+
+    if claim:
+        # scan stateless có thể mang tag bất kỳ -> ghi nhận vào bộ đếm ngày
+        TagCounter.claim(action, base_wh, tag)
+    return 200, detail, log
+
+def post_manual_lines(wh, action, lines, batch_id, allow_consume_itemized=False) -> int:
+    """Chốt đơn thủ công: lines = [(product, qty)]; trả về số Move. Thiếu hàng -> DRFValidationError (rollback cả đơn)."""
+    moves = []
+    for product, qty in lines:
+        if action == "IN":
+            moves.append(Move.objects.create(product=product, quantity=qty, action="IN", to_wh=wh,
+                                             type_action="MANUAL", note="IN (manual bulk)", batch_id=batch_id))
+            adjust_inventory(product, wh, +qty)
+            continue
+
+        # OUT: dùng bulk &/hoặc bốc item
+        bulk_used, picked_items = allocate_bulk_out(product, wh, qty, allow_consume_itemized=allow_consume_itemized)
+        if bulk_used > 0:
+            moves.append(Move.objects.create(product=product, quantity=bulk_used, action="OUT", from_wh=wh,
+                                             type_action="MANUAL", note="OUT (manual bulk)", batch_id=batch_id))
+            adjust_inventory(product, wh, -bulk_used)
+        for it in picked_items:
+            moves.append(Move.objects.create(item=it, action="OUT", from_wh=wh,
+                                             type_action="MANUAL", note="OUT (manual picked)", batch_id=batch_id))
+            adjust_inventory(it.product, wh, -1)
+            it.warehouse = None; it.status = "shipped"
+            it.save(update_fields=["warehouse", "status"])
+    TagCounter.claim_moves(moves)   # gợi ý tag trong ngày thấy cả Move của đơn thủ công
+    return len(moves)
+
+def create_label_items(rows, sync_name=False) -> list:
+    """
+    Tạo Item cho tem: rows = [(sku, name, qty, import_date)] -> [(sku, barcode_text, product_name)].
+    Chỉ ghi DB; ảnh / file tem render sau khi commit, ngoài giao dịch.
+    """
+    created = []
+    for sku, name, qty, import_dt in rows:
+        product, _ = Product.objects.get_or_create(sku=sku, defaults={"name": name})
+        if sync_name and name and product.name != name:
+            product.name = name
+            product.save(update_fields=["name"])
+        for _ in range(qty):
+            item = Item.objects.create(product=product, import_date=import_dt)
+            created.append((sku, item.barcode_text, product.name))
+    return created
+
 # ==== Views cho Manual IN/OUT ====
 
 def manual_start(request):
     if request.method == "POST":
         action = (request.POST.get("action") or "OUT").upper()
-        wh = Warehouse.objects.filter(id=request.POST.get("wh")).first()
+        wh = refcache.get_warehouse(id=request.POST.get("wh"))
         if action not in ("IN","OUT") or not wh:
             messages.error(request, "Chọn action (IN/OUT) và kho hợp lệ.")
             return redirect("manual_start")
@@ -776,7 +878,7 @@ def manual_add_line(request):
         messages.error(request, "SKU/Qty không hợp lệ.")
         return redirect("manual_preview")
 
-    product = Product.objects.filter(sku=sku).first()
+    product = refcache.get_product(sku=sku)
     if not product:
         messages.error(request, f"Không tìm thấy SKU {sku}.")
         return redirect("manual_preview")
@@ -805,7 +907,7 @@ def manual_preview(request):
     if not st.get("active"):
         return redirect("manual_start")
 
-    wh = Warehouse.objects.filter(id=st["wh_id"]).first()
+    wh = refcache.get_warehouse(id=st["wh_id"])
     action = st["action"]
     allow = st.get("allow_consume_itemized", False)
 
@@ -815,12 +917,14 @@ def manual_preview(request):
     # Tính preview & cảnh báo
     preview_rows = []
     total_warn = 0
+    product_map = refcache.get_products_by_skus(ln["sku"] for ln in st.get("lines", []))
+    pools = preview_bulk_out_many(wh, (p.id for p in product_map.values())) if action == "OUT" else {}
     for i, ln in enumerate(st.get("lines", [])):
-        product = Product.objects.filter(sku=ln["sku"]).first()
+        product = product_map.get(ln["sku"])
         qty = int(ln["qty"])
         row = {"idx": i, "sku": ln["sku"], "qty": qty, "valid": bool(product)}
         if product and action == "OUT":
-            pv = preview_bulk_out(product, wh, qty)
+            pv = _preview_pools(*pools.get(product.id, (0, 0)), qty)
             row.update(pv)
             row["status"] = "OK" if pv["lack"] == 0 else ("THIẾU (sẽ bốc item)" if allow else "THIẾU (sẽ bị chặn)")
             if pv["lack"] > 0 and not allow:
@@ -839,63 +943,27 @@ def manual_preview(request):
     })
 
 @require_POST
-@transaction.atomic
 def manual_finalize(request):
     st = _manual_batch(request)
     if not st.get("active"):
         messages.warning(request, "Chưa bắt đầu đơn thủ công.")
         return redirect("manual_start")
 
-    wh = Warehouse.objects.select_for_update().filter(id=st["wh_id"]).first()
+    wh = refcache.get_warehouse(id=st["wh_id"])
     action = st["action"]
     allow = st.get("allow_consume_itemized", False)
     batch_id = st.get("batch_code") or timezone.localtime().strftime("%Y%m%d-%H%M%S")
 
-    created_moves = 0
-    # Duyệt từng dòng
-    for ln in st.get("lines", []):
-        product = Product.objects.filter(sku=ln["sku"]).first()
-        if not product:
-            continue
-        qty = int(ln["qty"])
-
-        if action == "IN":
-            # IN bulk: tăng tồn kho, log Move bulk
-            mv = Move.objects.create(
-                product=product, quantity=qty, action="IN", to_wh=wh,
-                type_action="MANUAL", note="IN (manual bulk)", batch_id=batch_id
-            )
-            # cập nhật tồn (dùng helper có sẵn của bạn)
-            adjust_inventory(product, wh, +qty)
-            created_moves += 1
-
-        else:  # OUT
-            # Quyết định dùng bulk &/hoặc bốc item
-            bulk_used, picked_items = allocate_bulk_out(product, wh, qty, allow_consume_itemized=allow)
-
-            if bulk_used > 0:
-                mvb = Move.objects.create(
-                    product=product, quantity=bulk_used, action="OUT", from_wh=wh,
-                    type_action="MANUAL", note="OUT (manual bulk)", batch_id=batch_id
-                )
-                adjust_inventory(product, wh, -bulk_used)
-                created_moves += 1
-
-            for it in picked_items:
-                mvi = Move.objects.create(
-                    item=it, action="OUT", from_wh=wh,
-                    type_action="MANUAL", note="OUT (manual picked)", batch_id=batch_id
-                )
-                # cập nhật tồn + trạng thái item (theo scan_move bạn đang làm)
-                adjust_inventory(it.product, wh, -1)
-                it.warehouse = None
-                it.status = "shipped"
-                it.save(update_fields=["warehouse","status"])
-                created_moves += 1
+    product_map = refcache.get_products_by_skus(ln["sku"] for ln in st.get("lines", []))
+    lines = [(product_map[ln["sku"]], int(ln["qty"])) for ln in st.get("lines", []) if ln["sku"] in product_map]
+    try:
+        created_moves = dbwriter.post(post_manual_lines, wh, action, lines, batch_id, allow)
+    except dbwriter.WriterBusy as e:
+        messages.error(request, str(e.detail))   # đơn vẫn giữ trong phiên, chốt lại được
+        return redirect("manual_preview")
 
     # Reset batch + hiển thị link truy xuất
-    request.session["manual_batch"] = {"active": False, "lines": []}
-    request.session.modified = True
+    _save_manual_batch(request, {"active": False, "lines": []})
     messages.success(request, f"Đã ghi sổ batch {batch_id} với {created_moves} giao dịch.")
     return redirect(f"{reverse('manual_batch_detail')}?batch={batch_id}")
 
@@ -917,7 +985,6 @@ def manual_batch_detail(request):
     })
 # ---------- Generate labels ----------
 
-@transaction.atomic
 def generate_labels(request):
     if request.method == "POST":
         form = GenerateForm(request.POST)
@@ -976,6 +1043,7 @@ def generate_labels(request):
             "media_url": settings.MEDIA_URL,
             "queue": queue,
             "total_qty": total_qty,
+            "pdf_templates": list(getattr(settings, "LABEL_PDF_TEMPLATES", {})),
         },
     )
 
@@ -993,34 +1061,59 @@ def clear_queue(request):
     messages.info(request, "Đã xóa toàn bộ giỏ in.")
     return redirect("generate_labels")
 
-@transaction.atomic
 def finalize_queue(request):
     queue = _get_queue(request)
     if not queue:
         messages.warning(request, "Giỏ in đang trống.")
         return redirect("generate_labels")
 
+    # png (ZIP ảnh) | zpl | epl (1 file job cho máy in nhiệt)
+    try:
+        fmt = labels.parse_format(request.POST.get("format"))
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect("generate_labels")
+    spool = fmt in labels.TEXT_FORMATS and request.POST.get("spool") == "1"
+    if spool and not labels.spool_enabled():
+        messages.error(request, "Chưa cấu hình thư mục spool máy in (LABEL_SPOOL_DIR).")
+        return redirect("generate_labels")
+    try:
+        template = labels.template_from(request.POST) if fmt == labels.PDF else None
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect("generate_labels")
+
     # Tạo batch: YYYYMMDD-HHMMSS
     batch_code = timezone.localtime().strftime("%Y%m%d-%H%M%S")
     batch_dir = MEDIA_ROOT / "labels" / batch_code
     batch_dir.mkdir(parents=True, exist_ok=True)
 
-    total_created = 0
-    for row in queue:
-        sku = row["sku"]
-        name = row["name"]
-        qty = int(row["qty"])
-        import_dt = datetime.strptime(row["import_date"], "%d/%m/%Y").date()
-
-        product, _ = Product.objects.get_or_create(sku=sku, defaults={"name": name})
-
-        sku_dir = batch_dir / sku
-        sku_dir.mkdir(exist_ok=True)
-
-        for _ in range(qty):
-            item = Item.objects.create(product=product, import_date=import_dt)
-            save_code128_png(item.barcode_text, product.name, out_dir=str(sku_dir))
-            total_created += 1
+    rows = [(row["sku"], row["name"], int(row["qty"]), datetime.strptime(row["import_date"], "%d/%m/%Y").date())
+            for row in queue]
+    try:
+        created = dbwriter.post(create_label_items, rows)
+    except dbwriter.WriterBusy as e:
+        batch_dir.rmdir()
+        messages.error(request, str(e.detail))
+        return redirect("generate_labels")
+    total_created = len(created)
+    job = [(code, name) for _, code, name in created]
+    if fmt == labels.PNG:
+        for sku, code, name in created:
+            sku_dir = batch_dir / sku
+            sku_dir.mkdir(exist_ok=True)
+            save_code128_png(code, name, out_dir=str(sku_dir))
+
+    if fmt != labels.PNG:
+        labels.save_manifest(batch_dir, [code for code, _ in job])
+        _save_queue(request, [])
+        if spool:
+            labels.spool_job(fmt, job, batch_code)
+            messages.success(request, f"Đã gửi {total_created} tem ({fmt.upper()}) tới máy in, batch {batch_code}.")
+            return redirect("generate_labels")
+        job_path = labels.render_file(fmt, job, batch_dir / f"{batch_code}.{fmt}", template)
+        return FileResponse(open(job_path, "rb"), as_attachment=True, filename=job_path.name,
+                            content_type=labels.CONTENT_TYPES[fmt])
 
     # Gói ZIP ra đĩa
     zip_file = batch_dir / f"{batch_code}.zip"
@@ -1042,17 +1135,39 @@ def download_batch(request, batch: str):
     """
     Tải ZIP: MEDIA_ROOT/labels/<batch>/<batch>.zip
     batch: YYYYMMDD-HHMMSS
+    ?format=pdf|zpl|epl (&template=, cols=, rows=, margin_mm=) -> in lại cả batch ở format đó.
     """
     if not re.match(r"^\d{8}-\d{6}$", batch or ""):
         return HttpResponseBadRequest("Bad batch name.")
 
+    if request.GET.get("format"):
+        return _download_batch_as(request, batch)
+
     zip_path = MEDIA_ROOT / "labels" / batch / f"{batch}.zip"
     if not zip_path.exists():
         raise Http404("Batch not found.")
 
-    data = zip_path.read_bytes()
-    resp = HttpResponse(data, content_type="application/zip")
-    resp["Content-Disposition"] = f'attachment; filename="{batch}.zip"'
+    return FileResponse(open(zip_path, "rb"), as_attachment=True, filename=f"{batch}.zip",
+                        content_type="application/zip")
+
+def _download_batch_as(request, batch: str):
+    try:
+        fmt = labels.parse_format(request.GET.get("format"))
+        template = labels.template_from(request.GET) if fmt == labels.PDF else None
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if fmt == labels.PNG:
+        return HttpResponseBadRequest("Batch PNG tải dạng ZIP (bỏ tham số format).")
+
+    batch_dir = MEDIA_ROOT / "labels" / batch
+    codes = labels.batch_codes(batch_dir) if batch_dir.is_dir() else []
+    if not codes:
+        raise Http404("Batch not found.")
+    titles = labels.titles_for(codes)
+    # GET không ghi vào thư mục batch: giữ nguyên file lúc tạo, request song song không giẫm file của nhau
+    resp = StreamingHttpResponse(labels.iter_file(fmt, ((c, titles.get(c, "")) for c in codes), template),
+                                 content_type=labels.CONTENT_TYPES[fmt])
+    resp["Content-Disposition"] = f'attachment; filename="{batch}.{fmt}"'
     return resp
 
 # ---------- Scan & Move ----------
@@ -1061,26 +1176,24 @@ def download_batch(request, batch: str):
 # ---------- Tiện ích phiên quét ----------
 
 
+_SCAN_STATE_DEFAULT = {"active": False, "scanned": []}
+
 def _scan_state(request):
-    """Trạng thái phiên quét lưu trong session."""
-    return request.session.setdefault("scan_session", {"active": False, "scanned": []})
+    """Trạng thái phiên quét (session_state: Redis, không ghi django_session mỗi lần quét)."""
+    return session_state.load(request, "scan_session", _SCAN_STATE_DEFAULT)
 
 def _save_scan_state(request, st):
-    request.session["scan_session"] = st
-    request.session.modified = True
+    # "scanned" = [code] + cũ[:19] -> session_state ghi bằng LPUSH + LTRIM
+    session_state.save(request, "scan_session", st, _SCAN_STATE_DEFAULT)
 
 def _tag_max_today(action: str, wh) -> int:
-    today = timezone.localdate()
-    qs = Move.objects.filter(action=action, created_at__date=today)
-    qs = qs.filter(to_wh=wh) if action == "IN" else qs.filter(from_wh=wh)
-    return qs.aggregate(m=Max("tag"))["m"] or 0   # dùng alias 'm'
-    # (hoặc: return qs.aggregate(Max("tag"))["tag__max"] or 0)
+    """Tag lớn nhất đã dùng hôm nay cho (action, kho) — đọc từ TagCounter theo khoá."""
+    return TagCounter.current(action, wh)
 
 
 
 # ---------- Bắt đầu / kết thúc phiên ----------
 
-@transaction.atomic
 def scan_start(request):
     if request.method != "POST":
         return redirect("scan_scan")
@@ -1089,7 +1202,7 @@ def scan_start(request):
     # bước 1: đọc sơ bộ action + kho để biết tag_max
     act = (request.POST.get("action") or "IN").upper()
     wh_id = request.POST.get("wh")
-    wh = Warehouse.objects.filter(id=wh_id).first()
+    wh = refcache.get_warehouse(id=wh_id)
     tag_max = _tag_max_today(act, wh) + 1 if wh else 1
 
     form = ScanStartForm(request.POST, tag_max=tag_max)
@@ -1105,6 +1218,7 @@ def scan_start(request):
     max_allowed = _tag_max_today(action, wh) + 1
     try_tag = int(request.POST.get("tag") or max_allowed)
     tag = try_tag if 1 <= try_tag <= max_allowed else max_allowed
+    TagCounter.claim(action, wh, tag)
 
     st = {
         "active": True,
@@ -1128,7 +1242,6 @@ def scan_stop(request):
     messages.info(request, "Đã kết thúc ghi.")
     return redirect("scan_scan")
 # ---------- Trang Scan & Check ----------
-@transaction.atomic
 def scan_move(request):
     st = _scan_state(request)
 
@@ -1144,44 +1257,20 @@ def scan_move(request):
         action = st["action"]
         type_action = st.get("type_action") or ""
         tag = int(st.get("tag") or 1)
-        wh = Warehouse.objects.filter(id=st.get("wh_id")).first()
+        wh = refcache.get_warehouse(id=st.get("wh_id"))
 
         try:
-            item = (Item.objects.select_for_update()
-                    .select_related("product","warehouse")
-                    .get(barcode_text=code))
-        except Item.DoesNotExist:
+            status, detail, _ = dbwriter.post(post_scan, code, action, wh, type_action, tag)
+        except dbwriter.WriterBusy as e:
+            messages.error(request, f"{code}: {e.detail}")
+            return redirect("scan_scan")
+        if status == 404:
             messages.error(request, f"Không tìm thấy barcode: {code}")
             return redirect("scan_scan")
-
-        if action == "IN":
-            # if not wh:
-            #     messages.error(request, "IN cần chọn kho.")
-            #     return redirect("scan_scan")
-            if item.warehouse:
-                messages.warning(request, f"{code} đang ở {item.warehouse.code}.")
-                return redirect("scan_scan")
-            Move.objects.create(item=item, action="IN", to_wh=wh,
-                                type_action=type_action, tag=tag, note="IN (scan)")
-            item.warehouse = wh; item.status = "in_stock"
-            item.save(update_fields=["warehouse","status"])
-            adjust_inventory(item.product, wh, +1)
-            messages.success(request, f"IN {code} → {wh.code}")
-
-        else:  # OUT
-            if not item.warehouse:
-                messages.warning(request, f"{code} đã OUT trước đó.")
-                return redirect("scan_scan")
-            if wh and item.warehouse != wh:
-                messages.warning(request, f"{code} đang ở {item.warehouse.code}, khác kho phiên ({wh.code}).")
-                return redirect("scan_scan")
-            base_wh = wh or item.warehouse
-            Move.objects.create(item=item, action="OUT", from_wh=base_wh,
-                                type_action=type_action, tag=tag, note="OUT (scan)")
-            adjust_inventory(item.product, base_wh, -1)
-            item.warehouse = None; item.status = "shipped"
-            item.save(update_fields=["warehouse","status"])
-            messages.success(request, f"OUT {code}")
+        if status != 200:
+            messages.warning(request, detail)
+            return redirect("scan_scan")
+        messages.success(request, detail)
 
         st["scanned"] = [code] + st.get("scanned", [])[:19]
         _save_scan_state(request, st)
@@ -1191,21 +1280,19 @@ def scan_move(request):
     from .forms import ScanStartForm, ScanCodeForm
     # build tag_map: {"IN-<wh_id>": max, "OUT-<wh_id>": max}
     tag_map = {}
-    today = timezone.localdate()
-    for wh in Warehouse.objects.all():
-        in_max = (Move.objects
-                .filter(action="IN", to_wh=wh, created_at__date=today)
-                .aggregate(m=Max("tag"))["m"] or 0)
-        out_max = (Move.objects
-               .filter(action="OUT", from_wh=wh, created_at__date=today)
-               .aggregate(m=Max("tag"))["m"] or 0)
-        tag_map[f"IN-{wh.id}"]  = in_max
-        tag_map[f"OUT-{wh.id}"] = out_max
+    for wh_id in Warehouse.objects.values_list("id", flat=True):
+        tag_map[f"IN-{wh_id}"] = 0
+        tag_map[f"OUT-{wh_id}"] = 0
+    counters = (TagCounter.objects
+                .filter(day=timezone.localdate())
+                .values_list("action", "warehouse_id", "max_tag"))
+    for act, wh_id, max_tag in counters:
+        tag_map[f"{act}-{wh_id}"] = max_tag
 
     start_form = ScanStartForm(initial={
         "action": st.get("action") or "IN",
         "action_type": st.get("type_action") or "",
-        "wh": Warehouse.objects.filter(id=st.get("wh_id")).first() if st.get("wh_id") else None,
+        "wh": refcache.get_warehouse(id=st.get("wh_id")),
         "tag": st.get("tag") or 1,
     }, tag_max=(st.get("tag") or 1))
 
@@ -1259,12 +1346,14 @@ def barcode_lookup(request):
     moves = []
     if request.method == "POST":
         code = request.POST.get("barcode", "").strip()
-        try:
-            item = Item.objects.select_related("product", "warehouse").get(
-                barcode_text=code
-            )
-            moves = item.moves.select_related("from_wh", "to_wh").all()
-        except Item.DoesNotExist:
+        payload, _hit = barcode_cache.lookup(code) if code else (None, False)
+        if payload:
+            item = payload["item"]
+            moves = [
+                {**m, "created_at": parse_datetime(m["created_at"]) if m["created_at"] else None}
+                for m in payload["moves"]
+            ]
+        else:
             messages.error(request, "Không tìm thấy barcode.")
     return render(request, "inventory/scan_check.html", {
         "item": item,
@@ -1376,31 +1465,14 @@ def _execute_sql(sql: str):
     """
     Cho phép chạy SELECT/WITH/INSERT/UPDATE/DELETE/REPLACE/PRAGMA/BEGIN/COMMIT/ROLLBACK.
     Trả về (cols, rows, affected):
-      - Nếu là SELECT/WITH: trả cols + rows, affected = len(rows)
+      - Nếu là SELECT/WITH: trả cols + tối đa QUERY_PANEL_MAX_ROWS rows, affected = len(rows)
       - Nếu là lệnh ghi:   cols=[], rows=[], affected = rowcount (nếu có)
+    Chạy qua query_runner: có timeout + đọc theo chunk.
     """
-    allowed = (
-        "select", "with", "insert", "update", "delete",
-        "replace", "pragma", "begin", "commit", "rollback",
-    )
-    if not re.match(r"^\s*(" + "|".join(allowed) + r")\b",
-                    sql, flags=re.IGNORECASE | re.DOTALL):
-        raise ValueError("Chỉ cho phép: " + ", ".join(allowed))
-
-    # (tuỳ chọn) Chặn multi-statements để an toàn hơn
-    # if ";" in sql.strip().rstrip(";"):
-    #     raise ValueError("Chỉ chạy 1 câu lệnh mỗi lần.")
-
-    with connection.cursor() as cur:
-        cur.execute(sql)
-        if cur.description:  # SELECT/WITH trả về dữ liệu
-            cols = [c[0] for c in cur.description]
-            rows = cur.fetchall()
-            affected = len(rows)
-        else:                # INSERT/UPDATE/DELETE...
-            cols, rows = [], []
-            affected = cur.rowcount if getattr(cur, "rowcount", -1) != -1 else None
-    return cols, rows, affected
+    res = query_runner.run_query(sql)
+    if res.cols:
+        return res.cols, res.rows, len(res.rows)
+    return [], [], res.affected
 
 
 def _list_db_tables_with_type():
@@ -1431,34 +1503,7 @@ def _list_db_tables_with_type():
     return items
 
 # views.py
-def _execute_sql(sql: str):
-    """
-    Cho phép chạy SELECT/INSERT/UPDATE/DELETE/PRAGMA... có kiểm soát:
-    chỉ chấp nhận khi từ đầu tiên thuộc whitelist.
-    """
-    allowed = (
-        "select", "with", "insert", "update", "delete",
-        "replace", "pragma", "begin", "commit", "rollback",
-    )
-    if not re.match(r"^\s*(" + "|".join(allowed) + r")\b", sql,
-                    flags=re.IGNORECASE | re.DOTALL):
-        raise ValueError("Chỉ cho phép: " + ", ".join(allowed))
-
-    with connection.cursor() as cur:
-        cur.execute(sql)
-        if cur.description:          # SELECT … => có kết quả
-            cols = [c[0] for c in cur.description]
-            rows = cur.fetchall()
-            rowcount = len(rows)
-        else:                         # INSERT/UPDATE/DELETE … => không có result set
-            cols, rows = [], []
-            rowcount = cur.rowcount   # số dòng bị ảnh hưởng
-    return cols, rows, rowcount
-
-
-
-# views.py
-def query_panel(request):
+def query_panel(request, pk=None):
     tables = _list_db_tables_with_type()
     table_names = [t["name"] for t in tables]
     selected = request.GET.get("table")
@@ -1474,6 +1519,55 @@ def query_panel(request):
         sql_text = (request.POST.get("sql") or "").strip()
     else:
         sql_text = f"SELECT * FROM {selected} LIMIT 100" if selected else ""
+    mode = (request.POST.get("mode") or "run") if request.method == "POST" else "run"
+
+    # SavedQuery đang mở (/queries/<pk>/)
+    saved = get_object_or_404(SavedQuery, pk=pk) if pk else None
+    if saved and request.method == "GET":
+        sql_text = saved.sql
+
+    if mode == "save":
+        form = SQLQueryForm(request.POST)
+        if form.is_valid():
+            cd = form.cleaned_data
+            saved = saved or SavedQuery()
+            if saved.pk and saved.sql != cd["sql"]:
+                # SQL đổi -> bỏ kết quả cũ, lần xem tới sẽ chạy lại
+                SavedQueryResult.objects.filter(query=saved).delete()
+                saved.last_run_at = None
+            saved.name = cd["name"] or saved.name or cd["sql"][:60]
+            saved.sql = cd["sql"]
+            saved.materialize = cd["materialize"]
+            saved.refresh_seconds = cd["refresh_seconds"] or 3600
+            saved.save()
+            messages.success(request, f"Đã lưu query “{saved.name}”.")
+            return redirect("query_panel_edit", pk=saved.pk)
+        for e in form.errors.values():
+            messages.error(request, e)
+        mode = "run"
+
+    if mode == "refresh" and saved:
+        run = saved_queries.refresh(saved)
+        if run.ok:
+            messages.success(request, f"Đã làm mới: {run.row_count} rows trong {run.runtime_ms} ms.")
+        else:
+            messages.error(request, f"Làm mới lỗi: {run.error}")
+        return redirect("query_panel_edit", pk=saved.pk)
+
+    # Export CSV: stream toàn bộ kết quả, không giữ trong RAM
+    if mode == "csv":
+        try:
+            query_runner.check_sql(sql_text)
+            stream = query_runner.iter_csv(sql_text)
+            first = next(stream)   # chạy câu lệnh ngay để báo lỗi SQL trên trang thay vì file hỏng
+        except (ValueError, query_runner.QueryTimeout, DatabaseError) as e:
+            messages.error(request, f"Export CSV lỗi: {e}")
+            mode = "run"
+        else:
+            resp = StreamingHttpResponse(chain([first], stream), content_type="text/csv; charset=utf-8")
+            fname = f"query_{timezone.localtime().strftime('%Y%m%d-%H%M%S')}.csv"
+            resp["Content-Disposition"] = f'attachment; filename="{fname}"'
+            return resp
 
     # Lấy danh sách cột của bảng đang xem
     columns = None
@@ -1487,35 +1581,60 @@ def query_panel(request):
 
     # Run query
     result = None
+    plan = None
     error = None
     rows_count = None
     affected_count = None   # ✨ thêm biến này
     status_text = None
+    max_rows = getattr(settings, "QUERY_PANEL_MAX_ROWS", 1000)
 
     if request.method == "POST":
+        sql_to_run = sql_text
+    elif saved:
+        # GET (link, <img>, redirect sau khi lưu) không có CSRF: chỉ tự chạy SELECT/WITH, lệnh ghi phải bấm Run (POST)
+        try:
+            read_only = query_runner.check_sql(sql_text) in query_runner.READ_ONLY
+        except ValueError:
+            read_only = False
+        sql_to_run = sql_text if read_only else ""
+        if not read_only and not saved.materialize:
+            status_text = "Query không phải SELECT/WITH: bấm Run để chạy."
+    else:
+        sql_to_run = f"SELECT * FROM {connection.ops.quote_name(selected)} LIMIT 100" if selected else ""
+    materialized = None
+    if saved and saved.materialize and request.method == "GET":
+        # Trả kết quả đã lưu ngay; quá hạn thì làm mới ở nền
+        payload, materialized = saved_queries.get_result(saved)
+        if payload:
+            result = {"cols": payload["cols"], "rows": payload["rows"], "truncated": materialized["truncated"]}
+            rows_count = len(payload["rows"])
+            status_text = f"Kết quả lưu lúc {timezone.localtime(materialized['refreshed_at']):%Y-%m-%d %H:%M:%S}."
+            if materialized["refreshing"]:
+                status_text += " Đang làm mới ở nền."
+        else:
+            error = saved.last_error or "Chưa có kết quả."
+    elif sql_to_run:
         try:
-            cols, rows, rc = _execute_sql(sql_text)
-            if cols:  # có result set -> SELECT/WITH
-                result = {"cols": cols, "rows": rows}
-                rows_count = len(rows)
-                status_text = f"Query executed successfully. {rows_count} rows returned."
-            else:     # không có result set -> INSERT/UPDATE/DELETE...
-                affected_count = rc
-                rows_count = 0
-                status_text = f"Query executed successfully. {rc} rows affected."
-            messages.success(request, status_text)
+            if mode == "explain":
+                res = query_runner.explain(sql_to_run)
+                plan = {"cols": res.cols, "rows": res.rows}
+                status_text = f"Query plan ({res.elapsed_ms} ms)."
+            else:
+                res = query_runner.run_query(sql_to_run)
+                if res.cols:  # có result set -> SELECT/WITH
+                    result = {"cols": res.cols, "rows": res.rows, "truncated": res.truncated}
+                    rows_count = len(res.rows)
+                    status_text = f"Query executed successfully. {rows_count} rows returned ({res.elapsed_ms} ms)."
+                    if res.truncated:
+                        status_text += f" Chỉ hiển thị {max_rows} dòng đầu — dùng Export CSV để lấy đủ."
+                else:     # không có result set -> INSERT/UPDATE/DELETE...
+                    affected_count = res.affected
+                    rows_count = 0
+                    status_text = f"Query executed successfully. {res.affected} rows affected ({res.elapsed_ms} ms)."
+            if request.method == "POST":
+                messages.success(request, status_text)
         except Exception as e:
             error = str(e)
-    else:
-        # GET: preview bảng đang chọn
-        if selected:
-            try:
-                cols, rows = _execute_select_sql(f"SELECT * FROM {selected} LIMIT 100")
-                result = {"cols": cols, "rows": rows}
-                rows_count = len(rows)
-                status_text = f"Query executed successfully. {rows_count} rows returned."
-            except Exception as e:
-                error = str(e)
 
     # Lấy type của bảng đang chọn
     selected_type = None
@@ -1530,115 +1649,25 @@ def query_panel(request):
         "selected_type": selected_type,
         "columns": columns,
         "sql": sql_text,
+        "mode": mode,
         "result": result,
+        "plan": plan,
+        "max_rows": max_rows,
         "error": error,
         "rows_count": rows_count,
         "affected_count": affected_count,  # ✨ đẩy ra template
         "status_text": status_text,
+        "saved": saved,
+        "saved_queries": SavedQuery.objects.order_by("name"),
+        "saved_runs": saved.runs.all()[:20] if saved else [],
+        "materialized": materialized,
     }
     return render(request, "inventory/query_panel.html", ctx)
 
 # ---------- Helpers cho upload ----------
-HEADER_ALIASES = {
-    "sku": {"sku", "mã", "ma", "ma sp", "ma_san_pham", "ma san pham", "product_sku"},
-    "name": {"name", "ten", "tên", "product_name"},
-    "qty": {"qty", "so luong", "số lượng", "quantity", "q"},
-    "note": {"note", "ghi chu", "ghi chú", "ghichu"},
-    "import_date": {"importdate", "import_date", "ngay nhap", "ngày nhập", "date"},
-}
-
-def _normalize(s: str) -> str:
-    s = (s or "").strip()
-    s = unicodedata.normalize("NFD", s).encode("ascii", "ignore").decode("ascii")
-    return re.sub(r"[^a-z0-9]+", "", s.lower())
-
-def _map_headers(headers):
-    """Map tiêu đề cột sang keys chuẩn: sku/name/qty/note/import_date"""
-    norm = [_normalize(h) for h in headers]
-    mapping = {}
-    for key, aliases in HEADER_ALIASES.items():
-        for i, nh in enumerate(norm):
-            if nh in {_normalize(a) for a in aliases}:
-                mapping[key] = i
-                break
-    # sku & qty là bắt buộc
-    if "sku" not in mapping or "qty" not in mapping:
-        raise ValueError("Thiếu cột bắt buộc: SKU và Qty.")
-    return mapping
-
-def _parse_csv(fileobj) -> list[dict]:
-    raw = fileobj.read()
-    if isinstance(raw, bytes):
-        # auto detect delimiter + BOM
-        text = raw.decode("utf-8-sig", errors="replace")
-    else:
-        text = raw
-    sample = text[:1024]
-    try:
-        dialect = csv.Sniffer().sniff(sample)
-    except Exception:
-        dialect = csv.excel
-    reader = csv.reader(io.StringIO(text), dialect)
-    rows = list(reader)
-    if not rows:
-        return []
-    mapping = _map_headers(rows[0])
-    out = []
-    for r in rows[1:]:
-        if not any(r):  # dòng trống
-            continue
-        get = lambda key: (r[mapping[key]].strip() if key in mapping and mapping[key] < len(r) else "")
-        sku  = get("sku")
-        qtys = get("qty")
-        if not sku or not qtys:
-            continue
-        try:
-            qty = int(str(qtys).replace(",", "").strip())
-        except Exception:
-            raise ValueError(f"Qty không hợp lệ ở SKU {sku}: {qtys}")
-        row = {"sku": sku, "qty": qty}
-        for opt in ("name", "note", "import_date"):
-            v = get(opt)
-            if v: row[opt] = v
-        out.append(row)
-    return out
-
-def _parse_xlsx(fileobj) -> list[dict]:
-    if not load_workbook:
-        raise RuntimeError("Thiếu thư viện openpyxl. Chạy: pip install openpyxl")
-    wb = load_workbook(filename=io.BytesIO(fileobj.read()), read_only=True, data_only=True)
-    ws = wb.active
-    rows = list(ws.iter_rows(values_only=True))
-    if not rows:
-        return []
-    headers = [str(x or "").strip() for x in rows[0]]
-    mapping = _map_headers(headers)
-    out = []
-    for r in rows[1:]:
-        get = lambda key: (str(r[mapping[key]]).strip() if key in mapping and mapping[key] < len(r) else "")
-        sku  = get("sku")
-        qtys = get("qty")
-        if not sku or not qtys:
-            continue
-        try:
-            qty = int(str(qtys).replace(",", "").strip())
-        except Exception:
-            raise ValueError(f"Qty không hợp lệ ở SKU {sku}: {qtys}")
-        row = {"sku": sku, "qty": qty}
-        for opt in ("name", "note", "import_date"):
-            v = get(opt)
-            if v: row[opt] = v
-        out.append(row)
-    return out
-
 def _parse_manual_file(dj_file) -> list[dict]:
-    name = (dj_file.name or "").lower()
-    if name.endswith(".csv"):
-        return _parse_csv(dj_file.file)
-    if name.endswith(".xlsx"):
-        return _parse_xlsx(dj_file.file)
-    # fallback: thử CSV
-    return _parse_csv(dj_file.file)
+    """Đọc file CSV/XLSX manual -> [{sku, qty, name?, note?, import_date?}] (xem importers.MANUAL)."""
+    return importers.read_upload(dj_file, importers.MANUAL)
 
 def _merge_lines(lines: list[dict]) -> list[dict]:
     """Gộp SKU trùng (cộng qty, giữ name/note/import_date đầu tiên gặp)."""
@@ -1671,9 +1700,9 @@ def manual_upload(request):
         return redirect("manual_preview")
 
     try:
-        rows = _parse_manual_file(form.cleaned_data["file"])
-        if form.cleaned_data.get("merge_duplicate"):
-            rows = _merge_lines(rows)
+        reader = importers.UploadReader(form.cleaned_data["file"], importers.MANUAL)
+        rows = _merge_lines(reader) if form.cleaned_data.get("merge_duplicate") else list(reader)
+        reader.raise_if_errors()
         # Chuẩn hoá: chỉ đẩy sku/qty vào batch (name/note/import_date giữ lại để hiển thị nếu muốn)
         new_lines = [{"sku": r["sku"], "qty": int(r["qty"])} for r in rows]
 
@@ -1686,6 +1715,9 @@ def manual_upload(request):
 
         total = sum(int(x["qty"]) for x in new_lines)
         messages.success(request, f"Đã nạp {len(new_lines)} dòng (tổng qty: {total}).")
+    except importers.ImportFileError as e:
+        detail = "; ".join(f"dòng {x['row']}: {', '.join(x['errors'])}" for x in e.errors[:5])
+        messages.error(request, f"Lỗi đọc file: {e}" + (f" ({detail})" if detail else ""))
     except Exception as e:
         messages.error(request, f"Lỗi đọc file: {e}")
 
@@ -1,4 +1,5 @@
 from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -43,7 +44,9 @@ class MoveViewSet(viewsets.ModelViewSet):
 
 # --- STOCK ORDER ---
 class StockOrderViewSet(viewsets.ModelViewSet):
-    queryset = StockOrder.objects.select_related("from_wh", "to_wh", "created_by").prefetch_related("lines").all()
+    queryset = StockOrder.objects.select_related("from_wh", "to_wh", "created_by").prefetch_related(
+        Prefetch("lines", queryset=StockOrderLine.objects.select_related("item", "product"))
+    ).all()
     serializer_class = StockOrderSerializer
 
     @action(detail=True, methods=["post"])
@@ -99,5 +102,5 @@ class StockOrderViewSet(viewsets.ModelViewSet):
     def lines(self, request, pk=None):
         """GET /api/orders/{id}/lines/ -> trả list dòng (đọc)."""
         order = self.get_object()
-        ser = StockOrderLineReadSerializer(order.lines.all(), many=True)
+        ser = StockOrderLineReadSerializer(order.lines.select_related("item", "product"), many=True)
         return Response(ser.data)
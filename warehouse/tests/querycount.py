@@ -0,0 +1,138 @@
+# tests/querycount.py
+"""
+Chốt chặn số query theo endpoint (chống N+1) — dùng chung cho test của inventory / api / erp_the20.
+Chỉ dùng trong test (cần django.test), không nằm trong package runtime warehouse.
+
+- routes(urlconf): liệt kê url name của mọi route trong 1 module urls (đi cả include / router).
+- QueryCountMixin (TestCase): mỗi Endpoint gọi ở 2 cỡ dữ liệu (grow(n) thêm dòng; payload cũng lớn theo n),
+  số query phải bằng nhau. Route mới chưa khai báo Endpoint (hoặc EXEMPT kèm lý do) -> test coverage fail.
+- Báo cáo: đặt biến môi trường QUERY_COUNT_REPORT=<file.json> -> gộp số query hiện tại của từng endpoint vào file.
+"""
+import json
+import os
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+
+REPORT_ENV = "QUERY_COUNT_REPORT"
+
+
+def routes(urlconf) -> set:
+    """Tập url name (bỏ route không đặt tên) của module urls."""
+    names = set()
+
+    def walk(patterns):
+        for p in patterns:
+            if isinstance(p, URLResolver):
+                walk(p.url_patterns)
+            elif isinstance(p, URLPattern) and p.name:
+                names.add(p.name)
+
+    walk(get_resolver(urlconf).url_patterns)
+    return names
+
+
+@dataclass
+class Endpoint:
+    """
+    route: url name (khớp routes()); path / data: hàm (test, n) -> giá trị (n = cỡ dữ liệu hiện tại).
+    setup: hàm (test, n) chạy trước (vd mở phiên manual), không tính query.
+    """
+    route: str
+    path: object
+    method: str = "get"
+    data: object = None
+    setup: object = None
+    status: tuple = (200,)
+    label: str = ""
+    kwargs: dict = field(default_factory=dict)
+
+    @property
+    def name(self):
+        return self.label or f"{self.method.upper()} {self.route}"
+
+
+class QueryCountMixin:
+    """
+    Lớp test khai báo:
+      URLCONF, ENDPOINTS (list Endpoint), EXEMPT ({route: lý do}), SIZES (nhỏ, lớn),
+      COUNT_ALIASES (alias DB cần đếm), reset_state() (tuỳ chọn).
+    Bắt buộc định nghĩa grow(self, n): thêm dữ liệu để tổng mỗi loại = n (gọi lần lượt với SIZES[0] rồi SIZES[1],
+    lần 2 chỉ thêm phần còn thiếu). Mixin không có grow mặc định: quên khai báo -> AttributeError ngay khi đo.
+    """
+    URLCONF = None
+    ENDPOINTS = ()
+    EXEMPT = {}
+    SIZES = (2, 8)
+    COUNT_ALIASES = ("default",)
+
+    def reset_state(self):
+        """Xoá cache + cookie phiên giữa 2 lần đo để lần sau không 'rẻ' (hay 'đắt') hơn vì trạng thái còn lại."""
+        cache.clear()
+        self.client.cookies.clear()
+
+    # ----- đo -----
+    def _count(self, ep, n):
+        self.reset_state()
+        if ep.setup:
+            ep.setup(self, n)
+        path = ep.path(self, n) if callable(ep.path) else ep.path
+        data = ep.data(self, n) if callable(ep.data) else ep.data
+        call = getattr(self.client, ep.method)
+        kwargs = dict(ep.kwargs)
+        if data is not None:
+            kwargs.setdefault("content_type", "application/json")
+            kwargs["data"] = json.dumps(data) if kwargs["content_type"] == "application/json" else data
+        with ExitStack() as stack:
+            for a in self.COUNT_ALIASES:
+                stack.enter_context(transaction.atomic(using=a))
+            ctxs = [stack.enter_context(CaptureQueriesContext(connections[a])) for a in self.COUNT_ALIASES]
+            res = call(path, **kwargs)
+            if getattr(res, "streaming", False):   # file/CSV stream: query chạy khi đọc body
+                b"".join(res.streaming_content)
+            for a in self.COUNT_ALIASES:
+                transaction.set_rollback(True, using=a)   # endpoint ghi không làm đổi dữ liệu lần đo sau
+        if res.status_code not in ep.status:
+            body = b"" if getattr(res, "streaming", False) else res.content[:300]
+            self.fail(f"{ep.name} -> {res.status_code}: {body!r}")
+        return sum(len(c.captured_queries) for c in ctxs)
+
+    def measure_all(self):
+        small, large = self.SIZES
+        self.grow(small)
+        before = {ep.name: self._count(ep, small) for ep in self.ENDPOINTS}
+        self.grow(large)
+        after = {ep.name: self._count(ep, large) for ep in self.ENDPOINTS}
+        return before, after
+
+    # ----- test dùng chung -----
+    def test_every_route_is_guarded(self):
+        covered = {ep.route for ep in self.ENDPOINTS} | set(self.EXEMPT)
+        missing = sorted(routes(self.URLCONF) - covered)
+        self.assertEqual(missing, [], f"Route chưa có Endpoint trong query-count suite: {missing}")
+
+    def test_query_count_constant_as_rows_grow(self):
+        before, after = self.measure_all()
+        _write_report(self.URLCONF, before, after, self.SIZES)
+        grown = {k: (before[k], after[k]) for k in before if after[k] != before[k]}
+        self.assertEqual(grown, {}, f"Số query đổi theo số dòng (nhỏ, lớn): {grown}")
+
+
+def _write_report(urlconf, before, after, sizes):
+    path = os.environ.get(REPORT_ENV)
+    if not path:
+        return
+    try:
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        report = {}
+    report[urlconf] = {
+        name: {f"n={sizes[0]}": before[name], f"n={sizes[1]}": after[name]} for name in sorted(before)
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
@@ -0,0 +1,100 @@
+# warehouse/aio.py
+"""
+Hạ tầng chạy ASGI (gunicorn -k uvicorn.workers.UvicornWorker warehouse.asgi:application).
+
+- run_db / run_io: view async đẩy việc chặn (ORM, SMTP, Lark HTTP) sang thread pool CÓ GIỚI HẠN
+  (ASYNC_DB_THREADS / ASYNC_IO_THREADS mỗi process) thay vì giữ cả worker:
+    db: ORM (erp_postgres, ecom_platform, default)
+    io: gửi email / Lark (chậm, dễ treo theo mạng) -> không chiếm chỗ của việc DB.
+  Hết thread -> việc xếp hàng chờ trong pool, event loop vẫn nhận request khác (vd API quét).
+  Mỗi việc đóng connection hỏng/quá CONN_MAX_AGE trước và sau khi chạy (như request_started/finished).
+  ASYNC_POOL_INLINE = True (settings_test): chạy thread_sensitive trên thread gọi -> TestCase thấy cùng transaction.
+- AsyncWhiteNoiseMiddleware: WhiteNoise chỉ hỗ trợ sync; 1 middleware sync trong chuỗi làm Django ép
+  cả view async về sync (async_to_sync mỗi request). Bản này nhận cả 2 chế độ.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+POOLS = {"db": ("ASYNC_DB_THREADS", 8), "io": ("ASYNC_IO_THREADS", 16)}
+
+_lock = threading.Lock()
+_pools = {}   # name -> (pid, executor)
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def executor(name) -> ThreadPoolExecutor:
+    """Pool theo tên; tạo lại sau fork (thread không theo sang process con)."""
+    pid = os.getpid()
+    entry = _pools.get(name)
+    if entry is None or entry[0] != pid:
+        with _lock:
+            entry = _pools.get(name)
+            if entry is None or entry[0] != pid:
+                setting, default = POOLS[name]
+                pool = ThreadPoolExecutor(max_workers=int(_conf(setting, default)), thread_name_prefix=f"aio-{name}")
+                entry = _pools[name] = (pid, pool)
+    return entry[1]
+
+
+def shutdown():
+    with _lock:
+        for pid, pool in _pools.values():
+            if pid == os.getpid():
+                pool.shutdown(wait=True)
+        _pools.clear()
+
+
+def _guarded(func):
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return call
+
+
+async def _run(name, func, args, kwargs):
+    if _conf("ASYNC_POOL_INLINE", False):
+        return await sync_to_async(func, thread_sensitive=True)(*args, **kwargs)
+    return await sync_to_async(_guarded(func), thread_sensitive=False, executor=executor(name))(*args, **kwargs)
+
+
+async def run_db(func, *args, **kwargs):
+    return await _run("db", func, args, kwargs)
+
+
+async def run_io(func, *args, **kwargs):
+    return await _run("io", func, args, kwargs)
+
+
+# ---------- Static ----------
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        static_file = self.find_file(request.path_info) if self.autorefresh else self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
@@ -3,6 +3,10 @@ ASGI config for warehouse project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Chạy production: gunicorn -k uvicorn.workers.UvicornWorker -w 3 warehouse.asgi:application
+(docker/entrypoint.sh, SERVER_MODE=asgi). View sync chạy ở thread riêng mỗi request, view async
+của ERP đẩy việc chặn sang pool có giới hạn (warehouse/aio.py).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -14,3 +18,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'warehouse.settings')
 
 application = get_asgi_application()
+
+# dò sẵn mapping cột bảng user ecom-platform (thread nền, ECOM_USER_WARM_ON_START)
+from erp_the20.selectors.user_selector import warm_up  # noqa: E402
+
+warm_up()
@@ -0,0 +1,219 @@
+# warehouse/asyncbench.py
+"""
+Đo lợi ích ASGI: API quét có bị request ERP chậm "bỏ đói" không.
+
+Kịch bản (giống nhau cho 2 chế độ): `slow` request ERP (PUT /the20/leave/requests/<id>/decide/) bắn cùng lúc,
+song song `clients` client gọi liên tục API quét nhẹ (GET /api/history/stats/) trong `duration` giây.
+- wsgi: `workers` thread, mỗi thread xử lý 1 request 1 lúc, chung 1 hàng đợi (như gunicorn -w N sync)
+  -> request ERP giữ worker trong lúc chờ DB ngoài / SMTP / Lark.
+- asgi: 1 event loop gọi thẳng warehouse.asgi.application (1 process, scope HTTP tự dựng).
+simulate=True: selector / service ERP và bước gửi thông báo được thay bằng sleep (remote_ms, notify_ms)
+-> không cần erp_postgres / ecom_platform / SMTP thật. simulate=False: chạy thẳng vào DB / SMTP đang cấu hình.
+"""
+import asyncio
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import date
+from unittest import mock
+from wsgiref.util import setup_testing_defaults
+
+from warehouse import aio
+
+FAST_PATH = "/api/history/stats/"
+SLOW_PATH = "/the20/leave/requests/{id}/decide/"
+SLOW_BODY = {"manager_id": 1, "approve": True}
+
+
+def _pct(vals, p):
+    if not vals:
+        return None
+    vals = sorted(vals)
+    k = (len(vals) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(vals) - 1)
+    return round(vals[lo] + (vals[hi] - vals[lo]) * (k - lo), 1)
+
+
+def _block(rows, elapsed):
+    lat = [ms for _, ms in rows]
+    return {
+        "count": len(rows),
+        "rps": round(len(rows) / elapsed, 1) if elapsed else None,
+        "p50_ms": _pct(lat, 50),
+        "p95_ms": _pct(lat, 95),
+        "max_ms": round(max(lat), 1) if lat else None,
+        "errors": sum(1 for status, _ in rows if status is None or status >= 400),
+    }
+
+
+# ---------- Giả lập ERP ----------
+def simulated(remote_ms, notify_ms):
+    """ExitStack đã patch các điểm gọi ra ngoài của luồng duyệt đơn nghỉ."""
+    from erp_the20.models import LeaveRequest
+    from erp_the20.services import leave_service
+    from erp_the20.views import async_view
+
+    remote, notify = remote_ms / 1000, notify_ms / 1000
+
+    def is_manager(_):
+        time.sleep(remote)
+        return True
+
+    def users_map(_):
+        time.sleep(remote)
+        return {}
+
+    def decide(*, leave_id, manager_id, approve, send_email=True, send_lark=True):
+        time.sleep(remote)
+        obj = LeaveRequest(id=leave_id, employee_id=2, leave_type=0, start_date=date(2026, 1, 1),
+                           end_date=date(2026, 1, 2), decided_by=manager_id,
+                           status=LeaveRequest.Status.APPROVED if approve else LeaveRequest.Status.REJECTED)
+        if send_email or send_lark:
+            send(obj, manager_id)
+        return obj
+
+    def send(*args, **kwargs):
+        time.sleep(notify)
+
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(async_view, "is_employee_manager", is_manager))
+    stack.enter_context(mock.patch.object(async_view, "get_external_users_map", users_map))
+    stack.enter_context(mock.patch.object(leave_service, "manager_decide", decide))
+    stack.enter_context(mock.patch.object(leave_service, "notify_decision", send))
+    return stack
+
+
+# ---------- WSGI: N worker sync ----------
+def _wsgi_call(app, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b""
+    environ = {"REQUEST_METHOD": method, "PATH_INFO": path, "wsgi.input": io.BytesIO(data),
+               "CONTENT_TYPE": "application/json", "CONTENT_LENGTH": str(len(data))}
+    setup_testing_defaults(environ)
+    status = []
+    result = app(environ, lambda s, headers, exc_info=None: status.append(int(s.split()[0])))
+    try:
+        b"".join(result)
+    finally:
+        getattr(result, "close", lambda: None)()
+    return status[0]
+
+
+def run_wsgi(slow, clients, duration, workers):
+    from django.core.wsgi import get_wsgi_application
+
+    app = get_wsgi_application()
+    server = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bench-worker")
+    fast_rows, slow_rows, lock = [], [], threading.Lock()
+
+    def timed(method, path, body, rows):
+        t0 = time.perf_counter()
+        try:
+            status = server.submit(_wsgi_call, app, method, path, body).result()
+        except Exception:
+            status = None
+        with lock:
+            rows.append((status, (time.perf_counter() - t0) * 1000))
+
+    deadline = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            timed("GET", FAST_PATH, None, fast_rows)
+
+    threads = [threading.Thread(target=timed, args=("PUT", SLOW_PATH.format(id=i + 1), SLOW_BODY, slow_rows))
+               for i in range(slow)]
+    threads += [threading.Thread(target=client) for _ in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    server.shutdown(wait=True)
+    return {"mode": f"wsgi x{workers}", "elapsed_s": round(elapsed, 2),
+            "fast": _block(fast_rows, duration), "slow": _block(slow_rows, elapsed)}
+
+
+# ---------- ASGI: 1 event loop ----------
+async def _asgi_call(app, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"127.0.0.1"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(data)).encode())],
+        "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80),
+    }
+    done = asyncio.Event()
+    sent = []
+
+    async def receive():
+        if not sent:
+            sent.append(True)
+            return {"type": "http.request", "body": data, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    status = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await app(scope, receive, send)
+    done.set()
+    return status[0]
+
+
+async def _run_asgi(slow, clients, duration):
+    from django.core.asgi import get_asgi_application
+
+    app = get_asgi_application()
+    fast_rows, slow_rows = [], []
+
+    async def timed(method, path, body, rows):
+        t0 = time.perf_counter()
+        try:
+            status = await _asgi_call(app, method, path, body)
+        except Exception:
+            status = None
+        rows.append((status, (time.perf_counter() - t0) * 1000))
+
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            await timed("GET", FAST_PATH, None, fast_rows)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(
+        *(timed("PUT", SLOW_PATH.format(id=i + 1), SLOW_BODY, slow_rows) for i in range(slow)),
+        *(client() for _ in range(clients)),
+    )
+    elapsed = time.perf_counter() - t0
+    return {"mode": "asgi", "elapsed_s": round(elapsed, 2),
+            "fast": _block(fast_rows, duration), "slow": _block(slow_rows, elapsed)}
+
+
+def run_asgi(slow, clients, duration):
+    return asyncio.run(_run_asgi(slow, clients, duration))
+
+
+def run(slow=12, clients=4, duration=5.0, workers=3, simulate=True, remote_ms=150, notify_ms=1500):
+    """Chạy cả 2 chế độ với cùng kịch bản; trả về report dict (ghi JSON được)."""
+    report = {"scenario": {"slow": slow, "clients": clients, "duration_s": duration, "workers": workers,
+                           "simulate": simulate, "remote_ms": remote_ms, "notify_ms": notify_ms,
+                           "fast_path": FAST_PATH, "slow_path": SLOW_PATH}}
+    with simulated(remote_ms, notify_ms) if simulate else ExitStack():
+        try:
+            report["wsgi"] = run_wsgi(slow, clients, duration, workers)
+            report["asgi"] = run_asgi(slow, clients, duration)
+        finally:
+            aio.shutdown()
+    return report
@@ -0,0 +1,227 @@
+# warehouse/db/pool.py
+"""
+Pool connection DB trong process (dùng cho backend warehouse.db.postgresql; không phụ thuộc driver).
+
+- acquire(connect): lấy connection rảnh mới dùng gần nhất (LIFO, còn "ấm"); connection rảnh quá check_after giây
+  phải qua check() (SELECT 1) trước khi giao, hỏng -> đóng, lấy cái khác. Hết chỗ (max_size, tính cả connection
+  đang dùng) -> chờ tối đa timeout giây rồi raise PoolTimeout.
+- release(conn): reset() (rollback giao dịch dở) rồi trả về pool; quá max_lifetime / reset lỗi -> đóng.
+- Connection rảnh quá idle_timeout giây bị đóng ở lần acquire / release kế tiếp.
+- get(alias, database, **options): 1 pool / (alias, DB đích) / process (tạo lại sau fork); stats() cho /metrics.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULTS = {
+    "max_size": 10,
+    "idle_timeout": 300,
+    "max_lifetime": 1800,
+    "timeout": 10,
+    "check_after": 30,
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _Entry:
+    __slots__ = ("conn", "created", "last_used")
+
+    def __init__(self, conn, now):
+        self.conn = conn
+        self.created = now
+        self.last_used = now
+
+
+class ConnectionPool:
+
+    def __init__(self, alias, database="", check=None, reset=None, close=None, **options):
+        self.alias = alias
+        self.database = database
+        self.options = {**DEFAULTS, **options}
+        self._check = check or (lambda conn: True)
+        self._reset = reset or (lambda conn: True)
+        self._close = close or (lambda conn: conn.close())
+        self._cond = threading.Condition()
+        self._idle = deque()      # _Entry, cuối = mới trả về nhất
+        self._busy = {}           # id(conn) -> _Entry
+        self._opening = 0
+        self.counters = {"checkouts": 0, "connects": 0, "waits": 0, "timeouts": 0, "wait_seconds": 0.0}
+        self.discarded = {}       # reason -> n
+
+    # ---------- public ----------
+    def acquire(self, connect):
+        deadline = time.monotonic() + self.options["timeout"]
+        while True:
+            entry, stale = self._take(deadline)
+            self._close_all(stale)
+            if entry is None:
+                return self._open(connect)
+            if self._healthy(entry):
+                entry.last_used = time.monotonic()
+                return entry.conn
+            self._discard(entry, "broken")
+
+    def release(self, conn, discard=False):
+        with self._cond:
+            entry = self._busy.pop(id(conn), None)
+        if entry is None:   # không phải của pool (vd tạo trước khi bật pool)
+            self._safe_close(conn)
+            return
+        now = time.monotonic()
+        max_lifetime = self.options["max_lifetime"]
+        if discard:
+            self._discard(entry, "discarded")
+        elif max_lifetime and now - entry.created >= max_lifetime:
+            self._discard(entry, "lifetime")
+        elif not self._safe(self._reset, conn):
+            self._discard(entry, "reset_failed")
+        else:
+            entry.last_used = now
+            with self._cond:
+                self._idle.append(entry)
+                stale = self._expire(now)
+                self._cond.notify()
+            self._close_all(stale)
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for entry in idle:
+            self._discard(entry, "shutdown", busy=False)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "alias": self.alias,
+                "database": self.database,
+                "max_size": self.options["max_size"],
+                "idle": len(self._idle),
+                "in_use": len(self._busy) + self._opening,
+                **self.counters,
+                "discarded": dict(self.discarded),
+            }
+
+    # ---------- nội bộ ----------
+    def _size(self):
+        return len(self._idle) + len(self._busy) + self._opening
+
+    def _take(self, deadline):
+        """(entry rảnh | None = được mở mới, [entry quá idle_timeout cần đóng])."""
+        waited = None
+        with self._cond:
+            try:
+                while True:
+                    stale = self._expire(time.monotonic())
+                    if self._idle:
+                        entry = self._idle.pop()
+                        self._busy[id(entry.conn)] = entry
+                        self.counters["checkouts"] += 1
+                        return entry, stale
+                    if self._size() < self.options["max_size"]:
+                        self._opening += 1
+                        self.counters["checkouts"] += 1
+                        return None, stale
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["timeouts"] += 1
+                        raise PoolTimeout(f"pool '{self.alias}' hết connection "
+                                          f"(max_size={self.options['max_size']}, chờ {self.options['timeout']}s)")
+                    if waited is None:
+                        waited = time.monotonic()
+                        self.counters["waits"] += 1
+                    self._cond.wait(remaining)
+            finally:
+                if waited is not None:
+                    self.counters["wait_seconds"] += time.monotonic() - waited
+
+    def _expire(self, now):
+        """Gỡ entry rảnh quá idle_timeout (cũ nhất nằm đầu deque); gọi khi đang giữ lock."""
+        idle_timeout = self.options["idle_timeout"]
+        stale = []
+        while idle_timeout and self._idle and now - self._idle[0].last_used >= idle_timeout:
+            stale.append(self._idle.popleft())
+        if stale:
+            self.discarded["idle"] = self.discarded.get("idle", 0) + len(stale)
+        return stale
+
+    def _open(self, connect):
+        try:
+            conn = connect()
+        except BaseException:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        entry = _Entry(conn, time.monotonic())
+        with self._cond:
+            self._opening -= 1
+            self._busy[id(conn)] = entry
+            self.counters["connects"] += 1
+        return conn
+
+    def _healthy(self, entry):
+        if getattr(entry.conn, "closed", False):
+            return False
+        check_after = self.options["check_after"]
+        if check_after and time.monotonic() - entry.last_used < check_after:
+            return True
+        return self._safe(self._check, entry.conn)
+
+    def _discard(self, entry, reason, busy=True):
+        with self._cond:
+            if busy:
+                self._busy.pop(id(entry.conn), None)
+            self.discarded[reason] = self.discarded.get(reason, 0) + 1
+            self._cond.notify()
+        self._safe_close(entry.conn)
+
+    def _close_all(self, entries):
+        for entry in entries:
+            self._safe_close(entry.conn)
+
+    def _safe_close(self, conn):
+        self._safe(self._close, conn)
+
+    @staticmethod
+    def _safe(func, conn):
+        try:
+            return func(conn) is not False
+        except Exception:
+            return False
+
+
+_lock = threading.Lock()
+_pools = {}   # (alias, database) -> (pid, ConnectionPool)
+
+
+def get(alias, database="", **kwargs) -> ConnectionPool:
+    """
+    Pool theo (alias, DB đích) trong process hiện tại: DB test / "postgres" (lúc tạo DB test) không lẫn với DB thật.
+    Sau fork tạo pool mới (không dùng lại socket của process cha).
+    """
+    key = (alias, database)
+    pid = os.getpid()
+    entry = _pools.get(key)
+    if entry is None or entry[0] != pid:
+        with _lock:
+            entry = _pools.get(key)
+            if entry is None or entry[0] != pid:
+                entry = _pools[key] = (pid, ConnectionPool(alias, database, **kwargs))
+    return entry[1]
+
+
+def stats() -> list:
+    pid = os.getpid()
+    return [pool.stats() for p, pool in list(_pools.values()) if p == pid]
+
+
+def close_all():
+    with _lock:
+        for pid, pool in _pools.values():
+            if pid == os.getpid():
+                pool.close_all()
+        _pools.clear()
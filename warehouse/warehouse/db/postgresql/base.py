@@ -0,0 +1,66 @@
+# warehouse/db/postgresql/base.py
+"""
+Backend PostgreSQL có pool connection (ENGINE "warehouse.db.postgresql") cho DB ở xa (erp_postgres, ecom_platform).
+
+OPTIONS["pool"] = {max_size, idle_timeout, max_lifetime, timeout, check_after} (xem warehouse/db/pool.py);
+không có / rỗng -> như backend postgresql của Django.
+Giữ CONN_MAX_AGE = 0: cuối mỗi request Django close() -> connection trả về pool (không đóng socket),
+request sau lấy lại connection đã xác thực sẵn thay vì TCP + TLS + auth mới. Số connection mỗi process
+bị chặn bởi max_size, kể cả khi nhiều thread (aio pool "db") cùng chạy.
+"""
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from warehouse.db import pool
+
+# psycopg2 / psycopg3: conn.info.transaction_status
+IDLE, INTRANS, INERROR = 0, 2, 3
+
+
+def _check(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1")
+
+
+def _reset(conn):
+    """Trả về pool được không: rollback giao dịch dở; đang chạy query / mất kết nối -> False."""
+    if conn.closed:
+        return False
+    status = conn.info.transaction_status
+    if status in (INTRANS, INERROR):
+        conn.rollback()
+        return True
+    return status == IDLE
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    _pool = None   # pool của connection hiện tại
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pool", None)   # không phải tham số của psycopg.connect
+        return params
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict["OPTIONS"].get("pool")
+        if not options:
+            self._pool = None
+            return super().get_new_connection(conn_params)
+        database = "{}@{}:{}/{}".format(conn_params.get("user", ""), conn_params.get("host", ""),
+                                       conn_params.get("port", ""), conn_params.get("dbname", ""))
+        self._pool = pool.get(self.alias, database, check=_check, reset=_reset,
+                              **({} if options is True else options))
+        level = self.settings_dict["OPTIONS"].get("isolation_level")
+        # connection lấy lại từ pool không qua super(): tự đặt như lúc connect
+        self.isolation_level = IsolationLevel(level) if level is not None else IsolationLevel.READ_COMMITTED
+        try:
+            return self._pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        except pool.PoolTimeout as exc:   # -> django.db.OperationalError như lỗi connect thường
+            raise self.Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if self._pool is None or self.connection is None:
+            return super()._close()
+        # đóng giữa atomic (connection còn được wrapper giữ) hoặc đã lỗi mà hết dùng được -> bỏ, không trả về pool
+        discard = self.in_atomic_block or (self.errors_occurred and not self.is_usable())
+        self._pool.release(self.connection, discard=discard)
@@ -0,0 +1,67 @@
+# warehouse/db/sqlite3/base.py
+"""
+Backend SQLite cho nhiều worker gunicorn cùng ghi 1 file (ENGINE "warehouse.db.sqlite3").
+
+- Mỗi connection mới chạy PRAGMA theo settings:
+    SQLITE_BUSY_TIMEOUT_MS     chờ khoá ghi tối đa N ms thay vì báo "database is locked" ngay
+    SQLITE_JOURNAL_MODE        "wal": đọc không chờ ghi, ghi không chặn đọc
+    SQLITE_SYNCHRONOUS         "normal": đủ an toàn với WAL (mất điện chỉ mất vài giao dịch cuối), bớt fsync
+    SQLITE_WAL_AUTOCHECKPOINT  số trang WAL trước khi tự checkpoint (xem lệnh sqlite_checkpoint)
+  Giá trị None -> giữ mặc định của SQLite.
+- OPTIONS["transaction_mode"] (như Django 5.1): "IMMEDIATE" -> transaction.atomic() mở bằng BEGIN IMMEDIATE,
+  giành khoá ghi ngay đầu giao dịch (chờ theo busy_timeout). BEGIN thường (DEFERRED) chỉ nâng khoá lúc ghi
+  đầu tiên; 2 giao dịch đọc-rồi-ghi đụng nhau thì 1 bên lỗi ngay, busy_timeout không cứu được.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+# busy_timeout đặt trước: đổi journal_mode cũng cần khoá
+PRAGMAS = (
+    ("busy_timeout", "SQLITE_BUSY_TIMEOUT_MS", 5000),
+    ("journal_mode", "SQLITE_JOURNAL_MODE", "wal"),
+    ("synchronous", "SQLITE_SYNCHRONOUS", "normal"),
+    ("wal_autocheckpoint", "SQLITE_WAL_AUTOCHECKPOINT", 1000),
+)
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def pragmas() -> list:
+    """[(pragma, value)] sẽ chạy cho mỗi connection mới."""
+    out = []
+    for pragma, setting, default in PRAGMAS:
+        value = _conf(setting, default)
+        if value is not None:
+            out.append((pragma, value))
+    return out
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    @property
+    def transaction_mode(self):
+        mode = (self.settings_dict["OPTIONS"].get("transaction_mode") or "DEFERRED").upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"DATABASES['{self.alias}']['OPTIONS']['transaction_mode'] phải là 1 trong {TRANSACTION_MODES}."
+            )
+        return mode
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("transaction_mode", None)   # không phải tham số của sqlite3.connect
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in pragmas():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
@@ -1,17 +1,128 @@
-class AppRouter:
+# warehouse/db_routers.py
+"""
+Định tuyến DB theo app + tách đọc / ghi.
+
+- Alias chính theo app: DB_APP_ALIASES (erp_the20 -> erp_postgres), app khác -> "default".
+  Mọi ghi và mặc định mọi đọc vào alias chính.
+- Replica: DB_REPLICAS = {app_label: [alias, ...]}. Chỉ view / đoạn code bật replica_reads() mới đọc từ replica
+  (export, dashboard thống kê: chịu được trễ replication vài giây); DB_REPLICA_READS = False -> tắt hẳn.
+- Đọc-thấy-ghi: ghi bất kỳ (db_for_write) trong request -> ghim về primary tới hết request.
+  DB_PIN_SECONDS > 0: RouterMiddleware đặt cookie để các request kế tiếp của client đó cũng đọc primary N giây.
+- Trạng thái theo request nằm trong contextvar (RouterMiddleware đặt mới mỗi request); object dùng chung nên
+  ghi ở thread khác (warehouse.dbwriter, aio.run_db) cũng ghim được request gốc.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PIN_COOKIE = "db_pin"
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+class _State:
+    __slots__ = ("replica", "pinned", "wrote")
+
+    def __init__(self, pinned=False):
+        self.replica = False
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar("db_route_state", default=None)
+
+
+@contextmanager
+def replica_reads():
+    """`with replica_reads():` hoặc `@replica_reads()`: đọc trong khối này đi replica (nếu chưa ghim primary)."""
+    st = _state.get()
+    token = None
+    if st is None:
+        st = _State()
+        token = _state.set(st)
+    prev, st.replica = st.replica, True
+    try:
+        yield
+    finally:
+        st.replica = prev
+        if token is not None:
+            _state.reset(token)
+
 
+def primary_alias(app_label) -> str:
+    return _conf("DB_APP_ALIASES", {}).get(app_label, "default")
+
+
+def replica_aliases(app_label) -> list:
+    return list(_conf("DB_REPLICAS", {}).get(app_label, ()))
+
+
+class AppRouter:
 
     def db_for_read(self, model, **hints):
-        if model._meta.app_label == 'erp_the20':
-            return 'erp_postgres'
-        return 'default'
+        app_label = model._meta.app_label
+        st = _state.get()
+        if st is not None and st.replica and not st.pinned and _conf("DB_REPLICA_READS", True):
+            replicas = replica_aliases(app_label)
+            if replicas:
+                return random.choice(replicas)
+        return primary_alias(app_label)
 
     def db_for_write(self, model, **hints):
-        if model._meta.app_label == 'erp_the20':
-            return 'erp_postgres'
-        return 'default'
+        st = _state.get()
+        if st is not None:
+            st.pinned = st.wrote = True
+        return primary_alias(model._meta.app_label)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # object đọc từ replica vẫn gán FK / ghi được vào primary của cùng app
+        return primary_alias(obj1._meta.app_label) == primary_alias(obj2._meta.app_label) or None
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
-        if app_label == 'erp_the20':
-            return db == 'erp_postgres'
-        return db == 'default'
+        # replica nhận schema qua replication; migrate được chủ yếu để dựng DB test
+        return db == primary_alias(app_label) or db in replica_aliases(app_label)
+
+
+class RouterMiddleware:
+    """Đặt sát sau MetricsMiddleware: trạng thái mới cho mỗi request (thread WSGI dùng lại context cũ)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        st, token = self._begin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(st, response)
+
+    async def __acall__(self, request):
+        st, token = self._begin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(st, response)
+
+    def _begin(self, request):
+        st = _State(pinned=bool(_conf("DB_PIN_SECONDS", 5) and request.COOKIES.get(PIN_COOKIE)))
+        return st, _state.set(st)
+
+    def _finish(self, st, response):
+        seconds = _conf("DB_PIN_SECONDS", 5)
+        if st.wrote and seconds:
+            response.set_cookie(PIN_COOKIE, "1", max_age=seconds, httponly=True, samesite="Lax")
+        return response
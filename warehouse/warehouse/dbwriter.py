@@ -0,0 +1,146 @@
+# warehouse/dbwriter.py
+"""
+Ghi tuần tự (single writer) cho SQLite: thao tác ghi sổ kho (quét, chốt đơn thủ công, tạo tem)
+không tự mở giao dịch trên thread request mà gửi cho 1 thread ghi duy nhất của process.
+
+- post(func, *args, **kwargs): xếp việc vào hàng đợi, chờ và trả về kết quả (hoặc raise exception) của func.
+- Thread ghi lấy 1 việc + gom các việc đang chờ (tối đa SQLITE_WRITER_BATCH) vào 1 giao dịch ngắn
+  (BEGIN IMMEDIATE, xem warehouse/db/sqlite3), mỗi việc 1 savepoint: việc lỗi chỉ rollback phần của nó.
+  Kết quả trả về sau COMMIT -> caller đọc lại thấy ngay dữ liệu vừa ghi.
+  Cả nhóm chỉ giành khoá ghi + fsync 1 lần; thread request không còn tranh khoá với nhau.
+- Chờ quá SQLITE_WRITER_TIMEOUT giây mà việc chưa được chạy -> huỷ khỏi hàng đợi (không ghi về sau) và
+  raise WriterBusy (API: 503 + Retry-After; trang HTML bắt và báo "thử lại"). Việc đã bắt đầu chạy thì chờ xong.
+- Việc chạy trong bản sao contextvars của caller (metrics theo request vẫn đếm được query của việc đó).
+- Chạy thẳng trên thread gọi (trong transaction.atomic) khi: DB không phải SQLite, caller đang ở trong
+  giao dịch (chờ thread ghi sẽ tự khoá), hoặc SQLITE_WRITER_INLINE = True (settings_test: TestCase).
+- Nhiều worker gunicorn vẫn giành khoá giữa các process, nhưng mỗi process chỉ còn 1 connection ghi
+  và chờ theo busy_timeout thay vì lỗi.
+"""
+import contextvars
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger("warehouse.dbwriter")
+
+_lock = threading.Lock()
+_writers = {}   # alias -> (pid, Writer)
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+class WriterBusy(APIException):
+    """Hàng đợi ghi quá tải: việc đã bị huỷ, chưa ghi gì -> client thử lại an toàn."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Hệ thống đang bận ghi sổ, vui lòng thử lại."
+    default_code = "writer_busy"
+    wait = 1   # DRF exception_handler -> header Retry-After
+
+
+class Writer:
+    """1 thread + 1 hàng đợi cho 1 DB alias."""
+
+    def __init__(self, alias=DEFAULT_DB_ALIAS):
+        self.alias = alias
+        self.queue = queue.SimpleQueue()
+        self.batches = 0
+        self.jobs = 0
+        self._thread = threading.Thread(target=self._loop, name=f"db-writer-{alias}", daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        fut = Future()
+        self.queue.put((fut, contextvars.copy_context(), func, args, kwargs))
+        return fut
+
+    def stop(self):
+        self.queue.put(None)
+        self._thread.join()
+
+    def _take(self):
+        batch = [self.queue.get()]
+        limit = max(int(_conf("SQLITE_WRITER_BATCH", 32)), 1)
+        while len(batch) < limit and batch[-1] is not None:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._take()
+            jobs = [job for job in batch if job is not None]
+            if jobs:
+                self._run(jobs)
+            if len(jobs) < len(batch):
+                connections[self.alias].close()
+                return
+
+    def _run(self, jobs):
+        done = []
+        try:
+            with transaction.atomic(using=self.alias):
+                for fut, ctx, func, args, kwargs in jobs:
+                    if not fut.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic(using=self.alias):
+                            done.append((fut, True, ctx.run(func, *args, **kwargs)))
+                    except Exception as exc:
+                        done.append((fut, False, exc))
+        except Exception as exc:   # BEGIN / COMMIT lỗi (vd quá busy_timeout) -> cả nhóm lỗi
+            logger.warning("writer batch failed: %s", exc, exc_info=True)
+            connections[self.alias].close()
+            for fut, *_ in jobs:
+                if fut.running():
+                    fut.set_exception(exc)
+            return
+        self.batches += 1
+        self.jobs += len(done)
+        for fut, ok, value in done:
+            if ok:
+                fut.set_result(value)
+            else:
+                fut.set_exception(value)
+
+
+def writer(alias=DEFAULT_DB_ALIAS) -> Writer:
+    """Writer theo alias; tạo lại sau fork (thread không theo sang process con)."""
+    pid = os.getpid()
+    entry = _writers.get(alias)
+    if entry is None or entry[0] != pid:
+        with _lock:
+            entry = _writers.get(alias)
+            if entry is None or entry[0] != pid:
+                entry = _writers[alias] = (pid, Writer(alias))
+    return entry[1]
+
+
+def inline(alias=DEFAULT_DB_ALIAS) -> bool:
+    conn = connections[alias]
+    return _conf("SQLITE_WRITER_INLINE", False) or conn.vendor != "sqlite" or conn.in_atomic_block
+
+
+def post(func, *args, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Chạy func(*args, **kwargs) trong 1 giao dịch ghi của `using`; trả về kết quả của func."""
+    if inline(using):
+        with transaction.atomic(using=using):
+            return func(*args, **kwargs)
+    fut = writer(using).submit(func, *args, **kwargs)
+    try:
+        return fut.result(timeout=_conf("SQLITE_WRITER_TIMEOUT", 30))
+    except TimeoutError:
+        if fut.cancel():   # còn trong hàng đợi: _run sẽ bỏ qua
+            logger.warning("writer busy: job cancelled after %ss in queue", _conf("SQLITE_WRITER_TIMEOUT", 30))
+            raise WriterBusy()
+        return fut.result()   # đang chạy: kết quả (đã / sắp commit) phải tới tay caller
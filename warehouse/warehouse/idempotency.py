@@ -0,0 +1,200 @@
+# warehouse/idempotency.py
+"""
+Middleware Idempotency-Key cho các API ghi (POST/PUT/PATCH/DELETE).
+
+Client gửi header `Idempotency-Key: <uuid>`; khi retry với cùng key:
+- Request đầu đã xong  -> trả lại đúng response đã lưu (header Idempotent-Replayed: true), view không chạy lại.
+- Request đầu đang chạy -> 409 (Retry-After: 1), không chạy song song.
+- Cùng key nhưng khác request (method/path/body) -> 422.
+
+Fingerprint = sha256(method, path, query, body). Response 5xx không lưu để client retry được.
+FileResponse (vd ZIP nhãn) lưu đường dẫn file và mở lại khi replay; response stream khác không lưu.
+Lưu trong CACHES[IDEMPOTENCY_CACHE_ALIAS]; cache lỗi -> bỏ qua lớp idempotency (log warning).
+"""
+import hashlib
+import logging
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+from warehouse import aio
+from warehouse.streaming import FileResponse
+
+logger = logging.getLogger("warehouse.idempotency")
+
+HEADER = "HTTP_IDEMPOTENCY_KEY"
+UNSAFE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def request_fingerprint(request) -> str:
+    h = hashlib.sha256()
+    h.update(request.method.encode())
+    h.update(b"\0" + request.path.encode())
+    h.update(b"\0" + request.META.get("QUERY_STRING", "").encode())
+    ctype = request.META.get("CONTENT_TYPE", "")
+    if ctype.startswith("multipart/form-data"):
+        # file upload: không đọc request.body (giới hạn DATA_UPLOAD_MAX_MEMORY_SIZE); băm form + nội dung file
+        for k in sorted(request.POST.keys()):
+            h.update(f"\0{k}={request.POST.getlist(k)}".encode())
+        for k in sorted(request.FILES.keys()):
+            for f in request.FILES.getlist(k):
+                h.update(f"\0{k}:{f.name}:{f.size}".encode())
+                for chunk in f.chunks():
+                    h.update(chunk)
+                f.seek(0)
+    else:
+        h.update(b"\0" + request.body)
+    return h.hexdigest()
+
+
+class IdempotencyMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self._applies(request):
+            return self.get_response(request)
+        state = self._begin(request)
+        if state is None:
+            return self.get_response(request)
+        if not isinstance(state, tuple):
+            return state
+        try:
+            response = self.get_response(request)
+            self._store(state, response)
+            return response
+        finally:
+            self._release(state)
+
+    async def __acall__(self, request):
+        # cache (Redis) + request.user (session) là I/O chặn -> chạy ở pool của warehouse.aio
+        if not self._applies(request):
+            return await self.get_response(request)
+        state = await aio.run_io(self._begin, request)
+        if state is None:
+            return await self.get_response(request)
+        if not isinstance(state, tuple):
+            return state
+        try:
+            response = await self.get_response(request)
+            await aio.run_io(self._store, state, response)
+            return response
+        finally:
+            await aio.run_io(self._release, state)
+
+    def _applies(self, request):
+        key = (request.META.get(HEADER) or "").strip()
+        return bool(key) and request.method in UNSAFE_METHODS and self._path_enabled(request.path)
+
+    def _begin(self, request):
+        """-> response trả ngay (400/409/422/replay) | None (bỏ qua lớp idempotency) | state (cache, resp_key, lock_key, fp)."""
+        key = request.META[HEADER].strip()
+        if len(key) > 255:
+            return JsonResponse({"detail": "Idempotency-Key quá dài (tối đa 255 ký tự)."}, status=400)
+
+        user = getattr(request, "user", None)
+        scope = f"u{user.pk}" if user is not None and user.is_authenticated else "anon"
+        base = f"idem:{scope}:{hashlib.sha256(key.encode()).hexdigest()}"
+        resp_key, lock_key = f"{base}:resp", f"{base}:lock"
+        fp = request_fingerprint(request)
+        cache = caches[_conf("IDEMPOTENCY_CACHE_ALIAS", "default")]
+
+        try:
+            stored = cache.get(resp_key)
+            if stored is None and not cache.add(lock_key, fp, _conf("IDEMPOTENCY_LOCK_TTL", 120)):
+                if cache.get(lock_key) not in (None, fp):
+                    return self._mismatch()
+                resp = JsonResponse({"detail": "Request với Idempotency-Key này đang được xử lý."}, status=409)
+                resp["Retry-After"] = "1"
+                return resp
+        except Exception as exc:
+            logger.warning("idempotency store unavailable, pass-through: %s", exc)
+            return None
+
+        if stored is not None:
+            if stored["fp"] != fp:
+                return self._mismatch()
+            replay = self._replay(stored)
+            if replay is not None:
+                return replay
+            # file đã bị xoá -> coi như chưa lưu, chạy lại bình thường
+            try:
+                cache.delete(resp_key)
+                if not cache.add(lock_key, fp, _conf("IDEMPOTENCY_LOCK_TTL", 120)):
+                    return JsonResponse({"detail": "Request với Idempotency-Key này đang được xử lý."}, status=409)
+            except Exception as exc:
+                logger.warning("idempotency store unavailable, pass-through: %s", exc)
+                return None
+        return cache, resp_key, lock_key, fp
+
+    def _store(self, state, response):
+        # view đã chạy (có thể đã commit): lỗi cache không được biến response thành 500
+        cache, resp_key, _, fp = state
+        record = self._record(fp, response)
+        if record is None:
+            return
+        try:
+            cache.set(resp_key, record, _conf("IDEMPOTENCY_TTL", 24 * 3600))
+        except Exception as exc:
+            logger.warning("idempotency store failed, response not saved for replay: %s", exc)
+
+    def _release(self, state):
+        try:
+            state[0].delete(state[2])
+        except Exception:
+            pass
+
+    # ----- helpers -----
+    def _path_enabled(self, path):
+        return any(path.startswith(p) for p in _conf("IDEMPOTENCY_PATHS", ("/api/",)))
+
+    def _mismatch(self):
+        return JsonResponse(
+            {"detail": "Idempotency-Key đã được dùng cho một request khác (khác method/path/body)."},
+            status=422,
+        )
+
+    def _record(self, fp, response):
+        if response.status_code >= 500:
+            return None
+        headers = [(k, v) for k, v in response.items() if k.lower() not in {"set-cookie", "vary"}]
+        rec = {"fp": fp, "status": response.status_code, "headers": headers}
+        if isinstance(response, FileResponse):
+            path = getattr(getattr(response, "file_to_stream", None), "name", None)
+            if not isinstance(path, str) or not os.path.isfile(path):
+                return None
+            rec["file"] = path
+            return rec
+        if getattr(response, "streaming", False):
+            return None
+        if len(response.content) > _conf("IDEMPOTENCY_MAX_BODY", 1024 * 1024):
+            return None
+        rec["body"] = response.content
+        return rec
+
+    def _replay(self, rec):
+        if "file" in rec:
+            if not os.path.isfile(rec["file"]):
+                return None
+            resp = FileResponse(open(rec["file"], "rb"), status=rec["status"])
+        else:
+            resp = HttpResponse(rec["body"], status=rec["status"])
+        for k, v in rec["headers"]:
+            resp[k] = v
+        resp["Idempotent-Replayed"] = "true"
+        return resp
@@ -0,0 +1,157 @@
+# warehouse/logpipe.py
+"""
+Logging không chặn request thread cho các logger nóng (inventory, erp_the20, warehouse).
+
+- AsyncStreamHandler (QueueHandler): thread request chỉ format message + put_nowait vào hàng đợi;
+  1 thread nền (QueueListener) ghi ra stdout. Hàng đợi đầy -> bỏ record (đếm dropped), không chờ.
+  Listener tự khởi động lại sau fork (worker gunicorn) và được stop (flush) lúc thoát process.
+- KeyValueFormatter: mỗi dòng 'ts=.. level=.. logger=.. msg=".." k=v ...'; trường có cấu trúc
+  truyền qua extra=fields(k=v, ...).
+- ThrottleFilter: lấy mẫu / giới hạn tốc độ theo logger (LOG_THROTTLE), chỉ áp cho INFO trở xuống;
+  số record bị bỏ được ghi kèm record kế tiếp (suppressed=N).
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def fields(**kw) -> dict:
+    """logger.info("scan in", extra=fields(code=code, wh=wh.code))"""
+    return {"fields": kw}
+
+
+# ---------- Formatter ----------
+def _value(v) -> str:
+    s = str(v)
+    if s == "" or any(c in s for c in ' "=\n'):
+        s = '"' + s.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+    return s
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        parts = [
+            f"ts={self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            f"level={record.levelname}",
+            f"logger={record.name}",
+            f"msg={_value(record.getMessage())}",
+        ]
+        for k, v in (getattr(record, "fields", None) or {}).items():
+            parts.append(f"{k}={_value(v)}")
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            parts.append(f"suppressed={suppressed}")
+        if record.exc_text:
+            parts.append(f"exc={_value(record.exc_text)}")
+        return " ".join(parts)
+
+
+# ---------- Throttle ----------
+class ThrottleFilter(logging.Filter):
+    """
+    LOG_THROTTLE = {"inventory.scan": {"sample": 0.1, "rate": 50, "per": 1.0}}
+    sample: tỉ lệ giữ (0..1); rate/per: tối đa `rate` record mỗi `per` giây cho logger đó (và logger con).
+    WARNING trở lên luôn qua.
+    """
+
+    def __init__(self, name=""):
+        super().__init__(name)
+        self._lock = threading.Lock()
+        self._windows = {}    # logger prefix -> [window_start, count, suppressed]
+
+    def _rule(self, logger_name):
+        rules = _conf("LOG_THROTTLE", {})
+        while logger_name:
+            if logger_name in rules:
+                return logger_name, rules[logger_name]
+            logger_name = logger_name.rpartition(".")[0]
+        return None, None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key, rule = self._rule(record.name)
+        if rule is None:
+            return True
+        with self._lock:
+            w = self._windows.setdefault(key, [0.0, 0, 0])
+            sample = rule.get("sample", 1.0)
+            if sample < 1.0 and random.random() >= sample:
+                w[2] += 1
+                return False
+            rate = rule.get("rate")
+            if rate:
+                now = time.monotonic()
+                if now - w[0] >= rule.get("per", 1.0):
+                    w[0], w[1] = now, 0
+                if w[1] >= rate:
+                    w[2] += 1
+                    return False
+                w[1] += 1
+            if w[2]:
+                record.suppressed, w[2] = w[2], 0
+        return True
+
+
+# ---------- Handler ----------
+class AsyncStreamHandler(logging.handlers.QueueHandler):
+    """Dùng trong LOGGING: {"class": "warehouse.logpipe.AsyncStreamHandler", "maxsize": 10000}."""
+
+    def __init__(self, maxsize=10000, stream=None):
+        super().__init__(queue.Queue(maxsize))
+        self.stream = stream or sys.stdout
+        self.dropped = 0
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            out = logging.StreamHandler(self.stream)
+            out.setFormatter(self.formatter or KeyValueFormatter())
+            self._listener = logging.handlers.QueueListener(self.queue, out, respect_handler_level=False)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # giữ record gốc (fields, exc_text) cho formatter ở thread nền; chỉ chốt message tại đây
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        self._ensure_started()
+        super().emit(record)
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()   # xả nốt hàng đợi
+            self._listener = None
+            self._pid = None
@@ -0,0 +1,315 @@
+# warehouse/metrics.py
+"""
+Đo từng request + xuất Prometheus text tại /metrics.
+
+MetricsMiddleware (đặt đầu MIDDLEWARE) ghi cho mỗi request:
+- view đã resolve (url name, không có thì dotted path của view), method, nhóm status (2xx/4xx/5xx)
+- wall time, số query + thời gian SQL theo từng DB alias (execute_wrapper trên connection của thread)
+- kích thước response (bytes; response stream chỉ tính khi có Content-Length)
+Gộp thành histogram trong bộ nhớ process (mỗi worker gunicorn có bộ số riêng, Prometheus scrape theo instance).
+Request chậm hơn METRICS_SLOW_REQUEST_MS -> log warning "slow request" kèm số query/SQL ms theo alias.
+Kèm trạng thái pool connection (warehouse/db/pool.py) của process: db_pool_connections{state=idle|in_use}, ...
+Chạy được cả WSGI lẫn ASGI: query chạy ở thread khác thread của request (view sync dưới ASGI,
+warehouse.aio.run_db/run_io) được đếm qua contextvar + wrapper gắn sẵn trên mọi connection mới.
+Không cần prometheus_client.
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger("warehouse.metrics")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+START_TIME = time.time()
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+# ---------- Registry ----------
+class Histogram:
+    def __init__(self, name, help_text, buckets, labelnames):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self.series = {}   # labels -> [counts per bucket..., sum, count]
+
+    def observe(self, labels, value):
+        s = self.series.get(labels)
+        if s is None:
+            s = self.series[labels] = [0] * (len(self.buckets) + 2)
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                s[i] += 1
+        s[-2] += value
+        s[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, s in sorted(self.series.items()):
+            base = _labels(self.labelnames, labels)
+            for b, n in zip(self.buckets, s):
+                yield f"{self.name}_bucket{{{base},le=\"{_num(b)}\"}} {n}"
+            yield f"{self.name}_bucket{{{base},le=\"+Inf\"}} {s[-1]}"
+            yield f"{self.name}_sum{{{base}}} {_num(s[-2])}"
+            yield f"{self.name}_count{{{base}}} {s[-1]}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+
+    def inc(self, labels, n=1):
+        self.series[labels] = self.series.get(labels, 0) + n
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, n in sorted(self.series.items()):
+            yield f"{self.name}{{{_labels(self.labelnames, labels)}}} {n}"
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in zip(names, values))
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+_lock = threading.Lock()
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Thời gian xử lý request (wall time).",
+                             DURATION_BUCKETS, ("view", "method", "status"))
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Kích thước response.", SIZE_BUCKETS, ("view",))
+DB_QUERIES = Histogram("db_queries_per_request", "Số câu SQL mỗi request theo DB alias.",
+                       QUERY_BUCKETS, ("view", "alias"))
+DB_TIME = Histogram("db_query_duration_seconds", "Tổng thời gian SQL mỗi request theo DB alias.",
+                    DURATION_BUCKETS, ("view", "alias"))
+SLOW_REQUESTS = Counter("http_slow_requests_total", "Số request vượt METRICS_SLOW_REQUEST_MS.", ("view",))
+METRICS = (REQUEST_DURATION, RESPONSE_SIZE, DB_QUERIES, DB_TIME, SLOW_REQUESTS)
+
+
+def reset():
+    with _lock:
+        for m in METRICS:
+            m.series.clear()
+
+
+# (tên, kiểu, help, key trong pool.stats())
+POOL_SERIES = (
+    ("db_pool_max_size", "gauge", "Số connection tối đa của pool.", "max_size"),
+    ("db_pool_checkouts_total", "counter", "Số lần lấy connection từ pool.", "checkouts"),
+    ("db_pool_connects_total", "counter", "Số connection mới mở tới DB (TCP + auth).", "connects"),
+    ("db_pool_waits_total", "counter", "Số lần phải chờ vì pool hết connection.", "waits"),
+    ("db_pool_wait_seconds_total", "counter", "Tổng thời gian chờ connection.", "wait_seconds"),
+    ("db_pool_timeouts_total", "counter", "Số lần chờ quá timeout (request lỗi).", "timeouts"),
+)
+
+
+def _pool_lines():
+    from warehouse.db import pool
+
+    stats = pool.stats()
+    if not stats:
+        return []
+    base = lambda s: _labels(("alias", "database"), (s["alias"], s["database"].rpartition("/")[2]))
+    lines = ["# HELP db_pool_connections Connection trong pool theo trạng thái.",
+             "# TYPE db_pool_connections gauge"]
+    for s in stats:
+        lines += [f'db_pool_connections{{{base(s)},state="idle"}} {s["idle"]}',
+                  f'db_pool_connections{{{base(s)},state="in_use"}} {s["in_use"]}']
+    for name, kind, help_text, key in POOL_SERIES:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{{{base(s)}}} {_num(s[key])}" for s in stats]
+    lines += ["# HELP db_pool_discarded_total Connection bị đóng theo lý do (idle, lifetime, broken, ...).",
+              "# TYPE db_pool_discarded_total counter"]
+    for s in stats:
+        lines += [f'db_pool_discarded_total{{{base(s)},reason="{_escape(r)}"}} {n}'
+                  for r, n in sorted(s["discarded"].items())]
+    return lines
+
+
+def render() -> str:
+    with _lock:
+        lines = [line for m in METRICS for line in m.render()]
+    lines += _pool_lines()
+    lines += [
+        "# HELP process_start_time_seconds Thời điểm process khởi động (unix time).",
+        "# TYPE process_start_time_seconds gauge",
+        f"process_start_time_seconds {START_TIME:.3f}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Middleware ----------
+class _SqlTimer:
+    """execute_wrapper: đếm query + cộng thời gian SQL cho 1 alias trong 1 request."""
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - t0
+            self.count += 1
+
+
+# (thread của request, {alias: _SqlTimer}); thread của request tự gắn wrapper trực tiếp (tránh đếm 2 lần)
+_request_timers = contextvars.ContextVar("metrics_sql_timers", default=None)
+
+
+def _context_timer(execute, sql, params, many, context):
+    state = _request_timers.get()
+    if state is None or state[0] == threading.get_ident():
+        return execute(sql, params, many, context)
+    timer = state[1].get(context["connection"].alias)
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def _attach(sender, connection, **kwargs):
+    if _context_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_context_timer)
+
+
+connection_created.connect(_attach, dispatch_uid="warehouse.metrics")
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    return match.view_name or match._func_path
+
+
+def _response_size(response):
+    if getattr(response, "streaming", False):
+        try:
+            return int(response.get("Content-Length"))
+        except (TypeError, ValueError):
+            return None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.aliases = tuple(_conf("METRICS_DB_ALIASES", None) or settings.DATABASES)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _skip(self, request):
+        return not _conf("METRICS_ENABLED", True) or any(
+            request.path.startswith(p) for p in _conf("METRICS_EXCLUDE_PATHS", ("/metrics", "/static/"))
+        )
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if self._skip(request):
+            return self.get_response(request)
+
+        timers = {}
+        t0 = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in self.aliases:
+                try:
+                    conn = connections[alias]
+                except Exception:
+                    continue
+                timers[alias] = _SqlTimer()
+                stack.enter_context(conn.execute_wrapper(timers[alias]))
+            token = _request_timers.set((threading.get_ident(), timers))
+            try:
+                response = self.get_response(request)
+            finally:
+                _request_timers.reset(token)
+        elapsed = time.perf_counter() - t0
+        self._safe_record(request, response, elapsed, timers)
+        return response
+
+    async def __acall__(self, request):
+        if self._skip(request):
+            return await self.get_response(request)
+
+        # event loop không chạy query: mọi query nằm ở thread khác -> đếm qua _context_timer
+        timers = {alias: _SqlTimer() for alias in self.aliases if alias in settings.DATABASES}
+        t0 = time.perf_counter()
+        token = _request_timers.set((threading.get_ident(), timers))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_timers.reset(token)
+        elapsed = time.perf_counter() - t0
+        self._safe_record(request, response, elapsed, timers)
+        return response
+
+    def _safe_record(self, request, response, elapsed, timers):
+        try:
+            self._record(request, response, elapsed, timers)
+        except Exception as exc:   # đo lường không được làm hỏng request
+            logger.warning("metrics record failed: %s", exc)
+
+    def _record(self, request, response, elapsed, timers):
+        view = _view_name(request)
+        status = f"{response.status_code // 100}xx"
+        size = _response_size(response)
+        slow_ms = _conf("METRICS_SLOW_REQUEST_MS", 1000)
+        slow = slow_ms and elapsed * 1000 >= slow_ms
+
+        with _lock:
+            REQUEST_DURATION.observe((view, request.method, status), elapsed)
+            if size is not None:
+                RESPONSE_SIZE.observe((view,), size)
+            for alias, t in timers.items():
+                if t.count or alias == "default":
+                    DB_QUERIES.observe((view, alias), t.count)
+                    DB_TIME.observe((view, alias), t.seconds)
+            if slow:
+                SLOW_REQUESTS.inc((view,))
+
+        if slow:
+            sql = " ".join(f"{a}={t.count}q/{t.seconds * 1000:.0f}ms" for a, t in timers.items() if t.count)
+            logger.warning("slow request: %s %s view=%s status=%s %.0fms size=%s sql[%s]",
+                           request.method, request.path, view, response.status_code,
+                           elapsed * 1000, size if size is not None else "-", sql or "none")
+
+
+# ---------- /metrics ----------
+def metrics_view(request):
+    token = _conf("METRICS_TOKEN", "")
+    if token and request.META.get("HTTP_AUTHORIZATION", "") != f"Bearer {token}":
+        return HttpResponseForbidden("forbidden")
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,259 @@
+# warehouse/profiling.py
+"""
+Profile theo yêu cầu cho request chậm (sampling, không cần thư viện ngoài).
+
+Bật cho 1 request khi:
+- user staff (session) gửi header "X-Profile: 1" hoặc query ?__profile=1, hoặc
+- path khớp tiền tố trong PROFILE_PATHS (chỉ lưu khi chạy lâu hơn PROFILE_MIN_MS).
+Trong lúc view chạy, 1 thread phụ lấy stack của thread request mỗi PROFILE_INTERVAL_MS
+(sys._current_frames) -> file speedscope JSON trong MEDIA_ROOT/profiles (mở bằng https://www.speedscope.app).
+Trang /profiles/ (staff) liệt kê các profile gần nhất; giữ tối đa PROFILE_KEEP file.
+Chạy ASGI: lấy mẫu thread thread-sensitive của request (ThreadSensitiveContext) — thread mà view / middleware
+sync chạy trên đó. View async (ERP) đẩy việc sang pool aio: profile chỉ thấy phần chạy trên thread này.
+"""
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404
+from django.shortcuts import render
+from django.utils import timezone
+
+from warehouse.streaming import FileResponse
+
+logger = logging.getLogger("warehouse.profiling")
+
+HEADER = "HTTP_X_PROFILE"
+QUERY_FLAG = "__profile"
+INDEX_FILE = "index.jsonl"
+SUFFIX = ".speedscope.json"
+MAX_DEPTH = 200
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def profile_dir() -> Path:
+    return Path(settings.MEDIA_ROOT) / "profiles"
+
+
+# ---------- Sampler ----------
+class Sampler:
+    """Lấy mẫu stack của 1 thread theo chu kỳ; stack lưu dạng tuple chỉ số frame (gốc -> lá)."""
+
+    def __init__(self, thread_id, interval_s):
+        self.thread_id = thread_id
+        self.interval = interval_s
+        self.frames = {}      # (name, file, line) -> index
+        self.samples = []     # [(stack, weight_ms)]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._last = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                self.samples.append((self._stack(frame), (now - self._last) * 1000))
+            self._last = now
+
+    def _stack(self, frame):
+        out = []
+        while frame is not None and len(out) < MAX_DEPTH:
+            code = frame.f_code
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+            idx = self.frames.get(key)
+            if idx is None:
+                idx = self.frames[key] = len(self.frames)
+            out.append(idx)
+            frame = frame.f_back
+        return tuple(reversed(out))
+
+    def speedscope(self, name, elapsed_ms) -> dict:
+        frames = [None] * len(self.frames)
+        for (fn, file, line), i in self.frames.items():
+            frames[i] = {"name": fn, "file": file, "line": line}
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "warehouse.profiling",
+            "name": name,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(elapsed_ms, 3),
+                "samples": [list(s) for s, _ in self.samples],
+                "weights": [round(w, 3) for _, w in self.samples],
+            }],
+        }
+
+
+# ---------- Lưu / liệt kê ----------
+def _slug(path):
+    return re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-")[:60] or "root"
+
+
+def save(sampler, request, response, elapsed_ms, view) -> str:
+    """Ghi file speedscope + 1 dòng index; trả về tên file."""
+    d = profile_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    now = timezone.localtime()
+    name = f"{now:%Y%m%d-%H%M%S-%f}-{_slug(request.path)}{SUFFIX}"
+    title = f"{request.method} {request.get_full_path()}"
+    with open(d / name, "w", encoding="utf-8") as f:
+        json.dump(sampler.speedscope(title, elapsed_ms), f, separators=(",", ":"))
+    entry = {
+        "file": name, "at": now.isoformat(timespec="seconds"), "method": request.method,
+        "path": request.get_full_path(), "view": view, "status": response.status_code,
+        "ms": round(elapsed_ms, 1), "samples": len(sampler.samples),
+    }
+    with open(d / INDEX_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    _prune(d, int(_conf("PROFILE_KEEP", 200)))
+    return name
+
+
+def _prune(d, keep):
+    files = sorted(d.glob(f"*{SUFFIX}"))
+    if len(files) <= keep:
+        return
+    for p in files[:len(files) - keep]:
+        p.unlink(missing_ok=True)
+    kept = {p.name for p in files[len(files) - keep:]}
+    entries = [e for e in recent(limit=None) if e["file"] in kept]
+    with open(d / INDEX_FILE, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in reversed(entries))
+
+
+def recent(limit=100) -> list:
+    """Các profile còn file, mới nhất trước."""
+    d = profile_dir()
+    try:
+        lines = (d / INDEX_FILE).read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return []
+    out = []
+    for line in reversed(lines):
+        try:
+            e = json.loads(line)
+        except ValueError:
+            continue
+        if (d / e.get("file", "")).is_file():
+            out.append(e)
+            if limit and len(out) >= limit:
+                break
+    return out
+
+
+# ---------- Middleware ----------
+def _requested(request):
+    """Kiểm tra nhanh, chưa đụng request.user (đọc DB): có khả năng phải profile không."""
+    if not _conf("PROFILE_ENABLED", True) or request.path.startswith("/profiles/"):
+        return False
+    return bool(request.META.get(HEADER) or request.GET.get(QUERY_FLAG)) or \
+        any(request.path.startswith(p) for p in _conf("PROFILE_PATHS", ()))
+
+
+def _mode(request):
+    """'flag' (staff yêu cầu) | 'path' (PROFILE_PATHS) | None."""
+    if not _requested(request):
+        return None
+    flag = request.META.get(HEADER) or request.GET.get(QUERY_FLAG)
+    if flag and flag not in ("0", "false"):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_staff:
+            return "flag"
+    if any(request.path.startswith(p) for p in _conf("PROFILE_PATHS", ())):
+        return "path"
+    return None
+
+
+class ProfilingMiddleware:
+    """Đặt sau AuthenticationMiddleware (cần request.user)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        mode = _mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        sampler = Sampler(threading.get_ident(), _conf("PROFILE_INTERVAL_MS", 5) / 1000).start()
+        t0 = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        return self._finish(request, response, mode, sampler, (time.perf_counter() - t0) * 1000)
+
+    async def __acall__(self, request):
+        if not _requested(request):
+            return await self.get_response(request)
+        # request.user đọc session / DB: chạy trên thread sync; lấy luôn id thread đó để lấy mẫu
+        mode, thread_id = await sync_to_async(lambda: (_mode(request), threading.get_ident()))()
+        if mode is None:
+            return await self.get_response(request)
+
+        sampler = Sampler(thread_id, _conf("PROFILE_INTERVAL_MS", 5) / 1000).start()
+        t0 = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        return await sync_to_async(self._finish)(request, response, mode, sampler, elapsed_ms)
+
+    def _finish(self, request, response, mode, sampler, elapsed_ms):
+        if mode == "flag" or elapsed_ms >= _conf("PROFILE_MIN_MS", 500):
+            match = getattr(request, "resolver_match", None)
+            view = (match.view_name or match._func_path) if match else "<unresolved>"
+            try:
+                name = save(sampler, request, response, elapsed_ms, view)
+                response["X-Profile"] = f"/profiles/{name}"
+                logger.info("profile saved: %s %s %.0fms -> %s", request.method, request.path, elapsed_ms, name)
+            except OSError as exc:   # profile hỏng không được làm hỏng request
+                logger.warning("profile save failed: %s", exc)
+        return response
+
+
+# ---------- Trang xem ----------
+@staff_member_required
+def profile_index(request):
+    return render(request, "inventory/profiles.html", {"profiles": recent()})
+
+
+@staff_member_required
+def profile_file(request, name):
+    if not name.endswith(SUFFIX) or "/" in name or name.startswith("."):
+        raise Http404
+    path = profile_dir() / name
+    if not path.is_file():
+        raise Http404
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=name, content_type="application/json")
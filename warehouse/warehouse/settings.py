@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'warehouse.metrics.MetricsMiddleware',   # đầu tiên: đo trọn thời gian request
+    'warehouse.db_routers.RouterMiddleware',   # trạng thái replica / ghim primary theo request
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -55,9 +57,11 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'warehouse.profiling.ProfilingMiddleware',   # sau Authentication: cần request.user (staff)
+    'warehouse.idempotency.IdempotencyMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "warehouse.aio.AsyncWhiteNoiseMiddleware",   # WhiteNoise nhận cả sync/async (giữ chuỗi async dưới ASGI)
 ]
 
 ROOT_URLCONF = 'warehouse.urls'
@@ -78,42 +82,65 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'warehouse.wsgi.application'
+ASGI_APPLICATION = 'warehouse.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Pool connection cho Postgres ở xa (warehouse/db/pool.py): mỗi worker process 1 pool / alias, số liệu ở /metrics
+DB_POOL = {
+    'max_size': 10,        # tối đa N connection mở (đang dùng + rảnh) mỗi process
+    'idle_timeout': 300,   # rảnh quá N giây -> đóng
+    'max_lifetime': 1800,  # sống quá N giây -> đóng khi trả về (tránh firewall / server cắt ngang)
+    'timeout': 10,         # hết connection: chờ tối đa N giây rồi báo lỗi
+    'check_after': 30,     # rảnh quá N giây -> SELECT 1 trước khi giao (0 = luôn kiểm tra)
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'warehouse.db.sqlite3',   # backend sqlite3 + PRAGMA WAL / busy_timeout (SQLITE_* bên dưới)
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',   # atomic() giành khoá ghi ngay từ BEGIN
+        },
     },
     'erp_postgres': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'warehouse.db.postgresql',   # postgresql + pool connection (DB_POOL)
         'NAME': 'erp',
         'USER': 'admin01',
         'PASSWORD': 'THE20@12345',
         'HOST': '45.76.159.161',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0,   # cuối request trả connection về pool (pool giữ socket, không phải thread)
+        'OPTIONS': {'pool': DB_POOL},
     },
     'ecom_platform':{
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'warehouse.db.postgresql',
         'NAME': 'ecom-platform',
         'USER': 'admin01',
         'PASSWORD': 'THE20@12345',
         'HOST': '45.76.159.161',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {'pool': DB_POOL},
     },
 
 
 
 }
 DATABASE_ROUTERS = ['warehouse.db_routers.AppRouter']
+# Định tuyến theo app + replica chỉ-đọc (warehouse/db_routers.py)
+DB_APP_ALIASES = {'erp_the20': 'erp_postgres'}   # app -> alias chính; app khác -> 'default'
+DB_REPLICAS = {}          # app -> [alias replica], vd {'inventory': ['default_replica']}; chỉ view bật replica_reads() đọc ở đây
+DB_REPLICA_READS = True   # False -> mọi đọc về primary (replica trễ / hỏng)
+DB_PIN_SECONDS = 5        # sau khi ghi, client đọc primary thêm N giây (cookie db_pin); 0 = chỉ trong request
 
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
-CORS_ALLOW_HEADERS = list(default_headers) + ["x-local-access",]           # chỉ thêm dòng này]
+CORS_ALLOW_HEADERS = list(default_headers) + ["x-local-access", "idempotency-key"]           # chỉ thêm dòng này]
+CORS_EXPOSE_HEADERS = ["Idempotent-Replayed"]
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -184,18 +211,35 @@ REST_FRAMEWORK = {
 
 
 # Basic logging to see scan API logs in console during development
+# Log các logger nóng qua hàng đợi + thread ghi nền (warehouse/logpipe.py), định dạng key=value
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "formatters": {
+        "kv": {"()": "warehouse.logpipe.KeyValueFormatter"},
+    },
+    "filters": {
+        "throttle": {"()": "warehouse.logpipe.ThrottleFilter"},
+    },
     "handlers": {
         "console": {"class": "logging.StreamHandler"},
+        "async": {
+            "class": "warehouse.logpipe.AsyncStreamHandler",
+            "maxsize": 10000,            # đầy -> bỏ record, không chặn request
+            "formatter": "kv",
+            "filters": ["throttle"],
+        },
     },
     "loggers": {
-        "inventory": {"handlers": ["console"], "level": "INFO"},
-        "erp_the20": {"handlers": ["console"], "level": "INFO"},  # <--- THÊM
-        "erp_the20.services": {"handlers": ["console"], "level": "INFO"},  # <--- THÊM
+        "inventory": {"handlers": ["async"], "level": "INFO"},
+        "warehouse": {"handlers": ["async"], "level": "INFO"},   # metrics (slow request), idempotency, profiling
+        "erp_the20": {"handlers": ["async"], "level": "INFO"},   # gồm cả erp_the20.services (propagate)
     },
 }
+# Lấy mẫu / giới hạn tốc độ log INFO theo logger (WARNING trở lên luôn ghi)
+LOG_THROTTLE = {
+    "inventory.scan": {"sample": 1.0, "rate": 200, "per": 1.0},
+}
 
 
 CACHES = {
@@ -205,6 +249,106 @@ CACHES = {
     }
 }
 
+# Cache tra cứu barcode (inventory/barcode_cache.py)
+BARCODE_CACHE_ALIAS = "default"
+BARCODE_CACHE_TTL = 300        # giây; lưới an toàn khi có ghi không qua signal
+BARCODE_CACHE_MOVES = 100      # số move gần nhất lưu kèm item
+BARCODE_CACHE_BACKOFF = 30     # Redis lỗi -> bỏ qua cache N giây, đọc DB
+
+# Cache LRU Warehouse/Product trong process (inventory/refcache.py)
+REFCACHE_MAXSIZE = 2048
+REFCACHE_VERSION_CHECK = 5     # giây giữa 2 lần đọc version key trên Redis
+REFCACHE_MAX_AGE = 300         # tuổi tối đa của entry (khi Redis không dùng được)
+
+# Trạng thái phiên scan/manual/gen_queue (inventory/session_state.py): "redis" | "memory" | "session"
+SESSION_STATE_BACKEND = "redis"
+SESSION_STATE_REDIS_URL = None   # None -> dùng LOCATION của CACHES["default"]
+SESSION_STATE_BACKOFF = 30       # Redis lỗi -> dùng django session N giây
+
+# Query Panel (inventory/query_runner.py)
+QUERY_PANEL_MAX_ROWS = 1000      # số dòng tối đa hiển thị trên trang
+QUERY_PANEL_FETCH_SIZE = 200     # fetchmany theo từng chunk
+QUERY_PANEL_TIMEOUT = 5          # giây; SQLite progress_handler / Postgres statement_timeout
+QUERY_PANEL_EXPORT_TIMEOUT = 60  # giây cho Export CSV
+
+# SavedQuery materialize (inventory/saved_queries.py, manage.py refresh_saved_queries)
+SAVED_QUERY_MAX_ROWS = 5000
+SAVED_QUERY_TIMEOUT = 30         # giây mỗi lần làm mới
+SAVED_QUERY_BACKGROUND = True    # kết quả quá hạn -> làm mới ở thread nền, vẫn trả kết quả cũ
+
+# Idempotency-Key cho API ghi (warehouse/idempotency.py)
+IDEMPOTENCY_PATHS = ("/api/",)
+IDEMPOTENCY_TTL = 24 * 3600      # giữ response đã lưu trong 24h
+IDEMPOTENCY_LOCK_TTL = 120       # khoá "đang xử lý" tự hết hạn nếu worker chết
+IDEMPOTENCY_MAX_BODY = 1024 * 1024
+
+# API v2 nhập hàng loạt: moves/bulk, items/create-by-sku/batch (api/services.py)
+API_BULK_MOVE_BATCH_SIZE = 500   # số dòng mỗi câu INSERT/UPDATE của bulk_create/bulk_update
+API_ITEM_BATCH_MAX = 5000        # số item tối đa mỗi request /api/v2/items/create-by-sku/batch/
+
+# Tem in (inventory/labels.py): format mặc định png | zpl | epl; kích thước theo dot (203 dpi = 8 dot/mm)
+LABEL_DEFAULT_FORMAT = "png"
+LABEL_WIDTH_DOTS = 406           # 50mm
+LABEL_HEIGHT_DOTS = 203          # 25mm
+LABEL_MODULE_DOTS = 2            # độ rộng vạch hẹp Code128
+LABEL_BAR_HEIGHT_DOTS = 90
+LABEL_TITLE_MAX_CHARS = 32
+LABEL_SPOOL_DIR = None           # thư mục agent máy in theo dõi (None = tắt chế độ spool)
+# Tờ decal PDF: kích thước trang, lưới cols x rows, lề (trên, phải, dưới, trái), khoảng cách (ngang, dọc) — mm
+LABEL_PDF_TEMPLATES = {
+    "a4-3x8": {"page_mm": (210, 297), "cols": 3, "rows": 8, "margin_mm": (13, 7, 13, 7), "gap_mm": (2.5, 0)},
+    "a4-4x10": {"page_mm": (210, 297), "cols": 4, "rows": 10, "margin_mm": (13, 5, 13, 5), "gap_mm": (2, 0), "font_pt": 6},
+    "a4-2x7": {"page_mm": (210, 297), "cols": 2, "rows": 7, "margin_mm": (15, 5, 15, 5), "gap_mm": (3, 0), "font_pt": 9},
+}
+LABEL_PDF_DEFAULT_TEMPLATE = "a4-3x8"
+
+# Metrics (/metrics, Prometheus text): histogram theo view; request chậm hơn ngưỡng -> log warning
+METRICS_ENABLED = True
+METRICS_SLOW_REQUEST_MS = 1000
+METRICS_EXCLUDE_PATHS = ("/metrics", "/static/")
+METRICS_TOKEN = ""   # đặt giá trị -> /metrics yêu cầu header "Authorization: Bearer <token>"
+
+# Profiling theo yêu cầu (warehouse/profiling.py): staff gửi "X-Profile: 1" / ?__profile=1,
+# hoặc path trong PROFILE_PATHS (chỉ lưu khi > PROFILE_MIN_MS). File speedscope ở MEDIA_ROOT/profiles, xem tại /profiles/
+PROFILE_ENABLED = True
+PROFILE_PATHS = ()          # vd ("/api/history/", "/dashboard/") -> luôn lấy mẫu
+PROFILE_MIN_MS = 500
+PROFILE_INTERVAL_MS = 5
+PROFILE_KEEP = 200
+
+# ASGI (gunicorn -k uvicorn.workers.UvicornWorker): view async của ERP đẩy việc chặn sang pool có giới hạn
+# (warehouse/aio.py). Số thread tính trên mỗi worker process.
+ASYNC_VIEWS = True          # False -> các route ERP chỉ dùng ViewSet DRF (sync)
+ASYNC_DB_THREADS = 8        # ORM: erp_postgres / ecom_platform / default
+ASYNC_IO_THREADS = 16       # email SMTP + Lark webhook
+ASYNC_POOL_INLINE = False   # True (test): chạy trên thread gọi, không qua pool
+STREAM_ASYNC_CHUNK = 64 * 1024  # ASGI: file/CSV stream gửi từng đợt N byte (warehouse/streaming.py), không gom cả body
+
+# SQLite nhiều worker cùng ghi (warehouse/db/sqlite3, warehouse/dbwriter.py, manage.py sqlite_checkpoint)
+SQLITE_BUSY_TIMEOUT_MS = 5000      # chờ khoá ghi tối đa N ms rồi mới báo "database is locked"
+SQLITE_JOURNAL_MODE = "wal"        # đọc không chờ ghi
+SQLITE_SYNCHRONOUS = "normal"      # WAL + normal: fsync lúc checkpoint, không fsync mỗi commit
+SQLITE_WAL_AUTOCHECKPOINT = 1000   # trang; WAL lớn hơn -> tự checkpoint (PASSIVE)
+SQLITE_WRITER_BATCH = 32           # số việc ghi sổ tối đa gom vào 1 giao dịch của thread ghi
+SQLITE_WRITER_TIMEOUT = 30         # giây request chờ thread ghi trả kết quả
+SQLITE_WRITER_INLINE = False       # True (test): chạy trên thread gọi, không qua thread ghi
+
+# Bảng user của ecom-platform (erp_the20/selectors/user_selector.py)
+ECOM_USER_COLUMNS_TTL = 3600     # giây giữ mapping cột (id/fullname/role/mail); đổi schema -> tự dò lại khi query lỗi
+ECOM_USER_WARM_ON_START = True   # wsgi/asgi: dò mapping ở thread nền lúc worker khởi động
+
+# Cache danh bạ user ecom-platform (erp_the20/selectors/user_directory.py): LRU process -> Redis -> DB
+USER_DIRECTORY_CACHE_ALIAS = "default"
+USER_DIRECTORY_TTL = 300         # giây; user tìm thấy (Redis)
+USER_DIRECTORY_LOCAL_TTL = 60    # giây; LRU trong process (ngắn hơn: các worker không báo nhau khi đổi)
+USER_DIRECTORY_MISS_TTL = 60     # giây; cache âm cho id không tồn tại
+USER_DIRECTORY_MAXSIZE = 4096    # số user tối đa trong LRU mỗi process
+USER_DIRECTORY_BACKOFF = 30      # Redis lỗi -> bỏ qua Redis N giây
+
+# Upload CSV/XLSX (manual batch, kiểm kê BOM): giới hạn cứng số dòng dữ liệu và kích thước file
+IMPORT_MAX_ROWS = 50000
+IMPORT_MAX_BYTES = 20 * 1024 * 1024
+
 
 # ===== Email (Gmail - hardcoded) =====
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
@@ -0,0 +1,38 @@
+# warehouse/settings_test.py
+"""Settings cho pytest: không cần Redis, cache trong bộ nhớ process."""
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+# primary + replica = 2 file SQLite riêng (không có replication: test tự ghi dữ liệu khác nhau vào mỗi bên)
+DATABASES["default"]["TEST"] = {"NAME": os.path.join(tempfile.gettempdir(), "warehouse-test-primary.sqlite3")}
+DATABASES["replica"] = {
+    **DATABASES["default"],
+    "NAME": BASE_DIR / "db-replica.sqlite3",
+    "TEST": {"NAME": os.path.join(tempfile.gettempdir(), "warehouse-test-replica.sqlite3")},
+}
+# DB test Postgres bị DROP cuối phiên: connection rảnh nằm trong pool sẽ chặn DROP DATABASE
+for _alias in ("erp_postgres", "ecom_platform"):
+    DATABASES[_alias]["OPTIONS"] = {}
+DB_REPLICAS = {"inventory": ["replica"]}
+DB_REPLICA_READS = False   # chỉ test replica bật lại (test khác chỉ khai báo DB default)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "warehouse-tests",
+    }
+}
+
+SESSION_STATE_BACKEND = "memory"
+SAVED_QUERY_BACKGROUND = False
+
+# view async chạy ORM trên cùng thread với test (thấy transaction của TestCase)
+ASYNC_POOL_INLINE = True
+
+# ghi sổ chạy ngay trên thread test (cùng transaction của TestCase), không qua thread ghi
+SQLITE_WRITER_INLINE = True
+
+# Cache danh bạ user ecom: tắt (dữ liệu user đổi giữa các test); test cache tự bật bằng override_settings
+USER_DIRECTORY_TTL = USER_DIRECTORY_LOCAL_TTL = USER_DIRECTORY_MISS_TTL = 0
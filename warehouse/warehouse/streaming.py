@@ -0,0 +1,50 @@
+# warehouse/streaming.py
+"""
+StreamingHttpResponse / FileResponse stream được cả khi chạy ASGI.
+
+Django 4.2 dưới ASGI: response stream có iterator sync bị gom hết vào RAM (sync_to_async(list)) kèm warning
+"must consume synchronous iterators" -> export CSV, ZIP/PDF nhãn, file profile giữ nguyên cả body mỗi request.
+Các lớp ở đây đọc iterator sync theo từng đợt ~STREAM_ASYNC_CHUNK byte trên thread thread-sensitive của request
+(cùng thread với view: cursor DB của query_runner.iter_csv mở ở đó) -> bộ nhớ phẳng như WSGI.
+Chạy WSGI: y như lớp gốc của Django.
+"""
+from asgiref.sync import sync_to_async
+from django import http
+from django.conf import settings
+
+
+def _pull(iterator, limit):
+    """Lấy các chunk kế tiếp tới khi đủ limit byte; [] = hết."""
+    parts, size = [], 0
+    for part in iterator:
+        parts.append(part)
+        size += len(part)
+        if size >= limit:
+            break
+    return parts
+
+
+class _AsyncStreamMixin:
+
+    async def __aiter__(self):
+        if self.is_async:
+            async for part in self.streaming_content:
+                yield part
+            return
+        iterator = self.streaming_content
+        limit = int(getattr(settings, "STREAM_ASYNC_CHUNK", 64 * 1024))
+        pull = sync_to_async(_pull, thread_sensitive=True)
+        while True:
+            parts = await pull(iterator, limit)
+            if not parts:
+                return
+            for part in parts:
+                yield part
+
+
+class StreamingHttpResponse(_AsyncStreamMixin, http.StreamingHttpResponse):
+    pass
+
+
+class FileResponse(_AsyncStreamMixin, http.FileResponse):
+    pass
@@ -23,8 +23,13 @@ from django.conf.urls.static import static
 from django.views.generic import RedirectView
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 from inventory import views
+from warehouse import metrics, profiling
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics.metrics_view, name="metrics"),
+    path("profiles/", profiling.profile_index, name="profile_index"),
+    path("profiles/<str:name>", profiling.profile_file, name="profile_file"),
+    path("api/v2/", include(("api.urls", "api_v2"))),
     path("api/", include("inventory.api_urls")),
     
     # # ========== API Duplicate Routes ==========
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'warehouse.settings')
 
 application = get_wsgi_application()
+
+# dò sẵn mapping cột bảng user ecom-platform (thread nền, ECOM_USER_WARM_ON_START)
+from erp_the20.selectors.user_selector import warm_up  # noqa: E402
+
+warm_up()